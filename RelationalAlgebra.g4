@@ -4,6 +4,7 @@ grammar RelationalAlgebra;
 SELECT  : [sS][iI][gG][mM][aA] ;
 PROJECT : [pP][iI] ;
 RENAME  : [rR][hH][oO] ;
+DELTA   : [dD][eE][lL][tT][aA] ;
 
 GROUP_AGGREGATE : [gG][rR][oO][uU][pP] ;
 
@@ -16,6 +17,9 @@ LEFT_BOWTIE     : [lL][bB][oO][wW][tT][iI][eE] ;
 RIGHT_BOWTIE    : [rR][bB][oO][wW][tT][iI][eE] ;
 FULL_BOWTIE     : [fF][bB][oO][wW][tT][iI][eE] ;
 
+SEMI_JOIN       : [sS][eE][mM][iI][jJ][oO][iI][nN] ;
+ANTI_JOIN       : [aA][nN][tT][iI][jJ][oO][iI][nN] ;
+
 UNION   : [uU][nN][iI][oO][nN] ;
 INTERSECT : [iI][nN][tT][eE][rR][sS][eE][cC][tT] ;
 MINUS   : [mM][iI][nN][uU][sS] ;
@@ -48,6 +52,8 @@ relExpr :
     | RENAME '[' namedScalarExpr (',' namedScalarExpr)* ']'
              '(' relExpr ')'                             # RelExprRename
 
+    | DELTA '(' relExpr ')'                              # RelExprDistinct
+
     | ('[' groups+=scalarExpr (',' groups+=scalarExpr)* ']')?
       GROUP_AGGREGATE '[' aggregates+=namedScalarExpr (',' aggregates+=namedScalarExpr)* ']'
              '(' relExpr ')'                             # RelExprGroupAggregate
@@ -57,6 +63,9 @@ relExpr :
     | relExpr RIGHT_BOWTIE ('[' scalarExpr ']')? relExpr # RelExprRightOuterJoin
     | relExpr  FULL_BOWTIE ('[' scalarExpr ']')? relExpr # RelExprFullOuterJoin
 
+    | relExpr SEMI_JOIN ('[' scalarExpr ']')? relExpr    # RelExprSemiJoin
+    | relExpr ANTI_JOIN ('[' scalarExpr ']')? relExpr    # RelExprAntiJoin
+
     | relExpr (CROSS | TIMES) relExpr    # RelExprCrossProduct
     | relExpr DIVIDE relExpr             # RelExprDivision
 
@@ -15,5 +15,13 @@ cp python_gen/*.py $APPDIR
 cp python/*.py $APPDIR
 cp python/*.css $APPDIR
 
+# Python can't write bytecode caches into the archive, so without these it
+# would compile every module each time the app starts.  zipimport looks for
+# the .pyc files next to the sources, and these aren't checked against the
+# sources' timestamps.  They are only used by the Python version that built
+# them; other versions compile the sources as usual.
+find $APPDIR -name __pycache__ -prune -exec rm -rf {} +
+python3 -m compileall -q -b --invalidation-mode unchecked-hash $APPDIR
+
 python -m zipapp $APPDIR -p '/usr/bin/env python3' -m ra2html_app:main
 
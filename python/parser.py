@@ -1,3 +1,5 @@
+import os
+
 from antlr4 import *
 from antlr4.InputStream import InputStream
 from antlr4.error.ErrorListener import *
@@ -41,3 +43,91 @@ def parse_str(ra_str):
     return parser
 
 
+# === FRONT ENDS =============================================================
+#
+# Statements can be parsed by the parser that ANTLR generates from
+# RelationalAlgebra.g4, or by the much faster hand-written parser in
+# ra_fastparse, which builds the same parse trees.  The hand-written parser
+# stops at the first syntax error, so when it fails the input is parsed again
+# with ANTLR, which recovers from errors and reports all of them; either way,
+# errors are reported exactly as ANTLR reports them.
+#
+# The front end is chosen with set_front_end(), or with the RA_PARSER
+# environment variable:
+#
+#   "antlr"  always use the ANTLR parser
+#   "fast"   use the hand-written parser (the default)
+#   "check"  parse with both, and raise a ValueError if the hand-written
+#            parser accepts input that ANTLR parses differently
+
+FRONT_ENDS = ['antlr', 'fast', 'check']
+
+front_end = os.environ.get('RA_PARSER', 'fast')
+
+
+def set_front_end(name):
+    global front_end
+
+    if name not in FRONT_ENDS:
+        raise ValueError('Unknown parser front end "%s"; expected one of %s' % \
+                         (name, ', '.join(FRONT_ENDS)))
+
+    front_end = name
+
+
+def get_front_end():
+    return front_end
+
+
+# Returns a tree's rule contexts and tokens as nested tuples, so that two
+# trees can be compared.
+def _tree_signature(tree):
+    if isinstance(tree, TerminalNode):
+        return (tree.symbol.type, tree.getText())
+
+    return (type(tree).__name__,) + \
+           tuple([_tree_signature(c) for c in tree.getChildren()])
+
+
+def _parse(ra_str, rule, fast_fn, error_listener):
+    fast_tree = None
+    if front_end != 'antlr':
+        from ra_fastparse import ParseError
+        try:
+            fast_tree = fast_fn(ra_str)
+        except ParseError:
+            pass
+
+        if fast_tree is not None and front_end == 'fast':
+            return fast_tree
+
+    parser = parse_str(ra_str)
+    if error_listener is not None:
+        parser.removeErrorListeners()
+        parser.addErrorListener(error_listener)
+
+    tree = getattr(parser, rule)()
+
+    if fast_tree is not None and \
+       _tree_signature(fast_tree) != _tree_signature(tree):
+        raise ValueError('The parsers disagree about:  %s\n' \
+                         '  ANTLR:  %s\n' \
+                         '  fast:   %s' % (ra_str, _tree_signature(tree),
+                                           _tree_signature(fast_tree)))
+
+    return tree
+
+
+# Parses a sequence of statements with the current front end, returning the
+# relStmts parse tree.  Syntax errors are reported to the error listener, such
+# as an UnderlineListener, or else printed by ANTLR's default listener.
+def parse_stmts(ra_str, error_listener=None):
+    from ra_fastparse import parse_relstmts
+    return _parse(ra_str, 'relStmts', parse_relstmts, error_listener)
+
+
+# Parses a single statement with the current front end, returning the relStmt
+# parse tree.
+def parse_stmt(ra_str, error_listener=None):
+    from ra_fastparse import parse_relstmt
+    return _parse(ra_str, 'relStmt', parse_relstmt, error_listener)
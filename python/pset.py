@@ -1,3 +1,4 @@
+import locale
 from enum import Enum
 
 
@@ -6,62 +7,141 @@ class PartType(Enum):
     COMMENT = 2
 
 
-def load_problem_file(filename):
+# Problem set files are read as bytes so that the position of each problem
+# can be recorded, and decoded with the same encoding that open() would use.
+ENCODING = locale.getpreferredencoding(False)
 
-    problems = {}
 
-    with open(filename) as f:
+def _is_problem_header(line):
+    return line.startswith('-- [Problem')
 
-        # Any initial comments or code will be under the key None.
-        problem = None
-        parts = []
-        problems[problem] = parts
 
-        prev_line_type = None
+def _problem_id(line):
+    return line[4:-1].strip()
 
-        while True:
-            # Read the next line of the file.  If we have hit EOF,
-            # break out of the loop.
-            line = f.readline()
-            if line == '':
-                break
 
-            # Skip blank lines
-            line = line.strip()
-            if line == '':
-                continue
+# Yields (offset, line) for each line of a file opened in binary mode that
+# isn't blank, with the line stripped.
+def _read_lines(f):
+    offset = f.tell()
+    for raw in f:
+        line = raw.decode(ENCODING).strip()
+        if line != '':
+            yield (offset, line)
 
-            # Analyze the current line
-            if line.startswith('-- [Problem'):
-                problem = line[4:-1].strip()
+        offset += len(raw)
 
-                if problem in problems:
-                    raise ValueError("Problem %s already appeared earlier" % problem)
 
-                parts = []
-                problems[problem] = parts
+# Collects the parts of a problem from the lines, up to the header of the
+# next problem.  Returns (parts, header), where header is the (offset, line)
+# of the next problem's header, or None at the end of the file.
+def _read_parts(lines):
+    parts = []
+    prev_line_type = None
 
-                prev_line_type = None
+    for (offset, line) in lines:
+        if _is_problem_header(line):
+            return (parts, (offset, line))
 
-            elif line.startswith('--'):
-                comment = line[2:].strip()
+        elif line.startswith('--'):
+            comment = line[2:].strip()
 
-                if prev_line_type != PartType.COMMENT:
-                    parts.append( (PartType.COMMENT, []) )
+            if prev_line_type != PartType.COMMENT:
+                parts.append( (PartType.COMMENT, []) )
 
-                parts[-1][1].append(comment)
+            parts[-1][1].append(comment)
 
-                prev_line_type = PartType.COMMENT
+            prev_line_type = PartType.COMMENT
 
-            else:
-                answer = line.strip()
+        else:
+            answer = line
+
+            if prev_line_type != PartType.ANSWER:
+                parts.append( (PartType.ANSWER, []) )
+
+            parts[-1][1].append(answer)
+
+            prev_line_type = PartType.ANSWER
+
+    return (parts, None)
 
-                if prev_line_type != PartType.ANSWER:
-                    parts.append( (PartType.ANSWER, []) )
 
-                parts[-1][1].append(answer)
+def _iter_file_order(filename):
+    with open(filename, 'rb') as f:
+        lines = _read_lines(f)
 
-                prev_line_type = PartType.ANSWER
+        # Any initial comments or code are under the problem ID None.
+        (parts, header) = _read_parts(lines)
+        yield (None, parts)
+
+        problem_ids = set()
+        while header is not None:
+            problem = _problem_id(header[1])
+            if problem in problem_ids:
+                raise ValueError("Problem %s already appeared earlier" % problem)
+
+            problem_ids.add(problem)
+
+            (parts, header) = _read_parts(lines)
+            yield (problem, parts)
+
+
+# Returns a dictionary of the offset in the file of each problem's header,
+# in the order the problems appear.
+def index_problem_file(filename):
+    index = {}
+
+    with open(filename, 'rb') as f:
+        for (offset, line) in _read_lines(f):
+            if not _is_problem_header(line):
+                continue
 
-    return problems
+            problem = _problem_id(line)
+            if problem in index:
+                raise ValueError("Problem %s already appeared earlier" % problem)
 
+            index[problem] = offset
+
+    return index
+
+
+# Reads the parts of the problem whose header is at the offset, or of the
+# header of the file if the offset is None.
+def _read_problem_at(f, offset):
+    f.seek(offset or 0)
+    lines = _read_lines(f)
+    if offset is not None:
+        next(lines)
+
+    return _read_parts(lines)[0]
+
+
+# Yields (problem_id, parts) for the header of a problem set file, under the
+# problem ID None, and then for the problems with the specified IDs or, if
+# none are specified, for all of the problems, in the order they appear in
+# the file or sorted by ID.
+#
+# Only one problem is held in memory at a time, so that very large files can
+# be processed.  When the problems are reordered, the file is indexed first,
+# and each problem is then read from its position in the file.
+def iter_problems(filename, problem_ids=None, sort=False):
+    if problem_ids is None and not sort:
+        yield from _iter_file_order(filename)
+        return
+
+    index = index_problem_file(filename)
+    if problem_ids is None:
+        problem_ids = sorted(index.keys())
+
+    with open(filename, 'rb') as f:
+        yield (None, _read_problem_at(f, None))
+
+        for problem in problem_ids:
+            if problem in index:
+                yield (problem, _read_problem_at(f, index[problem]))
+            else:
+                yield (problem, [])
+
+
+def load_problem_file(filename):
+    return dict(iter_problems(filename))
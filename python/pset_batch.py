@@ -0,0 +1,206 @@
+# Checking or formatting many problem set files at once.
+#
+# The files are spread across a pool of worker processes.  Each worker
+# imports the parser once, when it starts, and then handles many files, which
+# are handed out in chunks so that a worker isn't waiting on the main process
+# between small files.  The results come back in the order of the files and
+# are combined into a single report.
+
+import concurrent.futures, contextlib, fnmatch, glob, io, os, time
+
+
+# The file name pattern of problem set files in a directory.
+DEFAULT_PATTERN = '*.txt'
+
+CHECK = 'check'
+FORMAT = 'format'
+
+
+def _is_glob(path):
+    return any([c in path for c in '*?['])
+
+
+# Expands a list of files, directories and glob patterns into a sorted list
+# of problem set files.  Directories are searched recursively for files that
+# match the pattern.
+def find_pset_files(paths, pattern=DEFAULT_PATTERN):
+    files = set()
+    for path in paths:
+        matches = glob.glob(path, recursive=True) if _is_glob(path) else [path]
+        if not matches:
+            raise ValueError('No files match %s' % path)
+
+        for p in matches:
+            if os.path.isdir(p):
+                for (dirpath, dirnames, filenames) in os.walk(p):
+                    files.update([os.path.join(dirpath, f) for f in
+                                  fnmatch.filter(filenames, pattern)])
+            elif os.path.isfile(p):
+                files.add(p)
+            else:
+                raise ValueError('%s is not a file or directory' % p)
+
+    return sorted(files)
+
+
+# The result of checking or formatting one file.
+class FileResult:
+    def __init__(self, filename):
+        self.filename = filename
+        self.output = ''
+        self.answers = 0
+        self.answers_with_errors = 0
+
+        # The error that stopped the file from being processed, if any.
+        self.error = None
+        self.time = 0.0
+
+        # The answers whose results were found in the cache, and those that
+        # had to be processed.
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+# The ResultCache of a worker process, if results are cached.
+_worker_cache = None
+
+
+def _init_worker(front_end, cache):
+    global _worker_cache
+
+    from parser import set_front_end
+    set_front_end(front_end)
+    _worker_cache = cache
+
+    # Import the checker and formatter once, rather than for each file.
+    import pset_checker, pset_formatter, ra2html
+
+
+def _output_filename(filename):
+    return os.path.splitext(filename)[0] + '.html'
+
+
+# Checks or formats a file, using the ResultCache from pset_cache if one is
+# specified.
+def process_file(filename, mode, cache=None, sort=True):
+    from pset_checker import check_problem_file
+    from pset_formatter import format_problem_file
+    from ra2html import format_relational_algebra
+
+    result = FileResult(filename)
+    start = time.perf_counter()
+    if cache is not None:
+        (hits, misses) = (cache.hits, cache.misses)
+
+    out = io.StringIO()
+    try:
+        if mode == CHECK:
+            (result.answers, result.answers_with_errors) = \
+                check_problem_file(filename, out, cache=cache, sort=sort)
+        else:
+            formatter = format_relational_algebra
+            if cache is not None:
+                formatter = cache.cached('html', formatter)
+
+            with open(_output_filename(filename), 'w') as f, \
+                 contextlib.redirect_stdout(out):
+                format_problem_file(filename, formatter, f, sort=sort)
+
+    except Exception as e:
+        result.error = '%s: %s' % (type(e).__name__, e)
+
+    if cache is not None:
+        result.cache_hits = cache.hits - hits
+        result.cache_misses = cache.misses - misses
+
+    result.output = out.getvalue()
+    result.time = time.perf_counter() - start
+    return result
+
+
+def _process_chunk(filenames, mode, sort):
+    return [process_file(f, mode, _worker_cache, sort) for f in filenames]
+
+
+# Checks or formats the files with the specified number of worker processes,
+# returning a FileResult per file, in the same order.  With one worker, the
+# files are processed in this process.
+def process_files(filenames, mode, workers=None, cache=None, sort=True):
+    from parser import get_front_end
+
+    workers = min(workers or os.cpu_count() or 1, max(len(filenames), 1))
+    if workers == 1:
+        return [process_file(f, mode, cache, sort) for f in filenames]
+
+    # Several chunks per worker, so that the work stays balanced when some
+    # files take longer than others.
+    size = max(1, min(64, len(filenames) // (workers * 4)))
+    chunks = [filenames[i : i + size] for i in range(0, len(filenames), size)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+            initializer=_init_worker,
+            initargs=(get_front_end(), cache)) as pool:
+        results = []
+        for chunk_results in pool.map(_process_chunk, chunks,
+                                      [mode] * len(chunks),
+                                      [sort] * len(chunks)):
+            results += chunk_results
+
+    return results
+
+
+# Writes the combined report:  the output for each file, then a summary.
+def write_report(results, mode, elapsed, workers, out, cache=None):
+    for r in results:
+        print("=== %s" % r.filename, file=out)
+        if r.output:
+            print(r.output.rstrip('\n'), file=out)
+        if r.error is not None:
+            print("FAILED:  %s" % r.error, file=out)
+        print(file=out)
+
+    failed = [r for r in results if r.error is not None]
+    with_errors = [r for r in results
+                   if r.error is None and r.answers_with_errors > 0]
+
+    print("Summary", file=out)
+    print("%s %d files in %.2f s with %d workers (%.1f files/s)" % \
+          ('Checked' if mode == CHECK else 'Formatted', len(results),
+           elapsed, workers, len(results) / elapsed if elapsed > 0 else 0),
+          file=out)
+
+    if mode == CHECK:
+        print("  %d answers, %d with errors" % \
+              (sum([r.answers for r in results]),
+               sum([r.answers_with_errors for r in results])), file=out)
+        print("  %d files parsed successfully, %d with errors" % \
+              (len(results) - len(failed) - len(with_errors),
+               len(with_errors)), file=out)
+        for r in with_errors:
+            print("    %s:  %d of %d answers" % \
+                  (r.filename, r.answers_with_errors, r.answers), file=out)
+
+    print("  %d files failed" % len(failed), file=out)
+    for r in failed:
+        print("    %s:  %s" % (r.filename, r.error), file=out)
+
+    if cache is not None:
+        print("  %d answers found in the cache, %d processed" % \
+              (sum([r.cache_hits for r in results]),
+               sum([r.cache_misses for r in results])), file=out)
+
+
+# Checks or formats the problem set files named by the paths, and writes a
+# report to out.  Returns the results.
+def run_batch(paths, mode, workers=None, pattern=DEFAULT_PATTERN, out=None,
+              cache=None, sort=True):
+    filenames = find_pset_files(paths, pattern)
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = process_files(filenames, mode, workers, cache, sort)
+    elapsed = time.perf_counter() - start
+
+    write_report(results, mode, elapsed,
+                 min(workers, max(len(filenames), 1)), out, cache)
+    return results
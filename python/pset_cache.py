@@ -0,0 +1,175 @@
+# An on-disk cache of the results computed for answer blocks, such as the
+# HTML that ra2html renders for an answer and the syntax errors that the
+# checker finds in it.  Most resubmitted problem sets only change a few
+# answers, so the results for the rest can be reused.
+#
+# A result is keyed by a hash of the answer's text, the kind of result, and
+# the source code of the modules that compute results, so that results from
+# another version of the code are never used.  Each result is stored as JSON
+# in its own file, written under a temporary name and then renamed, so that
+# several processes can share the cache.
+#
+# The cache is bounded in size.  Reading a result marks its file as recently
+# used, and when the cache grows past its limit, the least recently used
+# results are removed until it is comfortably under the limit again.
+
+import hashlib, importlib.util, json, os
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# When the cache is over its limit, results are removed until it is at this
+# fraction of the limit, so that it isn't cleaned up after every new result.
+EVICT_TO_FRACTION = 0.8
+
+FILE_SUFFIX = '.json'
+
+# The modules whose code determines the results.
+SOURCE_MODULES = ['RelationalAlgebraParser', 'parser', 'ra_fastparse',
+                  'ra2html', 'pset_checker']
+
+_code_hash = None
+
+
+# Returns a hash of the source code of the modules that compute results.
+def _get_code_hash():
+    global _code_hash
+
+    if _code_hash is None:
+        h = hashlib.sha256()
+        for name in SOURCE_MODULES:
+            h.update(name.encode('utf-8'))
+            spec = importlib.util.find_spec(name)
+            if spec is not None and hasattr(spec.loader, 'get_data'):
+                # This works for modules in a zipapp as well as files.
+                h.update(spec.loader.get_data(spec.origin))
+
+        _code_hash = h.hexdigest()
+
+    return _code_hash
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # The total size of the results, which is only found when it is
+        # first needed.  Other processes may add to the cache too, so this is
+        # an estimate that is corrected whenever the cache is cleaned up.
+        self.size = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, kind, text):
+        h = hashlib.sha256()
+        for part in [_get_code_hash(), kind, text]:
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+
+        key = h.hexdigest()
+        return os.path.join(self.directory, key[:2], key[2:] + FILE_SUFFIX)
+
+    # Returns the result of computing fn(text), which must be a value that
+    # can be stored as JSON, reusing the stored result if there is one.
+    def lookup(self, kind, text, fn):
+        path = self._path(kind, text)
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = json.load(f)
+
+            os.utime(path)
+            self.hits += 1
+            return value
+
+        except (OSError, ValueError):
+            # A missing result, or one that another process is replacing.
+            pass
+
+        self.misses += 1
+        value = fn(text)
+        self._store(path, value)
+        return value
+
+    # Returns a function that computes fn(text) through the cache, such as
+    # an answer formatter for pset_formatter.format_problem_file().
+    def cached(self, kind, fn):
+        return lambda text: self.lookup(kind, text, fn)
+
+    def _store(self, path, value):
+        data = json.dumps(value).encode('utf-8')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+
+        if self.size is None:
+            self.size = sum([e[2] for e in self._entries()])
+        else:
+            self.size += len(data)
+
+        if self.size > self.max_bytes:
+            self.evict()
+
+    # Returns (path, mtime, size) for each stored result.
+    def _entries(self):
+        entries = []
+        for (dirpath, dirnames, filenames) in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(FILE_SUFFIX):
+                    continue
+
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append( (path, st.st_mtime, st.st_size) )
+
+        return entries
+
+    # Removes the least recently used results until the cache is under its
+    # limit.
+    def evict(self):
+        entries = self._entries()
+        entries.sort(key=lambda e: e[1])
+
+        self.size = sum([e[2] for e in entries])
+        target = self.max_bytes * EVICT_TO_FRACTION
+        for (path, mtime, size) in entries:
+            if self.size <= target:
+                break
+
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # Another process removed it first.
+                pass
+
+            self.size -= size
+
+    def clear(self):
+        for (path, mtime, size) in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self.size = 0
+
+    def stats(self):
+        return {
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions,
+            'size'      : self.size,
+            'max_bytes' : self.max_bytes,
+        }
@@ -1,13 +1,24 @@
 import pkgutil, sys
 
-from pset import load_problem_file, PartType
+from pset import iter_problems, PartType
 from parser import *
 
 
-def check_problem(problems, pid, out):
-    sub = problems.get(pid, [])
+# Parses an answer, returning the messages for any syntax errors.
+def check_answer(text):
+    error_listener = UnderlineListener()
+    parse_stmts(text, error_listener)
+    return error_listener.errors
 
-    for s in sub:
+
+# Checks that the answers in the parts of a problem parse, printing a line for
+# each part.  Returns (answers, answers_with_errors).  If a ResultCache from
+# pset_cache is specified, answers that were checked before aren't parsed
+# again.
+def check_parts(parts, out, cache=None):
+    (answers, failed) = (0, 0)
+
+    for s in parts:
         if s[0] == PartType.COMMENT:
             print(" * %d lines of comments" % len(s[1]), file=out)
 
@@ -18,37 +29,45 @@ def check_problem(problems, pid, out):
             # Try to parse the text
 
             text = '\n'.join(s[1])
-            error_listener = UnderlineListener()
-
-            parser = parse_str(text)
-
-            parser.removeErrorListeners()
-            parser.addErrorListener(error_listener)
-            parse_tree = parser.relStmts()
+            if cache is not None:
+                errors = cache.lookup('check', text, check_answer)
+            else:
+                errors = check_answer(text)
 
-            if error_listener.errors:
-                err_msgs = "\n".join([m for m in error_listener.errors])
+            answers += 1
+            if errors:
+                err_msgs = "\n".join(errors)
                 desc += " - ERRORS ENCOUNTERED\n\n" + err_msgs
+                failed += 1
             else:
                 desc += " - parsed successfully"
 
             print(desc, file=out)
 
+    return (answers, failed)
+
 
-def check_problem_file(filename, out=sys.stdout, problem_ids=None):
-    problems = load_problem_file(filename)
+def check_problem(problems, pid, out, cache=None):
+    return check_parts(problems.get(pid, []), out, cache)
 
-    if problem_ids is None:
-        problem_ids = list(problems.keys())
-        problem_ids = [pid for pid in problem_ids if pid is not None]
-        problem_ids.sort()
 
-    if problems.get(None, []):
+# Checks the answers in a problem file, returning (answers,
+# answers_with_errors) over all of its problems.  The problems are checked
+# one at a time, sorted by ID unless sort is False.
+def check_problem_file(filename, out=sys.stdout, problem_ids=None,
+                       cache=None, sort=True):
+    problems = iter_problems(filename, problem_ids, sort)
+    counts = []
+
+    (pid, parts) = next(problems)
+    if parts:
         # Check the header contents.
         print("\nHeader", file=out)
-        check_problem(problems, None, out)
+        counts.append(check_parts(parts, out, cache))
 
-    for pid in problem_ids:
+    for (pid, parts) in problems:
         print("\n" + pid, file=out)
-        check_problem(problems, pid, out)
+        counts.append(check_parts(parts, out, cache))
+
+    return (sum([c[0] for c in counts]), sum([c[1] for c in counts]))
 
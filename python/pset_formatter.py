@@ -1,45 +1,78 @@
 import os, pkgutil, sys
 
-from pset import load_problem_file, PartType
+from pset import iter_problems, PartType
 
 
-def format_problem(problems, pid, answer_formatter, out):
-    sub = problems.get(pid, [])
-    for s in sub:
-        if s[0] == PartType.COMMENT:
-            print("<div class='comment'>", file=out)
+# The HTML is collected and written to the output in pieces of about this
+# many characters, rather than a line at a time.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+# Collects text and writes it to a file in large pieces.
+class BufferedWriter:
+    def __init__(self, out, size=WRITE_BUFFER_SIZE):
+        self.out = out
+        self.size = size
+        self.pieces = []
+        self.length = 0
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.length += len(text)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            self.out.write(''.join(self.pieces))
+            self.pieces = []
+            self.length = 0
+
 
+def format_parts(parts, answer_formatter, out):
+    for s in parts:
+        if s[0] == PartType.COMMENT:
             text = '\n'.join(s[1])
             text = text.replace('&', '&amp;')
             text = text.replace('<', '&lt;')
             text = text.replace('>', '&gt;')
-            print(text, file=out)
 
-            print("</div>", file=out)
+            out.write("<div class='comment'>\n%s\n</div>\n" % text)
 
         else:
             assert s[0] == PartType.ANSWER
 
-            print("<div class='answer'>", file=out)
-
             text = '\n'.join(s[1])
             text = answer_formatter(text)
 
-            print(text, file=out)
+            out.write("<div class='answer'>\n%s\n</div>\n" % text)
+
+
+def format_problem(problems, pid, answer_formatter, out):
+    format_parts(problems.get(pid, []), answer_formatter, out)
+
 
-            print("</div>", file=out)
+# Writes the problem set file as HTML, with the problems sorted by ID unless
+# sort is False or the problem IDs are specified.  Each problem is written as
+# it is read, so that only one problem is held in memory at a time.
+def format_problem_file(filename, answer_formatter, out=sys.stdout,
+                        problem_ids=None, embed_css=True, sort=True):
+    problems = iter_problems(filename, problem_ids, sort)
 
+    # Read the header first, so that an unreadable file fails before any of
+    # the output is written.
+    (pid, parts) = next(problems)
 
-def format_problem_file(filename, answer_formatter,
-                        out=sys.stdout, problem_ids=None, embed_css=True):
-    problems = load_problem_file(filename)
+    out = BufferedWriter(out)
+    try:
+        _format_problems(filename, parts, problems, answer_formatter, out,
+                         embed_css)
+    finally:
+        out.flush()
 
-    if problem_ids is None:
-        # Pull out all problem IDs that are not None, and sort them.
-        problem_ids = list(problems.keys())
-        problem_ids = [pid for pid in problem_ids if pid is not None]
-        problem_ids.sort()
 
+def _format_problems(filename, header_parts, problems, answer_formatter, out,
+                     embed_css):
     print("<html><head>", file=out)
 
     if embed_css:
@@ -65,14 +98,13 @@ def format_problem_file(filename, answer_formatter,
 
     print("<h1>File:  %s</h1>" % os.path.basename(filename), file=out)
 
-    if None in problems:
-        format_problem(problems, None, answer_formatter, out)
+    format_parts(header_parts, answer_formatter, out)
 
-    for pid in problem_ids:
+    for (pid, parts) in problems:
         print(pid)
 
         print("<h2 id='%s'>%s</h2>" % (pid, pid), file=out)
-        format_problem(problems, pid, answer_formatter, out)
+        format_parts(parts, answer_formatter, out)
 
     print("</body>", file=out)
     print("</html>", file=out)
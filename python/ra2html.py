@@ -61,6 +61,11 @@ class RelationalAlgebraToHtml(RelationalAlgebraVisitor):
         return s
 
 
+    # RelationalAlgebraParser#RelExprDistinct.
+    def visitRelExprDistinct(self, ctx:RelationalAlgebraParser.RelExprDistinctContext):
+        return "&delta;(" + self.visit(ctx.relExpr()) + ")"
+
+
     # Visit a parse tree produced by RelationalAlgebraParser#RelExprGroupAggregate.
     def visitRelExprGroupAggregate(self, ctx:RelationalAlgebraParser.RelExprGroupAggregateContext):
         s = ""
@@ -170,6 +175,24 @@ class RelationalAlgebraToHtml(RelationalAlgebraVisitor):
 
         return s
 
+    def visitRelExprSemiJoin(self, ctx:RelationalAlgebraParser.RelExprSemiJoinContext):
+        s = self.visit(ctx.relExpr(0)) + " &#x22c9;"
+        if ctx.scalarExpr() is not None:
+            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
+
+        s += " " + self.visit(ctx.relExpr(1))
+
+        return s
+
+    def visitRelExprAntiJoin(self, ctx:RelationalAlgebraParser.RelExprAntiJoinContext):
+        s = self.visit(ctx.relExpr(0)) + " &#x25b7;"
+        if ctx.scalarExpr() is not None:
+            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
+
+        s += " " + self.visit(ctx.relExpr(1))
+
+        return s
+
 
     # Visit a parse tree produced by RelationalAlgebraParser#RelExprSelect.
     def visitRelExprSelect(self, ctx:RelationalAlgebraParser.RelExprSelectContext):
@@ -312,12 +335,7 @@ class RelationalAlgebraToHtml(RelationalAlgebraVisitor):
 
 def format_relational_algebra(ra_str):
     error_listener = UnderlineListener()
-
-    parser = parse_str(ra_str)
-
-    parser.removeErrorListeners()
-    parser.addErrorListener(error_listener)
-    parse_tree = parser.relStmts()
+    parse_tree = parse_stmts(ra_str, error_listener)
     visitor = RelationalAlgebraToHtml()
 
     html = visitor.visit(parse_tree)
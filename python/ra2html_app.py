@@ -1,18 +1,25 @@
 import argparse, os, sys
 
-from pset_checker import check_problem_file
-from pset_formatter import format_problem_file
-from ra2html import format_relational_algebra
+# The app is often run once per file from build scripts, so it starts as
+# quickly as it can:  the parser, and the ANTLR runtime it needs, are only
+# imported once the arguments have been checked, and if a server started with
+# --serve is listening on the socket named by RA2HTML_SOCKET, the command is
+# forwarded to it and nothing else is imported at all.
+SOCKET_ENV = 'RA2HTML_SOCKET'
 
+# The default directory of the cache of results for answers.
+CACHE_ENV = 'RA2HTML_CACHE'
 
-def main():
+
+def make_arg_parser():
     parser = argparse.ArgumentParser(
         description="Converts a relational algebra markup file into an HTML " \
                     "file using the relational algebra notation.")
 
-    parser.add_argument("input",
+    parser.add_argument("input", nargs="*",
         help="Path and filename of input relational algebra file to " \
-             "convert to HTML")
+             "convert to HTML.  Several files, directories and glob " \
+             "patterns may be given to check or convert many files at once.")
 
     parser.add_argument("-o", "--output",
         help="Specify the path and filename of where to store the output " \
@@ -24,15 +31,126 @@ def main():
         help="Causes the converter to perform a \"dry run\" of the file " \
              "conversion, without storing the output file.")
 
-    args = parser.parse_args()
+    parser.add_argument("--file-order", action="store_true",
+        help="Write the problems in the order they appear in the input " \
+             "file, rather than sorted by problem ID.  Each problem is " \
+             "then written as soon as it is read, without indexing the " \
+             "file first.")
+
+    parser.add_argument("-j", "--jobs", type=int,
+        help="Number of worker processes used to process many files.  " \
+             "Defaults to the number of CPUs.")
+
+    parser.add_argument("--pattern", default="*.txt",
+        help="File name pattern of the files to process in directories.  " \
+             "Defaults to %(default)s.")
+
+    parser.add_argument("--report",
+        help="When processing many files, write the report to this file " \
+             "rather than to standard output.")
+
+    parser.add_argument("--cache", default=os.environ.get(CACHE_ENV),
+        help="Directory of a cache of the HTML and errors produced for each " \
+             "answer, so that answers that haven't changed since an earlier " \
+             "run aren't processed again.  Defaults to the %s environment " \
+             "variable; without either, nothing is cached." % CACHE_ENV)
+
+    parser.add_argument("--cache-size", type=int, default=256,
+        help="Maximum size of the cache in megabytes; the least recently " \
+             "used results are removed beyond this.  Defaults to " \
+             "%(default)s.")
+
+    parser.add_argument("--parser",
+        help="Specify the parser front end to use:  antlr, fast or check.  " \
+             "The fast parser is used by default, unless the RA_PARSER " \
+             "environment variable selects another.")
+
+    parser.add_argument("--serve", metavar="SOCKET",
+        help="Run as a server listening on the specified Unix socket.  " \
+             "When the %s environment variable names the socket, the app " \
+             "forwards its commands to the server instead of running them " \
+             "itself." % SOCKET_ENV)
+
+    return parser
+
+
+# Runs the command with the specified arguments, returning its exit status.
+def run(argv):
+    arg_parser = make_arg_parser()
+    args = arg_parser.parse_args(argv)
+
+    if args.serve is not None:
+        from ra2html_server import serve
+
+        # Import everything up front, so that the first command is as fast
+        # as the rest.
+        import pset_checker, pset_formatter, ra2html
+        serve(args.serve, run)
+        return 0
+
+    if not args.input:
+        arg_parser.error("the input file is required")
+
+    first = args.input[0]
+    batch = len(args.input) > 1 or os.path.isdir(first) or \
+            (not os.path.isfile(first) and any([c in first for c in '*?[']))
+    if batch and args.output is not None:
+        arg_parser.error("-o can only be used with a single input file")
+
+    from parser import get_front_end, set_front_end
+
+    # A server runs many commands, so the front end is restored afterward.
+    front_end = get_front_end()
+    if args.parser is not None:
+        set_front_end(args.parser)
+
+    cache = None
+    if args.cache is not None:
+        from pset_cache import ResultCache
+        cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+
+    try:
+        if batch:
+            return convert_batch(args, cache)
+
+        return convert(args, cache)
+    finally:
+        set_front_end(front_end)
 
+
+# Checks or converts many files with a pool of worker processes, writing one
+# report for all of them.
+def convert_batch(args, cache):
+    from pset_batch import CHECK, FORMAT, run_batch
+
+    mode = CHECK if args.dry_run else FORMAT
+    try:
+        if args.report is not None:
+            with open(args.report, 'w') as f:
+                results = run_batch(args.input, mode, args.jobs, args.pattern,
+                                    f, cache, not args.file_order)
+
+            print("Wrote report on %d files to %s" % \
+                  (len(results), args.report))
+        else:
+            results = run_batch(args.input, mode, args.jobs, args.pattern,
+                                cache=cache, sort=not args.file_order)
+
+    except ValueError as e:
+        print("ERROR:  %s" % e)
+        return 1
+
+    return 1 if any([r.error is not None for r in results]) else 0
+
+
+def convert(args, cache):
     if args.dry_run:
         print("Performing a dry-run through the input file.")
 
-    infile = args.input
+    infile = args.input[0]
     if not os.path.isfile(infile):
         print("ERROR:  %s is not a file" % infile)
-        sys.exit(1)
+        return 1
 
     print("Reading from input file:  %s" % infile)
 
@@ -43,16 +161,46 @@ def main():
         outfile = parts[0] + '.html'
 
     if args.dry_run:
+        from pset_checker import check_problem_file
+
         print("Dry run:  Would write to output file %s" % outfile)
 
-        check_problem_file(infile, sys.stdout)
+        check_problem_file(infile, sys.stdout, cache=cache,
+                           sort=not args.file_order)
     else:
+        from pset_formatter import format_problem_file
+        from ra2html import format_relational_algebra
+
         print("Writing to output file:  %s" % outfile)
 
+        formatter = format_relational_algebra
+        if cache is not None:
+            formatter = cache.cached('html', formatter)
+
         with open(outfile, 'w') as f:
-            format_problem_file(infile, format_relational_algebra, f)
+            format_problem_file(infile, formatter, f,
+                                sort=not args.file_order)
+
+    return 0
+
+
+def main():
+    argv = sys.argv[1:]
+
+    socket_path = os.environ.get(SOCKET_ENV)
+    serving = any([a.split('=')[0] == '--serve' for a in argv])
+    if socket_path and not serving:
+        from ra2html_server import forward
+
+        response = forward(socket_path, argv)
+        if response is not None:
+            (status, out, err) = response
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            sys.exit(status)
+
+    sys.exit(run(argv))
 
 
 if __name__ == "__main__":
     main()
-
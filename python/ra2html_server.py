@@ -0,0 +1,108 @@
+# A server that runs ra2html_app commands in a long-lived process, so that a
+# build script that converts many files doesn't start Python and import the
+# parser for each of them.
+#
+# The server is started with "ra2html_app --serve SOCKET".  When the
+# RA2HTML_SOCKET environment variable names the same socket, ra2html_app sends
+# its arguments and working directory to the server, which runs the command
+# there and sends back its output and exit status; if no server is listening,
+# ra2html_app runs the command itself.  Commands are run one at a time, since
+# they change the working directory and capture the process's output.
+
+import contextlib, io, json, os, signal, socket, socketserver, traceback
+
+
+def _read_all(sock):
+    chunks = []
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+
+        chunks.append(data)
+
+    return b''.join(chunks)
+
+
+# Sends a command to the server listening on the socket.  Returns the
+# command's (status, stdout, stderr), or None if no server is listening.
+def forward(socket_path, argv):
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return None
+
+        request = {'argv' : argv, 'cwd' : os.getcwd()}
+        sock.sendall(json.dumps(request).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+
+        response = json.loads(_read_all(sock).decode('utf-8'))
+    finally:
+        sock.close()
+
+    return (response['status'], response['stdout'], response['stderr'])
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.read().decode('utf-8'))
+
+        out = io.StringIO()
+        err = io.StringIO()
+        cwd = os.getcwd()
+        try:
+            os.chdir(request['cwd'])
+            with contextlib.redirect_stdout(out), \
+                 contextlib.redirect_stderr(err):
+                status = self.server.run_fn(request['argv'])
+
+        except SystemExit as e:
+            # Raised by argparse for --help and bad arguments.
+            if isinstance(e.code, int) or e.code is None:
+                status = e.code or 0
+            else:
+                print(e.code, file=err)
+                status = 1
+
+        except Exception:
+            err.write(traceback.format_exc())
+            status = 1
+
+        finally:
+            os.chdir(cwd)
+
+        response = {'status' : status, 'stdout' : out.getvalue(),
+                    'stderr' : err.getvalue()}
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+
+# Runs commands sent to the socket with run_fn, which takes a command's
+# arguments and returns its exit status, until the server is interrupted or
+# terminated.
+def serve(socket_path, run_fn):
+    if forward(socket_path, ['--help']) is not None:
+        raise ValueError('A server is already listening on %s' % socket_path)
+
+    # The socket file of a server that has exited may be left behind.
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socketserver.UnixStreamServer(socket_path, _CommandHandler)
+    server.run_fn = run_fn
+    print("Serving ra2html commands on %s" % socket_path)
+
+    # Stop in the same way on SIGTERM as on Ctrl-C, removing the socket.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,287 @@
+import pickle, tempfile
+
+from ra_scalar import AggregateCall, AttrRef, FuncCall, UnaryOp, BinaryOp
+
+
+# The default limit on the number of groups that a GROUP operator keeps in
+# memory at once.  Beyond this, partially aggregated groups are spilled to
+# temporary files and combined at the end.
+DEFAULT_MAX_GROUPS = 100000
+
+# The number of files that spilled groups are partitioned across.
+NUM_SPILL_PARTITIONS = 16
+
+
+# === AGGREGATE FUNCTIONS ====================================================
+#
+# Each aggregate function keeps a small state value per group, which is
+# updated with each value of the aggregate's argument.  Partial states for the
+# same group can be merged, which is how groups that were spilled to disk are
+# combined.  When rows are counted (see ra_bag), a value that occurs several
+# times is passed to step_many() once, with the number of times.  Following
+# the usual SQL rules, null values are ignored, and aggregates other than the
+# counts are null for a group with no other values.
+
+class CountAggregate:
+    def initial(self):
+        return 0
+
+    def step(self, state, value):
+        return state + 1 if value is not None else state
+
+    def step_many(self, state, value, count):
+        return state + count if value is not None else state
+
+    def merge(self, state1, state2):
+        return state1 + state2
+
+    def final(self, state):
+        return state
+
+
+class CountDistinctAggregate:
+    # This is the one aggregate whose state grows with the size of the group,
+    # since every distinct value must be remembered.
+    def initial(self):
+        return set()
+
+    def step(self, state, value):
+        if value is not None:
+            state.add(value)
+
+        return state
+
+    def step_many(self, state, value, count):
+        return self.step(state, value)
+
+    def merge(self, state1, state2):
+        return state1 | state2
+
+    def final(self, state):
+        return len(state)
+
+
+class SumAggregate:
+    def initial(self):
+        return None
+
+    def step(self, state, value):
+        if value is None:
+            return state
+
+        return value if state is None else state + value
+
+    def step_many(self, state, value, count):
+        if value is None:
+            return state
+
+        return self.step(state, value * count)
+
+    def merge(self, state1, state2):
+        if state1 is None:
+            return state2
+        elif state2 is None:
+            return state1
+
+        return state1 + state2
+
+    def final(self, state):
+        return state
+
+
+class AvgAggregate:
+    # The state is a (sum, count) pair.
+    def initial(self):
+        return (0, 0)
+
+    def step(self, state, value):
+        if value is None:
+            return state
+
+        return (state[0] + value, state[1] + 1)
+
+    def step_many(self, state, value, count):
+        if value is None:
+            return state
+
+        return (state[0] + value * count, state[1] + count)
+
+    def merge(self, state1, state2):
+        return (state1[0] + state2[0], state1[1] + state2[1])
+
+    def final(self, state):
+        return state[0] / state[1] if state[1] > 0 else None
+
+
+class MinMaxAggregate:
+    def __init__(self, choose):
+        # choose is min or max
+        self.choose = choose
+
+    def initial(self):
+        return None
+
+    def step(self, state, value):
+        if value is None:
+            return state
+
+        return value if state is None else self.choose(state, value)
+
+    def step_many(self, state, value, count):
+        return self.step(state, value)
+
+    def merge(self, state1, state2):
+        return self.step(state1, state2)
+
+    def final(self, state):
+        return state
+
+
+AGGREGATES = {
+    'count'          : CountAggregate(),
+    'count_distinct' : CountDistinctAggregate(),
+    'sum'            : SumAggregate(),
+    'avg'            : AvgAggregate(),
+    'min'            : MinMaxAggregate(min),
+    'max'            : MinMaxAggregate(max),
+}
+
+
+# Returns the list of aggregate calls in an expression.
+def find_aggregates(expr):
+    if isinstance(expr, AggregateCall):
+        return [expr]
+    elif isinstance(expr, FuncCall):
+        return sum([find_aggregates(a) for a in expr.args], [])
+    elif isinstance(expr, UnaryOp):
+        return find_aggregates(expr.operand)
+    elif isinstance(expr, BinaryOp):
+        return find_aggregates(expr.lhs) + find_aggregates(expr.rhs)
+
+    return []
+
+
+# Returns a copy of the expression where each aggregate call is replaced by a
+# reference to the attribute named for it in the specified map, keyed by the
+# string form of the aggregate call.
+def replace_aggregates(expr, names):
+    if isinstance(expr, AggregateCall):
+        return AttrRef(names[str(expr)])
+    elif isinstance(expr, FuncCall):
+        return FuncCall(expr.name, [replace_aggregates(a, names)
+                                    for a in expr.args])
+    elif isinstance(expr, UnaryOp):
+        return UnaryOp(expr.op, replace_aggregates(expr.operand, names))
+    elif isinstance(expr, BinaryOp):
+        return BinaryOp(expr.op, replace_aggregates(expr.lhs, names),
+                        replace_aggregates(expr.rhs, names))
+
+    return expr
+
+
+# === HASH AGGREGATION =======================================================
+
+# Temporary files holding partially aggregated groups, partitioned by the hash
+# of the group key so that all partial states for a group end up in the same
+# file.
+class _SpillFiles:
+    def __init__(self, num_partitions):
+        self.files = [tempfile.TemporaryFile()
+                      for i in range(num_partitions)]
+
+    def write(self, table):
+        partitions = [[] for f in self.files]
+        for item in table.items():
+            partitions[hash(item[0]) % len(self.files)].append(item)
+
+        for (f, items) in zip(self.files, partitions):
+            if items:
+                pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+
+    # Generates the contents of each partition in turn, as lists of
+    # (key, states) pairs.  The files are closed afterward.
+    def partitions(self):
+        try:
+            for f in self.files:
+                f.seek(0)
+                items = []
+                while True:
+                    try:
+                        items.extend(pickle.load(f))
+                    except EOFError:
+                        break
+
+                yield items
+                f.close()
+
+        finally:
+            for f in self.files:
+                f.close()
+
+
+# Groups the rows by the key computed by key_fn, and computes the aggregates
+# over each group.  args_fn computes the tuple of argument values for the
+# aggregates from a row.  Generates a (key, values) pair for each group,
+# where values is the list of aggregate results.
+#
+# Only the aggregate state of each group is kept, never the rows in it.  If
+# there are more than max_groups groups at once, the partial states are
+# spilled to disk and the groups are finished one partition at a time.  When
+# empty_group is specified, that key gets a group even if there are no rows.
+# If counted is True, the rows are (row, count) pairs.
+def hash_aggregate(rows, key_fn, args_fn, aggregates,
+                   max_groups=DEFAULT_MAX_GROUPS, empty_group=None,
+                   counted=False):
+    table = {}
+    spill = None
+    indexes = range(len(aggregates))
+
+    for row in rows:
+        if counted:
+            (row, count) = row
+
+        key = key_fn(row)
+        states = table.get(key)
+        if states is None:
+            if len(table) >= max_groups:
+                if spill is None:
+                    spill = _SpillFiles(NUM_SPILL_PARTITIONS)
+
+                spill.write(table)
+                table = {}
+
+            states = table[key] = [a.initial() for a in aggregates]
+
+        values = args_fn(row)
+        if counted:
+            for i in indexes:
+                states[i] = aggregates[i].step_many(states[i], values[i],
+                                                    count)
+        else:
+            for i in indexes:
+                states[i] = aggregates[i].step(states[i], values[i])
+
+    if spill is None:
+        if not table and empty_group is not None:
+            table[empty_group] = [a.initial() for a in aggregates]
+
+        for (key, states) in table.items():
+            yield (key, [a.final(s) for (a, s) in zip(aggregates, states)])
+
+        return
+
+    spill.write(table)
+    table = None
+
+    for items in spill.partitions():
+        merged = {}
+        for (key, states) in items:
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = states
+            else:
+                for i in indexes:
+                    existing[i] = aggregates[i].merge(existing[i], states[i])
+
+        for (key, states) in merged.items():
+            yield (key, [a.final(s) for (a, s) in zip(aggregates, states)])
@@ -0,0 +1,369 @@
+# Bag semantics, where a relation may hold the same row more than once.
+#
+# PlanExecutor follows the relational algebra in treating relations as sets,
+# so every input it materializes and every result it produces is collected
+# into a set, hashing each whole row to find the duplicates.  BagExecutor
+# instead runs plans with bag semantics, as SQL does:  a projection keeps a
+# row for every input row, and aggregates count and sum every one of them.
+#
+# The streams of a BagExecutor pass each row along with the number of times
+# that it occurs, as a (row, count) pair.  Operators work out the counts of
+# their output from those of their input rather than comparing whole rows:
+# selections and projections keep each row's count, joins and Cartesian
+# products multiply the counts of the rows they pair up, and GROUP weights
+# each row's aggregate arguments by its count.  UNION adds counts, INTERSECT
+# keeps the smaller count and MINUS subtracts them, like SQL's UNION ALL,
+# INTERSECT ALL and EXCEPT ALL.  Equal rows are only combined by DELTA, which
+# removes duplicates where a query asks for it, and when a result is
+# materialized into a BagRelationValue.  Division works on distinct rows, and
+# the right side of a join is just collected into a list.
+#
+# Joins are never turned into semi-joins in plans that are run this way,
+# since a semi-join passes each row along once, however many rows it matches.
+# Scripts and materialized views are always run with set semantics.
+
+import itertools, operator
+
+from relation import RelationValue, RowStream
+from ra_scalar import compile_predicate, compile_projection
+from ra_join import INNER_JOIN, LEFT_OUTER_JOIN, FULL_OUTER_JOIN, \
+    compile_match_fn, divide_rows, index_join_keys, index_join_pairs, \
+    index_semi_join_rows, join_pairs, join_rows, semi_join_rows
+from ra_index import HASH_INDEX
+from ra_columnar import ColumnarRelationValue
+from ra_plan import SET_UNION, SET_INTERSECT, SET_DIFFERENCE
+from ra_eval import PlanExecutor
+
+
+# A relation-value that may hold each row several times.  counts maps each
+# distinct row to the number of times it occurs.  rows are the distinct rows,
+# so that code written for relation-values that are sets, such as indexes and
+# statistics, sees each row once.
+class BagRelationValue(RelationValue):
+    def __init__(self, attributes=None, counted_rows=()):
+        self.attributes = attributes
+        self.attr_index = None
+
+        self.counts = {}
+        for (row, count) in counted_rows:
+            self.counts[row] = self.counts.get(row, 0) + count
+
+    @property
+    def rows(self):
+        return self.counts.keys()
+
+    def add_row(self, row, count=1):
+        self._check_row(row)
+        self.counts[row] = self.counts.get(row, 0) + count
+
+    # Returns the number of rows, counting each as many times as it occurs.
+    def total_rows(self):
+        return sum(self.counts.values())
+
+    def copy(self):
+        return BagRelationValue(self.attributes, self.counts.items())
+
+    def _describe_row(self, row):
+        count = self.counts[row]
+        return str(row) if count == 1 else '%s  x %d' % (row, count)
+
+
+# Pairs each of the rows of a relation-value with the number of times it
+# occurs in the relation-value.
+def _with_counts(relval, rows):
+    if isinstance(relval, BagRelationValue):
+        counts = relval.counts
+        return ((row, counts[row]) for row in rows)
+
+    return zip(rows, itertools.repeat(1))
+
+
+# A RowStream whose rows are (row, count) pairs.
+class BagRowStream(RowStream):
+    @staticmethod
+    def from_relval(relval):
+        return BagRowStream(relval.attributes, None, relval)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            return _with_counts(self.source, self.source.rows)
+
+        return self._rows
+
+    # Returns the number of pairs if it is known without consuming the
+    # stream, or None otherwise.
+    def num_rows(self):
+        if isinstance(self._rows, list):
+            return len(self._rows)
+
+        return super().num_rows()
+
+    # Returns a stream over the same pairs that can be iterated over more
+    # than once.  The pairs are put in a list, without combining equal rows;
+    # this includes the pairs of a stream over a relation-value, whose rows
+    # are paired with their counts each time they are fetched.
+    def collect(self):
+        if isinstance(self._rows, list):
+            return self
+
+        return BagRowStream(self.attributes, list(self.rows))
+
+    # Combines the pairs of the stream into a BagRelationValue.  The stream
+    # cannot be used afterward.
+    def materialize(self):
+        if isinstance(self.source, BagRelationValue):
+            return self.source
+
+        return BagRelationValue(self.attributes, self.rows)
+
+
+# Wraps a combine function from ra_join, which builds a join's output row
+# from a left and a right row, so that it takes and produces (row, count)
+# pairs.
+def _counted_combiner(combine):
+    def combine_counted(lhs, rhs):
+        if lhs is None:
+            return (combine(None, rhs[0]), rhs[1])
+        elif rhs is None:
+            return (combine(lhs[0], None), lhs[1])
+
+        return (combine(lhs[0], rhs[0]), lhs[1] * rhs[1])
+
+    return combine_counted
+
+
+# Looks up the rows of a relation variable in one of its hash indexes, as
+# (row, count) pairs.
+class _CountedIndex:
+    def __init__(self, index, relval):
+        self.index = index
+        self.relval = relval
+
+    def lookup(self, key):
+        return _with_counts(self.relval, self.index.lookup(key))
+
+
+# Generates the pairs of the intersection of the left pairs with a bag, given
+# by a map of its rows' counts.  The counts are used up as they are matched.
+def _intersect_rows(pairs, counts):
+    for (row, count) in pairs:
+        available = counts.get(row, 0)
+        if available > 0:
+            n = min(count, available)
+            counts[row] = available - n
+            yield (row, n)
+
+
+# Generates the pairs of the difference of the left pairs and a bag, given by
+# a map of its rows' counts.  The counts are used up as they are subtracted.
+def _difference_rows(pairs, counts):
+    for (row, count) in pairs:
+        removed = min(count, counts.get(row, 0))
+        if removed > 0:
+            counts[row] -= removed
+
+        if count > removed:
+            yield (row, count - removed)
+
+
+# Executes a logical plan from ra_plan with bag semantics, producing a
+# BagRelationValue.  Relation variables whose values are ordinary
+# relation-values are read as bags that hold each of their rows once.
+class BagExecutor(PlanExecutor):
+
+    bag_semantics = True
+
+
+    def visitRelVarNode(self, node):
+        relval = self.database.get_relvar(node.name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % node.name)
+
+        return BagRowStream.from_relval(relval)
+
+
+    def visitIndexScanNode(self, node):
+        relval = self.database.get_relvar(node.name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % node.name)
+
+        return BagRowStream(relval.get_attrs(),
+            _with_counts(relval, self._index_scan_rows(node, relval)))
+
+
+    # An empty constant relation-value has no attributes, so the node's
+    # attributes are used.
+    def visitConstantNode(self, node):
+        return BagRowStream(list(node.attrs),
+                            _with_counts(node.relval, node.relval.rows))
+
+
+    def visitSelectNode(self, node):
+        input_stream = self.stream(node.child)
+
+        if isinstance(input_stream.source, ColumnarRelationValue):
+            result = input_stream.source.select(node.pred)
+            if result is not None:
+                return BagRowStream.from_relval(result)
+
+        pred_fn = compile_predicate(node.pred, input_stream.get_attr_index)
+
+        return BagRowStream(input_stream.get_attrs(),
+            filter(lambda pair: pred_fn(pair[0]), input_stream.rows))
+
+
+    # Unlike PlanExecutor, this never evaluates a columnar relation-value a
+    # column at a time, since that would remove the duplicates.
+    def visitProjectNode(self, node):
+        input_stream = self.stream(node.child)
+        project_fn = compile_projection(node.exprs,
+                                        input_stream.get_attr_index)
+
+        return BagRowStream(list(node.attrs), ((project_fn(row), count)
+            for (row, count) in input_stream.rows))
+
+
+    def visitDistinctNode(self, node):
+        input_stream = self.stream(node.child)
+
+        if input_stream.source is not None:
+            # The rows of a relation-value are distinct already.
+            rows = input_stream.source.rows
+        else:
+            rows = dict.fromkeys(map(operator.itemgetter(0),
+                                     input_stream.rows))
+
+        return BagRowStream(input_stream.get_attrs(),
+                            zip(rows, itertools.repeat(1)))
+
+
+    def visitGroupNode(self, node):
+        input_stream = self.stream(node.child)
+
+        return BagRowStream(list(node.attrs), zip(
+            self._group_rows(node, input_stream, counted=True),
+            itertools.repeat(1)))
+
+
+    def visitCrossNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1]).collect()
+
+        result_attrs = lhs.get_attrs() + rhs.get_attrs()
+        rhs_rows = rhs.rows
+
+        return BagRowStream(result_attrs,
+            ((lhs_row + rhs_row, lhs_count * rhs_count)
+             for (lhs_row, lhs_count) in lhs.rows
+             for (rhs_row, rhs_count) in rhs_rows))
+
+
+    def visitJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1]).collect()
+
+        if node.join_type in [LEFT_OUTER_JOIN, FULL_OUTER_JOIN]:
+            lhs = lhs.collect()
+
+        (cond, result_attrs, combine) = self._join_condition(node, lhs, rhs)
+
+        pairs = join_pairs(lhs, rhs, cond, node.join_type, counted=True)
+        return BagRowStream(result_attrs, join_rows(pairs, node.join_type,
+            lhs.rows, rhs.rows, _counted_combiner(combine)))
+
+
+    def visitIndexJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+        index = self._counted_index(node)
+
+        if node.join_type != INNER_JOIN:
+            if node.index_lhs:
+                rhs = rhs.collect()
+            else:
+                lhs = lhs.collect()
+
+        (cond, result_attrs, combine) = self._join_condition(node, lhs, rhs)
+
+        (indexed, probe) = (lhs, rhs) if node.index_lhs else (rhs, lhs)
+        (probe_exprs, equi_keys, leftover) = index_join_keys(cond,
+            node.index_attrs, indexed.get_attr_index, node.index_lhs)
+        key_fn = compile_projection(probe_exprs, probe.get_attr_index)
+
+        pairs = index_join_pairs(probe.rows, lambda pair: key_fn(pair[0]),
+            index, compile_match_fn(lhs, rhs, leftover, True, equi_keys),
+            node.index_lhs)
+
+        (lhs_rows, rhs_rows) = ((), probe.rows) if node.index_lhs \
+                               else (probe.rows, ())
+        return BagRowStream(result_attrs, join_rows(pairs, node.join_type,
+            lhs_rows, rhs_rows, _counted_combiner(combine)))
+
+
+    # Each row of the left input keeps its count, however many rows of the
+    # right input it matches.
+    def visitSemiJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+
+        return BagRowStream(lhs.get_attrs(), semi_join_rows(lhs, rhs,
+            self._semi_join_condition(node, lhs, rhs), node.join_type,
+            counted=True))
+
+
+    def visitIndexSemiJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+        index = self._counted_index(node)
+
+        cond = self._semi_join_condition(node, lhs, rhs)
+        (indexed, probe) = (lhs, rhs) if node.index_lhs else (rhs, lhs)
+        (probe_exprs, equi_keys, leftover) = index_join_keys(cond,
+            node.index_attrs, indexed.get_attr_index, node.index_lhs)
+        key_fn = compile_projection(probe_exprs, probe.get_attr_index)
+
+        return BagRowStream(lhs.get_attrs(), index_semi_join_rows(probe.rows,
+            lambda pair: key_fn(pair[0]), index,
+            compile_match_fn(lhs, rhs, leftover, True, equi_keys),
+            node.join_type, node.index_lhs))
+
+
+    def _counted_index(self, node):
+        return _CountedIndex(
+            self.database.get_index(node.indexed.name, node.index_attrs,
+                                    HASH_INDEX),
+            self.database.get_relvar(node.indexed.name))
+
+
+    # Division is defined on sets, so it is computed from the distinct rows
+    # of its inputs, and each quotient value occurs once.
+    def visitDivideNode(self, node):
+        lhs = self.stream(node.children[0]).materialize()
+        rhs = self.stream(node.children[1]).materialize()
+
+        return BagRowStream(list(node.attrs), zip(
+            divide_rows(lhs.rows, rhs.rows, node.quotient, node.shared),
+            itertools.repeat(1)))
+
+
+    def visitSetOpNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+        if lhs.num_attrs() != rhs.num_attrs():
+            raise ValueError("Arity of LHS is %d, but RHS is %d" % \
+                             (lhs.num_attrs(), rhs.num_attrs()))
+
+        if node.op == SET_UNION:
+            rows = itertools.chain(lhs.rows, rhs.rows)
+        else:
+            # The right input may be a relation variable's value, whose
+            # counts must not be changed.
+            counts = dict(rhs.materialize().counts)
+            if node.op == SET_INTERSECT:
+                rows = _intersect_rows(lhs.rows, counts)
+            else:
+                assert node.op == SET_DIFFERENCE
+                rows = _difference_rows(lhs.rows, counts)
+
+        return BagRowStream(lhs.get_attrs(), rows)
@@ -0,0 +1,498 @@
+# Benchmarks for the evaluator, the parser and the HTML formatter.
+#
+# The evaluator benchmarks run a query for each kind of operator over
+# synthetic relations, whose sizes, arities, value skew and selectivities are
+# set from the command line.  The relations are generated from a fixed seed,
+# so that runs with the same settings always do the same work.  The parser
+# and formatter benchmarks run over a problem set file, which is generated if
+# one isn't specified; parse_antlr always parses it with the ANTLR parser, so
+# that the speedup of the selected front end over ANTLR is reported too.
+#
+# Each benchmark is run once to warm up, and is then timed over several runs.
+# The results are printed as a table, and can also be written out as JSON
+# along with the settings and a description of the machine, so that results
+# from different revisions can be compared; --compare reports the change
+# from an earlier results file.
+
+import argparse, contextlib, datetime, io, itertools, json, os, platform, \
+    random, statistics, subprocess, sys, tempfile, time
+
+from parser import FRONT_ENDS, get_front_end, set_front_end
+from relation import RelationValue, Database
+from ra_columnar import ColumnarDatabase, numpy
+from ra_index import HASH_INDEX, SORTED_INDEX
+from ra_eval import eval_ra_expr
+
+
+DEFAULT_ROWS = 10000
+DEFAULT_ARITY = 4
+DEFAULT_DISTINCT = 100
+DEFAULT_SELECTIVITY = 0.1
+DEFAULT_REPEAT = 5
+DEFAULT_PROBLEMS = 200
+
+# A benchmark whose median time grows by more than this factor over the
+# baseline is reported as a regression by --compare.
+DEFAULT_THRESHOLD = 1.2
+
+
+# === SYNTHETIC DATA =========================================================
+
+# Returns a function that draws n values from range(distinct).  With a skew of
+# 0 every value is equally likely; otherwise the values follow a Zipf
+# distribution, where the k-th value has a weight of 1 / k**skew.
+def value_generator(rng, distinct, skew=0.0):
+    values = range(distinct)
+    if skew == 0:
+        return lambda n: [rng.randrange(distinct) for i in range(n)]
+
+    weights = list(itertools.accumulate([1 / (k + 1) ** skew
+                                         for k in values]))
+    return lambda n: rng.choices(values, cum_weights=weights, k=n)
+
+
+# Generates a relation-value with the specified attributes and number of
+# rows.  The first attribute numbers the rows from start, so that the rows are
+# all distinct and selections on it have an exact selectivity; the values of
+# the other attributes are drawn from range(distinct).
+def generate_relation(name, attrs, num_rows, distinct=DEFAULT_DISTINCT,
+                      skew=0.0, seed=0, start=0):
+    rng = random.Random(seed)
+    generate = value_generator(rng, distinct, skew)
+
+    columns = [range(start, start + num_rows)]
+    columns += [generate(num_rows) for a in attrs[1:]]
+
+    return RelationValue(['%s.%s' % (name, a) for a in attrs],
+                         zip(*columns))
+
+
+# Builds the database that the evaluator benchmarks run against:
+#
+#   r(id, a, b, ...)   The main relation, with the specified number of rows.
+#   r2(id, a, b, ...)  Half of the rows of r, and as many new ones.
+#   ri(id, a, b, ...)  A copy of r, with a sorted index on id and a hash
+#                      index on a.
+#   s(a, sv)           A row for each value of r.a.
+#   si(a, sv)          A copy of s, with a hash index on a.
+#   d(b)               A few values of r.b, to divide by.
+def make_database(settings):
+    db = ColumnarDatabase() if settings.columnar else Database()
+    n = settings.rows
+
+    attrs = ['id'] + [chr(ord('a') + i) for i in range(settings.arity - 1)]
+
+    r = generate_relation('r', attrs, n, settings.distinct, settings.skew,
+                          seed=1)
+    db.set_relvar('r', r)
+    db.set_relvar('ri', RelationValue(['ri.%s' % a for a in attrs], r.rows))
+    db.create_index('ri', ['ri.id'], SORTED_INDEX)
+    db.create_index('ri', ['ri.a'], HASH_INDEX)
+
+    new_rows = generate_relation('r2', attrs, n - n // 2, settings.distinct,
+                                 settings.skew, seed=2, start=n).rows
+    db.set_relvar('r2', RelationValue(['r2.%s' % a for a in attrs],
+        [row for row in r.rows if row[0] >= n // 2] + list(new_rows)))
+
+    for name in ['s', 'si']:
+        db.set_relvar(name, generate_relation(name, ['a', 'sv'],
+                                              settings.distinct,
+                                              settings.distinct, seed=3))
+
+    db.create_index('si', ['si.a'], HASH_INDEX)
+    db.set_relvar('d', generate_relation('d', ['b'], min(3, settings.distinct)))
+
+    return db
+
+
+# The evaluator benchmarks, as (name, query) pairs.  The queries are
+# formatted with these values:
+#
+#   t         The id below which a selection keeps the specified fraction of
+#             the rows of r.
+#   v         The number of distinct values of the non-key attributes.
+#   k         The number of rows of r whose product with s has about as many
+#             rows as r.
+#   constant  The rows of a constant relation.
+EVAL_BENCHMARKS = [
+    ('relvar',             'r;'),
+    ('constant',           '{%(constant)s};'),
+    ('select',             'SIGMA[id < %(t)d](r);'),
+    ('select_expr',        'SIGMA[a + b < %(v)d and a <> 1](r);'),
+    ('select_index_key',   'SIGMA[a = 1](ri);'),
+    ('select_index_range', 'SIGMA[id < %(t)d](ri);'),
+    ('project',            'PI[a, b](r);'),
+    ('project_expr',       'PI[id, a * 2 + b AS x](r);'),
+    ('group',              '[a]GROUP[count() AS n, sum(b) AS total, ' \
+                           'avg(b) AS mean](r);'),
+    ('group_all',          'GROUP[count() AS n, max(b) AS top](r);'),
+    ('cross',              'SIGMA[id < %(k)d](r) CROSS s;'),
+    ('natural_join',       'r BOWTIE s;'),
+    ('equi_join',          'r BOWTIE[r.a = s.a] s;'),
+    ('range_join',         'SIGMA[id < %(k)d](r) BOWTIE[r.b < s.sv] s;'),
+    ('index_join',         'r BOWTIE si;'),
+    ('left_outer_join',    'r LBOWTIE s;'),
+    ('right_outer_join',   'r RBOWTIE s;'),
+    ('full_outer_join',    'r FBOWTIE s;'),
+    ('join_chain',         'r BOWTIE s BOWTIE d;'),
+    ('divide',             'PI[a, b](r) DIVIDE d;'),
+    ('union',              'r UNION r2;'),
+    ('intersect',          'r INTERSECT r2;'),
+    ('minus',              'r MINUS r2;'),
+    ('distinct',           'DELTA(PI[a, b](r));'),
+    ('project_group',      '[a]GROUP[count() AS n](PI[a, b](r));'),
+]
+
+
+# Statements that generated problem sets are made of, which use all of the
+# grammar's operators.
+PSET_STATEMENTS = [
+    'R = (a, b, c);',
+    'r <- { (1, "a", 1.0), (-2, "b", -2.0), (3, null, true) };',
+    'SIGMA[a > 5 and b <> "x"](r);',
+    'PI[a, b * 2 AS c, abs(a - 1)](r);',
+    'RHO[x AS y](r);',
+    '[a]GROUP[count() AS n, sum(b) AS total](r);',
+    'r BOWTIE[r.a = s.a] s LBOWTIE t;',
+    '(r CROSS s) DIVIDE PI[b](t);',
+    'r UNION s INTERSECT t MINUS u;',
+    'SIGMA[NOT (a = 1 || b != 2)](r FBOWTIE s RBOWTIE t);',
+]
+
+
+# Generates the text of a problem set file with the specified number of
+# problems, each with a comment and an answer of several statements.
+def generate_pset(num_problems, statements_per_problem=4, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(1, num_problems + 1):
+        lines.append('-- [Problem %d]' % i)
+        lines.append('')
+        lines.append('-- Generated problem number %d.' % i)
+        lines.append('')
+        lines += rng.choices(PSET_STATEMENTS, k=statements_per_problem)
+        lines.append('')
+
+    return '\n'.join(lines) + '\n'
+
+
+# === RUNNING BENCHMARKS =====================================================
+
+# Runs the function once to warm up, and then the specified number of times,
+# returning a result with the times taken.  The throughput is the number of
+# units of work that each run does, e.g. input rows or bytes parsed, per
+# second.  Whatever the function returns is kept as the output.
+def time_function(fn, repeat, units):
+    output = fn()
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    median = statistics.median(times)
+    return {
+        'repeat'     : repeat,
+        'min'        : min(times),
+        'median'     : median,
+        'mean'       : statistics.mean(times),
+        'stdev'      : statistics.stdev(times) if len(times) > 1 else 0.0,
+        'units'      : units,
+        'throughput' : units / median if median > 0 else None,
+        'output'     : output,
+    }
+
+
+def run_eval_benchmarks(settings, selected):
+    db = make_database(settings)
+
+    executor = None
+    if settings.workers:
+        from ra_parallel import ParallelExecutor
+        executor = ParallelExecutor(db, settings.workers)
+    elif settings.bag:
+        from ra_bag import BagExecutor
+        executor = BagExecutor(db)
+
+    values = {
+        't' : int(settings.rows * settings.selectivity),
+        'v' : settings.distinct,
+        'k' : max(settings.rows // settings.distinct, 1),
+        'constant' : ', '.join(['(%d, %d)' % (i, i % 7) for i in range(1000)]),
+    }
+
+    results = []
+    try:
+        for (name, query) in EVAL_BENCHMARKS:
+            if not selected(name):
+                continue
+
+            query = query % values
+            fn = lambda: eval_ra_expr(db, query, executor=executor).num_rows()
+
+            # The output is the number of rows in the result.
+            result = time_function(fn, settings.repeat, settings.rows)
+            result.update({'group' : 'eval', 'name' : name, 'query' : query,
+                           'unit' : 'rows'})
+            results.append(result)
+    finally:
+        # Only the parallel executor has worker processes to shut down.
+        if settings.workers:
+            executor.close()
+
+    return results
+
+
+# Returns the text of each answer in a problem set file.
+def _answer_blocks(filename):
+    from pset import load_problem_file, PartType
+
+    blocks = []
+    for parts in load_problem_file(filename).values():
+        blocks += ['\n'.join(lines) for (part_type, lines) in parts
+                   if part_type == PartType.ANSWER]
+
+    return blocks
+
+
+def run_pset_benchmarks(settings, selected):
+    from parser import parse_stmts, UnderlineListener
+    from pset import load_problem_file
+    from pset_formatter import format_problem_file
+    from ra2html import format_relational_algebra
+
+    filename = settings.pset
+    tmp = None
+    if filename is None:
+        tmp = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+        with tmp:
+            tmp.write(generate_pset(settings.problems))
+
+        filename = tmp.name
+
+    try:
+        size = os.path.getsize(filename)
+        blocks = _answer_blocks(filename)
+        block_bytes = sum([len(b.encode('utf-8')) for b in blocks])
+
+        def load():
+            load_problem_file(filename)
+
+        def parse():
+            for text in blocks:
+                parse_stmts(text, UnderlineListener())
+
+        # Parses with the ANTLR parser whatever the front end is, as a
+        # baseline for parse_answers.
+        def parse_antlr():
+            old_front_end = get_front_end()
+            set_front_end('antlr')
+            try:
+                parse()
+            finally:
+                set_front_end(old_front_end)
+
+        def format_answers():
+            for text in blocks:
+                format_relational_algebra(text)
+
+        def format_file():
+            format_problem_file(filename, format_relational_algebra,
+                                io.StringIO())
+
+        benchmarks = [
+            ('parse',  'load_pset',      load,           size),
+            ('parse',  'parse_answers',  parse,          block_bytes),
+            ('parse',  'parse_antlr',    parse_antlr,    block_bytes),
+            ('format', 'format_answers', format_answers, block_bytes),
+            ('format', 'format_pset',    format_file,    size),
+        ]
+
+        results = []
+        for (group, name, fn, units) in benchmarks:
+            if group not in settings.groups or not selected(name):
+                continue
+
+            # The formatter prints each problem's id as it goes.
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = time_function(fn, settings.repeat, units)
+
+            result.update({'group' : group, 'name' : name, 'unit' : 'bytes',
+                           'file' : settings.pset or 'generated'})
+            results.append(result)
+
+        by_name = dict([(r['name'], r) for r in results])
+        if 'parse_answers' in by_name and 'parse_antlr' in by_name:
+            by_name['parse_answers']['speedup_over_antlr'] = \
+                by_name['parse_antlr']['median'] / \
+                by_name['parse_answers']['median']
+
+        return results
+
+    finally:
+        if tmp is not None:
+            os.remove(filename)
+
+
+# === REPORTING ==============================================================
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def describe_environment(settings):
+    return {
+        'timestamp' : datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit'    : _git_commit(),
+        'python'    : platform.python_version(),
+        'implementation' : platform.python_implementation(),
+        'platform'  : platform.platform(),
+        'cpu_count' : os.cpu_count(),
+        'numpy'     : numpy is not None,
+        'parser'    : get_front_end(),
+        'settings'  : vars(settings),
+    }
+
+
+def print_results(results, baseline=None, threshold=DEFAULT_THRESHOLD,
+                  out=sys.stdout):
+    print('%-8s %-20s %12s %12s %14s' % ('group', 'benchmark', 'median ms',
+                                         'min ms', 'throughput'), file=out)
+
+    regressions = []
+    for r in results:
+        line = '%-8s %-20s %12.3f %12.3f %14s' % (r['group'], r['name'],
+            r['median'] * 1000, r['min'] * 1000,
+            '%.0f %s/s' % (r['throughput'], r['unit'])
+            if r['throughput'] is not None else '-')
+
+        old = baseline.get((r['group'], r['name'])) if baseline else None
+        if old is not None and old['median'] > 0:
+            ratio = r['median'] / old['median']
+            line += '  %5.2fx' % ratio
+            if ratio > threshold:
+                line += '  REGRESSION'
+                regressions.append(r['name'])
+
+        print(line, file=out)
+
+    for r in results:
+        if 'speedup_over_antlr' in r:
+            print('\nThe %s parser is %.1fx as fast as the ANTLR parser.' % \
+                  (get_front_end(), r['speedup_over_antlr']), file=out)
+
+    return regressions
+
+
+def load_results(filename):
+    with open(filename) as f:
+        data = json.load(f)
+
+    return dict([((r['group'], r['name']), r) for r in data['results']])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the relational algebra evaluator, parser " \
+                    "and HTML formatter.")
+
+    parser.add_argument("benchmarks", nargs="*",
+        help="Names of the benchmarks to run; all of them are run if none " \
+             "are specified.  A name matches any benchmark it is part of.")
+
+    parser.add_argument("--groups", default="eval,parse,format",
+        help="Comma-separated groups of benchmarks to run.")
+
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS,
+        help="Number of rows in the main relation.")
+
+    parser.add_argument("--arity", type=int, default=DEFAULT_ARITY,
+        help="Number of attributes in the main relation, at least 3.")
+
+    parser.add_argument("--distinct", type=int, default=DEFAULT_DISTINCT,
+        help="Number of distinct values of each non-key attribute.")
+
+    parser.add_argument("--skew", type=float, default=0.0,
+        help="Zipf skew of the attribute values; 0 is uniform.")
+
+    parser.add_argument("--selectivity", type=float,
+        default=DEFAULT_SELECTIVITY,
+        help="Fraction of rows that the range selections keep.")
+
+    parser.add_argument("--columnar", action="store_true",
+        help="Store relation variables in columnar form.")
+
+    parser.add_argument("--workers", type=int, default=0,
+        help="Run queries with a parallel executor with this many workers.")
+
+    parser.add_argument("--bag", action="store_true",
+        help="Run queries with bag semantics, counting duplicate rows.")
+
+    parser.add_argument("--parser", choices=FRONT_ENDS,
+        help="Parser front end to use; by default the one selected by the " \
+             "RA_PARSER environment variable, or the fast parser.")
+
+    parser.add_argument("--pset",
+        help="Problem set file for the parser and formatter benchmarks.  " \
+             "One is generated if unspecified.")
+
+    parser.add_argument("--problems", type=int, default=DEFAULT_PROBLEMS,
+        help="Number of problems in a generated problem set.")
+
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+        help="Number of timed runs of each benchmark.")
+
+    parser.add_argument("-o", "--output",
+        help="Write the results to this file as JSON.")
+
+    parser.add_argument("--compare",
+        help="JSON results file to compare the results with.")
+
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="Slowdown factor over the compared results that counts as a " \
+             "regression.")
+
+    settings = parser.parse_args()
+    settings.groups = settings.groups.split(',')
+    if settings.arity < 3:
+        parser.error("--arity must be at least 3")
+
+    if settings.bag and settings.workers:
+        parser.error("--bag cannot be used with --workers")
+
+    if settings.parser is not None:
+        set_front_end(settings.parser)
+
+    selected = lambda name: not settings.benchmarks or \
+                            any([b in name for b in settings.benchmarks])
+
+    results = []
+    if 'eval' in settings.groups:
+        results += run_eval_benchmarks(settings, selected)
+
+    if 'parse' in settings.groups or 'format' in settings.groups:
+        results += run_pset_benchmarks(settings, selected)
+
+    baseline = load_results(settings.compare) if settings.compare else None
+    regressions = print_results(results, baseline, settings.threshold)
+
+    if settings.output is not None:
+        with open(settings.output, 'w') as f:
+            json.dump({'environment' : describe_environment(settings),
+                       'results' : results}, f, indent=2)
+
+    if regressions:
+        print("\n%d benchmarks regressed:  %s" % (len(regressions),
+                                                  ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# Columnar storage for relation-values.  Each attribute is stored as one typed
+# NumPy array plus a boolean array marking which entries are null, so that
+# selections and projections over stored relvars can evaluate their scalar
+# expressions a whole column at a time instead of row by row.
+#
+# NumPy is optional.  Without it, a ColumnarDatabase stores ordinary
+# relation-values and everything is evaluated row by row as usual.
+
+import itertools, operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from relation import RelationValue, Database
+from ra_scalar import AttrRef, Literal, FuncCall, UnaryOp, BinaryOp
+
+
+# Raised when an expression can't be evaluated on columns with exactly the
+# same results as the row-by-row evaluation, e.g. because an operand isn't of
+# a suitable type.  The operator then falls back to evaluating row by row,
+# which also reports any errors in the usual way.
+class _NotVectorizable(Exception):
+    pass
+
+
+_ARITHMETIC_OPS = {
+    '+' : operator.add,
+    '-' : operator.sub,
+    '*' : operator.mul,
+    '/' : operator.truediv,
+}
+
+_COMPARE_OPS = {
+    '==' : operator.eq,
+    '!=' : operator.ne,
+    '<'  : operator.lt,
+    '<=' : operator.le,
+    '>'  : operator.gt,
+    '>=' : operator.ge,
+}
+
+# Only functions whose NumPy version gives the same results as the Python
+# version are evaluated on columns.
+_VECTOR_FUNCTIONS = {}
+if numpy is not None:
+    _VECTOR_FUNCTIONS = {
+        'abs'   : numpy.absolute,
+        'lower' : numpy.char.lower,
+        'upper' : numpy.char.upper,
+    }
+
+
+# Builds a column from a list of Python values, some of which may be None.
+# Columns whose values are all bools, ints, floats or strings get the
+# corresponding NumPy type; anything else is stored as Python objects.
+# NumPy strings drop trailing NUL characters, so strings that end with one
+# are stored as objects, too.
+def make_column(values):
+    num_nulls = values.count(None)
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+
+    if kinds == {bool}:
+        dtype, fill = bool, False
+    elif kinds == {int}:
+        dtype, fill = numpy.int64, 0
+    elif kinds == {float}:
+        dtype, fill = numpy.float64, 0.0
+    elif kinds == {str} and \
+         not any([v.endswith('\0') for v in values if v is not None]):
+        dtype, fill = str, ''
+    else:
+        dtype, fill = object, None
+        if num_nulls < len(values):
+            fill = next(v for v in values if v is not None)
+
+    if num_nulls > 0:
+        nulls = numpy.fromiter(map(operator.is_, values,
+                                   itertools.repeat(None)),
+                               dtype=bool, count=len(values))
+        values = [fill if v is None else v for v in values]
+    else:
+        nulls = numpy.zeros(len(values), dtype=bool)
+
+    try:
+        return (numpy.array(values, dtype=dtype), nulls)
+    except OverflowError:
+        # Ints too large for int64.
+        return (numpy.array(values, dtype=object), nulls)
+
+
+# Returns the list of Python values in a column, with None for nulls.
+def _column_values(column):
+    (values, nulls) = column
+    result = values.tolist()
+    for i in numpy.flatnonzero(nulls).tolist():
+        result[i] = None
+
+    return result
+
+
+def _kind(value):
+    return numpy.asarray(value).dtype.kind
+
+
+# Evaluates a ScalarExpr over whole columns.  Returns a (values, nulls) pair;
+# either may be a scalar rather than an array when the expression doesn't
+# depend on any attributes.  The values at null positions are unspecified.
+def _eval_columns(expr, columns, resolve):
+    if isinstance(expr, AttrRef):
+        return columns[resolve(expr.name)]
+
+    elif isinstance(expr, Literal):
+        if expr.value is None:
+            raise _NotVectorizable()
+
+        return (expr.value, False)
+
+    elif isinstance(expr, FuncCall):
+        fn = _VECTOR_FUNCTIONS.get(expr.name)
+        if fn is None or len(expr.args) != 1:
+            raise _NotVectorizable()
+
+        (values, nulls) = _eval_columns(expr.args[0], columns, resolve)
+        return (fn(values), nulls)
+
+    elif isinstance(expr, UnaryOp):
+        (values, nulls) = _eval_columns(expr.operand, columns, resolve)
+        if expr.op == 'not':
+            if _kind(values) != 'b':
+                raise _NotVectorizable()
+
+            return (numpy.logical_not(values), nulls)
+
+        if _kind(values) not in 'iuf':
+            raise _NotVectorizable()
+
+        return (numpy.negative(values), nulls)
+
+    assert isinstance(expr, BinaryOp)
+
+    (lhs, lhs_nulls) = _eval_columns(expr.lhs, columns, resolve)
+    (rhs, rhs_nulls) = _eval_columns(expr.rhs, columns, resolve)
+
+    if expr.op in ['and', 'or']:
+        # Three-valued logic:  a false operand makes AND false even if the
+        # other operand is null, and likewise a true operand for OR.
+        if _kind(lhs) != 'b' or _kind(rhs) != 'b':
+            raise _NotVectorizable()
+
+        if expr.op == 'and':
+            decided = (~lhs & ~lhs_nulls) | (~rhs & ~rhs_nulls)
+            values = ~decided
+        else:
+            decided = (lhs & ~lhs_nulls) | (rhs & ~rhs_nulls)
+            values = decided
+
+        return (values, ~decided & (lhs_nulls | rhs_nulls))
+
+    nulls = lhs_nulls | rhs_nulls
+
+    if expr.op in _COMPARE_OPS:
+        return (_COMPARE_OPS[expr.op](lhs, rhs), nulls)
+
+    # Arithmetic on bools means something different to NumPy than to Python.
+    if _kind(lhs) == 'b' or _kind(rhs) == 'b':
+        raise _NotVectorizable()
+
+    if expr.op == '/' and numpy.any((rhs == 0) & ~nulls):
+        # Let the row-by-row evaluation report the division by zero.
+        raise _NotVectorizable()
+
+    values = _ARITHMETIC_OPS[expr.op](lhs, rhs)
+
+    if _kind(values) == 'i':
+        # Python ints don't overflow, but int64 columns do.
+        approx = _ARITHMETIC_OPS[expr.op](
+            numpy.asarray(lhs, dtype=numpy.float64),
+            numpy.asarray(rhs, dtype=numpy.float64))
+        if numpy.any(numpy.abs(approx) >= 2.0 ** 62):
+            raise _NotVectorizable()
+
+    return (values, nulls)
+
+
+# Evaluates an expression into a full column for a relation with n rows, or
+# returns None if it must be evaluated row by row.
+def _eval_column(expr, columns, resolve, n):
+    try:
+        with numpy.errstate(all='ignore'):
+            (values, nulls) = _eval_columns(expr, columns, resolve)
+
+    except (_NotVectorizable, TypeError, ValueError, ArithmeticError):
+        return None
+
+    if numpy.ndim(values) == 0:
+        values = numpy.full(n, values)
+
+    if numpy.ndim(nulls) == 0:
+        nulls = numpy.full(n, nulls, dtype=bool)
+
+    return (values, nulls)
+
+
+# Returns the indexes of the first occurrence of each distinct row.
+def _distinct_row_indexes(columns, n):
+    if all([values.dtype.kind in 'biufU' for (values, nulls) in columns]):
+        # Sort the rows as records; the values at null positions are replaced
+        # so that all nulls compare equal.
+        record = numpy.empty(n, dtype=[('v%d' % i, values.dtype)
+                                       for (i, (values, nulls)) in
+                                       enumerate(columns)] +
+                                      [('n%d' % i, bool)
+                                       for i in range(len(columns))])
+
+        for (i, (values, nulls)) in enumerate(columns):
+            record['v%d' % i] = numpy.where(nulls, values.dtype.type(), values)
+            record['n%d' % i] = nulls
+
+        (unused, indexes) = numpy.unique(record, return_index=True)
+        return numpy.sort(indexes)
+
+    first = {}
+    for (i, row) in enumerate(zip(*[_column_values(c) for c in columns])):
+        first.setdefault(row, i)
+
+    return numpy.fromiter(first.values(), dtype=numpy.intp, count=len(first))
+
+
+# A relation-value stored as columns.  Its rows are distinct, like those of
+# any relation-value.  The rows property builds the set of row-tuples on
+# demand, so that the operators that work on columns never need it.
+class ColumnarRelationValue(RelationValue):
+    def __init__(self, attributes, columns, num_rows):
+        self.attributes = attributes
+        self.attr_index = None
+        self.columns = columns
+        self._num_rows = num_rows
+
+
+    @staticmethod
+    def from_relval(relval):
+        rows = list(relval.rows)
+        if len(relval.attributes) == 0:
+            return ColumnarRelationValue([], [], len(rows))
+
+        columns = [make_column(list(map(operator.itemgetter(i), rows)))
+                   for i in range(len(relval.attributes))]
+
+        return ColumnarRelationValue(relval.get_attrs(), columns, len(rows))
+
+
+    @property
+    def rows(self):
+        if len(self.columns) == 0:
+            return {()} if self._num_rows > 0 else set()
+
+        return set(zip(*[_column_values(c) for c in self.columns]))
+
+
+    def num_rows(self):
+        return self._num_rows
+
+
+    def get_column(self, i):
+        return _column_values(self.columns[i])
+
+
+    def copy(self):
+        # The columns are never modified, so they can be shared.
+        return ColumnarRelationValue(self.attributes, self.columns,
+                                     self._num_rows)
+
+
+    def add_row(self, row):
+        raise ValueError("Cannot add rows to a columnar relation-value")
+
+
+    def _take(self, attributes, columns, indexes):
+        return ColumnarRelationValue(attributes,
+            [(values[indexes], nulls[indexes]) for (values, nulls) in columns],
+            len(indexes))
+
+
+    # Returns the rows that satisfy the predicate, or None if the predicate
+    # must be evaluated row by row.
+    def select(self, pred):
+        column = _eval_column(pred, self.columns, self.get_attr_index,
+                              self._num_rows)
+        if column is None:
+            return None
+
+        (values, nulls) = column
+        indexes = numpy.flatnonzero((values == True) & ~nulls)
+        return self._take(self.get_attrs(), self.columns, indexes)
+
+
+    # Computes a projection, or returns None if any of the project-expressions
+    # must be evaluated row by row.
+    def project(self, exprs, attributes):
+        if len(exprs) == 0:
+            return None
+
+        columns = []
+        for e in exprs:
+            column = _eval_column(e, self.columns, self.get_attr_index,
+                                  self._num_rows)
+            if column is None:
+                return None
+
+            columns.append(column)
+
+        # The rows are still distinct if every input attribute is kept.
+        if all([isinstance(e, AttrRef) for e in exprs]) and \
+           len({self.get_attr_index(e.name) for e in exprs}) == \
+           len(self.columns):
+            return ColumnarRelationValue(list(attributes), columns,
+                                         self._num_rows)
+
+        indexes = _distinct_row_indexes(columns, self._num_rows)
+        return self._take(list(attributes), columns, indexes)
+
+
+# A database that stores the value of every relvar in columnar form, so that
+# selections and projections over relvars are evaluated on whole columns.
+class ColumnarDatabase(Database):
+    def set_relvar(self, name, relval):
+        # The relation-value is converted first, so that indexes, statistics
+        # and listeners all see the value that is actually stored.  Bags from
+        # ra_bag are kept as they are, since the columns can't hold counts.
+        if numpy is not None and not relval.has_unnamed_attrs() and \
+           not isinstance(relval, ColumnarRelationValue) and \
+           getattr(relval, 'counts', None) is None:
+            relval = ColumnarRelationValue.from_relval(relval)
+
+        super().set_relvar(name, relval)
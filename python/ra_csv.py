@@ -0,0 +1,185 @@
+# Bulk loading of relation variables from delimited text files, and writing
+# of relation-values back out to them.
+#
+# Files are read in batches of rows.  The type of each column is inferred from
+# the first batch, unless the types are specified, and then each batch is
+# converted a column at a time.  The rows go straight into the relation-value
+# without the per-row checks of RelationValue.add_row(), since every row of a
+# batch is known to have the right number of values.
+
+import csv, itertools
+
+from relation import RelationValue
+
+
+DEFAULT_BATCH_SIZE = 10000
+
+BOOL_VALUES = {'true' : True, 'false' : False}
+
+
+def _parse_bool(s):
+    value = BOOL_VALUES.get(s.lower())
+    if value is None:
+        raise ValueError('invalid boolean value %r' % s)
+
+    return value
+
+
+# Functions for converting field text into each of the column types.
+COLUMN_TYPES = {
+    'bool'  : _parse_bool,
+    'int'   : int,
+    'float' : float,
+    'str'   : str,
+}
+
+
+# Infers the type of a column from a sample of its values, choosing the first
+# type that all non-null values can be converted to.
+def infer_column_type(values, null_string=''):
+    values = [v for v in values if v != null_string]
+    for t in ['bool', 'int', 'float']:
+        try:
+            for v in values:
+                COLUMN_TYPES[t](v)
+
+            if values:
+                return t
+        except ValueError:
+            pass
+
+    return 'str'
+
+
+# Converts a column of field text from one batch into values of the type.
+def _convert_column(values, col_type, null_string):
+    convert = COLUMN_TYPES[col_type]
+    if null_string not in values:
+        return list(map(convert, values))
+
+    return [None if v == null_string else convert(v) for v in values]
+
+
+def _open(path_or_file, mode):
+    if isinstance(path_or_file, str):
+        return open(path_or_file, mode, newline='')
+
+    return None
+
+
+# Loads a delimited text file into a relation-value for the named relation
+# variable.  The attribute names come from the file's header line, or are
+# specified as attributes if the file has no header.  types optionally maps
+# attribute names to 'bool', 'int', 'float' or 'str'; the types of any other
+# columns are inferred from the first batch of rows.  Fields matching
+# null_string, which by default is the empty string, are null.
+#
+# The caller stores the result in the database with set_relvar().
+def read_csv(path_or_file, relvar_name, attributes=None, types=None,
+             delimiter=',', header=True, null_string='',
+             batch_size=DEFAULT_BATCH_SIZE):
+    f = _open(path_or_file, 'r')
+    try:
+        reader = csv.reader(f if f is not None else path_or_file,
+                            delimiter=delimiter)
+
+        if header:
+            file_attrs = next(reader, None)
+            if file_attrs is None:
+                raise ValueError('File has no header line')
+
+            if attributes is None:
+                attributes = [a.strip() for a in file_attrs]
+
+        if attributes is None:
+            raise ValueError('Attribute names must be specified for a file ' \
+                             'without a header line')
+
+        num_attrs = len(attributes)
+        col_types = None
+        rows = set()
+        line = 2 if header else 1
+
+        while True:
+            batch = list(itertools.islice(reader, batch_size))
+            if not batch:
+                break
+
+            if set(map(len, batch)) != {num_attrs}:
+                for (i, r) in enumerate(batch):
+                    if len(r) != num_attrs:
+                        raise ValueError('Line %d has %d values, but there ' \
+                            'are %d attributes' % (line + i, len(r), num_attrs))
+
+            columns = list(zip(*batch))
+            if col_types is None:
+                col_types = []
+                for (a, values) in zip(attributes, columns):
+                    if types is not None and a in types:
+                        if types[a] not in COLUMN_TYPES:
+                            raise ValueError('Unknown type %s for ' \
+                                             'attribute %s' % (types[a], a))
+
+                        col_types.append(types[a])
+                    else:
+                        col_types.append(infer_column_type(values,
+                                                           null_string))
+
+            converted = []
+            for (a, values, t) in zip(attributes, columns, col_types):
+                try:
+                    converted.append(_convert_column(values, t, null_string))
+                except ValueError as e:
+                    raise ValueError('Lines %d-%d:  attribute %s has a value ' \
+                        'that is not of type %s (%s); specify its type ' \
+                        'explicitly' % (line, line + len(batch) - 1, a, t, e))
+
+            if num_attrs > 0:
+                rows.update(zip(*converted))
+            else:
+                rows.add(())
+
+            line += len(batch)
+
+    finally:
+        if f is not None:
+            f.close()
+
+    # This checks that the attribute names are distinct.
+    relval = RelationValue(None, rows)
+    relval.set_attrs([relvar_name + '.' + a for a in attributes])
+    return relval
+
+
+# Writes a relation-value to a delimited text file, with a header line of the
+# attribute names (without their relation names).  Null values are written
+# as null_string.
+def write_csv(relval, path_or_file, delimiter=',', header=True,
+              null_string=''):
+    f = _open(path_or_file, 'w')
+    try:
+        writer = csv.writer(f if f is not None else path_or_file,
+                            delimiter=delimiter)
+
+        if header:
+            writer.writerow([a.split('.')[-1] if a is not None else ''
+                             for a in relval.attributes])
+
+        # A bag from ra_bag has counts, and each row is written as many
+        # times as it occurs.
+        rows = relval.rows
+        counts = getattr(relval, 'counts', None)
+        if counts is not None:
+            rows = itertools.chain.from_iterable(
+                itertools.repeat(r, counts[r]) for r in rows)
+
+        # The csv module writes None as an empty field.
+        if null_string != '':
+            rows = (tuple([null_string if v is None else v for v in r])
+                    for r in rows)
+
+        writer.writerows(rows)
+
+    finally:
+        if f is not None:
+            f.close()
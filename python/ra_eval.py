@@ -1,525 +1,816 @@
-import io, sys
+import collections, io, itertools, re, sys
 
-from antlr4 import *
-from antlr4.InputStream import InputStream
-
-from RelationalAlgebraLexer import RelationalAlgebraLexer
 from RelationalAlgebraParser import RelationalAlgebraParser
 from RelationalAlgebraVisitor import RelationalAlgebraVisitor
 
+from parser import parse_stmt, parse_stmts
+from relation import RelationValue, RowStream, Database, make_attr_index, \
+    find_attr_index
+from ra_scalar import Literal, compile_predicate, compile_projection
+from ra_aggregate import AGGREGATES, DEFAULT_MAX_GROUPS, find_aggregates, \
+    hash_aggregate, replace_aggregates
+from ra_join import INNER_JOIN, LEFT_OUTER_JOIN, FULL_OUTER_JOIN, \
+    analyze_join_condition, compile_match_fn, divide_rows, index_join_keys, \
+    index_join_pairs, index_semi_join_rows, join_pairs, join_rows, \
+    natural_combiner, natural_join_attrs, semi_join_rows, theta_combiner
+from ra_index import HASH_INDEX
+from ra_columnar import ColumnarDatabase, ColumnarRelationValue
+from ra_storage import DiskDatabase
+from ra_csv import read_csv, write_csv
+from ra_views import ViewManager
+from ra_plan import SET_UNION, SET_INTERSECT, SET_DIFFERENCE, build_plan, \
+    explain, has_distinct_rows, optimize, plan_relvars
+
+
+# Generates the rows, skipping any that have already been generated.
+def _distinct_rows(rows):
+    seen = set()
+    for row in rows:
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+# Executes a logical plan from ra_plan, producing a relation-value.
+#
+# Operators are pull-based:  each one returns a RowStream whose rows are a
+# generator over the rows of its inputs, so a chain of selections, projections
+# and unions passes each row along without storing any intermediate results.
+# An input is only materialized where the operator must see all of it before
+# producing any output - the right side of joins, cross products, intersections
+# and differences, and the left side of outer joins.  Semi-joins and
+# anti-joins only keep the join keys of their right side.
+#
+# Projections and unions may pass along duplicate rows.  They are removed
+# wherever a stream is materialized, which includes the final result, and by
+# GROUP, which must not count them.
+#
+# Selections and projections over a columnar relation-value (see ra_columnar)
+# are evaluated a column at a time where possible, producing another columnar
+# relation-value.
+class PlanExecutor:
+
+    # Executors whose rows are counted rather than having their duplicates
+    # removed, such as ra_bag's BagExecutor, set this to True.  Their plans
+    # are optimized without turning joins into semi-joins.
+    bag_semantics = False
+
+    def __init__(self, database, max_groups=DEFAULT_MAX_GROUPS):
+        self.database = database
 
-def get_expr_name(ctx):
-    name = None
-
-    if isinstance(ctx, RelationalAlgebraParser.NamedScalarExprContext):
-        if ctx.NAME() is not None:
-            name = ctx.NAME().getText()
-
-        ctx = ctx.scalarExpr()
-
-    if name is None and \
-       isinstance(ctx, RelationalAlgebraParser.ScalarExprAttributeContext):
-        name = ctx.attrName().getText()
-
-    return name
-
-
-class RelationValue:
-    def __init__(self, attributes=None, rows=[]):
-        self.attributes = attributes
-        self.rows = set(rows)
-
-    def __check_attrs(self, attributes):
-        if attributes is None:
-            return
-
-        s = set()
-        for a in attributes:
-            if a is None:
-                raise ValueError('Attribute name cannot be None.')
-
-            if a in s:
-                raise ValueError('Attribute \"%s\" is ambiguous.' % a)
-
-            s.add(a)
-
-
-    def num_attrs(self):
-        return len(self.attributes)
-
-    def set_relation_name(self, rel_name):
-        attr_names = []
-        for a in self.attributes:
-            p = a.split('.')
-            n = p[-1]
-            if n in attr_names:
-                raise ValueError("Cannot set relation name to %s:  " + \
-                    "Attribute name %s appears multiple times" % \
-                    (rel_name, n))
+        # The number of groups that GROUP keeps in memory before spilling
+        # partially aggregated groups to disk.
+        self.max_groups = max_groups
 
-            attr_names.append(n)
 
-        self.attributes = [rel_name + '.' + n for n in attr_names]
+    def execute(self, plan):
+        return self.stream(plan).materialize()
 
 
-    def get_attrs(self):
-        return list(self.attributes)
+    def stream(self, plan):
+        return plan.accept(self)
 
-    def set_attrs(self, attrs):
-        if self.attributes is not None and len(attrs) != len(self.attributes):
-           raise ValueError("Relation-value has %d attributes, but %d "
-               "were specified" % (len(self.attributes), len(attrs)))
 
-        self.__check_attrs(attrs)
-        self.attributes = list(attrs)
+    def visitRelVarNode(self, node):
+        relval = self.database.get_relvar(node.name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % node.name)
 
+        return RowStream.from_relval(relval)
 
-    def has_unnamed_attrs(self):
-        if self.attributes is None:
-            return True
 
-        for a in self.attributes:
-            if a is None:
-                return True
+    # Find the rows of a relation variable with an index.  If the index can't
+    # be used, e.g. because the values being looked up can't be compared with
+    # the ones in the index, the relation variable is scanned instead, which
+    # reports any errors in the usual way.
+    def visitIndexScanNode(self, node):
+        relval = self.database.get_relvar(node.name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % node.name)
 
-        return False
+        return RowStream(relval.get_attrs(),
+                         self._index_scan_rows(node, relval))
 
-    def get_attr_index(self, name):
-        if '.' in name:
-            # This will raise a ValueError if the name is not found.
-            return self.attributes.index(name)
 
-        i_found = None
-        for i, a in enumerate(self.attributes):
-            p = a.split('.')
+    def _index_scan_rows(self, node, relval):
+        try:
+            index = self.database.get_index(node.name, node.index_attrs,
+                                            node.kind)
+            if node.key is not None:
+                rows = index.lookup(node.key)
+            else:
+                (low, low_inclusive) = node.low or (None, True)
+                (high, high_inclusive) = node.high or (None, True)
+                rows = index.range(low, low_inclusive, high, high_inclusive)
+
+        except (TypeError, ValueError):
+            pred_fn = compile_predicate(node.pred, relval.get_attr_index)
+            rows = filter(pred_fn, relval.rows)
+
+        return rows
 
-            if name == p[-1]:
-                if i_found is not None:
-                    raise ValueError('Attribute name %s is ambiguous' % name)
 
-                i_found = i
+    def visitConstantNode(self, node):
+        # Plans may be cached and run again, so the result must not be the
+        # constant relation-value itself.  The node's attributes are used
+        # because an empty constant relation-value has none.
+        return RowStream(list(node.attrs), node.relval.rows)
+
 
-        if i_found is None:
-            raise ValueError('No attribute with name %s' % name)
+    def visitSelectNode(self, node):
+        input_stream = self.stream(node.child)
 
-        return i_found
+        if isinstance(input_stream.source, ColumnarRelationValue):
+            result = input_stream.source.select(node.pred)
+            if result is not None:
+                return RowStream.from_relval(result)
 
+        # Compile the predicate once, with all attribute references resolved
+        # to positions in the input rows.
+        pred_fn = compile_predicate(node.pred, input_stream.get_attr_index)
 
-    def add_row(self, row):
-        if type(row) != tuple:
-            raise ValueError("row must be a tuple; got " + str(type(row)))
+        return RowStream(input_stream.get_attrs(),
+                         filter(pred_fn, input_stream.rows))
 
-        if self.attributes is None:
-            self.attributes = [None] * len(row)
 
-        if len(row) != len(self.attributes):
-           raise ValueError("Relation-value has %d attributes; row has %d "
-               "attributes" % (len(self.attributes), len(row)))
+    def visitProjectNode(self, node):
+        input_stream = self.stream(node.child)
 
-        self.rows.add(row)
+        if isinstance(input_stream.source, ColumnarRelationValue):
+            result = input_stream.source.project(node.exprs, node.attrs)
+            if result is not None:
+                return RowStream.from_relval(result)
 
-    def num_rows(self):
-        return len(self.rows)
+        # Resolve all attribute references to positions in the input rows,
+        # and compile the project-expressions into one function that produces
+        # an output row from an input row.
+        project_fn = compile_projection(node.exprs, input_stream.get_attr_index)
 
-    def get_rows(self):
-        return set(self.rows)
+        return RowStream(list(node.attrs), map(project_fn, input_stream.rows))
 
-    def pretty_print(self):
-        s = ''
 
-        if self.attributes is not None:
-            s += "(" + ",".join([a if a is not None else "unnamed" \
-                                 for a in self.attributes]) + ")"
+    # Results are free of duplicates anyway, but a stream may pick some up
+    # along the way, which are removed here.
+    def visitDistinctNode(self, node):
+        return RowStream.from_relval(self.stream(node.child).materialize())
 
-        print(s)
-        print('-' * len(s))
 
-        if len(self.rows) > 0:
-            for r in self.rows:
-                print(r)
-        else:
-            print('no rows')
+    # Group the rows of a relation-value and compute aggregates over each
+    # group.  This is a pipeline breaker, but only the aggregate state of each
+    # group is kept while the input streams through, not the input rows -
+    # unless the input may have duplicates, which must not be counted.  Then
+    # the rows seen so far are kept to skip them.
+    def visitGroupNode(self, node):
+        input_stream = self.stream(node.child)
 
+        if input_stream.source is None and not has_distinct_rows(node.child):
+            input_stream = RowStream(input_stream.get_attrs(),
+                                     _distinct_rows(input_stream.rows))
 
-class Database:
-    def __init__(self):
-        self.relation_variables = {}
+        return RowStream(list(node.attrs),
+                         self._group_rows(node, input_stream))
 
-    def get_relvar_names(self):
-        return list(self.relation_variables.keys())
 
-    def get_relvar(self, name):
-        return self.relation_variables.get(name)
+    # Generates the result rows of a GROUP node from its input stream, whose
+    # rows are (row, count) pairs if counted is True.
+    def _group_rows(self, node, input_stream, counted=False):
+        # Each distinct aggregate call is computed once, even if it appears
+        # in several of the aggregate expressions.
+        calls = {}
+        for e in node.agg_exprs:
+            for a in find_aggregates(e):
+                calls.setdefault(str(a), a)
 
-    def set_relvar(self, name, relval):
-        if relval.has_unnamed_attrs():
-            raise ValueError("Relation-value has unnamed attributes.")
+        calls = list(calls.values())
+        key_fn = compile_projection(node.group_exprs,
+                                    input_stream.get_attr_index)
+        args_fn = compile_projection(
+            [a.arg if a.arg is not None else Literal(True) for a in calls],
+            input_stream.get_attr_index)
 
-        self.relation_variables[name] = relval
+        # The aggregate expressions are computed from a row holding the group
+        # values followed by the aggregate results.  Attributes outside of an
+        # aggregate call must be one of the group values.
+        num_groups = len(node.group_exprs)
+        group_index = make_attr_index(node.group_names)
+        call_names = dict([(str(a), '#%d' % i) for (i, a) in enumerate(calls)])
 
-    def del_relvar(self, name):
-        del self.relation_variables[name]
+        def resolve(name):
+            if name.startswith('#'):
+                return num_groups + int(name[1:])
 
+            try:
+                return find_attr_index(group_index, name)
+            except ValueError:
+                raise ValueError('Attribute %s must be grouped or used in ' \
+                                 'an aggregate function' % name)
 
-class RelationalAlgebraEvaluator(RelationalAlgebraVisitor):
+        agg_fn = compile_projection(
+            [replace_aggregates(e, call_names) for e in node.agg_exprs],
+            resolve)
 
-    def __init__(self, database):
-        self.database = database
+        groups = hash_aggregate(input_stream.rows, key_fn, args_fn,
+            [AGGREGATES[a.name] for a in calls], self.max_groups,
+            empty_group=() if num_groups == 0 else None, counted=counted)
 
+        return (key + agg_fn(key + tuple(values)) for (key, values) in groups)
 
-    def visitRelStmtAssign(self, ctx:RelationalAlgebraParser.RelStmtAssignContext):
-        # Evaluate the name and attribute-names, if present.
-        relvar_name = ctx.relName.text
-        attrNames = [relvar_name + "." + a.text for a in ctx.attrNames]
 
-        # Evaluate the RHS relation-value.
-        relval = self.visit(ctx.relExpr())
+    # Compute the cross-product of two relation-values.
+    def visitCrossNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1]).materialize()
 
-        if len(attrNames) > 0:
-            # Names of attributes were specified in the assignment statement.
-            relval.set_attrs(attrNames)
-        else:
-            # Attribute names aren't specified.  See if there is an old
-            # relation-value with attribute names, and if so, pull the names
-            # from there.
+        result_attrs = lhs.get_attrs() + rhs.get_attrs()
+        rhs_rows = rhs.rows
 
-            old_relval = self.database.get_relvar(name)
-            if old_relval is not None:
-                relval.set_attrs(old_relval.get_attrs())
+        return RowStream(result_attrs, (lhs_row + rhs_row
+            for lhs_row in lhs.rows for rhs_row in rhs_rows))
 
-        self.database.set_relvar(relvar_name, relval)
-        return relval
 
+    # Compute a join of two relation-values.  If the join specifies a
+    # predicate then it is a theta-join; otherwise it is a natural join on the
+    # attributes that the two relation-values have in common.
+    def visitJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1]).materialize()
 
-    def visitRelStmtNoAssign(self, ctx:RelationalAlgebraParser.RelStmtNoAssignContext):
-        return self.visit(ctx.relExpr())
+        if node.join_type in [LEFT_OUTER_JOIN, FULL_OUTER_JOIN]:
+            # The left rows are scanned again for the ones without a match.
+            lhs = lhs.materialize()
 
+        (cond, result_attrs, combine) = self._join_condition(node, lhs, rhs)
 
-    def visitRelExprRelationVariable(self, ctx:RelationalAlgebraParser.RelExprRelationVariableContext):
-        return self.database.get_relvar(ctx.NAME().getText())
+        pairs = join_pairs(lhs, rhs, cond, node.join_type)
+        return RowStream(result_attrs,
+            join_rows(pairs, node.join_type, lhs.rows, rhs.rows, combine))
 
 
-    def visitRelExprDivision(self, ctx:RelationalAlgebraParser.RelExprDivisionContext):
-        lhs = self.visit(ctx.relExpr(0))
-        rhs = self.visit(ctx.relExpr(1))
+    # Compute a join where one input is a relation variable with a hash index
+    # on the join attributes, by looking up the other input's rows in the
+    # index.  The indexed input is never one whose unmatched rows are needed.
+    def visitIndexJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+        index = self.database.get_index(node.indexed.name, node.index_attrs,
+                                        HASH_INDEX)
 
-        # TODO:  Implement!
+        if node.join_type != INNER_JOIN:
+            # The probe rows are scanned again for the ones without a match.
+            if node.index_lhs:
+                rhs = rhs.materialize()
+            else:
+                lhs = lhs.materialize()
 
-        return RelationValue([])
+        (cond, result_attrs, combine) = self._join_condition(node, lhs, rhs)
 
+        (indexed, probe) = (lhs, rhs) if node.index_lhs else (rhs, lhs)
+        (probe_exprs, equi_keys, leftover) = index_join_keys(cond,
+            node.index_attrs, indexed.get_attr_index, node.index_lhs)
 
-    # Compute the cross-product of two relation-values.
-    def visitRelExprCrossProduct(self, ctx:RelationalAlgebraParser.RelExprCrossProductContext):
-        lhs = self.visit(ctx.relExpr(0))
-        lhs_attrs = lhs.get_attrs()
+        pairs = index_join_pairs(probe.rows,
+            compile_projection(probe_exprs, probe.get_attr_index), index,
+            compile_match_fn(lhs, rhs, leftover, equi_keys=equi_keys),
+            node.index_lhs)
 
-        rhs = self.visit(ctx.relExpr(1))
-        rhs_attrs = rhs.get_attrs()
+        (lhs_rows, rhs_rows) = ((), probe.rows) if node.index_lhs \
+                               else (probe.rows, ())
+        return RowStream(result_attrs,
+            join_rows(pairs, node.join_type, lhs_rows, rhs_rows, combine))
 
-        result_attrs = lhs_attrs + rhs_attrs
-        result = RelationValue(result_attrs)
 
-        for lhs_row in lhs.get_rows():
-            for rhs_row in rhs.get_rows():
-                result.add_row(lhs_row + rhs_row)
+    # Compute a semi-join or anti-join, which filters the left rows as they
+    # stream through by probing a hash table of the right side's join keys.
+    def visitSemiJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
 
-        return result
+        return RowStream(lhs.get_attrs(), semi_join_rows(lhs, rhs,
+            self._semi_join_condition(node, lhs, rhs), node.join_type))
 
 
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprConstantRelation.
-    def visitRelExprConstantRelation(self, ctx:RelationalAlgebraParser.RelExprConstantRelationContext):
-        relval = RelationValue()
-        for r in ctx.rowExpr():
-            relval.add_row(self.visit(r))
+    # Compute a semi-join or anti-join where one input is a relation variable
+    # with a hash index on the join attributes, by looking up the other
+    # input's join keys in the index.
+    def visitIndexSemiJoinNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
+        index = self.database.get_index(node.indexed.name, node.index_attrs,
+                                        HASH_INDEX)
 
-        return relval
+        cond = self._semi_join_condition(node, lhs, rhs)
+        (indexed, probe) = (lhs, rhs) if node.index_lhs else (rhs, lhs)
+        (probe_exprs, equi_keys, leftover) = index_join_keys(cond,
+            node.index_attrs, indexed.get_attr_index, node.index_lhs)
 
+        return RowStream(lhs.get_attrs(), index_semi_join_rows(probe.rows,
+            compile_projection(probe_exprs, probe.get_attr_index), index,
+            compile_match_fn(lhs, rhs, leftover, equi_keys=equi_keys),
+            node.join_type, node.index_lhs))
 
-    # RelationalAlgebraParser#RelExprRename.
-    def visitRelExprRename(self, ctx:RelationalAlgebraParser.RelExprRenameContext):
-        relval = self.visit(ctx.relExpr())
-        # TODO:  Rename the result before returning it.
-        return relval
 
+    def _semi_join_condition(self, node, lhs, rhs):
+        if node.is_natural():
+            return natural_join_attrs(lhs.attributes, rhs.attributes)[0]
 
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprGroupAggregate.
-    def visitRelExprGroupAggregate(self, ctx:RelationalAlgebraParser.RelExprGroupAggregateContext):
-        s = ""
-        if ctx.groups is not None:
-            s += "<sub>"
-            s += ", ".join([self.visit(g) for g in ctx.groups])
-            s += "</sub>"
+        return analyze_join_condition(node.pred, lhs.get_attr_index,
+                                      rhs.get_attr_index)
 
-        s += "<span class='group_operator'>G</span>"
 
-        s += "<sub>"
-        s += ", ".join([self.visit(a) for a in ctx.aggregates])
-        s += "</sub>"
+    # Returns (cond, result_attrs, combine) for a join of the two inputs:
+    # the JoinCondition, the attributes of the result, and the function that
+    # combines a left and a right row into a result row.
+    def _join_condition(self, node, lhs, rhs):
+        if not node.is_natural():
+            cond = analyze_join_condition(node.pred, lhs.get_attr_index,
+                                          rhs.get_attr_index)
 
-        return s
+            result_attrs = lhs.get_attrs() + rhs.get_attrs()
+            combine = theta_combiner(lhs.num_attrs(), rhs.num_attrs())
 
+        else:
+            (cond, shared, rhs_rest) = \
+                natural_join_attrs(lhs.attributes, rhs.attributes)
 
-    # Compute the set-union of two relation-values.
-    def visitRelExprSetUnion(self, ctx:RelationalAlgebraParser.RelExprSetUnionContext):
-        lhs = self.visit(ctx.relExpr(0))
-        rhs = self.visit(ctx.relExpr(1))
-        if lhs.num_attrs() != rhs.num_attrs():
-            raise ValueError("Arity of LHS is %d, but RHS is %d" % (lhs.num_attrs(), rhs.num_attrs()))
+            result_attrs = lhs.get_attrs() + \
+                           [rhs.attributes[i] for i in rhs_rest]
+            combine = natural_combiner(lhs.num_attrs(), shared, rhs_rest)
 
-        return RelationValue(lhs.get_attrs(), lhs.rows | rhs.rows)
+        return (cond, result_attrs, combine)
 
 
-    # Compute the set-intersection of two relation-values.
-    def visitRelExprSetIntersect(self, ctx:RelationalAlgebraParser.RelExprSetIntersectContext):
-        lhs = self.visit(ctx.relExpr(0))
-        rhs = self.visit(ctx.relExpr(1))
-        if lhs.num_attrs() != rhs.num_attrs():
-            raise ValueError("Arity of LHS is %d, but RHS is %d" % \
-                             (lhs.num_attrs(), rhs.num_attrs()))
+    # Compute the division of two relation-values.  The dividend must have
+    # distinct rows, so it is materialized unless it already is.
+    def visitDivideNode(self, node):
+        lhs = self.stream(node.children[0]).materialize()
+        rhs = self.stream(node.children[1]).materialize()
 
-        return RelationValue(lhs.get_attrs(), lhs.rows & rhs.rows)
+        return RowStream(list(node.attrs),
+            divide_rows(lhs.rows, rhs.rows, node.quotient, node.shared))
 
 
-    # Compute the set-difference of two relation-values.
-    def visitRelExprSetDifference(self, ctx:RelationalAlgebraParser.RelExprSetDifferenceContext):
-        lhs = self.visit(ctx.relExpr(0))
-        rhs = self.visit(ctx.relExpr(1))
+    # Compute the set-union, set-intersection or set-difference of two
+    # relation-values.  Only the right side of an intersection or difference
+    # is materialized; the left side is filtered as it streams through.
+    def visitSetOpNode(self, node):
+        lhs = self.stream(node.children[0])
+        rhs = self.stream(node.children[1])
         if lhs.num_attrs() != rhs.num_attrs():
             raise ValueError("Arity of LHS is %d, but RHS is %d" % \
                              (lhs.num_attrs(), rhs.num_attrs()))
 
-        return RelationValue(lhs.get_attrs(), lhs.rows - rhs.rows)
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprParens.
-    def visitRelExprParens(self, ctx:RelationalAlgebraParser.RelExprParensContext):
-        return self.visit(ctx.relExpr())
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprProject.
-    def visitRelExprProject(self, ctx:RelationalAlgebraParser.RelExprProjectContext):
-        input_relval = self.visit(ctx.relExpr())
-
-        attr_names = []
-        eval_strs = []
-        for e in ctx.namedScalarExpr():
-            attr_names.append(get_expr_name(e))
-            eval_strs.append(self.visit(e))
-
-        output_relval = RelationValue(attr_names)
-
-        for row in input_relval.get_rows():
-            # Set up the environment to evaluate each of the project exprs.
-            project_env = {}
-            for i, a in enumerate(input_relval.get_attrs()):
-                project_env[a] = row[i]
-
-            # Evaluate each project-expression to assemble the output row.
-            out_row = tuple([eval(s, project_env) for s in eval_strs])
-            output_relval.add_row(out_row)
-
-        return output_relval
-
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprLeftOuterJoin.
-    def visitRelExprLeftOuterJoin(self, ctx:RelationalAlgebraParser.RelExprLeftOuterJoinContext):
-        s = self.visit(ctx.relExpr(0)) + " &#x27d5;"
-        if ctx.scalarExpr() is not None:
-            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
-
-        s += " " + self.visit(ctx.relExpr(1))
-
-        return s
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprRightOuterJoin.
-    def visitRelExprRightOuterJoin(self, ctx:RelationalAlgebraParser.RelExprRightOuterJoinContext):
-        s = self.visit(ctx.relExpr(0)) + " &#x27d6;"
-        if ctx.scalarExpr() is not None:
-            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
-
-        s += " " + self.visit(ctx.relExpr(1))
-
-        return s
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprFullOuterJoin.
-    def visitRelExprFullOuterJoin(self, ctx:RelationalAlgebraParser.RelExprFullOuterJoinContext):
-        s = self.visit(ctx.relExpr(0)) + " &#x27d7;"
-        if ctx.scalarExpr() is not None:
-            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
-
-        s += " " + self.visit(ctx.relExpr(1))
-
-        return s
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprInnerJoin.
-    def visitRelExprInnerJoin(self, ctx:RelationalAlgebraParser.RelExprInnerJoinContext):
-        s = self.visit(ctx.relExpr(0)) + " &bowtie;"
-        if ctx.scalarExpr() is not None:
-            s += "<sub>" + self.visit(ctx.scalarExpr()) + "</sub>"
-
-        s += " " + self.visit(ctx.relExpr(1))
-
-        return s
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#RelExprSelect.
-    def visitRelExprSelect(self, ctx:RelationalAlgebraParser.RelExprSelectContext):
-        pred_str = self.visit(ctx.scalarExpr())
-        input_relval = self.visit(ctx.relExpr())
-
-        output_relval = RelationValue(input_relval.get_attrs())
-
-        for row in input_relval.get_rows():
-            # Set up the environment to evaluate the predicate.
-            pred_env = {}
-            for i, a in enumerate(input_relval.get_attrs()):
-                pred_env[a] = row[i]
-
-            # Evaluate the predicate.  If it's True, include the row.
-            pred_val = eval(pred_str, pred_env)
-            if pred_val == True:
-                output_relval.add_row(row)
-
-        return output_relval
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#rowExpr.
-    def visitRowExpr(self, ctx:RelationalAlgebraParser.RowExprContext):
-        # Generate a tuple containing all values in the row-expression.
-        # Individual values are strings, so eval() them to get to a value.
-        return tuple(eval(self.visit(v)) for v in ctx.literalValue())
-
+        if node.op == SET_UNION:
+            rows = itertools.chain(lhs.rows, rhs.rows)
+        elif node.op == SET_INTERSECT:
+            rhs_rows = rhs.materialize().rows
+            rows = filter(rhs_rows.__contains__, lhs.rows)
+        else:
+            assert node.op == SET_DIFFERENCE
+            rhs_rows = rhs.materialize().rows
+            rows = itertools.filterfalse(rhs_rows.__contains__, lhs.rows)
 
-    # RelationalAlgebraParser#namedScalarExpr.
-    def visitNamedScalarExpr(self, ctx:RelationalAlgebraParser.NamedScalarExprContext):
-        return self.visit(ctx.scalarExpr())
+        return RowStream(lhs.get_attrs(), rows)
 
 
-    # RelationalAlgebraParser#ScalarExprAttribute.
-    def visitScalarExprAttribute(self, ctx:RelationalAlgebraParser.ScalarExprAttributeContext):
-        return self.visitChildren(ctx)
+class RelationalAlgebraEvaluator(RelationalAlgebraVisitor):
 
+    def __init__(self, database, cached_stmt=None, executor=None):
+        self.database = database
+        self.executor = executor or PlanExecutor(database)
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprUnarySign.
-    def visitScalarExprUnarySign(self, ctx:RelationalAlgebraParser.ScalarExprUnarySignContext):
-        return "-" + self.visit(ctx.scalarExpr())
+        # If the statement came from a StatementCache, its plan is reused
+        # when possible.
+        self.cached_stmt = cached_stmt
 
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprFunction.
-    def visitScalarExprFunction(self, ctx:RelationalAlgebraParser.ScalarExprFunctionContext):
-        return ctx.NAME().getText() + "(" + \
-               ", ".join([self.visit(e) for e in ctx.scalarExpr()]) + ")"
+    # Translate a relExpr parse tree into a logical plan, optimize the plan,
+    # and then execute it.
+    def eval_rel_expr(self, ctx):
+        semi_joins = not self.executor.bag_semantics
+        if self.cached_stmt is not None:
+            plan = self.cached_stmt.get_plan(self.database, ctx, semi_joins)
+        else:
+            plan = optimize(build_plan(self.database, ctx), self.database,
+                            semi_joins)
 
+        return self.executor.execute(plan)
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprOr.
-    def visitScalarExprOr(self, ctx:RelationalAlgebraParser.ScalarExprOrContext):
-        return self.visit(ctx.scalarExpr(0)) + " or " + \
-               self.visit(ctx.scalarExpr(1))
 
+    def visitRelStmtAssign(self, ctx:RelationalAlgebraParser.RelStmtAssignContext):
+        # Evaluate the name and attribute-names, if present.
+        relvar_name = ctx.relName.text
+        attrNames = [relvar_name + "." + a.text for a in ctx.attrNames]
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprAdd.
-    def visitScalarExprAdd(self, ctx:RelationalAlgebraParser.ScalarExprAddContext):
-        return self.visit(ctx.scalarExpr(0)) + " " + ctx.op.text + " " + \
-               self.visit(ctx.scalarExpr(1))
+        # Evaluate the RHS relation-value.
+        relval = self.eval_rel_expr(ctx.relExpr())
+        old_relval = self.database.get_relvar(relvar_name)
 
+        if len(attrNames) > 0 or old_relval is not None:
+            # The result may be a relation-value that is stored in another
+            # relation variable, so don't rename its attributes in place.
+            relval = relval.copy()
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprNot.
-    def visitScalarExprNot(self, ctx:RelationalAlgebraParser.ScalarExprNotContext):
-        return "not " + self.visit(ctx.scalarExpr())
+        if len(attrNames) > 0:
+            # Names of attributes were specified in the assignment statement.
+            relval.set_attrs(attrNames)
+        else:
+            # Attribute names aren't specified.  See if there is an old
+            # relation-value with attribute names, and if so, pull the names
+            # from there.
 
+            if old_relval is not None:
+                relval.set_attrs(old_relval.get_attrs())
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprMul.
-    def visitScalarExprMul(self, ctx:RelationalAlgebraParser.ScalarExprMulContext):
-        return self.visit(ctx.scalarExpr(0)) + " " + ctx.op.text + " " + \
-               self.visit(ctx.scalarExpr(1))
+        self.database.set_relvar(relvar_name, relval)
+        return relval
 
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprCompare.
-    def visitScalarExprCompare(self, ctx:RelationalAlgebraParser.ScalarExprCompareContext):
-        op_map = {
-            "="  : "==",
-            "==" : "==",
-            "!=" : "!=",
-            "<>" : "!=",
-            ">"  : ">",
-            "<"  : "<",
-            ">=" : ">=",
-            "<=" : "<=",
+    def visitRelStmtNoAssign(self, ctx:RelationalAlgebraParser.RelStmtNoAssignContext):
+        return self.eval_rel_expr(ctx.relExpr())
+
+
+# Statements are parsed with the front end selected in parser.py.
+def parse_ra_stmt(ra_str):
+    return parse_stmt(ra_str)
+
+
+def parse_ra_stmts(ra_str):
+    return parse_stmts(ra_str)
+
+
+# A statement in a StatementCache:  its parse tree, and the optimized plan for
+# its relExpr once one has been built.  A plan depends on the attributes of
+# the relation variables it reads and on the database's indexes, so it is
+# rebuilt if any of them change, or if it is wanted with or without
+# semi-joins and was made the other way.
+class CachedStatement:
+    def __init__(self, parse_tree):
+        self.parse_tree = parse_tree
+        self.plan = None
+        self.relvars = None
+        self.index_version = None
+        self.semi_joins = True
+
+        # The number of rows in each relvar when the plan was made, or None
+        # if the plan was made for a script, before its relvars had values.
+        self.row_counts = None
+
+    def get_plan(self, database, ctx, semi_joins=True):
+        if self.plan is not None and \
+           (self.index_version != database.index_version or
+            self.semi_joins != semi_joins):
+            self.plan = None
+
+        if self.plan is not None:
+            for (name, attrs) in self.relvars.items():
+                relval = database.get_relvar(name)
+                if relval is None or relval.attributes != attrs or \
+                   (self.row_counts is not None and
+                    _size_changed(self.row_counts[name], relval.num_rows())):
+                    self.plan = None
+                    break
+
+        if self.plan is None:
+            self.plan = optimize(build_plan(database, ctx), database,
+                                 semi_joins)
+            self.relvars = plan_relvars(self.plan)
+            self.index_version = database.index_version
+            self.semi_joins = semi_joins
+            self.row_counts = dict([(name, database.get_relvar(name).num_rows())
+                                    for name in self.relvars])
+
+        return self.plan
+
+
+# A plan is made again when one of its relvars grows or shrinks by more than
+# this factor, since the best join order may then be different.
+REPLAN_SIZE_FACTOR = 2
+
+
+def _size_changed(old_rows, new_rows):
+    (old_rows, new_rows) = (max(old_rows, 1), max(new_rows, 1))
+    return new_rows > old_rows * REPLAN_SIZE_FACTOR or \
+           old_rows > new_rows * REPLAN_SIZE_FACTOR
+
+
+# The default number of statements in a StatementCache.
+DEFAULT_STATEMENT_CACHE_SIZE = 512
+
+
+# A least-recently-used cache of parsed statements and their plans, so that a
+# statement that is run repeatedly is only lexed, parsed and planned once.
+# Statements are keyed by their text with whitespace normalized.
+class StatementCache:
+    def __init__(self, max_entries=DEFAULT_STATEMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Collapses each run of whitespace outside of string literals into a
+    # single space, and removes it entirely next to brackets, commas and
+    # semicolons, which can't combine with anything else into one token.
+    @staticmethod
+    def normalize(ra_str):
+        parts = re.split(r'("[^"]*")', ra_str)
+        for i in range(0, len(parts), 2):
+            part = re.sub(r'\s+', ' ', parts[i])
+            parts[i] = re.sub(r' ?([][(){},;]) ?', r'\1', part)
+
+        return ''.join(parts).strip()
+
+    # Returns the CachedStatement for the statement text, parsing it if it
+    # isn't in the cache.
+    def lookup(self, ra_str):
+        key = StatementCache.normalize(ra_str)
+        stmt = self.entries.get(key)
+        if stmt is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return stmt
+
+        self.misses += 1
+        stmt = CachedStatement(parse_ra_stmt(ra_str))
+        self.entries[key] = stmt
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        return stmt
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            'entries'     : len(self.entries),
+            'max_entries' : self.max_entries,
+            'hits'        : self.hits,
+            'misses'      : self.misses,
+            'evictions'   : self.evictions,
         }
 
-        op = op_map[ctx.op.text]
-        return self.visit(ctx.scalarExpr(0)) + " " + op + " " + \
-               self.visit(ctx.scalarExpr(1))
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprAnd.
-    def visitScalarExprAnd(self, ctx:RelationalAlgebraParser.ScalarExprAndContext):
-        return self.visit(ctx.scalarExpr(0)) + " and " + \
-               self.visit(ctx.scalarExpr(1))
 
+statement_cache = StatementCache()
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprLiteral.
-    #def visitScalarExprLiteral(self, ctx:RelationalAlgebraParser.ScalarExprLiteralContext):
-    #    return self.visitChildren(ctx)
 
+# Evaluates a statement against the database.  Statements are looked up in
+# the specified StatementCache, which is shared by all calls by default; pass
+# None to parse and plan the statement from scratch.  The plan is run by the
+# specified executor, such as a ParallelExecutor from ra_parallel, or by a
+# new PlanExecutor.
+def eval_ra_expr(database, ra_str, cache=statement_cache, executor=None):
+    if cache is None:
+        parse_tree = parse_ra_stmt(ra_str)
+        visitor = RelationalAlgebraEvaluator(database, executor=executor)
+        return visitor.visit(parse_tree)
 
-    # Visit a parse tree produced by RelationalAlgebraParser#ScalarExprParens.
-    def visitScalarExprParens(self, ctx:RelationalAlgebraParser.ScalarExprParensContext):
-        return "(" + self.visit(ctx.scalarExpr()) + ")"
+    stmt = cache.lookup(ra_str)
+    visitor = RelationalAlgebraEvaluator(database, stmt, executor)
+    return visitor.visit(stmt.parse_tree)
 
 
-    # Visit a parse tree produced by RelationalAlgebraParser#AttrNameSimple.
-    def visitAttrNameSimple(self, ctx:RelationalAlgebraParser.AttrNameSimpleContext):
-        return ctx.NAME().getText()
-
-
-    # Visit a parse tree produced by RelationalAlgebraParser#AttrNameQualified.
-    def visitAttrNameQualified(self, ctx:RelationalAlgebraParser.AttrNameQualifiedContext):
-        return ".".join([n.getText() for n in ctx.NAME()])
+# === SCRIPTS ================================================================
+#
+# A script of several statements is planned as a whole before any of it is
+# run, so that subexpressions that appear more than once - within a statement
+# or across statements - are only computed once.  Two subexpressions are the
+# same if their plans have the same signature and they read the same version
+# of every relation variable, where each assignment in the script creates a
+# new version of its relvar.
 
+# Stands in for the database while a script is planned, giving relation
+# variables the attributes that they will have when each statement is run.
+class _ScriptSchema:
+    def __init__(self, database):
+        self.database = database
 
-    # Visit a parse tree produced by RelationalAlgebraParser#LiteralNumber.
-    def visitLiteralNumber(self, ctx:RelationalAlgebraParser.LiteralNumberContext):
-        return ctx.NUMBER().getText()
+        # Attributes of the relvars assigned by the script so far, or None if
+        # a relvar's attributes couldn't be worked out.
+        self.attrs = {}
 
+    def get_relvar(self, name):
+        if name in self.attrs:
+            attrs = self.attrs[name]
+            return RelationValue(attrs) if attrs is not None else None
 
-    # Visit a parse tree produced by RelationalAlgebraParser#LiteralString.
-    def visitLiteralString(self, ctx:RelationalAlgebraParser.LiteralStringContext):
-        return ctx.STRING().getText()
+        return self.database.get_relvar(name)
 
 
-    # RelationalAlgebraParser#LiteralTrue.
-    def visitLiteralTrue(self, ctx:RelationalAlgebraParser.LiteralTrueContext):
-        return "True"
+# A PlanExecutor that keeps the results of the shared subexpressions of a
+# script, so that each one is only computed once.
+class SharedResultExecutor(PlanExecutor):
+    def __init__(self, database, shared, max_groups=DEFAULT_MAX_GROUPS):
+        super().__init__(database, max_groups)
 
+        # Maps the ids of the plan nodes whose results are reused to their
+        # signatures, and signatures to their results once computed.
+        self.shared = shared
+        self.results = {}
 
-    # RelationalAlgebraParser#LiteralFalse.
-    def visitLiteralFalse(self, ctx:RelationalAlgebraParser.LiteralFalseContext):
-        return "False"
+    def stream(self, plan):
+        signature = self.shared.get(id(plan))
+        if signature is None:
+            return super().stream(plan)
 
+        result = self.results.get(signature)
+        if result is None:
+            result = super().stream(plan).materialize()
+            self.results[signature] = result
 
-    # RelationalAlgebraParser#LiteralNull.
-    def visitLiteralNull(self, ctx:RelationalAlgebraParser.LiteralNullContext):
-        return "None"
+        return RowStream.from_relval(result)
 
+    def release(self, signatures):
+        for signature in signatures:
+            self.results.pop(signature, None)
 
-def eval_ra_expr(database, ra_str):
-    input_stream = InputStream(ra_str)
-    lexer = RelationalAlgebraLexer(input_stream)
-    token_stream = CommonTokenStream(lexer)
-    parser = RelationalAlgebraParser(token_stream)
 
-    parse_tree = parser.relStmt()
-    visitor = RelationalAlgebraEvaluator(database)
-    return visitor.visit(parse_tree)
+# A script that has been parsed and planned, ready to run.
+class Script:
+    def __init__(self, database, parse_tree):
+        self.database = database
+        self.stmts = parse_tree.relStmt()
+
+        # A CachedStatement per statement, with the plan chosen for it, or
+        # None for schema statements.  The plans must stay alive for as long
+        # as the script, since they are identified by id.
+        self.cached_stmts = []
+
+        # For each statement, the signatures of the shared results whose last
+        # use is in that statement.
+        self.last_uses = [[] for stmt in self.stmts]
+
+        self._plan()
+
+    def _plan(self):
+        schema = _ScriptSchema(self.database)
+        versions = {}
+        node_signatures = {}
+        counts = collections.Counter()
+        last_use = {}
+
+        def visit(node, i):
+            signature = (node.signature(), tuple(sorted(
+                [(n, versions.get(n, 0)) for n in plan_relvars(node)])))
+            node_signatures[id(node)] = signature
+            counts[signature] += 1
+            last_use[signature] = i
+
+            # Subexpressions of a reused result are only computed once.
+            if counts[signature] == 1:
+                for c in node.children:
+                    visit(c, i)
+
+        for (i, stmt) in enumerate(self.stmts):
+            if isinstance(stmt, RelationalAlgebraParser.RelStmtSchemaContext):
+                self.cached_stmts.append(None)
+                continue
+
+            cached_stmt = CachedStatement(stmt)
+            self.cached_stmts.append(cached_stmt)
+
+            plan = None
+            try:
+                plan = optimize(build_plan(schema, stmt.relExpr()),
+                                self.database)
+            except ValueError:
+                # The error is reported when the statement is run.
+                pass
+
+            if plan is not None:
+                cached_stmt.plan = plan
+                cached_stmt.relvars = plan_relvars(plan)
+                cached_stmt.index_version = self.database.index_version
+                visit(plan, i)
+
+            if isinstance(stmt, RelationalAlgebraParser.RelStmtAssignContext):
+                name = stmt.relName.text
+                if plan is None:
+                    attrs = None
+                elif len(stmt.attrNames) > 0:
+                    attrs = [name + '.' + a.text for a in stmt.attrNames]
+                elif schema.get_relvar(name) is not None:
+                    attrs = schema.get_relvar(name).get_attrs()
+                else:
+                    attrs = plan.attrs
+
+                schema.attrs[name] = attrs
+                versions[name] = i + 1
+
+        self.shared = {}
+        for (node_id, signature) in node_signatures.items():
+            if counts[signature] > 1 and signature[0][0] not in \
+               ['RelVarNode', 'ConstantNode']:
+                self.shared[node_id] = signature
+
+        for signature in set(self.shared.values()):
+            self.last_uses[last_use[signature]].append(signature)
+
+    # Runs the script's statements in order, returning the list of their
+    # results (None for schema statements).
+    def run(self, max_groups=DEFAULT_MAX_GROUPS):
+        executor = SharedResultExecutor(self.database, self.shared,
+                                        max_groups)
+        results = []
+        for (i, stmt) in enumerate(self.stmts):
+            cached_stmt = self.cached_stmts[i]
+            if cached_stmt is None:
+                results.append(None)
+                continue
+
+            visitor = RelationalAlgebraEvaluator(self.database, cached_stmt,
+                                                 executor)
+            results.append(visitor.visit(stmt))
+            executor.release(self.last_uses[i])
+
+        return results
+
+
+# Evaluates a script of statements against the database, returning the list
+# of their results.
+def eval_ra_script(database, ra_str):
+    return Script(database, parse_ra_stmts(ra_str)).run()
+
+
+# Returns an EXPLAIN-style printout of the logical plan for a statement, both
+# as written and after optimization.  semi_joins is False for plans that are
+# run with bag semantics.
+def explain_ra_expr(database, ra_str, semi_joins=True):
+    parse_tree = parse_ra_stmt(ra_str)
+    plan = build_plan(database, parse_tree.relExpr())
+
+    return "Logical plan:\n" + explain(plan, 1) + "\n\n" + \
+           "Optimized plan:\n" + \
+           explain(optimize(plan, database, semi_joins), 1)
+
+
+# Returns a printout of the statistics that the optimizer keeps about a
+# relation variable.
+def describe_relvar_stats(database, name):
+    stats = database.get_stats(name)
+    lines = ['%s:  %d rows' % (name, stats.num_rows)]
+    for (i, attr) in enumerate(stats.relval.get_attrs()):
+        a = stats.get_attr_stats(i)
+        lines.append('  %s:  %d distinct, %d null, min %s, max %s' % \
+                     (attr, a.distinct, a.null_count, a.min, a.max))
+
+    return '\n'.join(lines)
+
+
+# Returns the ViewManager that maintains the database's views, creating it if
+# necessary.
+def get_view_manager(database):
+    for listener in database.listeners:
+        if isinstance(listener, ViewManager):
+            return listener
+
+    return ViewManager(database, PlanExecutor(database))
+
+
+# Creates a materialized view from an assignment statement, such as
+# "active <- SIGMA[status = 'active'](users);".  The relation variable being
+# assigned is kept up to date as the relvars in the expression change.
+def create_view(database, ra_str):
+    parse_tree = parse_ra_stmt(ra_str)
+    if not isinstance(parse_tree, RelationalAlgebraParser.RelStmtAssignContext):
+        raise ValueError('A view must be defined with an assignment statement')
+
+    attr_names = [a.text for a in parse_tree.attrNames] or None
+    return get_view_manager(database).create_view(parse_tree.relName.text,
+        parse_tree.relExpr(), attr_names)
+
+
+def drop_view(database, name):
+    get_view_manager(database).drop_view(name)
 
 
 if __name__ == '__main__':
-    db = Database()
+    args = sys.argv[1:]
+    if '--db' in args:
+        # Relation variables are stored in the specified directory.
+        db = DiskDatabase(args[args.index('--db') + 1])
+    elif '--columnar' in args:
+        db = ColumnarDatabase()
+    else:
+        db = Database()
+
+    executor = None
+    if '--workers' in args:
+        # Large operators are run on a pool of this many worker processes.
+        from ra_parallel import ParallelExecutor
+        executor = ParallelExecutor(db,
+                                    int(args[args.index('--workers') + 1]))
+
+    if '--bag' in args:
+        # Queries are run with bag semantics, keeping duplicate rows.
+        if executor is not None:
+            sys.exit('ERROR:  --bag cannot be used with --workers')
+
+        from ra_bag import BagExecutor
+        executor = BagExecutor(db)
+
+    semi_joins = executor is None or not executor.bag_semantics
 
     while True:
         try:
@@ -527,9 +818,69 @@ if __name__ == '__main__':
             if inp in ['exit', 'quit']:
                 break
 
-            result = eval_ra_expr(db, inp)
+            if inp.lower().startswith('explain analyze '):
+                # Runs the statement, and shows what each operator did.
+                from ra_profile import explain_analyze_ra_expr
+                print(explain_analyze_ra_expr(db,
+                                              inp[len('explain analyze '):]))
+                continue
+
+            if inp.lower().startswith('explain '):
+                print(explain_ra_expr(db, inp[len('explain '):], semi_joins))
+                continue
+
+            if inp.lower().startswith('stats '):
+                # stats relvar_name
+                print(describe_relvar_stats(db,
+                    inp[len('stats '):].strip().rstrip(';')))
+                continue
+
+            if inp.lower().startswith('view '):
+                # view relvar_name <- relExpr;
+                create_view(db, inp[len('view '):])
+                continue
+
+            if inp.lower().startswith('drop view '):
+                drop_view(db, inp[len('drop view '):].strip().rstrip(';'))
+                continue
+
+            if inp.lower().startswith('index '):
+                # index relvar_name(attr, ...) [hash|sorted]
+                m = re.match(r'index\s+(\w+)\s*\(([^)]*)\)\s*(\w*)\s*$',
+                             inp, re.IGNORECASE)
+                if m is None:
+                    raise ValueError('Usage:  index NAME(ATTR, ...) ' \
+                                     '[hash|sorted]')
+
+                db.create_index(m.group(1),
+                                [a.strip() for a in m.group(2).split(',')],
+                                m.group(3).lower() or HASH_INDEX)
+                continue
+
+            if inp.lower().startswith('run '):
+                # run script_file, which is run with set semantics even
+                # with --bag.
+                with open(inp[len('run '):].strip()) as f:
+                    for result in eval_ra_script(db, f.read()):
+                        if result is not None:
+                            result.pretty_print()
+
+                continue
+
+            if inp.lower().startswith('import '):
+                # import relvar_name file.csv
+                (cmd, name, path) = inp.split(None, 2)
+                db.set_relvar(name, read_csv(path, name))
+                continue
+
+            if inp.lower().startswith('export '):
+                # export file.csv statement
+                (cmd, path, stmt) = inp.split(None, 2)
+                write_csv(eval_ra_expr(db, stmt, executor=executor), path)
+                continue
+
+            result = eval_ra_expr(db, inp, executor=executor)
             result.pretty_print()
         except Exception as e:
             print("ERROR:  " + str(e))
             raise e
-
@@ -0,0 +1,582 @@
+# A hand-written front end for the relational algebra language.
+#
+# The parser that ANTLR generates from RelationalAlgebra.g4 is slow in
+# Python, since it predicts each alternative by simulating the grammar's ATN.
+# This module tokenizes with a single regular expression and parses by
+# recursive descent, using precedence climbing for the left-recursive rules,
+# and builds the same parse trees as the generated parser - the same context
+# classes, labels and tokens - so the existing visitors work on them
+# unchanged.
+#
+# The parser doesn't recover from syntax errors; it raises a ParseError at the
+# first one.  The functions in parser.py parse such input again with ANTLR,
+# which reports every error in the usual way.
+
+import re
+
+from antlr4 import ParserRuleContext
+from antlr4.Token import CommonToken, Token
+from antlr4.tree.Tree import TerminalNodeImpl
+
+from RelationalAlgebraParser import RelationalAlgebraParser
+
+
+P = RelationalAlgebraParser
+
+
+class ParseError(ValueError):
+    def __init__(self, line, column, msg):
+        super().__init__('Line %d, column %d:  %s' % (line, column, msg))
+        self.line = line
+        self.column = column
+        self.msg = msg
+
+
+# === TOKENS =================================================================
+
+KEYWORDS = {
+    'sigma'     : P.SELECT,
+    'pi'        : P.PROJECT,
+    'rho'       : P.RENAME,
+    'delta'     : P.DELTA,
+    'group'     : P.GROUP_AGGREGATE,
+    'cross'     : P.CROSS,
+    'times'     : P.TIMES,
+    'divide'    : P.DIVIDE,
+    'bowtie'    : P.BOWTIE,
+    'lbowtie'   : P.LEFT_BOWTIE,
+    'rbowtie'   : P.RIGHT_BOWTIE,
+    'fbowtie'   : P.FULL_BOWTIE,
+    'semijoin'  : P.SEMI_JOIN,
+    'antijoin'  : P.ANTI_JOIN,
+    'union'     : P.UNION,
+    'intersect' : P.INTERSECT,
+    'minus'     : P.MINUS,
+    'and'       : P.AND,
+    'as'        : P.AS,
+    'false'     : P.FALSE,
+    'not'       : P.NOT,
+    'null'      : P.NULL,
+    'or'        : P.OR,
+    'true'      : P.TRUE,
+}
+
+# The token types of the grammar's literal tokens, such as "<-" and "(".
+LITERAL_TYPES = dict([(name[1:-1], i) for (i, name) in
+                      enumerate(P.literalNames) if name.startswith("'")])
+
+# Like the ANTLR lexer, this matches the longest token at each point.  A
+# NUMBER that starts with a sign is longer than the "+" or "-" literal, and
+# the literals are tried longest first so that e.g. "<=" is preferred over
+# "<".  Keywords are matched as words, then looked up case-insensitively.
+# Any other character is an error.
+_TOKEN_RE = re.compile('|'.join([
+    r'(?P<ws>[ \t\r\n]+)',
+    r'(?P<word>[a-zA-Z][a-zA-Z0-9_]*)',
+    r'(?P<number>[+-]?[0-9]+(?:\.[0-9]+)?)',
+    r'(?P<string>"[^"]*")',
+    '(?P<literal>%s)' % '|'.join([re.escape(lit) for lit in
+                                  sorted(LITERAL_TYPES, key=len, reverse=True)]),
+    r'(?P<error>.)',
+]), re.DOTALL)
+
+
+# Tokens are made without calling CommonToken's constructor, which takes a
+# large part of the time spent tokenizing; every slot is set here instead.
+def _make_token(ttype, text, start, line, column, index):
+    tok = object.__new__(CommonToken)
+    tok.source = CommonToken.EMPTY_SOURCE
+    tok.type = ttype
+    tok.channel = Token.DEFAULT_CHANNEL
+    tok.start = start
+    tok.stop = start + len(text) - 1
+    tok.tokenIndex = index
+    tok.line = line
+    tok.column = column
+    tok._text = text
+    return tok
+
+
+# Splits the text into a list of tokens, ending with an EOF token.
+def tokenize(text):
+    tokens = []
+    (line, line_start) = (1, 0)
+
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        value = m.group()
+        pos = m.start()
+
+        if kind == 'word':
+            ttype = KEYWORDS.get(value.lower())
+            if ttype is None:
+                ttype = P.NAME if value[0].islower() else P.SCHEMA_NAME
+        elif kind == 'literal':
+            ttype = LITERAL_TYPES[value]
+        elif kind == 'number':
+            ttype = P.NUMBER
+        elif kind == 'string':
+            ttype = P.STRING
+        elif kind == 'error':
+            raise ParseError(line, pos - line_start,
+                             "token recognition error at: '%s'" % value)
+        else:
+            ttype = None
+
+        if ttype is not None:
+            tokens.append(_make_token(ttype, value, pos, line,
+                                      pos - line_start, len(tokens)))
+
+        # Whitespace and strings may span lines.
+        if kind in ['ws', 'string'] and '\n' in value:
+            line += value.count('\n')
+            line_start = pos + value.rindex('\n') + 1
+
+    pos = len(text)
+    tokens.append(_make_token(Token.EOF, '<EOF>', pos, line, pos - line_start,
+                              len(tokens)))
+    return tokens
+
+
+# === PRECEDENCE =============================================================
+#
+# The binary operators of the left-recursive rules, with their precedences
+# and the contexts they produce.  As ANTLR does for left-recursive rules,
+# alternatives listed earlier in the grammar bind more tightly, and all of
+# the operators are left-associative.
+
+REL_BINARY_OPS = {
+    P.BOWTIE       : (11, P.RelExprInnerJoinContext),
+    P.LEFT_BOWTIE  : (10, P.RelExprLeftOuterJoinContext),
+    P.RIGHT_BOWTIE : (9, P.RelExprRightOuterJoinContext),
+    P.FULL_BOWTIE  : (8, P.RelExprFullOuterJoinContext),
+    P.SEMI_JOIN    : (7, P.RelExprSemiJoinContext),
+    P.ANTI_JOIN    : (6, P.RelExprAntiJoinContext),
+    P.CROSS        : (5, P.RelExprCrossProductContext),
+    P.TIMES        : (5, P.RelExprCrossProductContext),
+    P.DIVIDE       : (4, P.RelExprDivisionContext),
+    P.UNION        : (3, P.RelExprSetUnionContext),
+    P.INTERSECT    : (2, P.RelExprSetIntersectContext),
+    P.MINUS        : (1, P.RelExprSetDifferenceContext),
+}
+
+JOIN_OPS = [P.BOWTIE, P.LEFT_BOWTIE, P.RIGHT_BOWTIE, P.FULL_BOWTIE,
+            P.SEMI_JOIN, P.ANTI_JOIN]
+
+SCHEMA_BINARY_OPS = {
+    P.UNION     : (3, P.SchemaExprSetUnionContext),
+    P.INTERSECT : (2, P.SchemaExprSetIntersectContext),
+    P.MINUS     : (1, P.SchemaExprSetDifferenceContext),
+}
+
+SCALAR_BINARY_OPS = dict(
+    [(LITERAL_TYPES[op], (7, P.ScalarExprMulContext)) for op in '*/'] +
+    [(LITERAL_TYPES[op], (6, P.ScalarExprAddContext)) for op in '+-'] +
+    [(LITERAL_TYPES[op], (5, P.ScalarExprCompareContext))
+     for op in ['>', '<', '>=', '<=', '!=', '=', '==', '<>']] +
+    [(op, (3, P.ScalarExprAndContext)) for op in [P.AND, LITERAL_TYPES['&&']]] +
+    [(op, (2, P.ScalarExprOrContext)) for op in [P.OR, LITERAL_TYPES['||']]])
+
+# Prefix operators apply to an operand that only contains operators of at
+# least their own precedence:  "-a * b" is "(-a) * b", while "NOT a = b" is
+# "NOT (a = b)" and "NOT a AND b" is "(NOT a) AND b".
+UNARY_SIGN_PREC = 8
+NOT_PREC = 4
+
+LITERAL_VALUE_CONTEXTS = {
+    P.NUMBER : P.LiteralNumberContext,
+    P.STRING : P.LiteralStringContext,
+    P.TRUE   : P.LiteralTrueContext,
+    P.FALSE  : P.LiteralFalseContext,
+    P.NULL   : P.LiteralNullContext,
+}
+
+T_LPAREN = LITERAL_TYPES['(']
+T_RPAREN = LITERAL_TYPES[')']
+T_COMMA = LITERAL_TYPES[',']
+T_SEMI = LITERAL_TYPES[';']
+T_ARROW = LITERAL_TYPES['<-']
+T_EQUALS = LITERAL_TYPES['=']
+T_LBRACKET = LITERAL_TYPES['[']
+T_RBRACKET = LITERAL_TYPES[']']
+T_LBRACE = LITERAL_TYPES['{']
+T_RBRACE = LITERAL_TYPES['}']
+T_DOT = LITERAL_TYPES['.']
+T_MINUS = LITERAL_TYPES['-']
+T_BANG = LITERAL_TYPES['!']
+
+
+# The generated contexts for labeled alternatives copy their position in the
+# tree from a context of the rule itself; nodes here are positioned as they
+# are added, so they all copy from this empty one.
+_NO_CONTEXT = ParserRuleContext()
+
+
+# TerminalNodeImpl overrides __setattr__, which makes creating one slow.
+class _TerminalNode(TerminalNodeImpl):
+    __setattr__ = object.__setattr__
+
+
+def _token_name(ttype):
+    if ttype == Token.EOF:
+        return '<EOF>'
+    elif ttype < len(P.literalNames) and P.literalNames[ttype] != '<INVALID>':
+        return P.literalNames[ttype]
+
+    return P.symbolicNames[ttype]
+
+
+# === PARSER =================================================================
+
+# Each method parses the grammar rule of the same name, returning its
+# context.
+class FastParser:
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.types = [tok.type for tok in self.tokens]
+        self.pos = 0
+
+    # Returns the type of the token k tokens ahead.
+    def la(self, k=0):
+        i = self.pos + k
+        return self.types[i] if i < len(self.types) else Token.EOF
+
+    def error(self, msg=None):
+        tok = self.tokens[self.pos]
+        if msg is None:
+            msg = "extraneous input '%s'" % tok.text
+
+        raise ParseError(tok.line, tok.column, msg)
+
+    def match(self, ctx, ttype):
+        tok = self.tokens[self.pos]
+        if tok.type != ttype:
+            self.error("mismatched input '%s' expecting %s" % \
+                       (tok.text, _token_name(ttype)))
+
+        self.pos += 1
+        node = _TerminalNode(tok)
+        node.parentCtx = ctx
+        ctx.addChild(node)
+        if ctx.start is None:
+            ctx.start = tok
+        ctx.stop = tok
+        return tok
+
+    def add(self, ctx, child):
+        ctx.addChild(child)
+        child.parentCtx = ctx
+        if ctx.start is None:
+            ctx.start = child.start
+        ctx.stop = child.stop
+        return child
+
+    # Matches a comma-separated list of items, each parsed by the function.
+    def add_list(self, ctx, parse_fn, items=None):
+        while True:
+            child = self.add(ctx, parse_fn())
+            if items is not None:
+                items.append(child)
+
+            if self.la() != T_COMMA:
+                break
+
+            self.match(ctx, T_COMMA)
+
+
+    def relStmts(self):
+        ctx = P.RelStmtsContext(None)
+        while self.la() != Token.EOF:
+            self.add(ctx, self.relStmt())
+
+        return ctx
+
+
+    def relStmt(self):
+        if self.la() == P.NAME and self.la(1) in [T_ARROW, T_LPAREN]:
+            ctx = P.RelStmtAssignContext(None, _NO_CONTEXT)
+            ctx.relName = self.match(ctx, P.NAME)
+            if self.la() == T_LPAREN:
+                self.match(ctx, T_LPAREN)
+                ctx.attrNames.append(self.match(ctx, P.NAME))
+                while self.la() == T_COMMA:
+                    self.match(ctx, T_COMMA)
+                    ctx.attrNames.append(self.match(ctx, P.NAME))
+                self.match(ctx, T_RPAREN)
+
+            self.match(ctx, T_ARROW)
+            self.add(ctx, self.relExpr())
+
+        elif self.la() == P.SCHEMA_NAME:
+            ctx = P.RelStmtSchemaContext(None, _NO_CONTEXT)
+            self.match(ctx, P.SCHEMA_NAME)
+            self.match(ctx, T_EQUALS)
+            self.match(ctx, T_LPAREN)
+            self.match(ctx, P.NAME)
+            while self.la() == T_COMMA:
+                self.match(ctx, T_COMMA)
+                self.match(ctx, P.NAME)
+            self.match(ctx, T_RPAREN)
+
+        else:
+            ctx = P.RelStmtNoAssignContext(None, _NO_CONTEXT)
+            self.add(ctx, self.relExpr())
+
+        self.match(ctx, T_SEMI)
+        return ctx
+
+
+    def relExpr(self, min_prec=0):
+        lhs = self.relExprPrimary()
+
+        while True:
+            op = REL_BINARY_OPS.get(self.la())
+            if op is None or op[0] < min_prec:
+                return lhs
+
+            (prec, ctx_class) = op
+            ctx = ctx_class(None, _NO_CONTEXT)
+            self.add(ctx, lhs)
+            is_join = self.la() in JOIN_OPS
+            self.match(ctx, self.la())
+
+            # Where "[...]" could be either a join condition or the grouping
+            # of a GROUP on the right, the generated parser takes it as the
+            # join condition, as this does.
+            if is_join and self.la() == T_LBRACKET:
+                self.match(ctx, T_LBRACKET)
+                self.add(ctx, self.scalarExpr())
+                self.match(ctx, T_RBRACKET)
+
+            self.add(ctx, self.relExpr(prec + 1))
+            lhs = ctx
+
+
+    def relExprPrimary(self):
+        t = self.la()
+
+        if t == P.SELECT:
+            ctx = P.RelExprSelectContext(None, _NO_CONTEXT)
+            self.match(ctx, P.SELECT)
+            self.match(ctx, T_LBRACKET)
+            self.add(ctx, self.scalarExpr())
+            self.match(ctx, T_RBRACKET)
+            self.parenRelExpr(ctx)
+
+        elif t == P.PROJECT:
+            ctx = P.RelExprProjectContext(None, _NO_CONTEXT)
+            self.match(ctx, P.PROJECT)
+            self.match(ctx, T_LBRACKET)
+            self.add_list(ctx, self.projectExpr)
+            self.match(ctx, T_RBRACKET)
+            self.parenRelExpr(ctx)
+
+        elif t == P.RENAME:
+            ctx = P.RelExprRenameContext(None, _NO_CONTEXT)
+            self.match(ctx, P.RENAME)
+            self.match(ctx, T_LBRACKET)
+            self.add_list(ctx, self.namedScalarExpr)
+            self.match(ctx, T_RBRACKET)
+            self.parenRelExpr(ctx)
+
+        elif t == P.DELTA:
+            ctx = P.RelExprDistinctContext(None, _NO_CONTEXT)
+            self.match(ctx, P.DELTA)
+            self.parenRelExpr(ctx)
+
+        elif t in [T_LBRACKET, P.GROUP_AGGREGATE]:
+            ctx = P.RelExprGroupAggregateContext(None, _NO_CONTEXT)
+            if t == T_LBRACKET:
+                self.match(ctx, T_LBRACKET)
+                self.add_list(ctx, self.scalarExpr, ctx.groups)
+                self.match(ctx, T_RBRACKET)
+
+            self.match(ctx, P.GROUP_AGGREGATE)
+            self.match(ctx, T_LBRACKET)
+            self.add_list(ctx, self.namedScalarExpr, ctx.aggregates)
+            self.match(ctx, T_RBRACKET)
+            self.parenRelExpr(ctx)
+
+        elif t == P.NAME:
+            ctx = P.RelExprRelationVariableContext(None, _NO_CONTEXT)
+            self.match(ctx, P.NAME)
+
+        elif t == T_LBRACE:
+            ctx = P.RelExprConstantRelationContext(None, _NO_CONTEXT)
+            self.match(ctx, T_LBRACE)
+            if self.la() != T_RBRACE:
+                self.add_list(ctx, self.rowExpr)
+            self.match(ctx, T_RBRACE)
+
+        elif t == T_LPAREN:
+            ctx = P.RelExprParensContext(None, _NO_CONTEXT)
+            self.parenRelExpr(ctx)
+
+        else:
+            self.error("no viable alternative at input '%s'" % \
+                       self.tokens[self.pos].text)
+
+        return ctx
+
+
+    def parenRelExpr(self, ctx):
+        self.match(ctx, T_LPAREN)
+        self.add(ctx, self.relExpr())
+        self.match(ctx, T_RPAREN)
+
+
+    def rowExpr(self):
+        ctx = P.RowExprContext(None)
+        self.match(ctx, T_LPAREN)
+        self.add_list(ctx, self.literalValue)
+        self.match(ctx, T_RPAREN)
+        return ctx
+
+
+    def projectExpr(self):
+        # A schema expression starts with a SCHEMA_NAME, possibly after some
+        # parentheses; a scalar expression never does.
+        k = 0
+        while self.la(k) == T_LPAREN:
+            k += 1
+
+        if self.la(k) == P.SCHEMA_NAME:
+            ctx = P.ProjectSchemaExprContext(None, _NO_CONTEXT)
+            self.add(ctx, self.schemaExpr())
+        else:
+            ctx = P.ProjectNamedScalarExprContext(None, _NO_CONTEXT)
+            self.add(ctx, self.namedScalarExpr())
+
+        return ctx
+
+
+    def schemaExpr(self, min_prec=0):
+        if self.la() == T_LPAREN:
+            lhs = P.SchemaExprParensContext(None, _NO_CONTEXT)
+            self.match(lhs, T_LPAREN)
+            self.add(lhs, self.schemaExpr())
+            self.match(lhs, T_RPAREN)
+        else:
+            lhs = P.SchemaExprNameContext(None, _NO_CONTEXT)
+            self.match(lhs, P.SCHEMA_NAME)
+
+        while True:
+            op = SCHEMA_BINARY_OPS.get(self.la())
+            if op is None or op[0] < min_prec:
+                return lhs
+
+            (prec, ctx_class) = op
+            ctx = ctx_class(None, _NO_CONTEXT)
+            self.add(ctx, lhs)
+            self.match(ctx, self.la())
+            self.add(ctx, self.schemaExpr(prec + 1))
+            lhs = ctx
+
+
+    def namedScalarExpr(self):
+        ctx = P.NamedScalarExprContext(None)
+        self.add(ctx, self.scalarExpr())
+        if self.la() == P.AS:
+            self.match(ctx, P.AS)
+            self.match(ctx, P.NAME)
+
+        return ctx
+
+
+    def scalarExpr(self, min_prec=0):
+        lhs = self.scalarExprPrimary()
+
+        while True:
+            op = SCALAR_BINARY_OPS.get(self.la())
+            if op is None or op[0] < min_prec:
+                return lhs
+
+            (prec, ctx_class) = op
+            ctx = ctx_class(None, _NO_CONTEXT)
+            self.add(ctx, lhs)
+            tok = self.match(ctx, self.la())
+            if hasattr(ctx, 'op'):
+                ctx.op = tok
+            self.add(ctx, self.scalarExpr(prec + 1))
+            lhs = ctx
+
+
+    def scalarExprPrimary(self):
+        t = self.la()
+
+        if t == P.NAME and self.la(1) == T_LPAREN:
+            ctx = P.ScalarExprFunctionContext(None, _NO_CONTEXT)
+            self.match(ctx, P.NAME)
+            self.match(ctx, T_LPAREN)
+            if self.la() != T_RPAREN:
+                self.add_list(ctx, self.scalarExpr)
+            self.match(ctx, T_RPAREN)
+
+        elif t == P.NAME:
+            ctx = P.ScalarExprAttributeContext(None, _NO_CONTEXT)
+            self.add(ctx, self.attrName())
+
+        elif t in LITERAL_VALUE_CONTEXTS:
+            ctx = P.ScalarExprLiteralContext(None, _NO_CONTEXT)
+            self.add(ctx, self.literalValue())
+
+        elif t == T_MINUS:
+            ctx = P.ScalarExprUnarySignContext(None, _NO_CONTEXT)
+            self.match(ctx, T_MINUS)
+            self.add(ctx, self.scalarExpr(UNARY_SIGN_PREC))
+
+        elif t in [P.NOT, T_BANG]:
+            ctx = P.ScalarExprNotContext(None, _NO_CONTEXT)
+            self.match(ctx, t)
+            self.add(ctx, self.scalarExpr(NOT_PREC))
+
+        elif t == T_LPAREN:
+            ctx = P.ScalarExprParensContext(None, _NO_CONTEXT)
+            self.match(ctx, T_LPAREN)
+            self.add(ctx, self.scalarExpr())
+            self.match(ctx, T_RPAREN)
+
+        else:
+            self.error("no viable alternative at input '%s'" % \
+                       self.tokens[self.pos].text)
+
+        return ctx
+
+
+    def attrName(self):
+        if self.la(1) == T_DOT:
+            ctx = P.AttrNameQualifiedContext(None, _NO_CONTEXT)
+            ctx.table = self.match(ctx, P.NAME)
+            self.match(ctx, T_DOT)
+            ctx.attr = self.match(ctx, P.NAME)
+        else:
+            ctx = P.AttrNameSimpleContext(None, _NO_CONTEXT)
+            ctx.attr = self.match(ctx, P.NAME)
+
+        return ctx
+
+
+    def literalValue(self):
+        ctx_class = LITERAL_VALUE_CONTEXTS.get(self.la())
+        if ctx_class is None:
+            self.error("mismatched input '%s' expecting a literal value" % \
+                       self.tokens[self.pos].text)
+
+        ctx = ctx_class(None, _NO_CONTEXT)
+        self.match(ctx, self.la())
+        return ctx
+
+
+# Parses a sequence of statements, returning a RelStmtsContext.
+def parse_relstmts(text):
+    return FastParser(text).relStmts()
+
+
+# Parses a single statement, returning a RelStmtContext.
+def parse_relstmt(text):
+    parser = FastParser(text)
+    ctx = parser.relStmt()
+    if parser.la() != Token.EOF:
+        parser.error()
+
+    return ctx
@@ -0,0 +1,128 @@
+import bisect, operator
+
+
+# Secondary indexes on relation variables.  An index is declared on a
+# relation variable in a Database, and is built from the relvar's value the
+# first time it is used after the relvar is assigned.  Rows whose key has a
+# null value are left out of the index, since null never matches anything.
+
+HASH_INDEX = 'hash'
+SORTED_INDEX = 'sorted'
+
+
+class Index:
+    def __init__(self, attrs):
+        self.attrs = list(attrs)
+
+        # The relation-value that the index was built from, if any.
+        self.relval = None
+
+    def describe(self):
+        return '%s INDEX (%s)' % (self.kind.upper(), ', '.join(self.attrs))
+
+    # Returns the positions of the index's attributes in the relation-value.
+    def _key_indexes(self, relval):
+        return [relval.get_attr_index(a) for a in self.attrs]
+
+    def build(self, relval):
+        raise NotImplementedError()
+
+    def clear(self):
+        self.relval = None
+
+
+# A hash index supports lookups of rows by the values of all of its
+# attributes.
+class HashIndex(Index):
+    kind = HASH_INDEX
+
+    def build(self, relval):
+        indexes = self._key_indexes(relval)
+        if len(indexes) == 1:
+            i = indexes[0]
+            key_fn = lambda row: (row[i],)
+        else:
+            key_fn = operator.itemgetter(*indexes)
+
+        table = {}
+        for row in relval.rows:
+            key = key_fn(row)
+            if None in key:
+                continue
+
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [row]
+            else:
+                bucket.append(row)
+
+        self.table = table
+        self.relval = relval
+
+    def clear(self):
+        super().clear()
+        self.table = None
+
+    # Returns the rows whose key is the specified tuple of values.
+    def lookup(self, key):
+        return self.table.get(key, ())
+
+
+# A sorted index is on a single attribute, and supports lookups of rows by
+# ranges of its value.  The rows are kept in a list sorted by key, which is
+# searched by bisection.
+class SortedIndex(Index):
+    kind = SORTED_INDEX
+
+    def __init__(self, attrs):
+        if len(attrs) != 1:
+            raise ValueError('A sorted index must be on exactly one attribute')
+
+        super().__init__(attrs)
+
+    def build(self, relval):
+        i = self._key_indexes(relval)[0]
+        entries = [(row[i], row) for row in relval.rows if row[i] is not None]
+        try:
+            entries.sort(key=operator.itemgetter(0))
+        except TypeError:
+            raise ValueError('Cannot build a sorted index on %s, since its ' \
+                             'values are not all comparable' % self.attrs[0])
+
+        self.keys = [k for (k, row) in entries]
+        self.rows = [row for (k, row) in entries]
+        self.relval = relval
+
+    def clear(self):
+        super().clear()
+        self.keys = None
+        self.rows = None
+
+    # Returns the rows whose key is in the range.  Either bound may be None if
+    # the range is open at that end.
+    def range(self, low=None, low_inclusive=True, high=None,
+              high_inclusive=True):
+        start = 0
+        if low is not None:
+            if low_inclusive:
+                start = bisect.bisect_left(self.keys, low)
+            else:
+                start = bisect.bisect_right(self.keys, low)
+
+        end = len(self.keys)
+        if high is not None:
+            if high_inclusive:
+                end = bisect.bisect_right(self.keys, high)
+            else:
+                end = bisect.bisect_left(self.keys, high)
+
+        return self.rows[start:end]
+
+    def lookup(self, key):
+        return self.range(key[0], True, key[0], True)
+
+
+INDEX_KINDS = {
+    HASH_INDEX   : HashIndex,
+    SORTED_INDEX : SortedIndex,
+}
@@ -0,0 +1,640 @@
+import itertools, operator
+
+from ra_scalar import AttrRef, BinaryOp, compile_predicate, compile_projection, \
+    compile_scalar_expr, make_conjunction, split_conjuncts
+
+
+INNER_JOIN = 'inner'
+LEFT_OUTER_JOIN = 'left'
+RIGHT_OUTER_JOIN = 'right'
+FULL_OUTER_JOIN = 'full'
+
+# A semi-join keeps the left rows that match at least one right row, and an
+# anti-join keeps the left rows that match none.
+SEMI_JOIN = 'semi'
+ANTI_JOIN = 'anti'
+
+
+# The comparison a op b is equivalent to b FLIPPED_OPS[op] a.
+FLIPPED_OPS = {
+    '==' : '==',
+    '<'  : '>',
+    '>'  : '<',
+    '<=' : '>=',
+    '>=' : '<=',
+}
+
+
+# Returns True if every attribute in the set of names can be resolved with the
+# specified resolve function.
+def _resolves(names, resolve):
+    if not names:
+        return False
+
+    for n in names:
+        try:
+            resolve(n)
+        except ValueError:
+            return False
+
+    return True
+
+
+# Describes how the condition of a join between two inputs will be evaluated.
+# The condition is split into its conjuncts, and each conjunct of the form
+# "lhs_expr op rhs_expr", where lhs_expr only refers to the left input and
+# rhs_expr only to the right input, is recorded as a key that the join
+# algorithms can use.  All other conjuncts are left in the residual predicate,
+# which is evaluated against the concatenation of a left and a right row.
+class JoinCondition:
+    def __init__(self):
+        self.equi_keys = []    # list of (lhs_expr, rhs_expr)
+        self.range_keys = []   # list of (lhs_expr, op, rhs_expr)
+        self.residual = None
+
+    def __str__(self):
+        parts = ['%s = %s' % (l, r) for (l, r) in self.equi_keys]
+        parts += ['%s %s %s' % (l, op, r) for (l, op, r) in self.range_keys]
+        if self.residual is not None:
+            parts.append(str(self.residual))
+
+        return ' AND '.join(parts)
+
+
+# Splits a join predicate into a JoinCondition, using the resolve functions of
+# the two inputs to work out which side each conjunct's operands refer to.
+def analyze_join_condition(expr, lhs_resolve, rhs_resolve):
+    cond = JoinCondition()
+    residual = []
+
+    for c in split_conjuncts(expr):
+        if isinstance(c, BinaryOp) and c.op in FLIPPED_OPS:
+            lhs_names = c.lhs.attr_names()
+            rhs_names = c.rhs.attr_names()
+
+            key = None
+            if _resolves(lhs_names, lhs_resolve) and \
+               _resolves(rhs_names, rhs_resolve):
+                key = (c.lhs, c.op, c.rhs)
+
+            elif _resolves(lhs_names, rhs_resolve) and \
+                 _resolves(rhs_names, lhs_resolve):
+                key = (c.rhs, FLIPPED_OPS[c.op], c.lhs)
+
+            if key is not None:
+                if key[1] == '==':
+                    cond.equi_keys.append( (key[0], key[2]) )
+                else:
+                    cond.range_keys.append(key)
+
+                continue
+
+        residual.append(c)
+
+    cond.residual = make_conjunction(residual)
+    return cond
+
+
+# Each join algorithm produces the (lhs_row, rhs_row) pairs that satisfy the
+# join condition.  The match function, if specified, is an additional test
+# that a pair must pass.  Rows whose join key contains null never match
+# anything.
+
+def hash_join_pairs(lhs_rows, rhs_rows, lhs_key_fn, rhs_key_fn, match_fn=None,
+                    build_lhs=False):
+    # Build a hash table on one input, then probe it with the other.  Callers
+    # pick the smaller input to build on, unless an outer join requires the
+    # right input to be the build side.
+    if build_lhs:
+        build_rows, build_key_fn = lhs_rows, lhs_key_fn
+        probe_rows, probe_key_fn = rhs_rows, rhs_key_fn
+    else:
+        build_rows, build_key_fn = rhs_rows, rhs_key_fn
+        probe_rows, probe_key_fn = lhs_rows, lhs_key_fn
+
+    table = {}
+    for row in build_rows:
+        key = build_key_fn(row)
+        if None in key:
+            continue
+
+        bucket = table.get(key)
+        if bucket is None:
+            table[key] = [row]
+        else:
+            bucket.append(row)
+
+    for probe_row in probe_rows:
+        bucket = table.get(probe_key_fn(probe_row))
+        if bucket is None:
+            continue
+
+        for build_row in bucket:
+            if build_lhs:
+                lhs_row, rhs_row = build_row, probe_row
+            else:
+                lhs_row, rhs_row = probe_row, build_row
+
+            if match_fn is None or match_fn(lhs_row, rhs_row):
+                yield (lhs_row, rhs_row)
+
+
+def merge_join_pairs(lhs_rows, rhs_rows, lhs_key_fn, op, rhs_key_fn,
+                     match_fn=None):
+    # Sort both inputs on their join keys, then sweep through the left input
+    # in key order.  For "<" and "<=" the matching right rows are a suffix of
+    # the sorted right input, and for ">" and ">=" they are a prefix; either
+    # way the boundary only ever moves forward, so it is found by merging
+    # rather than by searching.
+    lhs_keyed = [(lhs_key_fn(r), r) for r in lhs_rows]
+    rhs_keyed = [(rhs_key_fn(r), r) for r in rhs_rows]
+
+    lhs_sorted = sorted([kr for kr in lhs_keyed if kr[0] is not None],
+                        key=operator.itemgetter(0))
+    rhs_sorted = sorted([kr for kr in rhs_keyed if kr[0] is not None],
+                        key=operator.itemgetter(0))
+
+    # These tests are true while the right key at the boundary has not yet
+    # passed the left key.
+    before_boundary = {
+        '<'  : operator.le,   # skip right keys <= left key
+        '<=' : operator.lt,   # skip right keys < left key
+        '>'  : operator.lt,   # take right keys < left key
+        '>=' : operator.le,   # take right keys <= left key
+    }[op]
+
+    n = len(rhs_sorted)
+    boundary = 0
+    for lhs_k, lhs_row in lhs_sorted:
+        while boundary < n and before_boundary(rhs_sorted[boundary][0], lhs_k):
+            boundary += 1
+
+        if op in ['<', '<=']:
+            matches = rhs_sorted[boundary:]
+        else:
+            matches = rhs_sorted[:boundary]
+
+        for rhs_k, rhs_row in matches:
+            if match_fn is None or match_fn(lhs_row, rhs_row):
+                yield (lhs_row, rhs_row)
+
+
+def nested_loop_join_pairs(lhs_rows, rhs_rows, match_fn=None):
+    for lhs_row in lhs_rows:
+        for rhs_row in rhs_rows:
+            if match_fn is None or match_fn(lhs_row, rhs_row):
+                yield (lhs_row, rhs_row)
+
+
+def index_join_pairs(probe_rows, probe_key_fn, index, match_fn=None,
+                     index_lhs=False):
+    # Probe an existing hash index on one input with the rows of the other,
+    # so no hash table needs to be built.  The index is on the right input
+    # unless index_lhs is True.
+    for probe_row in probe_rows:
+        key = probe_key_fn(probe_row)
+        if None in key:
+            continue
+
+        for row in index.lookup(key):
+            if index_lhs:
+                (lhs_row, rhs_row) = (row, probe_row)
+            else:
+                (lhs_row, rhs_row) = (probe_row, row)
+
+            if match_fn is None or match_fn(lhs_row, rhs_row):
+                yield (lhs_row, rhs_row)
+
+
+# Generates the left rows of a semi-join or anti-join by looking up the join
+# keys of one input in a hash index on the other.  If the index is on the
+# right input, each left row is kept if its key finds a match, or finds none
+# for an anti-join.  If the index is on the left input, which is only done
+# for semi-joins, the left rows are the ones found by the lookups, and each
+# distinct key is only looked up once.  When there is a condition to check
+# beyond the keys, a left row may match several right rows, so the rows that
+# have been kept are recorded to keep each of them once.
+def index_semi_join_rows(probe_rows, probe_key_fn, index, match_fn, join_type,
+                         index_lhs=False):
+    if index_lhs:
+        looked_up = set()
+        kept = set()
+        for probe_row in probe_rows:
+            key = probe_key_fn(probe_row)
+            if None in key:
+                continue
+
+            if match_fn is None:
+                if key not in looked_up:
+                    looked_up.add(key)
+                    yield from index.lookup(key)
+
+                continue
+
+            for row in index.lookup(key):
+                if row not in kept and match_fn(row, probe_row):
+                    kept.add(row)
+                    yield row
+
+        return
+
+    for probe_row in probe_rows:
+        key = probe_key_fn(probe_row)
+
+        matched = False
+        if None not in key:
+            for row in index.lookup(key):
+                if match_fn is None or match_fn(probe_row, row):
+                    matched = True
+                    break
+
+        if matched != (join_type == ANTI_JOIN):
+            yield probe_row
+
+
+# Generates the output rows of a join from the matching pairs of rows.  The
+# combine function builds an output row from a left and right row; for outer
+# joins, unmatched rows are passed to it with None for the missing side.
+def join_rows(pairs, join_type, lhs_rows, rhs_rows, combine):
+    if join_type == INNER_JOIN:
+        for lhs_row, rhs_row in pairs:
+            yield combine(lhs_row, rhs_row)
+
+        return
+
+    lhs_matched = set()
+    rhs_matched = set()
+    for lhs_row, rhs_row in pairs:
+        lhs_matched.add(lhs_row)
+        rhs_matched.add(rhs_row)
+        yield combine(lhs_row, rhs_row)
+
+    if join_type in [LEFT_OUTER_JOIN, FULL_OUTER_JOIN]:
+        for lhs_row in lhs_rows:
+            if lhs_row not in lhs_matched:
+                yield combine(lhs_row, None)
+
+    if join_type in [RIGHT_OUTER_JOIN, FULL_OUTER_JOIN]:
+        for rhs_row in rhs_rows:
+            if rhs_row not in rhs_matched:
+                yield combine(None, rhs_row)
+
+
+# Returns a function that gets the tuple of values at the specified indexes
+# of a row.
+def _tuple_getter(indexes):
+    if len(indexes) == 0:
+        return lambda row: ()
+    elif len(indexes) == 1:
+        i = indexes[0]
+        return lambda row: (row[i],)
+
+    return operator.itemgetter(*indexes)
+
+
+# Returns a combine function for a theta-join, where the output row is simply
+# the left row followed by the right row.
+def theta_combiner(lhs_width, rhs_width):
+    lhs_nulls = (None,) * lhs_width
+    rhs_nulls = (None,) * rhs_width
+
+    def combine(lhs_row, rhs_row):
+        if lhs_row is None:
+            return lhs_nulls + rhs_row
+        elif rhs_row is None:
+            return lhs_row + rhs_nulls
+
+        return lhs_row + rhs_row
+
+    return combine
+
+
+# Returns a combine function for a natural join.  The output row is the left
+# row followed by the right row's non-shared attributes.  When there is no
+# left row, the shared attributes take their values from the right row.
+def natural_combiner(lhs_width, shared, rhs_rest):
+    # shared is a list of (lhs_index, rhs_index) pairs of shared attributes,
+    # and rhs_rest is the list of indexes of the right input's other attributes.
+    rest_nulls = (None,) * len(rhs_rest)
+    rest_fn = _tuple_getter(rhs_rest)
+
+    def combine(lhs_row, rhs_row):
+        if lhs_row is None:
+            lhs_row = [None] * lhs_width
+            for (i_lhs, i_rhs) in shared:
+                lhs_row[i_lhs] = rhs_row[i_rhs]
+
+            return tuple(lhs_row) + rest_fn(rhs_row)
+
+        elif rhs_row is None:
+            return lhs_row + rest_nulls
+
+        return lhs_row + rest_fn(rhs_row)
+
+    return combine
+
+
+# Executors with bag semantics (see ra_bag) pass each row along with the
+# number of times it occurs, as a (row, count) pair.  The functions below that
+# take a counted argument compute keys and test conditions on the rows in
+# such pairs when it is True, and produce the pairs themselves.
+def _row_fn(fn, counted):
+    if counted:
+        return lambda pair: fn(pair[0])
+
+    return fn
+
+
+# Compiles a list of predicates over the concatenation of a left and right
+# row into a function taking the two rows, or returns None if the list is
+# empty.  lhs and rhs provide the attributes of the two inputs.  equi_keys
+# lists (lhs_expr, rhs_expr) pairs that must also be equal, which are
+# evaluated against each row separately, since a natural join's keys may
+# name an attribute that both inputs have.
+def compile_match_fn(lhs, rhs, exprs, counted=False, equi_keys=()):
+    if not exprs and not equi_keys:
+        return None
+
+    lhs_resolve = lhs.get_attr_index
+    rhs_resolve = rhs.get_attr_index
+    lhs_width = lhs.num_attrs()
+
+    def combined_resolve(name):
+        # Resolve against the left input first, then the right input,
+        # reporting names that appear in both as ambiguous.
+        i_lhs = i_rhs = None
+        try:
+            i_lhs = lhs_resolve(name)
+        except ValueError:
+            pass
+
+        try:
+            i_rhs = rhs_resolve(name)
+        except ValueError:
+            pass
+
+        if i_lhs is not None and i_rhs is not None:
+            raise ValueError('Attribute name %s is ambiguous' % name)
+        elif i_lhs is not None:
+            return i_lhs
+        elif i_rhs is not None:
+            return lhs_width + i_rhs
+
+        raise ValueError('No attribute with name %s' % name)
+
+    pred_fn = None
+    if exprs:
+        pred_fn = compile_predicate(make_conjunction(exprs), combined_resolve)
+
+    if equi_keys:
+        lhs_key_fn = compile_projection([l for (l, r) in equi_keys],
+                                        lhs_resolve)
+        rhs_key_fn = compile_projection([r for (l, r) in equi_keys],
+                                        rhs_resolve)
+
+        # As in the hash join, keys with a null never match.
+        def match_fn(lhs_row, rhs_row):
+            key = lhs_key_fn(lhs_row)
+            return None not in key and key == rhs_key_fn(rhs_row) and \
+                   (pred_fn is None or pred_fn(lhs_row + rhs_row))
+    else:
+        match_fn = lambda lhs_row, rhs_row: pred_fn(lhs_row + rhs_row)
+
+    if counted:
+        return lambda lhs_pair, rhs_pair: match_fn(lhs_pair[0], rhs_pair[0])
+
+    return match_fn
+
+
+# Chooses a join algorithm for the join condition, and returns a generator
+# of the matching (lhs_row, rhs_row) pairs.  Equi-joins are performed as hash
+# joins, joins on a range comparison as sort-merge joins, and anything else
+# as a nested-loop join.  The inputs are RelationValues or RowStreams; the
+# left input's rows are only iterated over once, unless the hash table is
+# built on them, so only the right input needs to be materialized.
+def join_pairs(lhs, rhs, cond, join_type, counted=False):
+    lhs_resolve = lhs.get_attr_index
+    rhs_resolve = rhs.get_attr_index
+
+    # Any conjuncts that aren't used as keys by the chosen algorithm are
+    # evaluated against the concatenated rows.
+    leftover = [BinaryOp(op, l, r) for (l, op, r) in cond.range_keys]
+    if not cond.equi_keys and leftover:
+        # The first range comparison is used by the sort-merge join.
+        leftover = leftover[1:]
+
+    if cond.residual is not None:
+        leftover.append(cond.residual)
+
+    match_fn = compile_match_fn(lhs, rhs, leftover, counted)
+
+    if cond.equi_keys:
+        lhs_key_fn = _row_fn(compile_projection(
+            [l for (l, r) in cond.equi_keys], lhs_resolve), counted)
+        rhs_key_fn = _row_fn(compile_projection(
+            [r for (l, r) in cond.equi_keys], rhs_resolve), counted)
+
+        # Build the hash table on the smaller input, unless this is an
+        # outer join or the size of an input isn't known until it has been
+        # consumed.
+        lhs_size = lhs.num_rows()
+        rhs_size = rhs.num_rows()
+        build_lhs = join_type == INNER_JOIN and lhs_size is not None and \
+                    rhs_size is not None and lhs_size < rhs_size
+
+        return hash_join_pairs(lhs.rows, rhs.rows, lhs_key_fn, rhs_key_fn,
+                               match_fn, build_lhs)
+
+    elif cond.range_keys:
+        (l, op, r) = cond.range_keys[0]
+        return merge_join_pairs(lhs.rows, rhs.rows,
+            _row_fn(compile_scalar_expr(l, lhs_resolve), counted), op,
+            _row_fn(compile_scalar_expr(r, rhs_resolve), counted), match_fn)
+
+    return nested_loop_join_pairs(lhs.rows, rhs.rows, match_fn)
+
+
+# Generates the left rows of a semi-join or anti-join with the join condition.
+# Where the condition has equi-join keys, the right input's keys are put in a
+# hash table that the left rows are probed against; when nothing else has to
+# be tested, only the keys are kept, not the right rows.  The right input's
+# rows are consumed before this returns, and the left input streams through.
+def semi_join_rows(lhs, rhs, cond, join_type, counted=False):
+    leftover = [BinaryOp(op, l, r) for (l, op, r) in cond.range_keys]
+    if cond.residual is not None:
+        leftover.append(cond.residual)
+
+    match_fn = compile_match_fn(lhs, rhs, leftover, counted)
+
+    if cond.equi_keys:
+        lhs_key_fn = _row_fn(compile_projection(
+            [l for (l, r) in cond.equi_keys], lhs.get_attr_index), counted)
+        rhs_key_fn = _row_fn(compile_projection(
+            [r for (l, r) in cond.equi_keys], rhs.get_attr_index), counted)
+
+        if match_fn is None:
+            keys = set([k for k in map(rhs_key_fn, rhs.rows) if None not in k])
+            matched = lambda row: lhs_key_fn(row) in keys
+        else:
+            table = {}
+            for row in rhs.rows:
+                key = rhs_key_fn(row)
+                if None not in key:
+                    table.setdefault(key, []).append(row)
+
+            def matched(row):
+                for rhs_row in table.get(lhs_key_fn(row), ()):
+                    if match_fn(row, rhs_row):
+                        return True
+
+                return False
+
+    else:
+        rhs_rows = list(rhs.rows)
+        if match_fn is None:
+            # Every left row matches every right row.
+            matched = lambda row: len(rhs_rows) > 0
+        else:
+            def matched(row):
+                for rhs_row in rhs_rows:
+                    if match_fn(row, rhs_row):
+                        return True
+
+                return False
+
+    if join_type == ANTI_JOIN:
+        return itertools.filterfalse(matched, lhs.rows)
+
+    return filter(matched, lhs.rows)
+
+
+# Works out how a hash index on attributes of one input of a join can be used
+# to evaluate the join condition.  Every attribute of the index must be
+# equated with an expression over the other input, which becomes part of the
+# key that the index is probed with.  Returns a tuple (probe_exprs,
+# equi_keys, leftover), where probe_exprs lists the probe key expressions in
+# the order of the index's attributes, and equi_keys and leftover are the
+# (lhs_expr, rhs_expr) equalities and other predicates that must still be
+# evaluated against each pair of rows; or None if the index can't be used.
+def index_join_keys(cond, index_attrs, indexed_resolve, index_lhs):
+    try:
+        positions = [indexed_resolve(a) for a in index_attrs]
+    except ValueError:
+        return None
+
+    probe_exprs = [None] * len(positions)
+    equi_keys = []
+    for (l, r) in cond.equi_keys:
+        (indexed_expr, probe_expr) = (l, r) if index_lhs else (r, l)
+
+        i = None
+        if isinstance(indexed_expr, AttrRef):
+            try:
+                position = indexed_resolve(indexed_expr.name)
+                if position in positions:
+                    i = positions.index(position)
+            except ValueError:
+                pass
+
+        if i is not None and probe_exprs[i] is None:
+            probe_exprs[i] = probe_expr
+        else:
+            equi_keys.append( (l, r) )
+
+    if None in probe_exprs:
+        return None
+
+    leftover = [BinaryOp(op, l, r) for (l, op, r) in cond.range_keys]
+    if cond.residual is not None:
+        leftover.append(cond.residual)
+
+    return (probe_exprs, equi_keys, leftover)
+
+
+# Works out the natural join of inputs with the specified attribute names.
+# Returns a tuple (cond, shared, rhs_rest), where cond is the JoinCondition
+# equating the shared attributes, shared is a list of (lhs_index, rhs_index)
+# pairs of shared attributes, and rhs_rest lists the indexes of the right
+# input's other attributes.
+def natural_join_attrs(lhs_attrs, rhs_attrs):
+    if None in lhs_attrs or None in rhs_attrs:
+        raise ValueError("Natural join requires all attributes to be named")
+
+    lhs_names = [a.split('.')[-1] for a in lhs_attrs]
+    rhs_names = [a.split('.')[-1] for a in rhs_attrs]
+
+    cond = JoinCondition()
+    shared = []
+    rhs_rest = []
+    for i_rhs, n in enumerate(rhs_names):
+        if n not in lhs_names:
+            rhs_rest.append(i_rhs)
+            continue
+
+        if lhs_names.count(n) > 1 or rhs_names.count(n) > 1:
+            raise ValueError('Attribute name %s is ambiguous' % n)
+
+        i_lhs = lhs_names.index(n)
+        shared.append( (i_lhs, i_rhs) )
+        cond.equi_keys.append( (AttrRef(lhs_attrs[i_lhs]),
+                                AttrRef(rhs_attrs[i_rhs])) )
+
+    return (cond, shared, rhs_rest)
+
+
+# Works out the attributes of the division of a dividend by a divisor with
+# the specified attribute names.  Like a natural join, the divisor's
+# attributes are matched to the dividend's by name.  Returns a tuple
+# (quotient, shared), where quotient lists the indexes of the dividend's
+# attributes that are not in the divisor, and shared lists the indexes of the
+# dividend's attributes that match each of the divisor's attributes in turn.
+def division_attrs(lhs_attrs, rhs_attrs):
+    if None in lhs_attrs or None in rhs_attrs:
+        raise ValueError("Division requires all attributes to be named")
+
+    lhs_names = [a.split('.')[-1] for a in lhs_attrs]
+    rhs_names = [a.split('.')[-1] for a in rhs_attrs]
+
+    shared = []
+    for n in rhs_names:
+        if n not in lhs_names:
+            raise ValueError('Divisor attribute %s is not an attribute of ' \
+                             'the dividend' % n)
+
+        if lhs_names.count(n) > 1 or rhs_names.count(n) > 1:
+            raise ValueError('Attribute name %s is ambiguous' % n)
+
+        shared.append(lhs_names.index(n))
+
+    quotient = [i for i in range(len(lhs_attrs)) if i not in shared]
+    return (quotient, shared)
+
+
+# Computes the quotient of a division:  the quotient values that appear in
+# the dividend together with every row of the divisor.  The dividend rows
+# must be distinct, so that each (quotient, divisor) combination is counted
+# at most once; the quotient values whose count matches the size of the
+# divisor are the result.  This takes one pass over each input.
+#
+# Like the set operators, division compares whole rows, so a null in a
+# divisor row is matched by a null in the same attribute of a dividend row.
+def divide_rows(lhs_rows, rhs_rows, quotient, shared):
+    quotient_fn = _tuple_getter(quotient)
+    shared_fn = _tuple_getter(shared)
+
+    divisor = set(rhs_rows)
+    if len(divisor) == 0:
+        # Every quotient value is trivially matched with all of the divisor.
+        yield from set(map(quotient_fn, lhs_rows))
+        return
+
+    counts = {}
+    for row in lhs_rows:
+        if shared_fn(row) in divisor:
+            q = quotient_fn(row)
+            counts[q] = counts.get(q, 0) + 1
+
+    n = len(divisor)
+    for (q, count) in counts.items():
+        if count == n:
+            yield q
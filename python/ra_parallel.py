@@ -0,0 +1,308 @@
+# Parallel execution of plans.
+#
+# ParallelExecutor evaluates the two inputs of a binary operator at the same
+# time, each in its own thread, and runs operators whose inputs are large on
+# a pool of worker processes.  Such an operator's inputs are split into
+# partitions that can be processed independently - selections and
+# projections by simply chunking the rows, grouping, joins, set operations and
+# duplicate removal by hashing the rows' keys, so that rows that must meet end
+# up in the same partition - and each worker runs the operator on one
+# partition.  An input that every partition needs, like the right side of a
+# Cartesian product, is sent to all of them.
+#
+# The partitions are passed to the workers in shared memory, in the columnar
+# format that ra_storage uses for relation files, so that the rows aren't
+# pickled one object at a time; each worker returns its result in the same
+# format.
+
+import concurrent.futures, itertools, multiprocessing, os, threading
+from multiprocessing import shared_memory
+
+from relation import RelationValue, RowStream, Database
+from ra_scalar import AttrRef, compile_projection
+from ra_join import INNER_JOIN, LEFT_OUTER_JOIN, SEMI_JOIN, ANTI_JOIN, \
+    analyze_join_condition, natural_join_attrs
+from ra_plan import PlanNode, ConstantNode, SelectNode, ProjectNode, \
+    DistinctNode, GroupNode, CrossNode, JoinNode, IndexJoinNode, \
+    SemiJoinNode, IndexSemiJoinNode, DivideNode, SetOpNode, SET_UNION
+from ra_columnar import ColumnarRelationValue
+from ra_storage import encode_relation, decode_relation
+from ra_aggregate import DEFAULT_MAX_GROUPS
+from ra_eval import PlanExecutor
+
+
+# Operators with fewer input rows than this are run in the calling process,
+# since it would take longer to hand the rows to the workers.
+DEFAULT_MIN_PARTITION_ROWS = 100000
+
+
+def _read_shared(name):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return decode_relation(shm.buf)
+    finally:
+        shm.close()
+
+
+# Runs in a worker process:  executes the template plan node with the inputs
+# in the named shared memory blocks as its children.  The result is returned
+# encoded.
+def _run_partition(template, names, max_groups):
+    children = [ConstantNode(_read_shared(name)) for name in names]
+    plan = template.with_children(children)
+    result = PlanExecutor(Database(), max_groups).execute(plan)
+    return encode_relation(result)
+
+
+# Splits the rows into n contiguous chunks.
+def _chunk(rows, n):
+    rows = list(rows)
+    size = -(-len(rows) // n)
+    return [rows[i * size : (i + 1) * size] for i in range(n)]
+
+
+# Splits the rows into n partitions by the hash of their keys.
+def _hash_partition(rows, key_fn, n):
+    partitions = [[] for i in range(n)]
+    for row in rows:
+        partitions[hash(key_fn(row)) % n].append(row)
+
+    return partitions
+
+
+def _row_key(row):
+    return row
+
+
+# Stands in for a plan node whose result has already been computed.
+class _StreamNode(PlanNode):
+    def __init__(self, stream):
+        super().__init__(stream.get_attrs(), [])
+        self.stream = stream
+
+    def with_children(self, children):
+        return self
+
+    def describe(self):
+        return 'STREAM'
+
+
+# The pool is usually started from one of the threads that compute a binary
+# operator's inputs, while the other thread is still running.  Forking the
+# workers then could copy a lock that the other thread holds, leaving a
+# worker stuck, so they are started by a fork server where there is one.
+def _pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+
+    return multiprocessing.get_context()
+
+
+class ParallelExecutor(PlanExecutor):
+    def __init__(self, database, workers=None,
+                 min_partition_rows=DEFAULT_MIN_PARTITION_ROWS,
+                 max_groups=DEFAULT_MAX_GROUPS):
+        super().__init__(database, max_groups)
+
+        # The number of worker processes, which is also the number of
+        # partitions that an operator's inputs are split into.
+        self.workers = workers or os.cpu_count() or 1
+        self.min_partition_rows = min_partition_rows
+
+        # The pool is only started when it is first needed.
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def stream(self, plan):
+        if not plan.children or self.workers <= 1:
+            return super().stream(plan)
+
+        if isinstance(plan, (IndexJoinNode, IndexSemiJoinNode)):
+            # The indexed input has to stay a relation variable.
+            children = list(plan.children)
+            i = 1 if plan.index_lhs else 0
+            children[i] = _StreamNode(self.stream(children[i]))
+            return plan.with_children(children).accept(self)
+
+        inputs = self._stream_inputs(plan.children)
+
+        result = self._stream_partitioned(plan, inputs)
+        if result is not None:
+            return result
+
+        return plan.with_children([_StreamNode(s) for s in inputs]) \
+                   .accept(self)
+
+
+    def visit_StreamNode(self, node):
+        return node.stream
+
+
+    # Returns the streams of the plan node's inputs.  If there are two inputs
+    # that both do some work, they are computed at the same time.
+    def _stream_inputs(self, children):
+        if len(children) != 2 or not children[0].children or \
+           not children[1].children:
+            return [self.stream(c) for c in children]
+
+        rhs_result = []
+        def compute_rhs():
+            try:
+                rhs_result.append(self.stream(children[1]).materialize())
+            except Exception as e:
+                rhs_result.append(e)
+
+        thread = threading.Thread(target=compute_rhs)
+        thread.start()
+        try:
+            lhs = self.stream(children[0]).materialize()
+        finally:
+            thread.join()
+
+        if isinstance(rhs_result[0], Exception):
+            raise rhs_result[0]
+
+        return [RowStream.from_relval(lhs), RowStream.from_relval(rhs_result[0])]
+
+
+    # Works out how to split the inputs of the plan node into partitions.
+    # Returns a list with an entry per input, which is a list of the
+    # partitions of its rows, or None if the whole input goes to every
+    # partition; or returns None if the node can't be partitioned.
+    def _partition_inputs(self, plan, inputs):
+        n = self.workers
+
+        if isinstance(plan, (SelectNode, ProjectNode)):
+            return [_chunk(inputs[0].rows, n)]
+
+        elif isinstance(plan, GroupNode):
+            if not plan.group_exprs:
+                return None
+
+            key_fn = compile_projection(plan.group_exprs,
+                                        inputs[0].get_attr_index)
+            return [_hash_partition(inputs[0].rows, key_fn, n)]
+
+        elif isinstance(plan, DistinctNode):
+            return [_hash_partition(inputs[0].rows, _row_key, n)]
+
+        elif isinstance(plan, CrossNode):
+            return [_chunk(inputs[0].rows, n), None]
+
+        elif isinstance(plan, (JoinNode, SemiJoinNode)):
+            (lhs, rhs) = inputs
+            if plan.is_natural():
+                cond = natural_join_attrs(lhs.get_attrs(), rhs.get_attrs())[0]
+            else:
+                cond = analyze_join_condition(plan.pred, lhs.get_attr_index,
+                                              rhs.get_attr_index)
+
+            if cond.equi_keys:
+                lhs_key_fn = compile_projection(
+                    [l for (l, r) in cond.equi_keys], lhs.get_attr_index)
+                rhs_key_fn = compile_projection(
+                    [r for (l, r) in cond.equi_keys], rhs.get_attr_index)
+                return [_hash_partition(inputs[0].rows, lhs_key_fn, n),
+                        _hash_partition(inputs[1].rows, rhs_key_fn, n)]
+
+            # Without a key, only the left input can be split, so the right
+            # input's unmatched rows can't be found.
+            if plan.join_type in [INNER_JOIN, LEFT_OUTER_JOIN, SEMI_JOIN,
+                                  ANTI_JOIN]:
+                return [_chunk(inputs[0].rows, n), None]
+
+            return None
+
+        elif isinstance(plan, DivideNode):
+            key_fn = compile_projection(
+                [AttrRef(inputs[0].attributes[i]) for i in plan.quotient],
+                inputs[0].get_attr_index)
+            return [_hash_partition(inputs[0].rows, key_fn, n), None]
+
+        elif isinstance(plan, SetOpNode) and plan.op != SET_UNION:
+            return [_hash_partition(inputs[0].rows, _row_key, n),
+                    _hash_partition(inputs[1].rows, _row_key, n)]
+
+        return None
+
+
+    # Runs the plan node on partitions of its inputs in the worker processes,
+    # or returns None if the node can't be run this way or its inputs are
+    # too small to be worth it.
+    def _stream_partitioned(self, plan, inputs):
+        sizes = [s.num_rows() for s in inputs]
+        if None in sizes or max(sizes) < self.min_partition_rows:
+            return None
+
+        if isinstance(plan, (SelectNode, ProjectNode)) and \
+           isinstance(inputs[0].source, ColumnarRelationValue):
+            # These are already evaluated a whole column at a time.
+            return None
+
+        partitions = self._partition_inputs(plan, inputs)
+        if partitions is None:
+            return None
+
+        template = plan.with_children([ConstantNode(RelationValue(s.get_attrs()))
+                                       for s in inputs])
+
+        blocks = []
+        try:
+            # The shared memory block names for each input, with a name per
+            # partition, or a single name if the input goes to all of them.
+            names = []
+            for (s, parts) in zip(inputs, partitions):
+                if parts is None:
+                    names.append(self._share(s.materialize(), blocks))
+                else:
+                    names.append([self._share(RelationValue(s.get_attrs(), p),
+                                              blocks) for p in parts])
+
+            futures = []
+            for i in range(self.workers):
+                part_names = [n if isinstance(n, str) else n[i]
+                              for n in names]
+                futures.append(self._get_pool().submit(_run_partition,
+                    template, part_names, self.max_groups))
+
+            results = [decode_relation(f.result()) for f in futures]
+
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        return RowStream(results[0].get_attrs(),
+                         itertools.chain(*[r.rows for r in results]))
+
+
+    # Copies a relation-value into a new shared memory block, returning the
+    # block's name.
+    def _share(self, relval, blocks):
+        encoded = encode_relation(relval)
+        shm = shared_memory.SharedMemory(create=True, size=max(len(encoded), 1))
+        blocks.append(shm)
+        shm.buf[:len(encoded)] = encoded
+        return shm.name
+
+
+    def _get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=_pool_context())
+
+            return self.pool
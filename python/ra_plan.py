@@ -0,0 +1,1708 @@
+from RelationalAlgebraParser import RelationalAlgebraParser
+from RelationalAlgebraVisitor import RelationalAlgebraVisitor
+
+from relation import RelationValue, make_attr_index, find_attr_index
+from ra_scalar import AttrRef, BinaryOp, Literal, build_aggregate_expr, \
+    build_scalar_expr, literal_value, make_conjunction, split_conjuncts, \
+    substitute_attrs
+from ra_join import INNER_JOIN, LEFT_OUTER_JOIN, RIGHT_OUTER_JOIN, \
+    FULL_OUTER_JOIN, SEMI_JOIN, ANTI_JOIN, FLIPPED_OPS, \
+    analyze_join_condition, division_attrs, index_join_keys, \
+    natural_join_attrs
+from ra_index import HASH_INDEX
+from ra_stats import ColumnEstimate, Estimate, RelationStats, selectivity
+
+
+def get_expr_name(ctx):
+    name = None
+
+    if isinstance(ctx, RelationalAlgebraParser.NamedScalarExprContext):
+        if ctx.NAME() is not None:
+            name = ctx.NAME().getText()
+
+        ctx = ctx.scalarExpr()
+
+    if name is None and \
+       isinstance(ctx, RelationalAlgebraParser.ScalarExprAttributeContext):
+        name = ctx.attrName().getText()
+
+    return name
+
+
+# === LOGICAL PLAN NODES =====================================================
+#
+# A relational algebra expression is translated into a tree of plan nodes
+# before it is executed, so that the tree can be rewritten into an equivalent
+# but cheaper form.  Every plan node knows the attributes that its result will
+# have, so that attribute references can be resolved while planning.
+
+class PlanNode:
+    def __init__(self, attrs, children):
+        self.attrs = attrs
+        self.children = children
+        self.attr_index = None
+
+    def num_attrs(self):
+        return len(self.attrs) if self.attrs is not None else 0
+
+    def get_attr_index(self, name):
+        if self.attr_index is None:
+            self.attr_index = make_attr_index(self.attrs)
+
+        return find_attr_index(self.attr_index, name)
+
+    # Returns a copy of this node with different children.
+    def with_children(self, children):
+        raise NotImplementedError()
+
+    # Returns a one-line description of the node, for EXPLAIN output.
+    def describe(self):
+        raise NotImplementedError()
+
+    def accept(self, visitor):
+        return getattr(visitor, 'visit' + type(self).__name__)(self)
+
+    # Returns a hashable value that is the same for any two plans that
+    # compute the same result from the same relation variables.
+    def signature(self):
+        return (type(self).__name__, self.describe(), tuple(self.attrs),
+                tuple([c.signature() for c in self.children]))
+
+
+class RelVarNode(PlanNode):
+    def __init__(self, name, attrs):
+        super().__init__(attrs, [])
+        self.name = name
+
+    def with_children(self, children):
+        return self
+
+    def describe(self):
+        return self.name
+
+
+class ConstantNode(PlanNode):
+    def __init__(self, relval):
+        # An empty constant relation has no attributes at all.
+        attrs = relval.attributes if relval.attributes is not None else []
+        super().__init__(attrs, [])
+        self.relval = relval
+
+    def with_children(self, children):
+        return self
+
+    def describe(self):
+        return '{ %d rows }' % self.relval.num_rows()
+
+    def signature(self):
+        return (type(self).__name__, tuple(self.attrs),
+                frozenset(self.relval.rows))
+
+
+class SelectNode(PlanNode):
+    def __init__(self, child, pred):
+        super().__init__(child.attrs, [child])
+        self.pred = pred
+
+    @property
+    def child(self):
+        return self.children[0]
+
+    def with_children(self, children):
+        return SelectNode(children[0], self.pred)
+
+    def describe(self):
+        return 'SIGMA[%s]' % self.pred
+
+
+class ProjectNode(PlanNode):
+    def __init__(self, child, exprs, names):
+        super().__init__(names, [child])
+        self.exprs = exprs
+
+    @property
+    def child(self):
+        return self.children[0]
+
+    def with_children(self, children):
+        return ProjectNode(children[0], self.exprs, self.attrs)
+
+    def describe(self):
+        items = []
+        for e, n in zip(self.exprs, self.attrs):
+            if n is None or (isinstance(e, AttrRef) and e.name == n):
+                items.append(str(e))
+            else:
+                items.append('%s AS %s' % (e, n))
+
+        return 'PI[%s]' % ', '.join(items)
+
+
+# Removes duplicate rows.  With the usual set semantics every result is
+# already free of duplicates, so this only does anything when rows are
+# counted; see ra_bag.
+class DistinctNode(PlanNode):
+    def __init__(self, child):
+        super().__init__(child.attrs, [child])
+
+    @property
+    def child(self):
+        return self.children[0]
+
+    def with_children(self, children):
+        return DistinctNode(children[0])
+
+    def describe(self):
+        return 'DELTA'
+
+
+# Groups the rows of the child by the values of the group expressions, and
+# computes the aggregate expressions for each group.  The result has the
+# group values followed by the aggregate values.
+class GroupNode(PlanNode):
+    def __init__(self, child, group_exprs, group_names, agg_exprs, agg_names):
+        super().__init__(group_names + agg_names, [child])
+        self.group_exprs = group_exprs
+        self.agg_exprs = agg_exprs
+
+    @property
+    def child(self):
+        return self.children[0]
+
+    @property
+    def group_names(self):
+        return self.attrs[:len(self.group_exprs)]
+
+    @property
+    def agg_names(self):
+        return self.attrs[len(self.group_exprs):]
+
+    def with_children(self, children):
+        return GroupNode(children[0], self.group_exprs, self.group_names,
+                         self.agg_exprs, self.agg_names)
+
+    def describe(self):
+        aggs = []
+        for e, n in zip(self.agg_exprs, self.agg_names):
+            aggs.append(str(e) if n is None else '%s AS %s' % (e, n))
+
+        s = 'GROUP[%s]' % ', '.join(aggs)
+        if self.group_exprs:
+            s = '[%s] ' % ', '.join([str(e) for e in self.group_exprs]) + s
+
+        return s
+
+
+class CrossNode(PlanNode):
+    def __init__(self, lhs, rhs):
+        super().__init__(lhs.attrs + rhs.attrs, [lhs, rhs])
+
+    def with_children(self, children):
+        return CrossNode(children[0], children[1])
+
+    def describe(self):
+        return 'CROSS'
+
+
+JOIN_KEYWORDS = {
+    INNER_JOIN       : 'BOWTIE',
+    LEFT_OUTER_JOIN  : 'LBOWTIE',
+    RIGHT_OUTER_JOIN : 'RBOWTIE',
+    FULL_OUTER_JOIN  : 'FBOWTIE',
+    SEMI_JOIN        : 'SEMIJOIN',
+    ANTI_JOIN        : 'ANTIJOIN',
+}
+
+
+# A theta-join if pred is specified, or otherwise a natural join.
+class JoinNode(PlanNode):
+    def __init__(self, lhs, rhs, join_type, pred=None):
+        if pred is not None:
+            attrs = lhs.attrs + rhs.attrs
+            self.shared = None
+            self.rhs_rest = None
+        else:
+            (cond, self.shared, self.rhs_rest) = \
+                natural_join_attrs(lhs.attrs, rhs.attrs)
+            attrs = lhs.attrs + [rhs.attrs[i] for i in self.rhs_rest]
+
+        super().__init__(attrs, [lhs, rhs])
+        self.join_type = join_type
+        self.pred = pred
+
+    def is_natural(self):
+        return self.pred is None
+
+    def with_children(self, children):
+        return JoinNode(children[0], children[1], self.join_type, self.pred)
+
+    def describe(self):
+        s = JOIN_KEYWORDS[self.join_type]
+        if self.pred is not None:
+            s += '[%s]' % self.pred
+
+        return s
+
+
+# A semi-join or anti-join, which keeps the rows of the left input that match
+# at least one row of the right input, or that match none of them.  Rows
+# match if they satisfy pred, if it is specified, or otherwise if they agree
+# on the attributes that the inputs share, as in a natural join.  The result
+# has the left input's attributes.
+class SemiJoinNode(PlanNode):
+    def __init__(self, lhs, rhs, join_type, pred=None):
+        if pred is None:
+            self.shared = natural_join_attrs(lhs.attrs, rhs.attrs)[1]
+        else:
+            self.shared = None
+
+        super().__init__(lhs.attrs, [lhs, rhs])
+        self.join_type = join_type
+        self.pred = pred
+
+    def is_natural(self):
+        return self.pred is None
+
+    def with_children(self, children):
+        return SemiJoinNode(children[0], children[1], self.join_type,
+                            self.pred)
+
+    def describe(self):
+        s = JOIN_KEYWORDS[self.join_type]
+        if self.pred is not None:
+            s += '[%s]' % self.pred
+
+        return s
+
+
+# The result has the dividend's attributes that aren't in the divisor.
+class DivideNode(PlanNode):
+    def __init__(self, lhs, rhs):
+        (self.quotient, self.shared) = division_attrs(lhs.attrs, rhs.attrs)
+        super().__init__([lhs.attrs[i] for i in self.quotient], [lhs, rhs])
+
+    def with_children(self, children):
+        return DivideNode(children[0], children[1])
+
+    def describe(self):
+        return 'DIVIDE'
+
+
+SET_UNION = 'UNION'
+SET_INTERSECT = 'INTERSECT'
+SET_DIFFERENCE = 'MINUS'
+
+
+class SetOpNode(PlanNode):
+    def __init__(self, op, lhs, rhs):
+        super().__init__(lhs.attrs, [lhs, rhs])
+        self.op = op
+
+    def with_children(self, children):
+        return SetOpNode(self.op, children[0], children[1])
+
+    def describe(self):
+        return self.op
+
+
+# === PHYSICAL PLAN NODES ====================================================
+#
+# These are only introduced by the optimizer, where the database has an index
+# that can compute part of the plan.
+
+def _describe_index(kind, index_attrs):
+    return '%s INDEX (%s)' % (kind.upper(), ', '.join(index_attrs))
+
+
+# Reads the rows of a relation variable that satisfy pred, using an index.
+# The rows are looked up by key if key is specified, or else by the range
+# between low and high, each of which is a (value, inclusive) pair or None.
+class IndexScanNode(PlanNode):
+    def __init__(self, name, attrs, kind, index_attrs, pred, key=None,
+                 low=None, high=None):
+        super().__init__(attrs, [])
+        self.name = name
+        self.kind = kind
+        self.index_attrs = index_attrs
+        self.pred = pred
+        self.key = key
+        self.low = low
+        self.high = high
+
+    def with_children(self, children):
+        return self
+
+    def describe(self):
+        return '%s USING %s [%s]' % (self.name,
+            _describe_index(self.kind, self.index_attrs), self.pred)
+
+
+# A join where one input is a relation variable with a hash index on its join
+# attributes.  The other input's rows are looked up in the index, instead of
+# building a hash table.  The indexed input is the left one if index_lhs is
+# True, and the right one otherwise.
+class IndexJoinNode(JoinNode):
+    def __init__(self, lhs, rhs, join_type, pred, index_lhs, index_attrs):
+        super().__init__(lhs, rhs, join_type, pred)
+        self.index_lhs = index_lhs
+        self.index_attrs = index_attrs
+
+    @property
+    def indexed(self):
+        return self.children[0 if self.index_lhs else 1]
+
+    def with_children(self, children):
+        return IndexJoinNode(children[0], children[1], self.join_type,
+                             self.pred, self.index_lhs, self.index_attrs)
+
+    def describe(self):
+        return '%s USING %s ON %s' % (super().describe(),
+            _describe_index(HASH_INDEX, self.index_attrs), self.indexed.name)
+
+
+# A semi-join or anti-join where one input is a relation variable with a hash
+# index on its join attributes.  The other input's join keys are looked up in
+# the index, instead of building a hash table.  Only a semi-join can have the
+# index on its left input, whose rows are then the ones that the lookups find.
+class IndexSemiJoinNode(SemiJoinNode):
+    def __init__(self, lhs, rhs, join_type, pred, index_lhs, index_attrs):
+        super().__init__(lhs, rhs, join_type, pred)
+        self.index_lhs = index_lhs
+        self.index_attrs = index_attrs
+
+    @property
+    def indexed(self):
+        return self.children[0 if self.index_lhs else 1]
+
+    def with_children(self, children):
+        return IndexSemiJoinNode(children[0], children[1], self.join_type,
+                                 self.pred, self.index_lhs, self.index_attrs)
+
+    def describe(self):
+        return '%s USING %s ON %s' % (super().describe(),
+            _describe_index(HASH_INDEX, self.index_attrs), self.indexed.name)
+
+
+# Returns a map from the name of each relation variable that the plan reads to
+# the attributes it was planned with.
+def plan_relvars(plan):
+    if isinstance(plan, (RelVarNode, IndexScanNode)):
+        return {plan.name : plan.attrs}
+
+    relvars = {}
+    for c in plan.children:
+        relvars.update(plan_relvars(c))
+
+    return relvars
+
+
+# Returns True if the rows that the plan's stream produces are known to be
+# distinct.  Projections and unions pass along any duplicates they produce,
+# which are only removed when their rows are materialized, and outer joins
+# are left out too, since they may pad different rows into the same one.
+def has_distinct_rows(plan):
+    if isinstance(plan, (RelVarNode, IndexScanNode, ConstantNode,
+                         DistinctNode, GroupNode, DivideNode)):
+        return True
+
+    elif isinstance(plan, (SelectNode, SemiJoinNode, IndexSemiJoinNode)) or \
+         (isinstance(plan, SetOpNode) and plan.op != SET_UNION):
+        # These only filter the rows of their (left) input.
+        return has_distinct_rows(plan.children[0])
+
+    elif isinstance(plan, CrossNode) or \
+         (isinstance(plan, JoinNode) and plan.join_type == INNER_JOIN):
+        return all([has_distinct_rows(c) for c in plan.children])
+
+    return False
+
+
+# Produces an indented, EXPLAIN-style printout of a plan.
+def explain(plan, indent=0):
+    lines = ['  ' * indent + plan.describe()]
+    for c in plan.children:
+        lines.append(explain(c, indent + 1))
+
+    return '\n'.join(lines)
+
+
+# === PLAN CONSTRUCTION ======================================================
+
+# Translates a relExpr parse tree into a logical plan.  The database is used
+# to find the attributes of the relation variables that are referenced.
+class PlanBuilder(RelationalAlgebraVisitor):
+
+    def __init__(self, database):
+        self.database = database
+
+
+    def visitRelExprRelationVariable(self, ctx:RelationalAlgebraParser.RelExprRelationVariableContext):
+        name = ctx.NAME().getText()
+        relval = self.database.get_relvar(name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % name)
+
+        return RelVarNode(name, relval.get_attrs())
+
+
+    def visitRelExprConstantRelation(self, ctx:RelationalAlgebraParser.RelExprConstantRelationContext):
+        relval = RelationValue()
+        for r in ctx.rowExpr():
+            relval.add_row(self.visit(r))
+
+        return ConstantNode(relval)
+
+
+    def visitRowExpr(self, ctx:RelationalAlgebraParser.RowExprContext):
+        return tuple(literal_value(v) for v in ctx.literalValue())
+
+
+    def visitRelExprSelect(self, ctx:RelationalAlgebraParser.RelExprSelectContext):
+        return SelectNode(self.visit(ctx.relExpr()),
+                          build_scalar_expr(ctx.scalarExpr()))
+
+
+    def visitRelExprProject(self, ctx:RelationalAlgebraParser.RelExprProjectContext):
+        child = self.visit(ctx.relExpr())
+
+        names = []
+        exprs = []
+        for p in ctx.projectExpr():
+            if not isinstance(p, RelationalAlgebraParser.ProjectNamedScalarExprContext):
+                raise ValueError("Schema names are not supported in " \
+                                 "project expressions")
+
+            e = p.namedScalarExpr()
+            names.append(get_expr_name(e))
+            exprs.append(build_scalar_expr(e))
+
+        return ProjectNode(child, exprs, names)
+
+
+    def visitRelExprRename(self, ctx:RelationalAlgebraParser.RelExprRenameContext):
+        # TODO:  Rename the result before returning it.
+        return self.visit(ctx.relExpr())
+
+
+    def visitRelExprDistinct(self, ctx:RelationalAlgebraParser.RelExprDistinctContext):
+        return DistinctNode(self.visit(ctx.relExpr()))
+
+
+    def visitRelExprGroupAggregate(self, ctx:RelationalAlgebraParser.RelExprGroupAggregateContext):
+        child = self.visit(ctx.relExpr())
+
+        group_names = [get_expr_name(g) for g in ctx.groups]
+        group_exprs = [build_scalar_expr(g) for g in ctx.groups]
+
+        agg_names = [get_expr_name(a) for a in ctx.aggregates]
+        agg_exprs = [build_aggregate_expr(a) for a in ctx.aggregates]
+
+        return GroupNode(child, group_exprs, group_names, agg_exprs, agg_names)
+
+
+    def __join(self, ctx, join_type):
+        pred = None
+        if ctx.scalarExpr() is not None:
+            pred = build_scalar_expr(ctx.scalarExpr())
+
+        return JoinNode(self.visit(ctx.relExpr(0)), self.visit(ctx.relExpr(1)),
+                        join_type, pred)
+
+
+    def visitRelExprInnerJoin(self, ctx:RelationalAlgebraParser.RelExprInnerJoinContext):
+        return self.__join(ctx, INNER_JOIN)
+
+
+    def visitRelExprLeftOuterJoin(self, ctx:RelationalAlgebraParser.RelExprLeftOuterJoinContext):
+        return self.__join(ctx, LEFT_OUTER_JOIN)
+
+
+    def visitRelExprRightOuterJoin(self, ctx:RelationalAlgebraParser.RelExprRightOuterJoinContext):
+        return self.__join(ctx, RIGHT_OUTER_JOIN)
+
+
+    def visitRelExprFullOuterJoin(self, ctx:RelationalAlgebraParser.RelExprFullOuterJoinContext):
+        return self.__join(ctx, FULL_OUTER_JOIN)
+
+
+    def __semi_join(self, ctx, join_type):
+        pred = None
+        if ctx.scalarExpr() is not None:
+            pred = build_scalar_expr(ctx.scalarExpr())
+
+        return SemiJoinNode(self.visit(ctx.relExpr(0)),
+                            self.visit(ctx.relExpr(1)), join_type, pred)
+
+
+    def visitRelExprSemiJoin(self, ctx:RelationalAlgebraParser.RelExprSemiJoinContext):
+        return self.__semi_join(ctx, SEMI_JOIN)
+
+
+    def visitRelExprAntiJoin(self, ctx:RelationalAlgebraParser.RelExprAntiJoinContext):
+        return self.__semi_join(ctx, ANTI_JOIN)
+
+
+    def visitRelExprCrossProduct(self, ctx:RelationalAlgebraParser.RelExprCrossProductContext):
+        return CrossNode(self.visit(ctx.relExpr(0)), self.visit(ctx.relExpr(1)))
+
+
+    def visitRelExprDivision(self, ctx:RelationalAlgebraParser.RelExprDivisionContext):
+        return DivideNode(self.visit(ctx.relExpr(0)), self.visit(ctx.relExpr(1)))
+
+
+    def visitRelExprSetUnion(self, ctx:RelationalAlgebraParser.RelExprSetUnionContext):
+        return SetOpNode(SET_UNION, self.visit(ctx.relExpr(0)),
+                         self.visit(ctx.relExpr(1)))
+
+
+    def visitRelExprSetIntersect(self, ctx:RelationalAlgebraParser.RelExprSetIntersectContext):
+        return SetOpNode(SET_INTERSECT, self.visit(ctx.relExpr(0)),
+                         self.visit(ctx.relExpr(1)))
+
+
+    def visitRelExprSetDifference(self, ctx:RelationalAlgebraParser.RelExprSetDifferenceContext):
+        return SetOpNode(SET_DIFFERENCE, self.visit(ctx.relExpr(0)),
+                         self.visit(ctx.relExpr(1)))
+
+
+    def visitRelExprParens(self, ctx:RelationalAlgebraParser.RelExprParensContext):
+        return self.visit(ctx.relExpr())
+
+
+def build_plan(database, ctx):
+    return PlanBuilder(database).visit(ctx)
+
+
+# === OPTIMIZATION ===========================================================
+
+# Rewrites a logical plan into an equivalent plan that should be cheaper to
+# execute.  Selection predicates are split into their conjuncts, and each
+# conjunct is pushed as far down the plan as it can go; a conjunct that
+# refers to both inputs of a Cartesian product turns the product into a join.
+# If the database is specified, chains of inner joins are then put in the
+# order that its statistics suggest is cheapest.  Joins whose results are
+# only used for the attributes of one input become semi-joins, unless
+# semi_joins is False, as it must be for plans whose rows are counted (see
+# ra_bag).  The database's indexes are used for the selections
+# and joins on relation variables that they can compute.  Projections are
+# then pushed below set-unions, and joins only pass along the attributes that
+# are needed above them.
+#
+# A rewrite is only made when every attribute reference involved resolves
+# cleanly; otherwise the plan is left alone so that executing it reports the
+# error.
+def optimize(plan, database=None, semi_joins=True):
+    plan = push_down_selections(plan)
+    if database is not None:
+        plan = reorder_joins(plan, database)
+
+    if semi_joins:
+        plan = introduce_semi_joins(plan)
+
+    if database is not None:
+        plan = choose_indexes(plan, database)
+
+    plan = push_down_projections(plan)
+    return plan
+
+
+# Returns the list of indexes that the attribute names resolve to in the plan
+# node's output, or None if any of them don't resolve.
+def _resolve_all(node, names):
+    indexes = []
+    for n in names:
+        try:
+            indexes.append(node.get_attr_index(n))
+        except ValueError:
+            return None
+
+    return indexes
+
+
+def push_down_selections(node):
+    if isinstance(node, SelectNode):
+        result = push_down_selections(node.child)
+        for c in split_conjuncts(node.pred):
+            result = _push_conjunct(result, c)
+
+        return result
+
+    return node.with_children([push_down_selections(c) for c in node.children])
+
+
+def _push_conjunct(node, conjunct):
+    pushed = _try_push_conjunct(node, conjunct)
+    if pushed is None:
+        pushed = SelectNode(node, conjunct)
+
+    return pushed
+
+
+# Tries to move the conjunct into or below the plan node, returning the new
+# plan node, or None if the conjunct has to stay above the node.
+def _try_push_conjunct(node, conjunct):
+    if isinstance(node, SelectNode):
+        pushed = _try_push_conjunct(node.child, conjunct)
+        if pushed is not None:
+            return SelectNode(pushed, node.pred)
+
+        return SelectNode(node.child, make_conjunction([node.pred, conjunct]))
+
+    indexes = _resolve_all(node, conjunct.attr_names())
+    if not indexes:
+        # Either the conjunct doesn't resolve, or it's a constant.
+        return None
+
+    if isinstance(node, ProjectNode):
+        # Replace references to the projection's results with the expressions
+        # that compute them.
+        exprs = dict([(n, node.exprs[node.get_attr_index(n)])
+                      for n in conjunct.attr_names()])
+        pushed = substitute_attrs(conjunct, exprs)
+        return node.with_children([_push_conjunct(node.child, pushed)])
+
+    elif isinstance(node, (CrossNode, JoinNode)):
+        (lhs, rhs) = node.children
+        on_lhs = all([i < lhs.num_attrs() for i in indexes])
+        on_rhs = all([i >= lhs.num_attrs() for i in indexes])
+
+        # Conjuncts can only be pushed into the inputs of an outer join whose
+        # rows are all preserved.
+        join_type = getattr(node, 'join_type', INNER_JOIN)
+        if on_lhs and join_type in [INNER_JOIN, LEFT_OUTER_JOIN]:
+            return node.with_children([_push_conjunct(lhs, conjunct), rhs])
+
+        elif on_rhs and join_type in [INNER_JOIN, RIGHT_OUTER_JOIN]:
+            return node.with_children([lhs, _push_conjunct(rhs, conjunct)])
+
+        elif not on_lhs and not on_rhs:
+            # The conjunct refers to both inputs.  A Cartesian product with
+            # such a predicate is really a join, and theta-joins can evaluate
+            # it as part of their join condition.
+            if isinstance(node, CrossNode):
+                return JoinNode(lhs, rhs, INNER_JOIN, conjunct)
+
+            elif join_type == INNER_JOIN and not node.is_natural():
+                return JoinNode(lhs, rhs, INNER_JOIN,
+                                make_conjunction([node.pred, conjunct]))
+
+        return None
+
+    elif isinstance(node, DistinctNode):
+        return node.with_children([_push_conjunct(node.child, conjunct)])
+
+    elif isinstance(node, SemiJoinNode):
+        # The result's rows are rows of the left input.
+        (lhs, rhs) = node.children
+        return node.with_children([_push_conjunct(lhs, conjunct), rhs])
+
+    elif isinstance(node, GroupNode):
+        # A conjunct on the group values selects whole groups, so it can be
+        # applied to the rows before they are grouped.
+        if any([i >= len(node.group_exprs) for i in indexes]):
+            return None
+
+        exprs = dict([(n, node.group_exprs[node.get_attr_index(n)])
+                      for n in conjunct.attr_names()])
+        pushed = substitute_attrs(conjunct, exprs)
+        return node.with_children([_push_conjunct(node.child, pushed)])
+
+    elif isinstance(node, DivideNode):
+        # Each quotient value comes from the dividend rows with that value,
+        # so a conjunct on the quotient can be applied to the dividend.
+        (lhs, rhs) = node.children
+        exprs = dict([(n, AttrRef(lhs.attrs[node.quotient[node.get_attr_index(n)]]))
+                      for n in conjunct.attr_names()])
+        return node.with_children([_push_conjunct(lhs, substitute_attrs(
+                                       conjunct, exprs)), rhs])
+
+    elif isinstance(node, SetOpNode):
+        (lhs, rhs) = node.children
+        pushed_lhs = _push_conjunct(lhs, conjunct)
+        if node.op == SET_DIFFERENCE:
+            return node.with_children([pushed_lhs, rhs])
+
+        # The right input's attributes may have different names, so the
+        # conjunct must be rewritten in terms of those names.
+        rhs_conjunct = _rename_positional(conjunct, node, rhs)
+        if rhs_conjunct is None:
+            return None
+
+        return node.with_children([pushed_lhs,
+                                   _push_conjunct(rhs, rhs_conjunct)])
+
+    return None
+
+
+# === COST ESTIMATION ========================================================
+
+# Returns a function that resolves attribute names to their indexes in the
+# plan node's attributes, or to None if they don't resolve.
+def _resolver(node):
+    def resolve(name):
+        indexes = _resolve_all(node, [name])
+        return indexes[0] if indexes is not None else None
+
+    return resolve
+
+
+# Estimates the number of rows that a plan produces, and the number of
+# distinct values of each of its attributes, from the statistics of the
+# relation variables in the database.
+class CardinalityEstimator:
+
+    def __init__(self, database):
+        self.database = database
+
+
+    def estimate(self, node):
+        return node.accept(self)
+
+
+    def visitRelVarNode(self, node):
+        return Estimate.from_stats(self.database.get_stats(node.name))
+
+
+    def visitConstantNode(self, node):
+        if node.relval.attributes is None:
+            return Estimate(0, [])
+
+        return Estimate.from_stats(RelationStats(node.relval))
+
+
+    def visitIndexScanNode(self, node):
+        e = Estimate.from_stats(self.database.get_stats(node.name))
+        return e.filtered(selectivity(node.pred, e, _resolver(node)))
+
+
+    def visitSelectNode(self, node):
+        e = self.estimate(node.child)
+        return e.filtered(selectivity(node.pred, e, _resolver(node.child)))
+
+
+    # Returns the estimates of the columns that the expressions compute from
+    # the input, and the number of distinct combinations of their values.
+    def _columns(self, e, exprs, resolve):
+        columns = []
+        distinct = 1
+        for expr in exprs:
+            i = resolve(expr.name) if isinstance(expr, AttrRef) else None
+            if i is None:
+                columns.append(ColumnEstimate(e.rows))
+                distinct *= max(e.rows, 1)
+            else:
+                columns.append(e.columns[i])
+                distinct *= e.distinct(i)
+
+        return (columns, distinct)
+
+
+    def visitProjectNode(self, node):
+        e = self.estimate(node.child)
+        (columns, distinct) = self._columns(e, node.exprs,
+                                            _resolver(node.child))
+        return Estimate(min(e.rows, distinct), columns)
+
+
+    # The estimates are of the distinct rows already.
+    def visitDistinctNode(self, node):
+        return self.estimate(node.child)
+
+
+    def visitGroupNode(self, node):
+        e = self.estimate(node.child)
+        (columns, distinct) = self._columns(e, node.group_exprs,
+                                            _resolver(node.child))
+
+        rows = min(e.rows, distinct) if node.group_exprs else 1
+        return Estimate(rows, columns + [ColumnEstimate(rows)
+                                         for a in node.agg_exprs])
+
+
+    def visitCrossNode(self, node):
+        (l, r) = [self.estimate(c) for c in node.children]
+        return Estimate(l.rows * r.rows, l.columns + r.columns)
+
+
+    def visitJoinNode(self, node):
+        (l, r) = [self.estimate(c) for c in node.children]
+
+        if node.is_natural():
+            e = Estimate(l.rows * r.rows,
+                         l.columns + [r.columns[j] for j in node.rhs_rest])
+            s = 1.0
+            for (i, j) in node.shared:
+                s /= max(l.distinct(i), r.distinct(j))
+        else:
+            e = Estimate(l.rows * r.rows, l.columns + r.columns)
+            s = selectivity(node.pred, e, _resolver(node))
+
+        e = e.filtered(s)
+
+        # Outer joins also produce the unmatched rows of the inputs that they
+        # preserve.
+        rows = e.rows
+        if node.join_type in [LEFT_OUTER_JOIN, FULL_OUTER_JOIN]:
+            rows = max(rows, l.rows)
+
+        if node.join_type in [RIGHT_OUTER_JOIN, FULL_OUTER_JOIN]:
+            rows = max(rows, r.rows)
+
+        return Estimate(rows, e.columns)
+
+
+    def visitIndexJoinNode(self, node):
+        return self.visitJoinNode(node)
+
+
+    def visitIndexSemiJoinNode(self, node):
+        return self.visitSemiJoinNode(node)
+
+
+    def visitSemiJoinNode(self, node):
+        (l, r) = [self.estimate(c) for c in node.children]
+
+        # The fraction of the left rows with a match, assuming that the join
+        # values of the input with fewer of them appear in the other input.
+        if r.rows == 0:
+            matched = 0.0
+        elif node.is_natural():
+            matched = 1.0
+            for (i, j) in node.shared:
+                matched *= min(1.0, r.distinct(j) / l.distinct(i))
+        else:
+            e = Estimate(l.rows * r.rows, l.columns + r.columns)
+            s = selectivity(node.pred, e, _resolver(CrossNode(*node.children)))
+            matched = min(1.0, s * r.rows)
+
+        if node.join_type == ANTI_JOIN:
+            return l.filtered(1.0 - matched)
+
+        return l.filtered(matched)
+
+
+    def visitDivideNode(self, node):
+        (l, r) = [self.estimate(c) for c in node.children]
+        return Estimate(l.rows / max(r.rows, 1),
+                        [l.columns[i] for i in node.quotient])
+
+
+    def visitSetOpNode(self, node):
+        (l, r) = [self.estimate(c) for c in node.children]
+        if node.op == SET_UNION:
+            rows = l.rows + r.rows
+        elif node.op == SET_INTERSECT:
+            rows = min(l.rows, r.rows)
+        else:
+            rows = l.rows
+
+        return Estimate(rows, l.columns)
+
+
+# === JOIN ORDERING ==========================================================
+#
+# A tree of inner joins and Cartesian products can be evaluated in any order,
+# and the order can make orders of magnitude of difference to the sizes of
+# the intermediate results.  The tree is collected into a join graph, whose
+# vertices are the inputs of the tree and whose edges are the predicates that
+# relate them.  Graphs with up to MAX_DP_JOIN_INPUTS inputs are ordered by
+# dynamic programming over the subsets of the inputs, which finds the
+# cheapest tree that has no Cartesian products unless the graph isn't
+# connected; larger graphs are ordered greedily, by repeatedly joining the
+# two trees whose join is estimated to be smallest.
+#
+# The cost of a tree is the number of rows that its joins read and produce.
+# Each join puts its smaller input on the right, since that is the input
+# that is materialized and that a hash join builds its table on.
+#
+# A tree is either all natural joins, whose inputs are related by their
+# shared attribute names, or all theta-joins and Cartesian products, whose
+# inputs are related by the conjuncts of the join predicates; a join of the
+# other kind is an input of the tree.  A reordered tree is followed by a
+# projection that puts the attributes back the way they were.
+
+MAX_DP_JOIN_INPUTS = 8
+
+# Building a hash table on a row costs more than probing the table with one.
+BUILD_COST_FACTOR = 2
+
+# A join tree is only reordered if that reduces its estimated cost to this
+# fraction of the original cost or less.
+REORDER_MIN_SAVING = 0.9
+
+
+def reorder_joins(node, database):
+    return _reorder_joins(node, CardinalityEstimator(database))
+
+
+def _reorder_joins(node, estimator):
+    graph = _JoinGraph.collect(node)
+    if graph is None:
+        node = node.with_children([_reorder_joins(c, estimator)
+                                   for c in node.children])
+        if isinstance(node, ProjectNode):
+            node = _merge_projections(node)
+
+        return node
+
+    graph.leaves = [_reorder_joins(l, estimator) for l in graph.leaves]
+    return graph.reorder(estimator)
+
+
+def _is_natural_join(node):
+    return isinstance(node, JoinNode) and \
+           not isinstance(node, IndexJoinNode) and \
+           node.join_type == INNER_JOIN and node.is_natural()
+
+
+def _is_theta_join(node):
+    return isinstance(node, CrossNode) or \
+           (isinstance(node, JoinNode) and
+            not isinstance(node, IndexJoinNode) and
+            node.join_type == INNER_JOIN and not node.is_natural())
+
+
+# Sets of the graph's inputs are represented as bit masks, with bit i set if
+# the set includes input i.  The shape of a join tree is either the index of
+# an input, or a (lhs, rhs) pair of shapes.
+class _JoinGraph:
+
+    def __init__(self, root, natural):
+        self.root = root
+        self.natural = natural
+
+        # The inputs of the tree, in their original order.
+        self.leaves = []
+
+        # For a graph of theta-joins, the (conjunct, mask) pairs of the join
+        # predicates' conjuncts and the inputs that they refer to.  The
+        # conjuncts are rewritten to refer to attributes by their full names.
+        self.conjuncts = []
+
+
+    # Returns the join graph of the tree rooted at the plan node, or None if
+    # the node isn't a join, or its tree can't be reordered.
+    @staticmethod
+    def collect(node):
+        if _is_natural_join(node):
+            graph = _JoinGraph(node, True)
+        elif _is_theta_join(node):
+            graph = _JoinGraph(node, False)
+        else:
+            return None
+
+        try:
+            graph.shape = graph._collect(node)
+        except ValueError:
+            return None
+
+        if not graph._check_names():
+            return None
+
+        return graph
+
+
+    def _is_member(self, node):
+        if self.natural:
+            return _is_natural_join(node)
+
+        return _is_theta_join(node)
+
+
+    # Collects the inputs and predicates of the tree, and returns its shape.
+    def _collect(self, node):
+        if not self._is_member(node):
+            self.leaves.append(node)
+            return len(self.leaves) - 1
+
+        first = len(self.leaves)
+        shape = (self._collect(node.children[0]),
+                 self._collect(node.children[1]))
+
+        if not self.natural and isinstance(node, JoinNode):
+            # The join's attributes are those of the inputs under it, in
+            # order, so each attribute reference can be traced to an input.
+            owners = []
+            for i in range(first, len(self.leaves)):
+                owners += [i] * self.leaves[i].num_attrs()
+
+            for c in split_conjuncts(node.pred):
+                renames = {}
+                mask = 0
+                for n in c.attr_names():
+                    i = node.get_attr_index(n)
+                    renames[n] = AttrRef(node.attrs[i])
+                    mask |= 1 << owners[i]
+
+                self.conjuncts.append( (substitute_attrs(c, renames), mask) )
+
+        return shape
+
+
+    # Checks that the inputs' attributes can be told apart in any order.  The
+    # attributes of a natural join's inputs are matched by name, so no input
+    # may have two with the same name; the attributes of theta-joins are
+    # referred to by their full names, which must all be different.
+    def _check_names(self):
+        attrs = []
+        for leaf in self.leaves:
+            attrs += leaf.attrs
+
+        if None in attrs:
+            return False
+
+        if self.natural:
+            for leaf in self.leaves:
+                names = set([a.split('.')[-1] for a in leaf.attrs])
+                if len(names) != leaf.num_attrs():
+                    return False
+
+            return True
+
+        attr_index = make_attr_index(attrs)
+        return all([attr_index.get(a) == i for (i, a) in enumerate(attrs)])
+
+
+    # Returns the best plan for the tree, which is the original tree (with
+    # its inputs replaced) unless a cheaper order is found.
+    def reorder(self, estimator):
+        n = len(self.leaves)
+        full = (1 << n) - 1
+
+        # The inputs that the joins are built from.  A conjunct that only
+        # refers to one input is applied to that input, and a conjunct that
+        # refers to none is applied with the last join.
+        self.inputs = list(self.leaves)
+        self.edges = []
+        join_conjuncts = []
+        for (c, mask) in self.conjuncts:
+            if mask & (mask - 1) == 0 and mask != 0:
+                i = mask.bit_length() - 1
+                self.inputs[i] = SelectNode(self.inputs[i], c)
+            else:
+                join_conjuncts.append( (c, mask or full) )
+                self.edges.append(mask or full)
+
+        self.join_conjuncts = join_conjuncts
+
+        # Maps masks to (Estimate, names) pairs, where the names are the
+        # attribute names that the estimate's columns are looked up by.
+        self.estimates = {}
+        for (i, node) in enumerate(self.inputs):
+            names = node.attrs
+            if self.natural:
+                names = [a.split('.')[-1] for a in names]
+
+            self.estimates[1 << i] = (estimator.estimate(node), names)
+
+        if self.natural:
+            masks = {}
+            for i in range(n):
+                for name in self.estimates[1 << i][1]:
+                    masks[name] = masks.get(name, 0) | (1 << i)
+
+            self.edges = [m for m in masks.values() if m & (m - 1)]
+
+        if n <= MAX_DP_JOIN_INPUTS:
+            shape = self._order_dp(n)
+        else:
+            shape = self._order_greedy(n)
+
+        # The estimates are rough, so the original order is kept unless the
+        # new one is clearly cheaper.
+        if self._cost(shape)[1] > REORDER_MIN_SAVING * \
+                                  self._cost(self.shape)[1]:
+            return self._replace_leaves(self.root, iter(self.leaves))
+
+        return self._restore_attrs(self._build(shape)[0])
+
+
+    # Returns True if a predicate relates the two sets of inputs.
+    def _connected(self, s1, s2):
+        for m in self.edges:
+            if m & s1 and m & s2 and (self.natural or m & ~(s1 | s2) == 0):
+                return True
+
+        return False
+
+
+    # Returns the conjuncts that are evaluated by a join of the two sets of
+    # inputs, which are the ones that refer to both.
+    def _predicates(self, s1, s2):
+        s = s1 | s2
+        return [c for (c, m) in self.join_conjuncts
+                if m & ~s == 0 and m & ~s1 and m & ~s2]
+
+
+    # Returns the (Estimate, names) pair for the join of two sets of inputs.
+    def _estimate(self, s1, s2):
+        s = s1 | s2
+        if s in self.estimates:
+            return self.estimates[s]
+
+        (e1, names1) = self.estimates[s1]
+        (e2, names2) = self.estimates[s2]
+        if self.natural:
+            shared = set(names1) & set(names2)
+            rest = [j for (j, n) in enumerate(names2) if n not in shared]
+            e = Estimate(e1.rows * e2.rows,
+                         e1.columns + [e2.columns[j] for j in rest])
+            names = names1 + [names2[j] for j in rest]
+
+            sel = 1.0
+            for n in shared:
+                sel /= max(e1.distinct(names1.index(n)),
+                           e2.distinct(names2.index(n)))
+        else:
+            e = Estimate(e1.rows * e2.rows, e1.columns + e2.columns)
+            names = names1 + names2
+
+            sel = 1.0
+            preds = self._predicates(s1, s2)
+            if preds:
+                positions = dict([(a, i) for (i, a) in enumerate(names)])
+                sel = selectivity(make_conjunction(preds), e, positions.get)
+
+        self.estimates[s] = (e.filtered(sel), names)
+        return self.estimates[s]
+
+
+    def _rows(self, s):
+        return self.estimates[s][0].rows
+
+
+    # Returns the cost of joining two sets of inputs, whose best trees have
+    # the specified costs, with s1 on the left.
+    def _join_cost(self, s1, s2, cost1, cost2):
+        return cost1 + cost2 + self._rows(s1) + \
+               BUILD_COST_FACTOR * self._rows(s2) + \
+               self._estimate(s1, s2)[0].rows
+
+
+    # Returns a (shape, cost) pair for the join of two sets of inputs, with
+    # the smaller one on the right.
+    def _join(self, s1, shape1, cost1, s2, shape2, cost2):
+        self._estimate(s1, s2)
+        if self._rows(s1) < self._rows(s2):
+            (s1, shape1, cost1, s2, shape2, cost2) = \
+                (s2, shape2, cost2, s1, shape1, cost1)
+
+        return ((shape1, shape2), self._join_cost(s1, s2, cost1, cost2))
+
+
+    def _order_dp(self, n):
+        # Maps masks to the (shape, cost) of the best tree for that set.
+        best = dict([(1 << i, (i, 0)) for i in range(n)])
+
+        for s in range(1, 1 << n):
+            if s in best:
+                continue
+
+            # Consider every way of splitting the set in two, where the first
+            # part has the lowest input in the set.
+            splits = []
+            low = s & -s
+            sub = (s - 1) & s
+            while sub:
+                if sub & low:
+                    splits.append( (sub, s ^ sub) )
+
+                sub = (sub - 1) & s
+
+            connected = [(s1, s2) for (s1, s2) in splits
+                         if self._connected(s1, s2)]
+            if connected:
+                splits = connected
+
+            for (s1, s2) in splits:
+                candidate = self._join(s1, best[s1][0], best[s1][1],
+                                       s2, best[s2][0], best[s2][1])
+                if s not in best or candidate[1] < best[s][1]:
+                    best[s] = candidate
+
+        return best[(1 << n) - 1][0]
+
+
+    def _order_greedy(self, n):
+        # The (mask, shape, cost) of each tree built so far.
+        trees = [(1 << i, i, 0) for i in range(n)]
+
+        while len(trees) > 1:
+            best = None
+            for a in range(len(trees)):
+                for b in range(a + 1, len(trees)):
+                    (s1, s2) = (trees[a][0], trees[b][0])
+                    key = (not self._connected(s1, s2),
+                           self._estimate(s1, s2)[0].rows)
+                    if best is None or key < best[0]:
+                        best = (key, a, b)
+
+            (key, a, b) = best
+            (s1, shape1, cost1) = trees[a]
+            (s2, shape2, cost2) = trees[b]
+            (shape, cost) = self._join(s1, shape1, cost1, s2, shape2, cost2)
+
+            trees[a] = (s1 | s2, shape, cost)
+            del trees[b]
+
+        return trees[0][1]
+
+
+    # Returns the (mask, cost) of a tree with the specified shape.
+    def _cost(self, shape):
+        if isinstance(shape, int):
+            return (1 << shape, 0)
+
+        (s1, cost1) = self._cost(shape[0])
+        (s2, cost2) = self._cost(shape[1])
+        return (s1 | s2, self._join_cost(s1, s2, cost1, cost2))
+
+
+    # Returns the (plan, mask) of a tree with the specified shape.
+    def _build(self, shape):
+        if isinstance(shape, int):
+            return (self.inputs[shape], 1 << shape)
+
+        (lhs, s1) = self._build(shape[0])
+        (rhs, s2) = self._build(shape[1])
+        if self.natural:
+            node = JoinNode(lhs, rhs, INNER_JOIN)
+        else:
+            preds = self._predicates(s1, s2)
+            if preds:
+                node = JoinNode(lhs, rhs, INNER_JOIN, make_conjunction(preds))
+            else:
+                node = CrossNode(lhs, rhs)
+
+        return (node, s1 | s2)
+
+
+    def _replace_leaves(self, node, leaves):
+        if not self._is_member(node):
+            return next(leaves)
+
+        return node.with_children([self._replace_leaves(c, leaves)
+                                   for c in node.children])
+
+
+    # Adds a projection to the reordered plan that gives it the original
+    # tree's attributes, in the same order.
+    def _restore_attrs(self, plan):
+        attrs = self.root.attrs
+        if plan.attrs == attrs:
+            return plan
+
+        if self.natural:
+            # Each name appears once, but it may be qualified by a different
+            # relation name.
+            full_names = dict([(a.split('.')[-1], a) for a in plan.attrs])
+            exprs = [AttrRef(full_names[a.split('.')[-1]]) for a in attrs]
+        else:
+            exprs = [AttrRef(a) for a in attrs]
+
+        return ProjectNode(plan, exprs, attrs)
+
+
+# Combines a projection of a projection that only picks attributes into one
+# projection.
+def _merge_projections(node):
+    child = node.child
+    if not isinstance(child, ProjectNode) or \
+       not all([isinstance(e, AttrRef) for e in child.exprs]):
+        return node
+
+    exprs = {}
+    for n in set().union(*[e.attr_names() for e in node.exprs]):
+        indexes = _resolve_all(child, [n])
+        if indexes is None:
+            return node
+
+        exprs[n] = child.exprs[indexes[0]]
+
+    return ProjectNode(child.child, [substitute_attrs(e, exprs)
+                                     for e in node.exprs], node.attrs)
+
+
+# === SEMI-JOINS =============================================================
+#
+# When only the attributes of one input of an inner join are used above it,
+# the join can be computed as a semi-join of that input, which passes each of
+# its rows along at most once, however many rows of the other input it
+# matches, and only keeps the other input's join keys rather than its rows.
+# The attributes that are used from each node are worked out from the top of
+# the plan down.
+#
+# The rewrite relies on the duplicates in a result being removed, so nothing
+# below a GROUP is rewritten, since its aggregates would count them, and it
+# isn't made at all in plans that are run with bag semantics.
+
+def introduce_semi_joins(node):
+    return _introduce_semi_joins(node, None)
+
+
+# Rewrites the joins in the plan into semi-joins where they can be.  needed is
+# the set of the node's attribute names that are used above it, or None if
+# they may all be used, e.g. by position.
+def _introduce_semi_joins(node, needed):
+    if isinstance(node, GroupNode):
+        return node
+
+    if isinstance(node, JoinNode) and not isinstance(node, IndexJoinNode) and \
+       node.join_type == INNER_JOIN and needed is not None:
+        semi_join = _semi_join(node, needed)
+        if semi_join is not None:
+            node = semi_join
+
+    if isinstance(node, ProjectNode):
+        names = set().union(*[e.attr_names() for e in node.exprs])
+        return node.with_children([_introduce_semi_joins(node.child, names)])
+
+    elif isinstance(node, DistinctNode):
+        return node.with_children([_introduce_semi_joins(node.child, needed)])
+
+    elif isinstance(node, SelectNode):
+        if needed is not None:
+            needed = needed | node.pred.attr_names()
+
+        return node.with_children([_introduce_semi_joins(node.child, needed)])
+
+    elif isinstance(node, (CrossNode, JoinNode, SemiJoinNode)) and \
+         not isinstance(node, IndexJoinNode):
+        inputs_needed = _inputs_needed(node, needed)
+        if inputs_needed is not None:
+            return node.with_children([_introduce_semi_joins(c, n) for (c, n)
+                                       in zip(node.children, inputs_needed)])
+
+    return node.with_children([_introduce_semi_joins(c, None)
+                               for c in node.children])
+
+
+# Returns a semi-join that computes the join's attributes in needed, or None
+# if the join uses attributes of both of its inputs.
+def _semi_join(node, needed):
+    indexes = _resolve_all(node, needed)
+    if indexes is None:
+        return None
+
+    (lhs, rhs) = node.children
+    try:
+        if all([i < lhs.num_attrs() for i in indexes]):
+            semi_join = SemiJoinNode(lhs, rhs, SEMI_JOIN, node.pred)
+        elif all([i >= lhs.num_attrs() for i in indexes]):
+            semi_join = SemiJoinNode(rhs, lhs, SEMI_JOIN, node.pred)
+        else:
+            return None
+    except ValueError:
+        return None
+
+    if _resolve_all(semi_join, needed) is None:
+        return None
+
+    return semi_join
+
+
+# Returns the names of the attributes of each input of a join, Cartesian
+# product or semi-join that are needed to compute it and the attributes in
+# needed, or None for an input whose attributes may all be needed.  Returns
+# None if this can't be worked out.
+def _inputs_needed(node, needed):
+    if needed is None:
+        return None
+
+    indexes = _resolve_all(node, needed)
+    if indexes is None:
+        return None
+
+    # Work out the needed attributes' indexes in the concatenation of the
+    # inputs' attributes.  A natural join's result skips the right input's
+    # shared attributes, and a semi-join's result is its left input.
+    (lhs, rhs) = node.children
+    width = lhs.num_attrs()
+    if isinstance(node, JoinNode) and node.is_natural():
+        indexes = [i if i < width else width + node.rhs_rest[i - width]
+                   for i in indexes]
+
+    pred = getattr(node, 'pred', None)
+    if pred is not None:
+        pred_indexes = _resolve_all(CrossNode(lhs, rhs), pred.attr_names())
+        if pred_indexes is None:
+            return None
+
+        indexes += pred_indexes
+
+    elif not isinstance(node, CrossNode):
+        for (i_lhs, i_rhs) in node.shared:
+            indexes += [i_lhs, width + i_rhs]
+
+    inputs_needed = [set(), set()]
+    for i in indexes:
+        (side, j) = (0, i) if i < width else (1, i - width)
+
+        # Each needed attribute must be referable by its name.
+        name = node.children[side].attrs[j]
+        if name is None or _resolve_all(node.children[side], [name]) != [j]:
+            return None
+
+        inputs_needed[side].add(name)
+
+    return inputs_needed
+
+
+def choose_indexes(node, database):
+    node = node.with_children([choose_indexes(c, database)
+                               for c in node.children])
+
+    if isinstance(node, SelectNode) and isinstance(node.child, RelVarNode):
+        return _choose_scan_index(node, database)
+
+    elif isinstance(node, (JoinNode, SemiJoinNode)):
+        return _choose_join_index(node, database)
+
+    return node
+
+
+# If the conjunct compares an attribute of the node with a non-null literal,
+# returns a tuple (index, op, value) such that the conjunct is
+# "attribute op value"; otherwise returns None.
+def _literal_comparison(node, conjunct):
+    if not isinstance(conjunct, BinaryOp) or conjunct.op not in FLIPPED_OPS:
+        return None
+
+    (lhs, op, rhs) = (conjunct.lhs, conjunct.op, conjunct.rhs)
+    if isinstance(lhs, Literal):
+        (lhs, op, rhs) = (rhs, FLIPPED_OPS[op], lhs)
+
+    if not isinstance(lhs, AttrRef) or not isinstance(rhs, Literal) or \
+       rhs.value is None:
+        return None
+
+    indexes = _resolve_all(node, [lhs.name])
+    if indexes is None:
+        return None
+
+    return (indexes[0], op, rhs.value)
+
+
+# Replaces a selection on a relation variable with an index scan, if one of
+# its indexes can find the rows for some of the selection's conjuncts.
+# Lookups of a key are preferred to ranges, and indexes that cover more
+# conjuncts are preferred to ones that cover fewer.
+def _choose_scan_index(node, database):
+    relvar = node.child
+    conjuncts = split_conjuncts(node.pred)
+    comparisons = [_literal_comparison(relvar, c) for c in conjuncts]
+
+    best = None
+    for index in database.get_indexes(relvar.name):
+        positions = _resolve_all(relvar, index.attrs)
+        if positions is None:
+            continue
+
+        # The indexes of the conjuncts that the index computes.
+        used = []
+        key = low = high = None
+
+        if index.kind == HASH_INDEX:
+            for p in positions:
+                for (i, c) in enumerate(comparisons):
+                    if c is not None and c[0] == p and c[1] == '==':
+                        used.append(i)
+                        break
+                else:
+                    break
+
+            if len(used) != len(positions):
+                continue
+
+            key = tuple([comparisons[i][2] for i in used])
+
+        else:
+            for (i, c) in enumerate(comparisons):
+                if c is None or c[0] != positions[0]:
+                    continue
+
+                (unused, op, value) = c
+                if op == '==':
+                    used = [i]
+                    key = (value,)
+                    low = high = None
+                    break
+                elif op in ['>', '>='] and low is None:
+                    used.append(i)
+                    low = (value, op == '>=')
+                elif op in ['<', '<='] and high is None:
+                    used.append(i)
+                    high = (value, op == '<=')
+
+            if not used:
+                continue
+
+        rank = (key is not None, len(used))
+        if best is None or rank > best[0]:
+            best = (rank, index, used, key, low, high)
+
+    if best is None:
+        return node
+
+    (rank, index, used, key, low, high) = best
+    scan = IndexScanNode(relvar.name, relvar.attrs, index.kind, index.attrs,
+                         make_conjunction([conjuncts[i] for i in used]),
+                         key, low, high)
+
+    rest = [c for (i, c) in enumerate(conjuncts) if i not in used]
+    if not rest:
+        return scan
+
+    return SelectNode(scan, make_conjunction(rest))
+
+
+# Replaces a join or semi-join with an index join, if one of its inputs is a
+# relation variable with a hash index on the attributes that the join
+# equates.  The indexed input can't be one whose unmatched rows an outer join
+# preserves, or the left input of an anti-join.
+def _choose_join_index(node, database):
+    (lhs, rhs) = node.children
+
+    sides = []
+    if isinstance(rhs, RelVarNode) and \
+       node.join_type in [INNER_JOIN, LEFT_OUTER_JOIN, SEMI_JOIN, ANTI_JOIN]:
+        sides.append(False)
+
+    if isinstance(lhs, RelVarNode) and \
+       node.join_type in [INNER_JOIN, RIGHT_OUTER_JOIN, SEMI_JOIN]:
+        sides.append(True)
+
+    if not sides:
+        return node
+
+    try:
+        if node.is_natural():
+            cond = natural_join_attrs(lhs.attrs, rhs.attrs)[0]
+        else:
+            cond = analyze_join_condition(node.pred, lhs.get_attr_index,
+                                          rhs.get_attr_index)
+    except ValueError:
+        return node
+
+    best = None
+    for index_lhs in sides:
+        indexed = lhs if index_lhs else rhs
+        for index in database.get_indexes(indexed.name):
+            if index.kind != HASH_INDEX or \
+               index_join_keys(cond, index.attrs, indexed.get_attr_index,
+                               index_lhs) is None:
+                continue
+
+            if best is None or len(index.attrs) > len(best[1].attrs):
+                best = (index_lhs, index)
+
+    if best is None:
+        return node
+
+    if isinstance(node, SemiJoinNode):
+        return IndexSemiJoinNode(lhs, rhs, node.join_type, node.pred, best[0],
+                                 best[1].attrs)
+
+    return IndexJoinNode(lhs, rhs, node.join_type, node.pred, best[0],
+                         best[1].attrs)
+
+
+# Rewrites an expression over the node's attributes into an expression over
+# the other plan node's attributes, matching attributes by position.  Returns
+# None if this can't be done.
+def _rename_positional(expr, node, other):
+    if other.num_attrs() != node.num_attrs():
+        return None
+
+    renames = {}
+    for n in expr.attr_names():
+        name = other.attrs[node.get_attr_index(n)]
+        if name is None:
+            return None
+
+        renames[n] = AttrRef(name)
+
+    return substitute_attrs(expr, renames)
+
+
+def push_down_projections(node):
+    node = node.with_children([push_down_projections(c)
+                               for c in node.children])
+
+    if not isinstance(node, ProjectNode):
+        return node
+
+    child = node.child
+    if isinstance(child, SetOpNode) and child.op == SET_UNION:
+        # Projection distributes over set-union.
+        (lhs, rhs) = child.children
+        if _resolve_all(lhs, set().union(*[e.attr_names() for e in node.exprs])) \
+           is None:
+            return node
+
+        rhs_exprs = [_rename_positional(e, lhs, rhs) for e in node.exprs]
+        if None in rhs_exprs:
+            return node
+
+        return SetOpNode(SET_UNION,
+            push_down_projections(ProjectNode(lhs, node.exprs, node.attrs)),
+            push_down_projections(ProjectNode(rhs, rhs_exprs, node.attrs)))
+
+    elif isinstance(child, (CrossNode, JoinNode)):
+        # Only pass along the join inputs' attributes that are needed by the
+        # projection or by the join itself.
+        names = set().union(*[e.attr_names() for e in node.exprs])
+        if isinstance(child, JoinNode) and child.pred is not None:
+            names |= child.pred.attr_names()
+
+        indexes = _resolve_all(child, names)
+        if indexes is None:
+            return node
+
+        (lhs, rhs) = child.children
+        lhs_needed = set([i for i in indexes if i < lhs.num_attrs()])
+        rhs_needed = set()
+        for i in indexes:
+            if i >= lhs.num_attrs():
+                rhs_needed.add(i - lhs.num_attrs())
+
+        if isinstance(child, JoinNode) and child.is_natural():
+            # The shared attributes of a natural join must be kept, and the
+            # join's output positions for the right input skip them.
+            rhs_needed = set([child.rhs_rest[i] for i in rhs_needed])
+            for (i_lhs, i_rhs) in child.shared:
+                lhs_needed.add(i_lhs)
+                rhs_needed.add(i_rhs)
+
+        new_lhs = _prune_attrs(lhs, lhs_needed)
+        new_rhs = _prune_attrs(rhs, rhs_needed)
+        if isinstance(child, IndexJoinNode):
+            # The indexed input must stay a relation variable.
+            if child.index_lhs:
+                new_lhs = lhs
+            else:
+                new_rhs = rhs
+
+        if new_lhs is lhs and new_rhs is rhs:
+            return node
+
+        return node.with_children([child.with_children([new_lhs, new_rhs])])
+
+    return node
+
+
+# Returns a plan that only produces the specified attributes of the node,
+# which may be the node itself if all attributes are needed.
+def _prune_attrs(node, needed):
+    if len(needed) == node.num_attrs():
+        return node
+
+    attrs = []
+    for i in sorted(needed):
+        # Each attribute that is kept must be referable by its name.
+        if _resolve_all(node, [node.attrs[i]]) != [i]:
+            return node
+
+        attrs.append(node.attrs[i])
+
+    return ProjectNode(node, [AttrRef(a) for a in attrs], attrs)
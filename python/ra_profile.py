@@ -0,0 +1,316 @@
+# Profiling of plan execution, for EXPLAIN ANALYZE.
+#
+# ProfilingExecutor runs a plan like PlanExecutor does, but records for each
+# operator how long it took, how many rows it consumed and produced, the peak
+# memory allocated while it was running, and whether the caches it relies on
+# already held what it needed:  the index of an index scan or index join, and
+# for a DiskDatabase, the relvars that have already been opened.
+#
+# Since operators are pull-based, an operator does its work both when its
+# stream is created and each time a row is pulled from it; both are timed.
+# An operator's time includes the time of the operators it pulls rows from,
+# which is subtracted out to give the time spent in the operator itself.
+#
+# Memory is measured with tracemalloc, which slows execution down
+# considerably, so it is only tracked when asked for.
+
+import time, tracemalloc
+
+from relation import RowStream
+from ra_index import HASH_INDEX
+from ra_plan import RelVarNode, IndexScanNode, IndexJoinNode, \
+    IndexSemiJoinNode
+from ra_storage import DiskDatabase
+from ra_aggregate import DEFAULT_MAX_GROUPS
+from ra_eval import PlanExecutor, RelationalAlgebraEvaluator, parse_ra_stmt, \
+    statement_cache
+
+
+# What was measured about one operator of a plan.
+class OperatorProfile:
+    def __init__(self, plan):
+        self.plan = plan
+        self.children = []
+
+        # The time spent in the operator, including the time spent in its
+        # inputs, in seconds.
+        self.time = 0.0
+        self.rows_out = 0
+
+        # The most memory allocated at any point while the operator was
+        # running, in bytes, or None if memory wasn't tracked.
+        self.peak_memory = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def rows_in(self):
+        return sum([c.rows_out for c in self.children])
+
+    @property
+    def self_time(self):
+        return max(self.time - sum([c.time for c in self.children]), 0.0)
+
+    def to_dict(self):
+        return {
+            'operator'     : type(self.plan).__name__,
+            'description'  : self.plan.describe(),
+            'time'         : self.time,
+            'self_time'    : self.self_time,
+            'rows_in'      : self.rows_in,
+            'rows_out'     : self.rows_out,
+            'peak_memory'  : self.peak_memory,
+            'cache_hits'   : self.cache_hits,
+            'cache_misses' : self.cache_misses,
+            'children'     : [c.to_dict() for c in self.children],
+        }
+
+
+class ProfilingExecutor(PlanExecutor):
+    def __init__(self, database, track_memory=False,
+                 max_groups=DEFAULT_MAX_GROUPS):
+        super().__init__(database, max_groups)
+        self.track_memory = track_memory
+
+        # The profile of the plan that was executed last.
+        self.profile = None
+
+        # The (profile, start time) of each operator whose code is running,
+        # innermost last.
+        self.active = []
+        self.base_memory = 0
+
+
+    def execute(self, plan):
+        self.profile = None
+        if not self.track_memory:
+            return super().execute(plan)
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+
+        try:
+            # Only memory allocated by the plan counts.
+            self.base_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            return super().execute(plan)
+        finally:
+            if started:
+                tracemalloc.stop()
+
+
+    def stream(self, plan):
+        profile = OperatorProfile(plan)
+        if self.active:
+            self.active[-1][0].children.append(profile)
+        else:
+            self.profile = profile
+
+        self._check_caches(plan, profile)
+
+        self._enter(profile)
+        try:
+            s = super().stream(plan)
+        finally:
+            self._leave()
+
+        if s.source is not None:
+            # The rows are already stored, so the operator does no more work
+            # when they are pulled.
+            profile.rows_out = s.source.num_rows()
+            return s
+
+        return RowStream(s.attributes, self._pull(s.rows, profile))
+
+
+    # Passes the rows along, timing the operator each time a row is pulled
+    # from it.
+    def _pull(self, rows, profile):
+        self._enter(profile)
+        try:
+            it = iter(rows)
+        finally:
+            self._leave()
+
+        while True:
+            self._enter(profile)
+            try:
+                row = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._leave()
+
+            profile.rows_out += 1
+            yield row
+
+
+    def _enter(self, profile):
+        if self.track_memory:
+            self._record_peak()
+
+        self.active.append( (profile, time.perf_counter()) )
+
+    def _leave(self):
+        end = time.perf_counter()
+        if self.track_memory:
+            self._record_peak()
+
+        (profile, start) = self.active.pop()
+        profile.time += end - start
+
+
+    # The peak since the last time the operators changed was reached while
+    # all of the active operators were running.
+    def _record_peak(self):
+        peak = max(tracemalloc.get_traced_memory()[1] - self.base_memory, 0)
+        for (profile, start) in self.active:
+            profile.peak_memory = max(profile.peak_memory or 0, peak)
+
+        tracemalloc.reset_peak()
+
+
+    # Records whether the relvar an operator reads is already open, and
+    # whether the index it uses is already up to date with the relvar.  This
+    # must not open the relvar itself.
+    def _check_caches(self, plan, profile):
+        if isinstance(plan, (RelVarNode, IndexScanNode)):
+            name = plan.name
+            if isinstance(self.database, DiskDatabase):
+                if name in self.database.unopened:
+                    profile.cache_misses += 1
+                else:
+                    profile.cache_hits += 1
+
+        if isinstance(plan, IndexScanNode):
+            index = self.database.find_index(name, plan.index_attrs, plan.kind)
+        elif isinstance(plan, (IndexJoinNode, IndexSemiJoinNode)):
+            name = plan.indexed.name
+            index = self.database.find_index(name, plan.index_attrs,
+                                             HASH_INDEX)
+        else:
+            return
+
+        relval = self.database.relation_variables.get(name)
+        if index is not None and relval is not None and index.relval is relval:
+            profile.cache_hits += 1
+        else:
+            profile.cache_misses += 1
+
+
+# Evaluates a statement like eval_ra_expr(), and returns the result along with
+# a profile of its execution.  The profile is a dict of plain values, so that
+# it can be logged or serialized as JSON:
+#
+#   statement         the statement's text
+#   total_time        the time taken by the whole statement, in seconds
+#   parse_time        the time taken to parse it, or to find it in the cache
+#   rows              the number of rows in the result
+#   statement_cached  whether the statement was already parsed
+#   plan_cached       whether the statement's plan was reused
+#   peak_memory       the most memory allocated by the plan, or None
+#   plan              the profile of the plan's root operator, or None if the
+#                     statement didn't run one
+#
+# Each operator's profile has its operator type and description, time,
+# self_time, rows_in, rows_out, peak_memory, cache_hits and cache_misses, and
+# the profiles of its children.
+def profile_ra_expr(database, ra_str, cache=statement_cache,
+                    track_memory=False):
+    executor = ProfilingExecutor(database, track_memory)
+
+    (stmt, old_plan, statement_cached) = (None, None, False)
+
+    start = time.perf_counter()
+    if cache is None:
+        parse_tree = parse_ra_stmt(ra_str)
+    else:
+        hits = cache.hits
+        stmt = cache.lookup(ra_str)
+        (parse_tree, statement_cached) = (stmt.parse_tree, cache.hits > hits)
+        old_plan = stmt.plan
+
+    parsed = time.perf_counter()
+    visitor = RelationalAlgebraEvaluator(database, stmt, executor)
+    result = visitor.visit(parse_tree)
+    end = time.perf_counter()
+
+    root = executor.profile
+    profile = {
+        'statement'        : ra_str,
+        'total_time'       : end - start,
+        'parse_time'       : parsed - start,
+        'rows'             : result.num_rows() if result is not None else None,
+        'statement_cached' : statement_cached,
+        'plan_cached'      : old_plan is not None and stmt.plan is old_plan,
+        'peak_memory'      : root.peak_memory if root is not None else None,
+        'plan'             : root.to_dict() if root is not None else None,
+    }
+
+    return (result, profile)
+
+
+def _format_time(seconds):
+    return '%.3f ms' % (seconds * 1000)
+
+
+def _format_bytes(n):
+    for unit in ['B', 'KB', 'MB']:
+        if n < 1024:
+            return '%d %s' % (n, unit) if unit == 'B' else '%.1f %s' % (n, unit)
+
+        n /= 1024
+
+    return '%.1f GB' % n
+
+
+def _format_operator(op, depth, lines):
+    details = ['time=%s' % _format_time(op['time']),
+               'self=%s' % _format_time(op['self_time'])]
+    if op['children']:
+        details.append('rows in=%d out=%d' % (op['rows_in'], op['rows_out']))
+    else:
+        details.append('rows=%d' % op['rows_out'])
+
+    if op['peak_memory'] is not None:
+        details.append('peak mem=%s' % _format_bytes(op['peak_memory']))
+
+    if op['cache_hits'] or op['cache_misses']:
+        details.append('cache hits=%d misses=%d' % \
+                       (op['cache_hits'], op['cache_misses']))
+
+    lines.append('  ' * depth + '%s  (%s)' % (op['description'],
+                                             ', '.join(details)))
+    for child in op['children']:
+        _format_operator(child, depth + 1, lines)
+
+
+# Returns an EXPLAIN-style printout of a profile from profile_ra_expr(), with
+# what was measured about each operator next to it.
+def format_profile(profile):
+    summary = ['total %s' % _format_time(profile['total_time']),
+               'parse %s' % _format_time(profile['parse_time'])]
+    if profile['rows'] is not None:
+        summary.append('%d rows' % profile['rows'])
+
+    summary.append('statement %s' % \
+                   ('cached' if profile['statement_cached'] else 'parsed'))
+    summary.append('plan %s' % \
+                   ('cached' if profile['plan_cached'] else 'built'))
+    if profile['peak_memory'] is not None:
+        summary.append('peak mem %s' % _format_bytes(profile['peak_memory']))
+
+    lines = ['Execution profile:  ' + ', '.join(summary)]
+    if profile['plan'] is not None:
+        _format_operator(profile['plan'], 1, lines)
+
+    return '\n'.join(lines)
+
+
+# Runs a statement and returns an EXPLAIN ANALYZE printout of its execution.
+def explain_analyze_ra_expr(database, ra_str, cache=statement_cache,
+                            track_memory=True):
+    (result, profile) = profile_ra_expr(database, ra_str, cache, track_memory)
+    return format_profile(profile)
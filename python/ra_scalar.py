@@ -0,0 +1,422 @@
+import functools, math, operator
+
+from RelationalAlgebraParser import RelationalAlgebraParser
+from RelationalAlgebraVisitor import RelationalAlgebraVisitor
+
+
+# Functions that may be called from scalar expressions, e.g. "abs(a - b)".
+SCALAR_FUNCTIONS = {
+    'abs'   : abs,
+    'round' : round,
+    'floor' : math.floor,
+    'ceil'  : math.ceil,
+    'sqrt'  : math.sqrt,
+    'pow'   : pow,
+    'min'   : min,
+    'max'   : max,
+    'len'   : len,
+    'str'   : str,
+    'int'   : int,
+    'float' : float,
+    'lower' : lambda s: s.lower(),
+    'upper' : lambda s: s.upper(),
+}
+
+
+# Aggregate functions that may be used in the aggregates of GROUP.  The
+# one-argument forms of min() and max() are aggregates there, too.
+AGGREGATE_FUNCTIONS = ['count', 'count_distinct', 'sum', 'avg', 'min', 'max']
+
+
+# Scalar expressions are translated out of the parse tree into this small
+# expression tree.  The tree can then be compiled into a single Python
+# function that takes a row-tuple and computes the expression's value, so
+# that no parsing or name lookup is done per row.
+#
+# Null values follow the usual three-valued logic:  arithmetic, comparisons
+# and function calls involving null produce null, and AND / OR / NOT treat
+# null as "unknown."
+
+class ScalarExpr:
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, str(self))
+
+    # Returns the set of attribute names referenced by the expression.
+    def attr_names(self):
+        return set()
+
+
+class AttrRef(ScalarExpr):
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def attr_names(self):
+        return {self.name}
+
+    def to_python(self, gen):
+        return 'row[%d]' % gen.resolve(self.name)
+
+
+class Literal(ScalarExpr):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        if self.value is None:
+            return 'null'
+        elif self.value is True:
+            return 'true'
+        elif self.value is False:
+            return 'false'
+        elif isinstance(self.value, str):
+            return '"%s"' % self.value
+
+        return str(self.value)
+
+    def to_python(self, gen):
+        return repr(self.value)
+
+
+class FuncCall(ScalarExpr):
+    def __init__(self, name, args):
+        if name not in SCALAR_FUNCTIONS:
+            if name in AGGREGATE_FUNCTIONS:
+                raise ValueError('Aggregate function %s can only be used ' \
+                                 'in GROUP' % name)
+
+            raise ValueError('Unknown function %s' % name)
+
+        self.name = name
+        self.args = args
+
+    def __str__(self):
+        return '%s(%s)' % (self.name, ', '.join([str(a) for a in self.args]))
+
+    def attr_names(self):
+        return set().union(*[a.attr_names() for a in self.args])
+
+    def to_python(self, gen):
+        return gen.null_guarded(self.args,
+            lambda srcs: '%s(%s)' % (self.name, ', '.join(srcs)))
+
+
+class UnaryOp(ScalarExpr):
+    def __init__(self, op, operand):
+        # op is either '-' or 'not'
+        self.op = op
+        self.operand = operand
+
+    def __str__(self):
+        if self.op == 'not':
+            return 'NOT (%s)' % self.operand
+
+        return '-(%s)' % self.operand
+
+    def attr_names(self):
+        return self.operand.attr_names()
+
+    def to_python(self, gen):
+        return gen.null_guarded([self.operand],
+            lambda srcs: '(%s %s)' % (self.op, srcs[0]))
+
+
+class BinaryOp(ScalarExpr):
+    def __init__(self, op, lhs, rhs):
+        # op is the Python spelling of the operator, e.g. '==' or 'and'
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def __str__(self):
+        op = self.op
+        if op in ['and', 'or']:
+            op = op.upper()
+        elif op == '==':
+            op = '='
+
+        return '(%s %s %s)' % (self.lhs, op, self.rhs)
+
+    def attr_names(self):
+        return self.lhs.attr_names() | self.rhs.attr_names()
+
+    def to_python(self, gen):
+        if self.op in ['and', 'or']:
+            # For AND, a false operand decides the result even if the other
+            # operand is null; likewise for OR and a true operand.
+            decisive = 'False' if self.op == 'and' else 'True'
+            t1 = gen.temp()
+            t2 = gen.temp()
+            return '(%s if (%s := %s) is %s else ' \
+                   '(%s if (%s := %s) is %s else ' \
+                   '(None if %s is None or %s is None else (%s %s %s))))' % \
+                   (t1, t1, self.lhs.to_python(gen), decisive,
+                    t2, t2, self.rhs.to_python(gen), decisive,
+                    t1, t2, t1, self.op, t2)
+
+        return gen.null_guarded([self.lhs, self.rhs],
+            lambda srcs: '(%s %s %s)' % (srcs[0], self.op, srcs[1]))
+
+
+# A call to an aggregate function, which computes one value from all of the
+# rows in a group.  The arg is None for count(), which counts the rows.
+class AggregateCall(ScalarExpr):
+    def __init__(self, name, arg):
+        self.name = name
+        self.arg = arg
+
+    def __str__(self):
+        return '%s(%s)' % (self.name, self.arg if self.arg is not None else '')
+
+    def attr_names(self):
+        return self.arg.attr_names() if self.arg is not None else set()
+
+    def to_python(self, gen):
+        # Aggregates are computed by the GROUP operator, which replaces them
+        # with references to their results before compiling anything.
+        raise ValueError('Aggregate function %s can only be used in GROUP' % \
+                         self.name)
+
+
+# Returns a copy of the expression where attribute references are replaced by
+# the expressions in the specified map from attribute names to expressions.
+def substitute_attrs(expr, exprs):
+    if isinstance(expr, AttrRef):
+        return exprs.get(expr.name, expr)
+    elif isinstance(expr, FuncCall):
+        return FuncCall(expr.name, [substitute_attrs(a, exprs) for a in expr.args])
+    elif isinstance(expr, UnaryOp):
+        return UnaryOp(expr.op, substitute_attrs(expr.operand, exprs))
+    elif isinstance(expr, BinaryOp):
+        return BinaryOp(expr.op, substitute_attrs(expr.lhs, exprs),
+                        substitute_attrs(expr.rhs, exprs))
+    elif isinstance(expr, AggregateCall) and expr.arg is not None:
+        return AggregateCall(expr.name, substitute_attrs(expr.arg, exprs))
+
+    return expr
+
+
+# Splits a predicate into the list of its top-level conjuncts.
+def split_conjuncts(expr):
+    if isinstance(expr, BinaryOp) and expr.op == 'and':
+        return split_conjuncts(expr.lhs) + split_conjuncts(expr.rhs)
+
+    return [expr]
+
+
+# Combines a list of predicates into a single conjunction, or None if the
+# list is empty.
+def make_conjunction(exprs):
+    result = None
+    for e in exprs:
+        result = e if result is None else BinaryOp('and', result, e)
+
+    return result
+
+
+# Generates the Python source for a scalar expression.  Attribute names are
+# resolved to row positions through the resolve function, and temporaries are
+# introduced wherever a subexpression's value must be tested for null before
+# it is used.
+class _CodeGen:
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.num_temps = 0
+
+    def temp(self):
+        name = '_t%d' % self.num_temps
+        self.num_temps += 1
+        return name
+
+    def null_guarded(self, operands, build):
+        checks = []
+        srcs = []
+        for e in operands:
+            src = e.to_python(self)
+            if isinstance(e, Literal) and e.value is not None:
+                # Non-null literals never need to be checked.
+                srcs.append(src)
+
+            elif isinstance(e, (AttrRef, Literal)):
+                # These are cheap enough to evaluate twice.
+                checks.append('%s is None' % src)
+                srcs.append(src)
+
+            else:
+                t = self.temp()
+                checks.append('(%s := %s) is None' % (t, src))
+                srcs.append(t)
+
+        if not checks:
+            return build(srcs)
+
+        return '(None if %s else %s)' % (' or '.join(checks), build(srcs))
+
+
+# Map the comparison operators of the language to their Python equivalents.
+COMPARE_OPS = {
+    "="  : "==",
+    "==" : "==",
+    "!=" : "!=",
+    "<>" : "!=",
+    ">"  : ">",
+    "<"  : "<",
+    ">=" : ">=",
+    "<=" : "<=",
+}
+
+
+# Convert a literalValue parse-tree node into the corresponding Python value.
+def literal_value(ctx):
+    if isinstance(ctx, RelationalAlgebraParser.LiteralNumberContext):
+        text = ctx.NUMBER().getText()
+        if '.' in text:
+            return float(text)
+
+        return int(text)
+
+    elif isinstance(ctx, RelationalAlgebraParser.LiteralStringContext):
+        # There are no escape sequences in strings; just strip the quotes.
+        return ctx.STRING().getText()[1:-1]
+
+    elif isinstance(ctx, RelationalAlgebraParser.LiteralTrueContext):
+        return True
+
+    elif isinstance(ctx, RelationalAlgebraParser.LiteralFalseContext):
+        return False
+
+    elif isinstance(ctx, RelationalAlgebraParser.LiteralNullContext):
+        return None
+
+    raise ValueError('Unrecognized literal value %s' % ctx.getText())
+
+
+# Translates a scalarExpr parse tree into a ScalarExpr tree.
+class ScalarExprBuilder(RelationalAlgebraVisitor):
+
+    def visitNamedScalarExpr(self, ctx:RelationalAlgebraParser.NamedScalarExprContext):
+        return self.visit(ctx.scalarExpr())
+
+    def visitScalarExprAttribute(self, ctx:RelationalAlgebraParser.ScalarExprAttributeContext):
+        return AttrRef(ctx.attrName().getText())
+
+    def visitScalarExprLiteral(self, ctx:RelationalAlgebraParser.ScalarExprLiteralContext):
+        return Literal(literal_value(ctx.literalValue()))
+
+    def visitScalarExprFunction(self, ctx:RelationalAlgebraParser.ScalarExprFunctionContext):
+        return FuncCall(ctx.NAME().getText(),
+                        [self.visit(e) for e in ctx.scalarExpr()])
+
+    def visitScalarExprUnarySign(self, ctx:RelationalAlgebraParser.ScalarExprUnarySignContext):
+        return UnaryOp('-', self.visit(ctx.scalarExpr()))
+
+    def visitScalarExprNot(self, ctx:RelationalAlgebraParser.ScalarExprNotContext):
+        return UnaryOp('not', self.visit(ctx.scalarExpr()))
+
+    def visitScalarExprMul(self, ctx:RelationalAlgebraParser.ScalarExprMulContext):
+        return BinaryOp(ctx.op.text, self.visit(ctx.scalarExpr(0)),
+                        self.visit(ctx.scalarExpr(1)))
+
+    def visitScalarExprAdd(self, ctx:RelationalAlgebraParser.ScalarExprAddContext):
+        return BinaryOp(ctx.op.text, self.visit(ctx.scalarExpr(0)),
+                        self.visit(ctx.scalarExpr(1)))
+
+    def visitScalarExprCompare(self, ctx:RelationalAlgebraParser.ScalarExprCompareContext):
+        return BinaryOp(COMPARE_OPS[ctx.op.text],
+                        self.visit(ctx.scalarExpr(0)),
+                        self.visit(ctx.scalarExpr(1)))
+
+    def visitScalarExprAnd(self, ctx:RelationalAlgebraParser.ScalarExprAndContext):
+        return BinaryOp('and', self.visit(ctx.scalarExpr(0)),
+                        self.visit(ctx.scalarExpr(1)))
+
+    def visitScalarExprOr(self, ctx:RelationalAlgebraParser.ScalarExprOrContext):
+        return BinaryOp('or', self.visit(ctx.scalarExpr(0)),
+                        self.visit(ctx.scalarExpr(1)))
+
+    def visitScalarExprParens(self, ctx:RelationalAlgebraParser.ScalarExprParensContext):
+        return self.visit(ctx.scalarExpr())
+
+
+def build_scalar_expr(ctx):
+    return ScalarExprBuilder().visit(ctx)
+
+
+# Translates the scalarExpr of a GROUP aggregate into a ScalarExpr tree,
+# where calls to aggregate functions become AggregateCall nodes.
+class AggregateExprBuilder(ScalarExprBuilder):
+
+    def __init__(self):
+        self.in_aggregate = False
+
+    def visitScalarExprFunction(self, ctx:RelationalAlgebraParser.ScalarExprFunctionContext):
+        name = ctx.NAME().getText()
+        args = ctx.scalarExpr()
+
+        if name not in AGGREGATE_FUNCTIONS or \
+           (name in SCALAR_FUNCTIONS and len(args) != 1):
+            return super().visitScalarExprFunction(ctx)
+
+        if self.in_aggregate:
+            raise ValueError('Aggregate functions cannot be nested')
+
+        if len(args) > 1 or (len(args) == 0 and name != 'count'):
+            raise ValueError('Aggregate function %s takes one argument' % name)
+
+        if len(args) == 0:
+            return AggregateCall(name, None)
+
+        self.in_aggregate = True
+        try:
+            return AggregateCall(name, self.visit(args[0]))
+        finally:
+            self.in_aggregate = False
+
+
+def build_aggregate_expr(ctx):
+    return AggregateExprBuilder().visit(ctx)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_source(src):
+    # The generated source only refers to "row" and to the scalar functions,
+    # so identical sources can share the same compiled function.
+    env = dict(SCALAR_FUNCTIONS)
+    env['__builtins__'] = {}
+    return eval(compile('lambda row: ' + src, '<scalar-expr>', 'eval'), env)
+
+
+# Compile a ScalarExpr into a function that takes a row-tuple and returns the
+# value of the expression for that row.  The resolve argument maps an attribute
+# name to its index in the row-tuple; it is only called here, while compiling,
+# and never while evaluating rows.
+def compile_scalar_expr(expr, resolve):
+    return _compile_source(expr.to_python(_CodeGen(resolve)))
+
+
+# Compile a selection predicate into a function that returns True only for the
+# rows that satisfy the predicate.  As in the original evaluator, the value is
+# compared with == True, so null and values like "x" or 2 don't satisfy the
+# predicate, but Python treats 1 and 1.0 as equal to True, so they do.  (The
+# comparison also accepts NumPy booleans, which "is True" would not.)
+def compile_predicate(expr, resolve):
+    return _compile_source('(%s) == True' % expr.to_python(_CodeGen(resolve)))
+
+
+# Compile a list of project-expressions into one function that takes an input
+# row-tuple and produces the output row-tuple.  When every expression is just
+# an attribute reference, the function is an operator.itemgetter so that no
+# Python code runs per row at all.
+def compile_projection(exprs, resolve):
+    if len(exprs) == 0:
+        return lambda row: ()
+
+    if all([isinstance(e, AttrRef) for e in exprs]):
+        indexes = [resolve(e.name) for e in exprs]
+        if len(indexes) > 1:
+            return operator.itemgetter(*indexes)
+
+    gen = _CodeGen(resolve)
+    return _compile_source('(%s,)' % ', '.join([e.to_python(gen) for e in exprs]))
@@ -0,0 +1,317 @@
+import bisect
+
+from ra_scalar import AttrRef, BinaryOp, Literal, UnaryOp, split_conjuncts
+from ra_join import FLIPPED_OPS
+
+
+# Statistics about the values of relation variables, which the optimizer uses
+# to estimate the number of rows that each part of a plan produces.  A
+# Database computes the statistics of a relvar when they are first asked for,
+# and the statistics of each attribute when they are first asked for, since
+# most queries only look at a few attributes.  When a relvar is changed by
+# inserting and deleting rows, its statistics are updated from the changed
+# rows rather than computed again.
+
+# The number of buckets in an attribute's histogram.  Each bucket holds about
+# the same number of values, so that skewed values get narrower buckets.
+HISTOGRAM_BUCKETS = 16
+
+# The selectivities assumed for predicates that the statistics say nothing
+# about.
+DEFAULT_EQ_SELECTIVITY = 0.1
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+DEFAULT_SELECTIVITY = 0.25
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class AttrStats:
+    def __init__(self, values):
+        # The number of rows with each non-null value.
+        self.counts = {}
+        self.num_values = 0
+        self.null_count = 0
+        self._histogram = None
+
+        self.update(values, ())
+
+    # Adds the values of inserted rows, and removes the values of deleted
+    # rows.
+    def update(self, inserted, deleted):
+        counts = self.counts
+        for v in inserted:
+            if v is None:
+                self.null_count += 1
+            else:
+                counts[v] = counts.get(v, 0) + 1
+                self.num_values += 1
+
+        for v in deleted:
+            if v is None:
+                self.null_count -= 1
+            else:
+                if counts[v] == 1:
+                    del counts[v]
+                else:
+                    counts[v] -= 1
+
+                self.num_values -= 1
+
+        self._histogram = None
+
+    @property
+    def distinct(self):
+        return len(self.counts)
+
+    # Returns the bounds of the histogram's buckets, which are the minimum
+    # value followed by the largest value in each bucket; or None if the
+    # values can't be ordered.
+    def histogram(self):
+        if self._histogram is None:
+            try:
+                keys = sorted(self.counts)
+            except TypeError:
+                self._histogram = []
+                return None
+
+            total = self.num_values
+            buckets = min(HISTOGRAM_BUCKETS, len(keys))
+            bounds = keys[:1]
+            seen = 0
+            for k in keys:
+                seen += self.counts[k]
+                if seen * buckets >= len(bounds) * total:
+                    bounds.append(k)
+
+            self._histogram = bounds
+
+        return self._histogram or None
+
+    @property
+    def min(self):
+        bounds = self.histogram()
+        return bounds[0] if bounds else None
+
+    @property
+    def max(self):
+        bounds = self.histogram()
+        return bounds[-1] if bounds else None
+
+    # Estimates the fraction of the non-null values that are less than the
+    # specified value, or returns None if it can't be compared with them.
+    def fraction_below(self, value):
+        bounds = self.histogram()
+        if bounds is None:
+            return None
+
+        try:
+            if value <= bounds[0]:
+                return 0.0
+            elif value > bounds[-1]:
+                return 1.0
+
+            i = bisect.bisect_left(bounds, value) - 1
+        except TypeError:
+            return None
+
+        # Assume the values are spread evenly within the bucket.
+        (low, high) = (bounds[i], bounds[i + 1])
+        within = 0.5
+        if _is_number(value) and _is_number(low) and high > low:
+            within = (value - low) / (high - low)
+
+        return (i + within) / (len(bounds) - 1)
+
+    # Estimates the fraction of the non-null values v for which "v op value"
+    # is true, or returns None if nothing is known about it.
+    def fraction(self, op, value):
+        if self.distinct == 0:
+            return 0.0
+
+        if op == '==':
+            return self.counts.get(value, 0) / self.num_values
+
+        elif op == '!=':
+            return 1 - self.fraction('==', value)
+
+        below = self.fraction_below(value)
+        if below is None:
+            return None
+
+        if op == '<':
+            f = below
+        elif op == '<=':
+            f = below + 1 / self.distinct
+        elif op == '>':
+            f = 1 - below - 1 / self.distinct
+        else:
+            f = 1 - below
+
+        return min(max(f, 0.0), 1.0)
+
+
+class RelationStats:
+    def __init__(self, relval):
+        self.relval = relval
+        self.num_rows = relval.num_rows()
+        self.attr_stats = [None] * relval.num_attrs()
+
+    def get_attr_stats(self, i):
+        if self.attr_stats[i] is None:
+            self.attr_stats[i] = AttrStats(self.relval.get_column(i))
+
+        return self.attr_stats[i]
+
+    # Brings the statistics up to date with the relvar's new value, which
+    # differs from the old one by the inserted and deleted rows.
+    def update(self, relval, inserted, deleted):
+        self.relval = relval
+        self.num_rows = relval.num_rows()
+        for (i, stats) in enumerate(self.attr_stats):
+            if stats is not None:
+                stats.update([row[i] for row in inserted],
+                             [row[i] for row in deleted])
+
+
+# === ESTIMATES ==============================================================
+#
+# The optimizer estimates the number of rows that a plan node produces, and
+# the number of distinct values of each of its attributes.  Where a column
+# comes straight from a relvar, its estimate keeps the relvar's statistics so
+# that selections on it can use them.
+
+class ColumnEstimate:
+    def __init__(self, distinct, stats=None):
+        self.distinct = distinct
+
+        # The statistics of the relvar attribute that the column comes from,
+        # if it comes straight from one.
+        self.stats = stats
+
+
+# The estimate of a relvar's column, whose statistics are only computed if
+# they are used.
+class _RelVarColumnEstimate(ColumnEstimate):
+    def __init__(self, relation_stats, i):
+        self.relation_stats = relation_stats
+        self.i = i
+
+    @property
+    def stats(self):
+        return self.relation_stats.get_attr_stats(self.i)
+
+    @property
+    def distinct(self):
+        return self.stats.distinct
+
+
+# The estimate of a column after some of its rows are filtered out, which
+# can't have more distinct values than there are rows left.
+class _FilteredColumnEstimate(ColumnEstimate):
+    def __init__(self, column, rows):
+        self.column = column
+        self.rows = rows
+
+    @property
+    def stats(self):
+        return self.column.stats
+
+    @property
+    def distinct(self):
+        return min(self.column.distinct, self.rows)
+
+
+class Estimate:
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+    @staticmethod
+    def from_stats(stats):
+        return Estimate(stats.num_rows,
+                        [_RelVarColumnEstimate(stats, i)
+                         for i in range(len(stats.attr_stats))])
+
+    # Returns the number of distinct values of the i-th column, which can't
+    # be more than the number of rows.
+    def distinct(self, i):
+        return max(min(self.columns[i].distinct, self.rows), 1)
+
+    # Returns the estimate after the rows are filtered by a predicate with the
+    # specified selectivity.
+    def filtered(self, selectivity):
+        rows = self.rows * selectivity
+        return Estimate(rows, [_FilteredColumnEstimate(c, rows)
+                               for c in self.columns])
+
+
+# Estimates the fraction of an estimate's rows that satisfy a predicate.  The
+# resolve function maps an attribute name to the index of its column in the
+# estimate, or to None if the name doesn't resolve.
+def selectivity(pred, estimate, resolve):
+    s = 1.0
+    for c in split_conjuncts(pred):
+        s *= _conjunct_selectivity(c, estimate, resolve)
+
+    return s
+
+
+def _column_index(expr, resolve):
+    if isinstance(expr, AttrRef):
+        return resolve(expr.name)
+
+    return None
+
+
+def _conjunct_selectivity(c, estimate, resolve):
+    if isinstance(c, UnaryOp) and c.op == 'not':
+        return 1 - _conjunct_selectivity(c.operand, estimate, resolve)
+
+    if not isinstance(c, BinaryOp):
+        return DEFAULT_SELECTIVITY
+
+    if c.op == 'or':
+        s1 = _conjunct_selectivity(c.lhs, estimate, resolve)
+        s2 = _conjunct_selectivity(c.rhs, estimate, resolve)
+        return s1 + s2 - s1 * s2
+
+    elif c.op == 'and':
+        return selectivity(c, estimate, resolve)
+
+    elif c.op not in FLIPPED_OPS and c.op != '!=':
+        return DEFAULT_SELECTIVITY
+
+    (lhs, op, rhs) = (c.lhs, c.op, c.rhs)
+    if isinstance(lhs, Literal):
+        (lhs, op, rhs) = (rhs, FLIPPED_OPS.get(op, op), lhs)
+
+    i = _column_index(lhs, resolve)
+    if isinstance(rhs, Literal):
+        if rhs.value is None:
+            # Comparisons with null are never true.
+            return 0.0
+
+        stats = estimate.columns[i].stats if i is not None else None
+        if stats is not None:
+            f = stats.fraction(op, rhs.value)
+            if f is not None:
+                total = stats.num_values + stats.null_count
+                return f * stats.num_values / total if total else 0.0
+
+    elif op == '==':
+        j = _column_index(rhs, resolve)
+        if i is not None and j is not None:
+            return 1 / max(estimate.distinct(i), estimate.distinct(j))
+
+    if op == '==':
+        if i is not None:
+            return 1 / estimate.distinct(i)
+
+        return DEFAULT_EQ_SELECTIVITY
+
+    elif op == '!=':
+        return 1 - DEFAULT_EQ_SELECTIVITY
+
+    return DEFAULT_RANGE_SELECTIVITY
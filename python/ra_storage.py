@@ -0,0 +1,306 @@
+# On-disk storage for relation variables.
+#
+# Each relation variable is stored in its own file, "<name>.rel", in a binary
+# columnar format:
+#
+#   - The 8-byte magic string "RELVAR01".
+#   - The length of the header, as an 8-byte little-endian integer.
+#   - The header, a JSON object giving the attributes, the number of rows,
+#     and the type and location of each column's data.
+#   - The column data.  Each column has a block of values and a block of null
+#     flags (one byte per row), each starting on an 8-byte boundary.
+#
+# Columns of ints, floats and bools are stored as little-endian int64, float64
+# and one-byte values.  Columns of strings are stored as fixed-width UTF-32,
+# padded with NUL characters.  These are the same layouts that NumPy uses, so
+# when NumPy is available a relation is loaded as a ColumnarRelationValue
+# whose columns are views of the memory-mapped file; nothing is read until it
+# is used, and processes that open the same file share its pages.  Columns of
+# any other values are pickled.
+
+import array, json, mmap, os, pickle, struct, sys
+
+from relation import RelationValue, Database
+from ra_columnar import ColumnarRelationValue, make_column, numpy
+
+
+MAGIC = b'RELVAR01'
+
+FILE_SUFFIX = '.rel'
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+# Chooses the storage type for a list of column values, which may include
+# None.
+def _column_type(values):
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+
+    if kinds == {bool}:
+        return 'bool'
+    elif kinds == {int}:
+        if all([INT64_MIN <= v <= INT64_MAX for v in values if v is not None]):
+            return 'int64'
+    elif kinds == {float}:
+        return 'float64'
+    elif kinds == {str}:
+        # Trailing NULs would be lost in the fixed-width format.
+        if not any([v.endswith('\0') for v in values if v is not None]):
+            return 'str'
+    elif len(kinds) == 0:
+        return 'int64'
+
+    return 'object'
+
+
+# Encodes a list of column values, returning (type, width, data).  The width
+# is the number of characters per value of a str column.
+def _encode_values(values):
+    col_type = _column_type(values)
+    width = 0
+
+    if col_type == 'int64':
+        a = array.array('q', [0 if v is None else v for v in values])
+    elif col_type == 'float64':
+        a = array.array('d', [0.0 if v is None else v for v in values])
+    elif col_type == 'bool':
+        return (col_type, width, bytes([v is True for v in values]))
+    elif col_type == 'str':
+        width = max([len(v) for v in values if v is not None] + [1])
+        data = ''.join([(v or '').ljust(width, '\0') for v in values])
+        return (col_type, width, data.encode('utf-32-le'))
+    else:
+        return (col_type, width, pickle.dumps(values, pickle.HIGHEST_PROTOCOL))
+
+    if sys.byteorder != 'little':
+        a.byteswap()
+
+    return (col_type, width, a.tobytes())
+
+
+# Encodes a column of a ColumnarRelationValue directly from its arrays.
+def _encode_array(values, nulls):
+    kind = values.dtype.kind
+    if kind == 'i':
+        return ('int64', 0, values.astype('<i8').tobytes())
+    elif kind == 'f':
+        return ('float64', 0, values.astype('<f8').tobytes())
+    elif kind == 'b':
+        return ('bool', 0, values.tobytes())
+    elif kind == 'U':
+        width = max(values.dtype.itemsize // 4, 1)
+        return ('str', width,
+                values.astype('<U%d' % width).tobytes())
+
+    objects = values.tolist()
+    for i in numpy.flatnonzero(nulls).tolist():
+        objects[i] = None
+
+    return ('object', 0, pickle.dumps(objects, pickle.HIGHEST_PROTOCOL))
+
+
+# Encodes a relation-value in the file format, returning a bytearray.
+def encode_relation(relval):
+    attributes = relval.get_attrs()
+    num_rows = relval.num_rows()
+
+    blocks = []
+    if isinstance(relval, ColumnarRelationValue):
+        for (values, nulls) in relval.columns:
+            blocks.append( (_encode_array(values, nulls), nulls.tobytes()) )
+
+    else:
+        rows = list(relval.rows)
+        for i in range(len(attributes)):
+            values = [row[i] for row in rows]
+            blocks.append( (_encode_values(values),
+                            bytes([v is None for v in values])) )
+
+    columns = []
+    offset = 0
+    for ((col_type, width, data), nulls) in blocks:
+        columns.append({'type' : col_type, 'width' : width,
+                        'offset' : offset, 'size' : len(data),
+                        'nulls' : _align(offset + len(data))})
+        offset = _align(_align(offset + len(data)) + len(nulls))
+
+    header = json.dumps({'attributes' : attributes, 'num_rows' : num_rows,
+                         'columns' : columns}).encode('utf-8')
+
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    encoded = bytearray(data_start + offset)
+    encoded[:len(MAGIC)] = MAGIC
+    struct.pack_into('<Q', encoded, len(MAGIC), len(header))
+    encoded[len(MAGIC) + 8 : len(MAGIC) + 8 + len(header)] = header
+
+    for (c, ((col_type, width, data), nulls)) in zip(columns, blocks):
+        start = data_start + c['offset']
+        encoded[start : start + len(data)] = data
+        start = data_start + c['nulls']
+        encoded[start : start + len(nulls)] = nulls
+
+    return encoded
+
+
+# Writes a relation-value to the file.  The file is written under a temporary
+# name and then renamed, so that a process reading the old file is unaffected.
+def write_relation(path, relval):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_relation(relval))
+
+    os.replace(tmp_path, path)
+
+
+# Reads the header of a relation file that has been memory-mapped.  Returns
+# (header, data_start).
+def _read_header(mapped, path):
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a relation file' % path)
+
+    (header_len,) = struct.unpack_from('<Q', mapped, len(MAGIC))
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(mapped[start : start + header_len]))
+    return (header, _align(start + header_len))
+
+
+def _decode_values(buf, col_type, width, num_rows):
+    if col_type == 'object':
+        return pickle.loads(buf)
+    elif col_type == 'str':
+        text = bytes(buf).decode('utf-32-le')
+        return [text[i * width : (i + 1) * width].rstrip('\0')
+                for i in range(num_rows)]
+    elif col_type == 'bool':
+        return [b != 0 for b in buf]
+
+    a = array.array('q' if col_type == 'int64' else 'd')
+    a.frombytes(buf)
+    if sys.byteorder != 'little':
+        a.byteswap()
+
+    return a.tolist()
+
+
+_NUMPY_TYPES = {
+    'int64'   : '<i8',
+    'float64' : '<f8',
+    'bool'    : '?',
+}
+
+
+# Decodes a relation-value from a buffer holding the file format.  If columnar
+# is True, which requires NumPy, the result is a ColumnarRelationValue whose
+# columns are views of the buffer, and only object columns are read up front;
+# otherwise the rows are copied out of the buffer into a RelationValue.
+def decode_relation(buf, columnar=False, path='buffer'):
+    (header, data_start) = _read_header(buf, path)
+    attributes = header['attributes']
+    num_rows = header['num_rows']
+
+    if not columnar:
+        columns = []
+        for c in header['columns']:
+            offset = data_start + c['offset']
+            values = _decode_values(buf[offset : offset + c['size']],
+                                    c['type'], c['width'], num_rows)
+            offset = data_start + c['nulls']
+            columns.append([None if n else v for (v, n) in
+                            zip(values, buf[offset : offset + num_rows])])
+
+        if len(attributes) == 0:
+            return RelationValue(attributes, [()] * num_rows)
+
+        return RelationValue(attributes, zip(*columns))
+
+    view = memoryview(buf)
+    columns = []
+    for c in header['columns']:
+        offset = data_start + c['offset']
+        values_buf = view[offset : offset + c['size']]
+
+        if c['type'] == 'object':
+            columns.append(make_column(pickle.loads(values_buf)))
+            continue
+        elif c['type'] == 'str':
+            values = numpy.frombuffer(values_buf, dtype='<U%d' % c['width'],
+                                      count=num_rows)
+        else:
+            values = numpy.frombuffer(values_buf,
+                                      dtype=_NUMPY_TYPES[c['type']],
+                                      count=num_rows)
+
+        offset = data_start + c['nulls']
+        nulls = numpy.frombuffer(view[offset : offset + num_rows], dtype=bool,
+                                 count=num_rows)
+        columns.append( (values, nulls) )
+
+    return ColumnarRelationValue(attributes, columns, num_rows)
+
+
+# Opens a relation file.  With NumPy, the result is a ColumnarRelationValue
+# over the memory-mapped file, and only object columns are read up front;
+# without it, the rows are read into a RelationValue.
+def read_relation(path):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if numpy is None:
+        # Slicing the mmap copies the data, so the file can be closed.
+        relval = decode_relation(mapped, False, path)
+        mapped.close()
+        return relval
+
+    # The arrays keep the mmap open for as long as they are in use.
+    return decode_relation(mapped, True, path)
+
+
+# A database whose relation variables are stored in files in a directory.
+# Relation variables are only opened when they are first used, and assigning
+# to a relation variable writes its file immediately.
+class DiskDatabase(Database):
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # The relation variables that are stored on disk but not opened yet.
+        self.unopened = set()
+        for filename in os.listdir(directory):
+            if filename.endswith(FILE_SUFFIX):
+                self.unopened.add(filename[:-len(FILE_SUFFIX)])
+
+    def relvar_path(self, name):
+        return os.path.join(self.directory, name + FILE_SUFFIX)
+
+    def get_relvar_names(self):
+        return list(self.relation_variables.keys()) + list(self.unopened)
+
+    def get_relvar(self, name):
+        if name in self.unopened:
+            self.relation_variables[name] = \
+                read_relation(self.relvar_path(name))
+            self.unopened.discard(name)
+
+        return self.relation_variables.get(name)
+
+    def set_relvar(self, name, relval):
+        super().set_relvar(name, relval)
+        self.unopened.discard(name)
+        write_relation(self.relvar_path(name), relval)
+
+    def del_relvar(self, name):
+        os.remove(self.relvar_path(name))
+
+        if name in self.unopened:
+            self.unopened.discard(name)
+            self._clear_indexes(name)
+            self._notify(name, None, None)
+        else:
+            super().del_relvar(name)
@@ -0,0 +1,430 @@
+# Materialized views:  relation variables whose value is defined by a
+# relational algebra expression over other relation variables, and which are
+# kept up to date as those relation variables change.
+#
+# Instead of recomputing its expression, a view is maintained from the rows
+# inserted into and deleted from its inputs, using the counting algorithm.
+# Each operator of the view's plan turns the deltas of its inputs into a
+# delta of its output, where a delta maps rows to the (signed) change in the
+# number of ways that each row is derived.  Selections, projections and
+# unions only look at the deltas.  Joins keep a hash table of each input's
+# rows on the join key, and differences and intersections keep the derivation
+# counts of their inputs, so that only the rows touched by a delta are
+# examined.  A row is in the view while its derivation count is positive.
+#
+# Plans with any other operator (grouping, division, outer joins, semi-joins
+# and anti-joins) are just recomputed whenever one of their inputs changes.
+# Joins are kept as joins when the view is planned, rather than being turned
+# into semi-joins, so that they can be maintained.
+
+from relation import RelationValue
+from ra_scalar import BinaryOp, compile_predicate, compile_projection
+from ra_join import INNER_JOIN, JoinCondition, analyze_join_condition, \
+    compile_match_fn, natural_combiner, natural_join_attrs, theta_combiner
+from ra_plan import RelVarNode, ConstantNode, SelectNode, ProjectNode, \
+    DistinctNode, CrossNode, JoinNode, SetOpNode, SET_UNION, SET_INTERSECT, \
+    build_plan, optimize, plan_relvars
+
+
+# Raised when a plan has an operator that can't be maintained incrementally.
+class _NotIncremental(Exception):
+    pass
+
+
+def _add(delta, row, n):
+    count = delta.get(row, 0) + n
+    if count:
+        delta[row] = count
+    else:
+        del delta[row]
+
+
+# === DELTA OPERATORS ========================================================
+#
+# Each operator's delta() method takes a map from the names of the relation
+# variables that changed to their (inserted, deleted) rows, and returns the
+# delta of the operator's output.
+
+class _RelVarDelta:
+    def __init__(self, node):
+        self.name = node.name
+
+    def delta(self, changes):
+        change = changes.get(self.name)
+        if change is None:
+            return {}
+
+        (inserted, deleted) = change
+        delta = dict.fromkeys(inserted, 1)
+        delta.update(dict.fromkeys(deleted, -1))
+        return delta
+
+
+class _ConstantDelta:
+    def __init__(self, node):
+        # The rows are produced once, when the view is first computed.
+        self.pending = node.relval.rows
+
+    def delta(self, changes):
+        delta = dict.fromkeys(self.pending, 1)
+        self.pending = ()
+        return delta
+
+
+class _SelectDelta:
+    def __init__(self, node):
+        self.child = _delta_operator(node.child)
+        self.pred_fn = compile_predicate(node.pred, node.child.get_attr_index)
+
+    def delta(self, changes):
+        pred_fn = self.pred_fn
+        return dict([(row, n) for (row, n) in
+                     self.child.delta(changes).items() if pred_fn(row)])
+
+
+class _ProjectDelta:
+    def __init__(self, node):
+        self.child = _delta_operator(node.child)
+        self.project_fn = compile_projection(node.exprs,
+                                             node.child.get_attr_index)
+
+    def delta(self, changes):
+        delta = {}
+        for (row, n) in self.child.delta(changes).items():
+            _add(delta, self.project_fn(row), n)
+
+        return delta
+
+
+class _UnionDelta:
+    def __init__(self, node):
+        self.lhs = _delta_operator(node.children[0])
+        self.rhs = _delta_operator(node.children[1])
+
+    def delta(self, changes):
+        delta = self.lhs.delta(changes)
+        for (row, n) in self.rhs.delta(changes).items():
+            _add(delta, row, n)
+
+        return delta
+
+
+# Set-intersection and set-difference.  A row of the result is derived once,
+# if it is in the left input and is (or isn't) in the right input.
+class _IntersectDifferenceDelta:
+    def __init__(self, node):
+        self.lhs = _delta_operator(node.children[0])
+        self.rhs = _delta_operator(node.children[1])
+        self.intersect = node.op == SET_INTERSECT
+
+        self.lhs_counts = {}
+        self.rhs_counts = {}
+
+    def _derived(self, row):
+        return row in self.lhs_counts and \
+               (row in self.rhs_counts) == self.intersect
+
+    def delta(self, changes):
+        lhs_delta = self.lhs.delta(changes)
+        rhs_delta = self.rhs.delta(changes)
+
+        delta = {}
+        for row in set(lhs_delta) | set(rhs_delta):
+            before = self._derived(row)
+            if row in lhs_delta:
+                _add(self.lhs_counts, row, lhs_delta[row])
+
+            if row in rhs_delta:
+                _add(self.rhs_counts, row, rhs_delta[row])
+
+            after = self._derived(row)
+            if before != after:
+                delta[row] = 1 if after else -1
+
+        return delta
+
+
+# Inner joins and Cartesian products.  The delta of A JOIN B is
+# (delta A) JOIN B_old + A_new JOIN (delta B), and each input's rows are kept
+# in a hash table on its join key so that the rows matching a delta row can
+# be found directly.
+class _JoinDelta:
+    def __init__(self, node):
+        (lhs, rhs) = node.children
+        self.lhs = _delta_operator(lhs)
+        self.rhs = _delta_operator(rhs)
+
+        if isinstance(node, CrossNode):
+            cond = JoinCondition()
+            self.combine = theta_combiner(lhs.num_attrs(), rhs.num_attrs())
+        elif node.is_natural():
+            (cond, shared, rhs_rest) = natural_join_attrs(lhs.attrs, rhs.attrs)
+            self.combine = natural_combiner(lhs.num_attrs(), shared, rhs_rest)
+        else:
+            cond = analyze_join_condition(node.pred, lhs.get_attr_index,
+                                          rhs.get_attr_index)
+            self.combine = theta_combiner(lhs.num_attrs(), rhs.num_attrs())
+
+        self.lhs_key_fn = compile_projection([l for (l, r) in cond.equi_keys],
+                                             lhs.get_attr_index)
+        self.rhs_key_fn = compile_projection([r for (l, r) in cond.equi_keys],
+                                             rhs.get_attr_index)
+
+        leftover = [BinaryOp(op, l, r) for (l, op, r) in cond.range_keys]
+        if cond.residual is not None:
+            leftover.append(cond.residual)
+
+        self.match_fn = compile_match_fn(lhs, rhs, leftover)
+
+        # Map join keys to maps from rows to their derivation counts.
+        self.lhs_table = {}
+        self.rhs_table = {}
+
+    @staticmethod
+    def _update_table(table, key_fn, delta):
+        for (row, n) in delta.items():
+            key = key_fn(row)
+            if None in key:
+                # Rows with a null key never match anything.
+                continue
+
+            bucket = table.setdefault(key, {})
+            _add(bucket, row, n)
+            if not bucket:
+                del table[key]
+
+    def delta(self, changes):
+        lhs_delta = self.lhs.delta(changes)
+        rhs_delta = self.rhs.delta(changes)
+        match_fn = self.match_fn
+        combine = self.combine
+
+        delta = {}
+        for (lhs_row, n) in lhs_delta.items():
+            for (rhs_row, m) in \
+                self.rhs_table.get(self.lhs_key_fn(lhs_row), {}).items():
+                if match_fn is None or match_fn(lhs_row, rhs_row):
+                    _add(delta, combine(lhs_row, rhs_row), n * m)
+
+        _JoinDelta._update_table(self.lhs_table, self.lhs_key_fn, lhs_delta)
+
+        for (rhs_row, m) in rhs_delta.items():
+            for (lhs_row, n) in \
+                self.lhs_table.get(self.rhs_key_fn(rhs_row), {}).items():
+                if match_fn is None or match_fn(lhs_row, rhs_row):
+                    _add(delta, combine(lhs_row, rhs_row), n * m)
+
+        _JoinDelta._update_table(self.rhs_table, self.rhs_key_fn, rhs_delta)
+
+        return delta
+
+
+# Builds the tree of delta operators for a plan, raising _NotIncremental if
+# the plan can't be maintained incrementally.
+def _delta_operator(node):
+    if isinstance(node, RelVarNode):
+        return _RelVarDelta(node)
+    elif isinstance(node, ConstantNode):
+        return _ConstantDelta(node)
+    elif isinstance(node, SelectNode):
+        return _SelectDelta(node)
+    elif isinstance(node, ProjectNode):
+        return _ProjectDelta(node)
+    elif isinstance(node, DistinctNode):
+        # A row is in the result while it has any derivations, so removing
+        # duplicates changes nothing.
+        return _delta_operator(node.child)
+    elif isinstance(node, CrossNode) or \
+         (isinstance(node, JoinNode) and node.join_type == INNER_JOIN):
+        return _JoinDelta(node)
+    elif isinstance(node, SetOpNode):
+        (lhs, rhs) = node.children
+        if lhs.num_attrs() != rhs.num_attrs():
+            raise ValueError("Arity of LHS is %d, but RHS is %d" % \
+                             (lhs.num_attrs(), rhs.num_attrs()))
+
+        if node.op == SET_UNION:
+            return _UnionDelta(node)
+
+        return _IntersectDifferenceDelta(node)
+
+    raise _NotIncremental()
+
+
+# === VIEWS ==================================================================
+
+class MaterializedView:
+    def __init__(self, name, ctx, attr_names, database):
+        self.name = name
+        self.ctx = ctx
+        self.attr_names = attr_names
+        self.plan_view(database)
+
+    # Plans the view's expression against the current attributes of its
+    # inputs, and resets its state so that it will be computed from scratch.
+    def plan_view(self, database):
+        self.plan = optimize(build_plan(database, self.ctx), semi_joins=False)
+        self.inputs = plan_relvars(self.plan)
+
+        attrs = self.plan.attrs
+        if self.attr_names is not None:
+            if len(self.attr_names) != len(attrs):
+                raise ValueError('View %s has %d attributes, but %d were ' \
+                    'specified' % (self.name, len(attrs),
+                                   len(self.attr_names)))
+
+            attrs = [self.name + '.' + a for a in self.attr_names]
+
+        self.attrs = attrs
+
+        try:
+            self.operator = _delta_operator(self.plan)
+        except _NotIncremental:
+            self.operator = None
+
+        # Maps each row of the view to its derivation count.
+        self.counts = {}
+
+    def is_incremental(self):
+        return self.operator is not None
+
+    # Applies changes to the view's inputs, returning the (inserted, deleted)
+    # rows of the view.
+    def apply(self, changes):
+        inserted = set()
+        deleted = set()
+        for (row, n) in self.operator.delta(changes).items():
+            old_count = self.counts.get(row, 0)
+            _add(self.counts, row, n)
+            if old_count <= 0 < old_count + n:
+                inserted.add(row)
+            elif old_count + n <= 0 < old_count:
+                deleted.add(row)
+
+        return (inserted, deleted)
+
+    # Computes the view's rows from scratch.  An incremental view is computed
+    # by treating every row of its inputs as newly inserted.
+    def compute(self, database, executor):
+        if self.operator is None:
+            return executor.execute(self.plan).rows
+
+        changes = {}
+        for name in self.inputs:
+            changes[name] = (database.get_relvar(name).rows, ())
+
+        self.apply(changes)
+        return set(self.counts)
+
+
+# Keeps the materialized views of a database up to date.  Assigning directly
+# to a view's relation variable turns it back into an ordinary relvar, as
+# does deleting one of its inputs.
+class ViewManager:
+    def __init__(self, database, executor):
+        self.database = database
+        self.executor = executor
+
+        # The views, in the order they were created.  A view can only depend
+        # on views created before it, so this is an order in which views can
+        # be updated.
+        self.views = {}
+
+        # The name of the view whose relvar is being updated, if any.
+        self.updating = None
+
+        database.listeners.append(self)
+
+    # Creates a view from a relExpr parse tree, and stores its value in the
+    # relation variable with the view's name.
+    def create_view(self, name, ctx, attr_names=None):
+        if name in self.views:
+            raise ValueError('%s is already a view' % name)
+
+        view = MaterializedView(name, ctx, attr_names, self.database)
+        if name in self._all_inputs(view):
+            raise ValueError('View %s cannot depend on itself' % name)
+
+        self.views[name] = view
+        self._recompute(view)
+        return view
+
+    # Stops maintaining a view.  Its relvar keeps its current value.
+    def drop_view(self, name):
+        if name not in self.views:
+            raise ValueError('%s is not a view' % name)
+
+        del self.views[name]
+
+    # Returns the names of all relvars that a view depends on, directly or
+    # through other views.
+    def _all_inputs(self, view):
+        names = set()
+        pending = list(view.inputs)
+        while pending:
+            name = pending.pop()
+            if name not in names:
+                names.add(name)
+                if name in self.views:
+                    pending.extend(self.views[name].inputs)
+
+        return names
+
+    def _store(self, view, relval, delta=None):
+        self.updating = view.name
+        try:
+            if delta is None:
+                self.database.set_relvar(view.name, relval)
+            else:
+                self.database.replace_relvar(view.name, relval, *delta)
+        finally:
+            self.updating = None
+
+    def _recompute(self, view):
+        rows = view.compute(self.database, self.executor)
+        self._store(view, RelationValue(list(view.attrs), rows))
+
+    def relvar_changed(self, name, old_relval, new_relval, delta):
+        if name in self.views and name != self.updating:
+            del self.views[name]
+
+        dependents = [v for v in self.views.values() if name in v.inputs]
+        for view in dependents:
+            if view.name not in self.views:
+                # Dropped while updating an earlier view.
+                continue
+
+            if new_relval is None:
+                del self.views[view.name]
+                continue
+
+            if old_relval is None or \
+               new_relval.get_attrs() != view.inputs[name]:
+                # The view must be replanned for the input's new attributes.
+                # If that is no longer possible, it stops being a view.
+                try:
+                    view.plan_view(self.database)
+                except ValueError:
+                    del self.views[view.name]
+                    continue
+
+                self._recompute(view)
+                continue
+
+            if delta is None:
+                old_rows = old_relval.rows
+                new_rows = new_relval.rows
+                delta = (new_rows - old_rows, old_rows - new_rows)
+
+            if not delta[0] and not delta[1]:
+                continue
+
+            if not view.is_incremental():
+                self._recompute(view)
+                continue
+
+            view_delta = view.apply({name : delta})
+            if view_delta[0] or view_delta[1]:
+                self._store(view, RelationValue(list(view.attrs),
+                                                view.counts.keys()),
+                            view_delta)
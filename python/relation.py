@@ -0,0 +1,392 @@
+import itertools
+
+from ra_index import HASH_INDEX, INDEX_KINDS
+
+
+# Builds a map for resolving attribute names to their indexes in a list of
+# attributes.  Names map to the index of the one attribute with that name, or
+# to -1 if the name is ambiguous.  Unqualified names match the last part of
+# qualified attribute names.
+def make_attr_index(attributes):
+    attr_index = {}
+    if attributes is None:
+        return attr_index
+
+    for i, a in enumerate(attributes):
+        if a is None:
+            continue
+
+        if '.' in a:
+            attr_index[a] = -1 if a in attr_index else i
+
+        n = a.split('.')[-1]
+        attr_index[n] = -1 if n in attr_index else i
+
+    return attr_index
+
+
+# Resolves an attribute name using a map from make_attr_index().  Raises a
+# ValueError if the name is not found or is ambiguous.
+def find_attr_index(attr_index, name):
+    i = attr_index.get(name)
+    if i is None:
+        raise ValueError('No attribute with name %s' % name)
+    elif i == -1:
+        raise ValueError('Attribute name %s is ambiguous' % name)
+
+    return i
+
+
+class RelationValue:
+    def __init__(self, attributes=None, rows=[]):
+        self.attributes = attributes
+        self.attr_index = None
+        self.rows = set(rows)
+
+    def __check_attrs(self, attributes):
+        if attributes is None:
+            return
+
+        s = set()
+        for a in attributes:
+            if a is None:
+                raise ValueError('Attribute name cannot be None.')
+
+            if a in s:
+                raise ValueError('Attribute \"%s\" is ambiguous.' % a)
+
+            s.add(a)
+
+
+    def num_attrs(self):
+        return len(self.attributes)
+
+    def set_relation_name(self, rel_name):
+        attr_names = []
+        for a in self.attributes:
+            p = a.split('.')
+            n = p[-1]
+            if n in attr_names:
+                raise ValueError("Cannot set relation name to %s:  " + \
+                    "Attribute name %s appears multiple times" % \
+                    (rel_name, n))
+
+            attr_names.append(n)
+
+        self.attributes = [rel_name + '.' + n for n in attr_names]
+        self.attr_index = None
+
+
+    def get_attrs(self):
+        return list(self.attributes)
+
+    def set_attrs(self, attrs):
+        if self.attributes is not None and len(attrs) != len(self.attributes):
+           raise ValueError("Relation-value has %d attributes, but %d "
+               "were specified" % (len(self.attributes), len(attrs)))
+
+        self.__check_attrs(attrs)
+        self.attributes = list(attrs)
+        self.attr_index = None
+
+
+    def has_unnamed_attrs(self):
+        if self.attributes is None:
+            return True
+
+        for a in self.attributes:
+            if a is None:
+                return True
+
+        return False
+
+    def get_attr_index(self, name):
+        # Attribute names are resolved through a map that is built once per
+        # set of attributes, since operators resolve all of their attribute
+        # references up front and would otherwise rescan the attribute list
+        # for each one.
+        if self.attr_index is None:
+            self.attr_index = make_attr_index(self.attributes)
+
+        return find_attr_index(self.attr_index, name)
+
+
+    def add_row(self, row):
+        self._check_row(row)
+        self.rows.add(row)
+
+    # Checks that a row can be added, taking the number of attributes from it
+    # if they aren't known yet.
+    def _check_row(self, row):
+        if type(row) != tuple:
+            raise ValueError("row must be a tuple; got " + str(type(row)))
+
+        if self.attributes is None:
+            self.attributes = [None] * len(row)
+
+        if len(row) != len(self.attributes):
+           raise ValueError("Relation-value has %d attributes; row has %d "
+               "attributes" % (len(self.attributes), len(row)))
+
+    def num_rows(self):
+        return len(self.rows)
+
+    def get_rows(self):
+        return set(self.rows)
+
+    # Returns a list of the values of the i-th attribute in every row.
+    def get_column(self, i):
+        return [row[i] for row in self.rows]
+
+    # Returns a relation-value with the same attributes and rows, whose
+    # attributes can be renamed without affecting this one.
+    def copy(self):
+        return RelationValue(self.attributes, self.rows)
+
+    def pretty_print(self):
+        s = ''
+
+        if self.attributes is not None:
+            s += "(" + ",".join([a if a is not None else "unnamed" \
+                                 for a in self.attributes]) + ")"
+
+        print(s)
+        print('-' * len(s))
+
+        if len(self.rows) > 0:
+            for r in self.rows:
+                print(self._describe_row(r))
+        else:
+            print('no rows')
+
+    def _describe_row(self, row):
+        return str(row)
+
+
+# A stream of rows with named attributes, produced by one operator of a plan
+# and consumed by the next.  Unlike a RelationValue, the rows are usually a
+# generator that is pulled from only once, and may contain duplicates; they
+# are only collected into a set where an operator needs all of its input at
+# once, or when the final result is produced.  A stream over the rows of an
+# existing relation-value keeps that relation-value as its source, so that
+# materializing it again costs nothing.
+class RowStream:
+    def __init__(self, attributes, rows, source=None):
+        self.attributes = attributes
+        self.attr_index = None
+        self._rows = rows
+        self.source = source
+
+    @staticmethod
+    def from_relval(relval):
+        # The source's rows are only fetched if an operator actually iterates
+        # over them, since a relation-value may not store its rows as tuples.
+        return RowStream(relval.attributes, None, relval)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            return self.source.rows
+
+        return self._rows
+
+    def num_attrs(self):
+        return len(self.attributes)
+
+    def get_attrs(self):
+        return list(self.attributes)
+
+    def get_attr_index(self, name):
+        if self.attr_index is None:
+            self.attr_index = make_attr_index(self.attributes)
+
+        return find_attr_index(self.attr_index, name)
+
+    # Returns the number of rows if it is known without consuming the stream,
+    # or None otherwise.
+    def num_rows(self):
+        if self.source is None:
+            return None
+
+        return self.source.num_rows()
+
+    # Collects the rows of the stream into a relation-value, removing any
+    # duplicates.  The stream cannot be used afterward.
+    def materialize(self):
+        if self.source is not None:
+            return self.source
+
+        return RelationValue(self.attributes, self.rows)
+
+
+# Each change to the indexes of any database gets a new version number, so
+# that plans chosen with one set of indexes are never reused with another.
+_index_versions = itertools.count(1)
+
+
+class Database:
+    def __init__(self):
+        self.relation_variables = {}
+
+        # Maps relvar names to the list of indexes declared on them.
+        self.indexes = {}
+        self.index_version = 0
+
+        # Maps relvar names to their RelationStats, for the relvars whose
+        # statistics have been asked for.
+        self.stats = {}
+
+        # Objects whose relvar_changed() method is called after a relation
+        # variable is assigned or deleted.  See ra_views.
+        self.listeners = []
+
+        # The (name, inserted, deleted) change being made by replace_relvar(),
+        # which saves listeners from working it out again.
+        self._pending_change = None
+
+    def get_relvar_names(self):
+        return list(self.relation_variables.keys())
+
+    def get_relvar(self, name):
+        return self.relation_variables.get(name)
+
+    def set_relvar(self, name, relval):
+        if relval.has_unnamed_attrs():
+            raise ValueError("Relation-value has unnamed attributes.")
+
+        old_relval = self.get_relvar(name) if self.listeners else None
+
+        self.relation_variables[name] = relval
+        self._clear_indexes(name)
+        self._update_stats(name, relval)
+        self._notify(name, old_relval, relval)
+
+    def del_relvar(self, name):
+        old_relval = self.relation_variables.pop(name)
+        self._clear_indexes(name)
+        self.stats.pop(name, None)
+        self._notify(name, old_relval, None)
+
+    # Inserts and deletes rows of a relation variable.  The relvar gets a new
+    # relation-value, since relation-values are never modified once stored.
+    def update_relvar(self, name, inserted=(), deleted=()):
+        old_relval = self.get_relvar(name)
+        if old_relval is None:
+            raise ValueError('No relation variable named %s' % name)
+
+        rows = old_relval.rows
+        inserted = set(inserted) - rows
+        deleted = set(deleted) & rows
+        for row in inserted:
+            if type(row) != tuple or len(row) != old_relval.num_attrs():
+                raise ValueError('Relation variable %s has %d attributes; ' \
+                    'row %s does not match' % (name, old_relval.num_attrs(),
+                                               row))
+
+        if not inserted and not deleted:
+            return
+
+        self.replace_relvar(name, RelationValue(old_relval.get_attrs(),
+                                                (rows - deleted) | inserted),
+                            inserted, deleted)
+
+    # Assigns a relation variable a new value that differs from its old value
+    # by the specified inserted and deleted rows.
+    def replace_relvar(self, name, relval, inserted, deleted):
+        self._pending_change = (name, inserted, deleted)
+        try:
+            self.set_relvar(name, relval)
+        finally:
+            self._pending_change = None
+
+    # Tells the listeners about a change to a relation variable.  new_relval
+    # is None if the relvar was deleted, and old_relval is None if it didn't
+    # exist or its old value wasn't read.  The (inserted, deleted) rows are
+    # passed if they are known, and None otherwise.
+    def _notify(self, name, old_relval, new_relval):
+        delta = None
+        if self._pending_change is not None and \
+           self._pending_change[0] == name:
+            delta = self._pending_change[1:]
+            self._pending_change = None
+
+        for listener in list(self.listeners):
+            listener.relvar_changed(name, old_relval, new_relval, delta)
+
+    # Returns the statistics of a relation variable's current value.
+    def get_stats(self, name):
+        relval = self.get_relvar(name)
+        if relval is None:
+            raise ValueError('No relation variable named %s' % name)
+
+        stats = self.stats.get(name)
+        if stats is None or stats.relval is not relval:
+            # Imported here, since it needs the scalar expression code, which
+            # nothing else in this module does.
+            from ra_stats import RelationStats
+            stats = RelationStats(relval)
+            self.stats[name] = stats
+
+        return stats
+
+    # Updates the statistics of a relation variable that has been assigned,
+    # if the rows it gained and lost are known; otherwise they are discarded,
+    # and computed again when they are next asked for.
+    def _update_stats(self, name, relval):
+        stats = self.stats.pop(name, None)
+        if stats is not None and self._pending_change is not None and \
+           self._pending_change[0] == name:
+            (inserted, deleted) = self._pending_change[1:]
+            stats.update(relval, inserted, deleted)
+            self.stats[name] = stats
+
+    # Discards the contents of a relation variable's indexes, which are
+    # rebuilt from its new value when they are next used.
+    def _clear_indexes(self, name):
+        for index in self.indexes.get(name, []):
+            index.clear()
+
+    # Declares an index of the specified kind on attributes of a relation
+    # variable.  The index is built when it is first used.
+    def create_index(self, name, attrs, kind=HASH_INDEX):
+        if kind not in INDEX_KINDS:
+            raise ValueError('Unknown index kind %s' % kind)
+
+        if self.find_index(name, attrs, kind) is not None:
+            raise ValueError('Relation variable %s already has that index' % \
+                             name)
+
+        self.indexes.setdefault(name, []).append(INDEX_KINDS[kind](attrs))
+        self.index_version = next(_index_versions)
+
+    def drop_index(self, name, attrs, kind=HASH_INDEX):
+        index = self.find_index(name, attrs, kind)
+        if index is None:
+            raise ValueError('Relation variable %s has no such index' % name)
+
+        self.indexes[name].remove(index)
+        self.index_version = next(_index_versions)
+
+    def find_index(self, name, attrs, kind):
+        for index in self.indexes.get(name, []):
+            if index.kind == kind and index.attrs == list(attrs):
+                return index
+
+        return None
+
+    # Returns the indexes declared on a relation variable.
+    def get_indexes(self, name):
+        return list(self.indexes.get(name, []))
+
+    # Returns an index that is up to date with the relation variable's
+    # current value, building it if necessary.
+    def get_index(self, name, attrs, kind):
+        index = self.find_index(name, attrs, kind)
+        if index is None:
+            raise ValueError('Relation variable %s has no such index' % name)
+
+        relval = self.get_relvar(name)
+        if index.relval is not relval:
+            index.build(relval)
+
+        return index
@@ -0,0 +1,10 @@
+# The tests import the modules in python/ and the parser that build.sh
+# generates into python_gen/.  Run them from the top of the repository with
+#
+#   python -m unittest
+
+import os, sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _dir in ['python_gen', 'python']:
+    sys.path.insert(0, os.path.join(_ROOT, _dir))
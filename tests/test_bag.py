@@ -0,0 +1,123 @@
+import random, unittest
+
+from relation import RelationValue, Database
+from ra_bag import BagExecutor
+from ra_eval import eval_ra_expr
+from ra_index import HASH_INDEX
+
+
+# Queries whose results with DELTA applied are the same with bag semantics as
+# with set semantics.  MINUS subtracts counts, so its left input must have
+# its duplicates removed first.
+QUERIES = [
+    'r;',
+    'PI[b](r);',
+    'SIGMA[a > 2](r);',
+    'r CROSS u;',
+    's CROSS u;',
+    'PI[b](r) CROSS PI[c](s);',
+    'r BOWTIE s;',
+    'u BOWTIE s;',
+    'r LBOWTIE t;',
+    'r LBOWTIE u;',
+    'r RBOWTIE s;',
+    'r FBOWTIE t;',
+    'r BOWTIE[r.a = t.a and r.b < t.c] t;',
+    'r LBOWTIE[r.a < t.a] t;',
+    'r SEMIJOIN s;',
+    'r ANTIJOIN s;',
+    'r SEMIJOIN[r.a = t.a and r.b < t.c] t;',
+    'PI[b](r) UNION PI[b](s);',
+    'PI[b](r) INTERSECT PI[b](s);',
+    'DELTA(PI[b](r)) MINUS PI[b](s);',
+    'DELTA(PI[a, c](r BOWTIE s)) MINUS t;',
+    'r MINUS PI[a, b](r BOWTIE s);',
+    '(r CROSS u) BOWTIE s;',
+    'PI[a](r BOWTIE s BOWTIE t);',
+    '[b]GROUP[count() AS n](r);',
+    'PI[a, b](r) DIVIDE PI[b](s);',
+]
+
+
+def random_relation(name, attrs, num_rows, rng):
+    rows = set()
+    for i in range(num_rows):
+        rows.add(tuple([rng.randrange(5) for a in attrs]))
+
+    return RelationValue(['%s.%s' % (name, a) for a in attrs], rows)
+
+
+def make_database(seed):
+    rng = random.Random(seed)
+    db = Database()
+    db.set_relvar('r', random_relation('r', ['a', 'b'], 12, rng))
+    db.set_relvar('s', random_relation('s', ['b', 'c'], 8, rng))
+    db.set_relvar('t', random_relation('t', ['a', 'c'], 10, rng))
+    db.set_relvar('u', random_relation('u', ['d', 'e'], 4, rng))
+    return db
+
+
+class BagSemanticsTest(unittest.TestCase):
+    def check_queries(self, db):
+        executor = BagExecutor(db)
+        for query in QUERIES:
+            with self.subTest(query=query):
+                expected = eval_ra_expr(db, query)
+                result = eval_ra_expr(db, 'DELTA(%s);' % query[:-1],
+                                      executor=executor)
+                self.assertEqual(result.counts,
+                                 dict.fromkeys(expected.rows, 1))
+
+    def test_delta_matches_set_semantics(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.check_queries(make_database(seed))
+
+    def test_delta_matches_set_semantics_with_indexes(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                db = make_database(seed)
+                db.create_index('r', ['r.a'], HASH_INDEX)
+                db.create_index('s', ['s.b'], HASH_INDEX)
+                db.create_index('t', ['t.a'], HASH_INDEX)
+                self.check_queries(db)
+
+    def test_counts(self):
+        db = Database()
+        db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                         {(1, 0), (2, 0), (3, 1), (1, 1)}))
+        db.set_relvar('s', RelationValue(['s.b', 's.c'],
+                                         {(0, 5), (1, 6), (2, 5)}))
+        db.set_relvar('u', RelationValue(['u.d', 'u.e'], {(7, 8), (9, 9)}))
+        executor = BagExecutor(db)
+
+        for (query, expected) in [('s CROSS u;', 6),
+                                  ('u BOWTIE s;', 6),
+                                  ('r LBOWTIE u;', 8),
+                                  ('PI[b](r);', 4),
+                                  ('PI[b](r) UNION PI[b](s);', 7),
+                                  ('PI[b](r BOWTIE s);', 4),
+                                  ('PI[b](r) MINUS PI[b](s);', 2)]:
+            with self.subTest(query=query):
+                result = eval_ra_expr(db, query, executor=executor)
+                self.assertEqual(result.total_rows(), expected)
+
+        result = eval_ra_expr(db, 'GROUP[count() AS n, sum(b) AS t](' \
+                              'PI[b](r));', executor=executor)
+        self.assertEqual(set(result.rows), {(4, 2)})
+
+    def test_constants(self):
+        db = Database()
+        executor = BagExecutor(db)
+        for (query, expected) in [('{};', {}),
+                                  ('{(1), (2)};', {(1,): 1, (2,): 1}),
+                                  ('GROUP[count() AS n]({});', {(0,): 1})]:
+            with self.subTest(query=query):
+                # Plans are cached, so each query is run twice.
+                for i in range(2):
+                    result = eval_ra_expr(db, query, executor=executor)
+                    self.assertEqual(result.counts, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from relation import RelationValue, Database
+from ra_columnar import ColumnarDatabase, make_column, _column_values
+from ra_eval import eval_ra_expr
+
+
+class MakeColumnTest(unittest.TestCase):
+    def test_values_round_trip(self):
+        for values in [[1, None, 3], [1.5, None], [True, False, None],
+                       ['a', '', None], ['a\0', 'b', None], [1, 'x', None],
+                       [2 ** 70, 1], [None, None]]:
+            with self.subTest(values=values):
+                self.assertEqual(_column_values(make_column(values)), values)
+
+
+class ColumnarDatabaseTest(unittest.TestCase):
+    def test_strings_with_trailing_nuls(self):
+        rows = {('a\0', 1), ('b', 2), ('', 3), (None, 4)}
+        for query in ['r;', 'SIGMA[i > 1](r);', 'PI[s](r);',
+                      'SIGMA[s = "b"](r);']:
+            with self.subTest(query=query):
+                results = []
+                for cls in [Database, ColumnarDatabase]:
+                    db = cls()
+                    db.set_relvar('r', RelationValue(['r.s', 'r.i'], rows))
+                    results.append(set(eval_ra_expr(db, query).rows))
+
+                self.assertEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import io, os, tempfile, unittest
+
+from relation import RelationValue
+from ra_bag import BagRelationValue
+from ra_csv import infer_column_type, read_csv, write_csv
+
+
+def read_text(text, **kwargs):
+    return read_csv(io.StringIO(text), 'r', **kwargs)
+
+
+class ReadCsvTest(unittest.TestCase):
+    def test_header(self):
+        relval = read_text('a, b\n1,x\n2,\n')
+        self.assertEqual(relval.get_attrs(), ['r.a', 'r.b'])
+        self.assertEqual(relval.rows, {(1, 'x'), (2, None)})
+
+    def test_no_header(self):
+        relval = read_text('1,x\n2,y\n', attributes=['a', 'b'], header=False)
+        self.assertEqual(relval.get_attrs(), ['r.a', 'r.b'])
+        self.assertEqual(relval.rows, {(1, 'x'), (2, 'y')})
+
+        with self.assertRaises(ValueError):
+            read_text('1,x\n', header=False)
+
+    def test_header_errors(self):
+        with self.assertRaises(ValueError):
+            read_text('')
+
+        # Attribute names must be distinct.
+        with self.assertRaises(ValueError):
+            read_text('a,a\n1,2\n')
+
+    def test_null_string(self):
+        relval = read_text('a,b\n1,NULL\nNULL,\n', null_string='NULL')
+        self.assertEqual(relval.rows, {(1, None), (None, '')})
+
+        # Only the null string is null, so an empty field is a string.
+        relval = read_text('a\n1\n""\n', null_string='-')
+        self.assertEqual(relval.rows, {('1',), ('',)})
+
+    def test_type_inference(self):
+        relval = read_text('b,i,f,s,n\n' \
+                           'True,1,1,x,\n' \
+                           'false,-2,2.5,2,\n' \
+                           ',,,,\n')
+        self.assertEqual(relval.rows, {(True, 1, 1.0, 'x', None),
+                                       (False, -2, 2.5, '2', None),
+                                       (None, None, None, None, None)})
+
+        self.assertEqual(infer_column_type(['1', '2']), 'int')
+        self.assertEqual(infer_column_type(['1', '2.0']), 'float')
+        self.assertEqual(infer_column_type(['TRUE', '', 'false']), 'bool')
+        self.assertEqual(infer_column_type(['1', 'x']), 'str')
+        self.assertEqual(infer_column_type(['', '']), 'str')
+
+    def test_specified_types(self):
+        relval = read_text('a,b\n01,1\n02,2\n', types={'a' : 'str'})
+        self.assertEqual(relval.rows, {('01', 1), ('02', 2)})
+
+        with self.assertRaises(ValueError):
+            read_text('a\n1\n', types={'a' : 'decimal'})
+
+    def test_later_batch_has_other_type(self):
+        text = 'a,b\n1,x\n2,y\n3,z\nfour,w\n'
+        relval = read_text(text, batch_size=4)
+        self.assertEqual(relval.rows,
+                         {('1', 'x'), ('2', 'y'), ('3', 'z'), ('four', 'w')})
+
+        with self.assertRaises(ValueError) as cm:
+            read_text(text, batch_size=2)
+
+        self.assertIn('Lines 4-5:  attribute a', str(cm.exception))
+        self.assertIn('not of type int', str(cm.exception))
+
+        # Specifying the type avoids the error.
+        relval = read_text(text, batch_size=2, types={'a' : 'str'})
+        self.assertIn(('four', 'w'), relval.rows)
+
+    def test_wrong_number_of_values(self):
+        with self.assertRaises(ValueError) as cm:
+            read_text('a,b\n1,2\n3\n')
+
+        self.assertIn('Line 3 has 1 values', str(cm.exception))
+
+
+class WriteCsvTest(unittest.TestCase):
+    def write_text(self, relval, **kwargs):
+        out = io.StringIO()
+        write_csv(relval, out, **kwargs)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        relval = RelationValue(['r.a', 'r.b', 'r.c'],
+                               {(1, 'x', 1.5), (2, None, -0.5), (3, 'a,b', None)})
+        text = self.write_text(relval)
+        self.assertEqual(text.splitlines()[0], 'a,b,c')
+        self.assertEqual(read_text(text).rows, relval.rows)
+
+        text = self.write_text(relval, delimiter='\t', null_string='NULL')
+        self.assertEqual(read_text(text, delimiter='\t',
+                                   null_string='NULL').rows, relval.rows)
+
+    def test_no_header(self):
+        relval = RelationValue(['r.a'], {(1,)})
+        self.assertEqual(self.write_text(relval, header=False), '1\r\n')
+
+    def test_bag(self):
+        bag = BagRelationValue(['r.a', 'r.b'], [((1, 'x'), 3), ((2, None), 1)])
+        lines = self.write_text(bag).splitlines()
+        self.assertEqual(lines[0], 'a,b')
+        self.assertEqual(sorted(lines[1:]), ['1,x', '1,x', '1,x', '2,'])
+
+    def test_file(self):
+        relval = RelationValue(['t.a', 't.b'], {(1, True), (2, False)})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 't.csv')
+            write_csv(relval, path)
+            result = read_csv(path, 't')
+
+        self.assertEqual(result.get_attrs(), ['t.a', 't.b'])
+        self.assertEqual(result.rows, relval.rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
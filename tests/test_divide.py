@@ -0,0 +1,66 @@
+import random, unittest
+
+from relation import RelationValue, Database
+from ra_bag import BagExecutor
+from ra_eval import eval_ra_expr
+
+
+# Division of r(a, c) by s(c) from its definition.
+DIVISION_BY_DEFINITION = 'PI[a](r) MINUS PI[a]((PI[a](r) CROSS s) MINUS r);'
+
+
+def make_database(r_rows, s_rows):
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.c'], r_rows))
+    db.set_relvar('s', RelationValue(['s.c'], s_rows))
+    return db
+
+
+class DivideTest(unittest.TestCase):
+    def check_division(self, db, expected):
+        result = eval_ra_expr(db, 'r DIVIDE s;')
+        self.assertEqual(set(result.rows), expected)
+        self.assertEqual(set(eval_ra_expr(db, DIVISION_BY_DEFINITION).rows),
+                         expected)
+
+        result = eval_ra_expr(db, 'r DIVIDE s;', executor=BagExecutor(db))
+        self.assertEqual(result.counts, dict.fromkeys(expected, 1))
+
+    def test_divide(self):
+        db = make_database({(1, 1), (1, 2), (2, 1), (3, 2), (3, 1), (3, 3)},
+                           {(1,), (2,)})
+        self.check_division(db, {(1,), (3,)})
+
+    def test_null_in_divisor(self):
+        db = make_database({(1, None), (2, 1), (1, 1)}, {(None,), (1,)})
+        self.check_division(db, {(1,)})
+
+        result = eval_ra_expr(db, 'PI[r.a, r.c](r) DIVIDE PI[r.c AS c](r);')
+        self.assertEqual(set(result.rows), {(1,)})
+
+    def test_null_in_quotient(self):
+        db = make_database({(None, 1), (None, 2), (1, 1)}, {(1,), (2,)})
+        self.check_division(db, {(None,)})
+
+    def test_empty_divisor(self):
+        db = make_database({(1, 1), (2, None)}, set())
+        self.check_division(db, {(1,), (2,)})
+
+        db = make_database(set(), set())
+        self.check_division(db, set())
+
+    def test_matches_definition(self):
+        rng = random.Random(5)
+        values = [None, 1, 2, 3]
+        for i in range(20):
+            r_rows = set([(rng.choice(values), rng.choice(values))
+                          for j in range(12)])
+            s_rows = set([(rng.choice(values),) for j in range(2)])
+            db = make_database(r_rows, s_rows)
+            with self.subTest(r=r_rows, s=s_rows):
+                expected = eval_ra_expr(db, DIVISION_BY_DEFINITION)
+                self.check_division(db, set(expected.rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from relation import RelationValue, Database
+from ra_columnar import ColumnarDatabase
+from ra_eval import eval_ra_expr, eval_ra_script
+from ra_parallel import ParallelExecutor
+
+
+# Queries whose input to GROUP may hold the same row more than once, which
+# must only be counted once, and their results over make_database().
+DUPLICATE_INPUT_QUERIES = [
+    ('GROUP[count() AS n, sum(b) AS t](PI[b](r));', {(2, 1)}),
+    ('GROUP[count() AS n](r UNION r);', {(4,)}),
+    ('[b]GROUP[count() AS n](PI[b](r) UNION PI[b](r));', {(0, 1), (1, 1)}),
+    ('GROUP[count() AS n](PI[a](r) BOWTIE PI[a](r));', {(3,)}),
+    ('GROUP[count() AS n](SIGMA[b = 0](PI[a, b](r) UNION r));', {(2,)}),
+    ('GROUP[count() AS n](r);', {(4,)}),
+]
+
+
+def make_database(cls=Database):
+    db = cls()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                     {(1, 0), (2, 0), (3, 1), (1, 1)}))
+    return db
+
+
+class GroupDuplicatesTest(unittest.TestCase):
+    def check_queries(self, db, executor=None):
+        for (query, expected) in DUPLICATE_INPUT_QUERIES:
+            with self.subTest(query=query):
+                result = eval_ra_expr(db, query, executor=executor)
+                self.assertEqual(set(result.rows), expected)
+
+    def test_set_database(self):
+        self.check_queries(make_database())
+
+    def test_columnar_database(self):
+        self.check_queries(make_database(ColumnarDatabase))
+
+    def test_parallel_executor(self):
+        db = make_database()
+        executor = ParallelExecutor(db, workers=2, min_partition_rows=1)
+        try:
+            self.check_queries(db, executor)
+        finally:
+            executor.close()
+
+    def test_script(self):
+        db = make_database()
+        results = eval_ra_script(db, 'x <- GROUP[count() AS n](PI[b](r));' \
+                                     'GROUP[count() AS n](r UNION r);')
+        self.assertEqual(set(results[-1].rows), {(4,)})
+        self.assertEqual(set(db.get_relvar('x').rows), {(2,)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import random, unittest
+
+from relation import RelationValue, Database
+from ra_eval import eval_ra_expr, explain_ra_expr
+from ra_index import HASH_INDEX, SORTED_INDEX, HashIndex, SortedIndex
+
+
+ROWS = [(1, 10, 'x'), (2, 20, 'y'), (2, None, 'z'), (None, 5, 'w'),
+        (3, 30, 'x')]
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.relval = RelationValue(['r.a', 'r.b', 'r.c'], ROWS)
+
+    def test_hash_index(self):
+        index = HashIndex(['r.a'])
+        index.build(self.relval)
+        self.assertEqual(set(index.lookup((2,))),
+                         {(2, 20, 'y'), (2, None, 'z')})
+        self.assertEqual(list(index.lookup((4,))), [])
+
+        # Rows with a null key aren't in the index.
+        self.assertEqual(list(index.lookup((None,))), [])
+
+        index = HashIndex(['r.c', 'r.a'])
+        index.build(self.relval)
+        self.assertEqual(list(index.lookup(('x', 3))), [(3, 30, 'x')])
+
+    def test_sorted_index(self):
+        index = SortedIndex(['r.b'])
+        index.build(self.relval)
+        keys = lambda rows: [row[1] for row in rows]
+        self.assertEqual(keys(index.range()), [5, 10, 20, 30])
+        self.assertEqual(keys(index.range(10, True, 30, False)), [10, 20])
+        self.assertEqual(keys(index.range(10, False)), [20, 30])
+        self.assertEqual(keys(index.range(high=20)), [5, 10, 20])
+        self.assertEqual(keys(index.lookup((20,))), [20])
+
+        with self.assertRaises(ValueError):
+            SortedIndex(['r.a', 'r.b'])
+
+        index = SortedIndex(['r.a'])
+        with self.assertRaises(ValueError):
+            index.build(RelationValue(['r.a'], {(1,), ('x',)}))
+
+    def test_database_indexes(self):
+        db = Database()
+        db.set_relvar('r', self.relval)
+        db.create_index('r', ['r.a'])
+        with self.assertRaises(ValueError):
+            db.create_index('r', ['r.a'], HASH_INDEX)
+
+        with self.assertRaises(ValueError):
+            db.create_index('r', ['r.a'], 'btree')
+
+        index = db.get_index('r', ['r.a'], HASH_INDEX)
+        self.assertEqual(len(index.lookup((1,))), 1)
+
+        # The index is rebuilt when the relvar changes.
+        db.update_relvar('r', inserted=[(1, 11, 'v')])
+        index = db.get_index('r', ['r.a'], HASH_INDEX)
+        self.assertEqual(len(index.lookup((1,))), 2)
+
+        db.drop_index('r', ['r.a'])
+        self.assertEqual(db.get_indexes('r'), [])
+        with self.assertRaises(ValueError):
+            db.get_index('r', ['r.a'], HASH_INDEX)
+
+
+# Selections and the index that each one is expected to use, if any.
+SCAN_QUERIES = [
+    ('SIGMA[a = 2](r);', 'HASH INDEX (r.a)'),
+    ('SIGMA[2 = a and c = "y"](r);', 'HASH INDEX (r.a)'),
+    ('SIGMA[a = 2 and b = 20](r);', 'HASH INDEX (r.a, r.b)'),
+    ('SIGMA[b > 10](r);', 'SORTED INDEX (r.b)'),
+    ('SIGMA[b >= 10 and b < 30](r);', 'SORTED INDEX (r.b)'),
+    ('SIGMA[30 > b](r);', 'SORTED INDEX (r.b)'),
+    ('SIGMA[b = 20](r);', 'SORTED INDEX (r.b)'),
+    ('SIGMA[a = null](r);', None),
+    ('SIGMA[a + 1 = 3](r);', None),
+    ('SIGMA[a = 1 or b = 30](r);', None),
+]
+
+# Joins and semi-joins of r with s, with an index on s.a or r.a.
+JOIN_QUERIES = [
+    'r BOWTIE s;',
+    'r BOWTIE[r.a = s.a and r.b < s.d] s;',
+    'r LBOWTIE s;',
+    'r RBOWTIE s;',
+    'r SEMIJOIN s;',
+    'r ANTIJOIN s;',
+    'r SEMIJOIN[r.a = s.a and r.b > s.d] s;',
+    'r ANTIJOIN[r.a = s.a and r.b > s.d] s;',
+    'PI[c](r BOWTIE s);',
+]
+
+
+def make_database(seed):
+    rng = random.Random(seed)
+    values = [None, 1, 2, 3]
+
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b', 'r.c'], set(
+        [(rng.choice(values), rng.randrange(40), rng.choice('xyz'))
+         for i in range(20)])))
+    db.set_relvar('s', RelationValue(['s.a', 's.d'], set(
+        [(rng.choice(values), rng.randrange(40)) for i in range(8)])))
+    return db
+
+
+class IndexQueryTest(unittest.TestCase):
+    def test_index_scans(self):
+        for seed in range(5):
+            db = make_database(seed)
+            expected = [eval_ra_expr(db, q, cache=None).rows
+                        for (q, index) in SCAN_QUERIES]
+
+            db.create_index('r', ['r.a'], HASH_INDEX)
+            db.create_index('r', ['r.a', 'r.b'], HASH_INDEX)
+            db.create_index('r', ['r.b'], SORTED_INDEX)
+            for ((query, index), rows) in zip(SCAN_QUERIES, expected):
+                with self.subTest(seed=seed, query=query):
+                    plan = explain_ra_expr(db, query).split('Optimized')[1]
+                    if index is None:
+                        self.assertNotIn('USING', plan)
+                    else:
+                        self.assertIn('USING %s' % index, plan)
+
+                    result = eval_ra_expr(db, query, cache=None)
+                    self.assertEqual(result.rows, rows)
+
+    def test_index_scan_falls_back(self):
+        # The sorted index can't be built on values that can't be compared,
+        # so the relvar is scanned instead.
+        db = Database()
+        db.set_relvar('r', RelationValue(['r.b'], {(1,), ('x',), (2,)}))
+        db.create_index('r', ['r.b'], SORTED_INDEX)
+        result = eval_ra_expr(db, 'SIGMA[b = 2](r);', cache=None)
+        self.assertEqual(result.rows, {(2,)})
+
+    def test_index_joins(self):
+        for seed in range(5):
+            db = make_database(seed)
+            expected = [eval_ra_expr(db, q, cache=None).rows
+                        for q in JOIN_QUERIES]
+
+            for indexed in ['r', 's']:
+                db = make_database(seed)
+                db.create_index(indexed, [indexed + '.a'], HASH_INDEX)
+                for (query, rows) in zip(JOIN_QUERIES, expected):
+                    with self.subTest(seed=seed, indexed=indexed,
+                                      query=query):
+                        result = eval_ra_expr(db, query, cache=None)
+                        self.assertEqual(result.rows, rows)
+
+    def test_index_join_plans(self):
+        db = make_database(0)
+        db.create_index('s', ['s.a'], HASH_INDEX)
+        plan = explain_ra_expr(db, 'r BOWTIE s;').split('Optimized')[1]
+        self.assertIn('USING HASH INDEX (s.a) ON s', plan)
+        plan = explain_ra_expr(db, 'r ANTIJOIN s;').split('Optimized')[1]
+        self.assertIn('USING HASH INDEX (s.a) ON s', plan)
+
+        # The unmatched rows of s must be kept, so its index isn't used.
+        plan = explain_ra_expr(db, 'r RBOWTIE s;').split('Optimized')[1]
+        self.assertNotIn('USING', plan)
+
+    def test_index_follows_updates(self):
+        db = make_database(0)
+        db.create_index('s', ['s.a'], HASH_INDEX)
+        query = 'r SEMIJOIN[r.a = s.a and r.b < s.d] s;'
+        eval_ra_expr(db, query)
+
+        db.update_relvar('s', inserted=[(1, 100), (2, 100), (3, 100)])
+        result = eval_ra_expr(db, query)
+        self.assertEqual(result.rows, set([row for row in
+            db.get_relvar('r').rows if row[0] is not None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
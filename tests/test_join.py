@@ -0,0 +1,218 @@
+import operator, random, unittest
+
+from relation import RelationValue, Database
+from ra_eval import eval_ra_expr, explain_ra_expr
+from ra_index import HASH_INDEX, HashIndex
+from ra_join import hash_join_pairs, merge_join_pairs, \
+    nested_loop_join_pairs, index_join_pairs
+
+
+# Comparison operators as the join conditions use them, where a comparison
+# with null never matches.
+OPS = {
+    '==' : operator.eq,
+    '<'  : operator.lt,
+    '<=' : operator.le,
+    '>'  : operator.gt,
+    '>=' : operator.ge,
+}
+
+
+def random_rows(rng, num_rows, width):
+    values = [None, 0, 1, 2, 3]
+    return list(set([tuple([rng.choice(values) for i in range(width)])
+                     for j in range(num_rows)]))
+
+
+# The pairs of rows whose first values compare true with the operator.
+def expected_pairs(lhs_rows, rhs_rows, op):
+    return set([(l, r) for l in lhs_rows for r in rhs_rows
+                if l[0] is not None and r[0] is not None and
+                   OPS[op](l[0], r[0])])
+
+
+class JoinAlgorithmTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.inputs = [(random_rows(rng, 15, 2), random_rows(rng, 12, 2))
+                       for i in range(10)]
+
+    def test_hash_join(self):
+        key_fn = lambda row: (row[0],)
+        for (lhs_rows, rhs_rows) in self.inputs:
+            expected = expected_pairs(lhs_rows, rhs_rows, '==')
+            for build_lhs in [False, True]:
+                pairs = list(hash_join_pairs(lhs_rows, rhs_rows, key_fn,
+                                             key_fn, build_lhs=build_lhs))
+                self.assertEqual(len(pairs), len(expected))
+                self.assertEqual(set(pairs), expected)
+
+    def test_merge_join(self):
+        key_fn = lambda row: row[0]
+        for (lhs_rows, rhs_rows) in self.inputs:
+            for op in ['<', '<=', '>', '>=']:
+                with self.subTest(op=op):
+                    pairs = list(merge_join_pairs(lhs_rows, rhs_rows, key_fn,
+                                                  op, key_fn))
+                    expected = expected_pairs(lhs_rows, rhs_rows, op)
+                    self.assertEqual(len(pairs), len(expected))
+                    self.assertEqual(set(pairs), expected)
+
+    def test_nested_loop_join(self):
+        for (lhs_rows, rhs_rows) in self.inputs:
+            match_fn = lambda l, r: l[0] is not None and l[0] == r[0]
+            pairs = list(nested_loop_join_pairs(lhs_rows, rhs_rows,
+                                                match_fn))
+            self.assertEqual(set(pairs),
+                             expected_pairs(lhs_rows, rhs_rows, '=='))
+
+    def test_index_join(self):
+        for (lhs_rows, rhs_rows) in self.inputs:
+            expected = expected_pairs(lhs_rows, rhs_rows, '==')
+            for index_lhs in [False, True]:
+                (indexed, probe) = (lhs_rows, rhs_rows) if index_lhs \
+                                   else (rhs_rows, lhs_rows)
+                index = HashIndex(['x.a'])
+                index.build(RelationValue(['x.a', 'x.b'], indexed))
+
+                pairs = list(index_join_pairs(probe, lambda row: (row[0],),
+                                              index, index_lhs=index_lhs))
+                self.assertEqual(len(pairs), len(expected))
+                self.assertEqual(set(pairs), expected)
+
+    def test_match_fn(self):
+        # The match function is tested on top of the keys.
+        match_fn = lambda l, r: l[1] != r[1]
+        key_fn = lambda row: (row[0],)
+        for (lhs_rows, rhs_rows) in self.inputs:
+            expected = set([(l, r) for (l, r) in
+                            expected_pairs(lhs_rows, rhs_rows, '==')
+                            if l[1] != r[1]])
+            self.assertEqual(set(hash_join_pairs(lhs_rows, rhs_rows, key_fn,
+                key_fn, match_fn)), expected)
+            self.assertEqual(set(merge_join_pairs(lhs_rows, rhs_rows,
+                lambda row: row[0], '<=', lambda row: row[0],
+                lambda l, r: match_fn(l, r) and l[0] >= r[0])), expected)
+
+
+# Joins of r(a, b) and t(a, c) on r.a and t.a, written so that they are run
+# with each of the join algorithms.
+EQUI_JOIN_CONDITIONS = [
+    ('hash', 'r.a = t.a'),
+    ('nested loop', 'not (r.a <> t.a)'),
+    ('merge', 'r.a <= t.a and r.a >= t.a'),
+]
+
+JOIN_OPS = [
+    ('BOWTIE', 'inner'),
+    ('LBOWTIE', 'left'),
+    ('RBOWTIE', 'right'),
+    ('FBOWTIE', 'full'),
+]
+
+
+# Computes an outer join of the rows, where pred says whether a left and a
+# right row match, padding unmatched rows with nulls.
+def reference_join(lhs_rows, rhs_rows, pred, join_type, lhs_width=2,
+                   rhs_width=2):
+    result = set()
+    for l in lhs_rows:
+        for r in rhs_rows:
+            if pred(l, r):
+                result.add(l + r)
+
+    if join_type in ['left', 'full']:
+        for l in lhs_rows:
+            if not any([pred(l, r) for r in rhs_rows]):
+                result.add(l + (None,) * rhs_width)
+
+    if join_type in ['right', 'full']:
+        for r in rhs_rows:
+            if not any([pred(l, r) for l in lhs_rows]):
+                result.add((None,) * lhs_width + r)
+
+    return result
+
+
+def make_database(seed):
+    rng = random.Random(seed)
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                     random_rows(rng, 10, 2)))
+    db.set_relvar('t', RelationValue(['t.a', 't.c'],
+                                     random_rows(rng, 10, 2)))
+    return db
+
+
+class JoinQueryTest(unittest.TestCase):
+    def check_joins(self, db):
+        r_rows = list(db.get_relvar('r').rows)
+        t_rows = list(db.get_relvar('t').rows)
+        equal_keys = lambda l, r: l[0] is not None and l[0] == r[0]
+
+        for (op, join_type) in JOIN_OPS:
+            expected = reference_join(r_rows, t_rows, equal_keys, join_type)
+            for (algorithm, cond) in EQUI_JOIN_CONDITIONS:
+                with self.subTest(op=op, algorithm=algorithm):
+                    result = eval_ra_expr(db, 'r %s[%s] t;' % (op, cond))
+                    self.assertEqual(set(result.rows), expected)
+
+    def test_join_algorithms_agree(self):
+        for seed in range(5):
+            self.check_joins(make_database(seed))
+
+    def test_index_joins(self):
+        for seed in range(5):
+            for indexed in ['r', 't']:
+                db = make_database(seed)
+                db.create_index(indexed, [indexed + '.a'], HASH_INDEX)
+                self.check_joins(db)
+
+        # The index is used where the indexed input's unmatched rows don't
+        # have to be kept.
+        db = make_database(0)
+        db.create_index('r', ['r.a'], HASH_INDEX)
+        plan = explain_ra_expr(db, 'r RBOWTIE[r.a = t.a] t;')
+        self.assertIn('USING HASH INDEX (r.a) ON r', plan)
+        plan = explain_ra_expr(db, 'r LBOWTIE[r.a = t.a] t;')
+        self.assertNotIn('INDEX', plan)
+
+    def test_range_joins(self):
+        db = make_database(1)
+        r_rows = list(db.get_relvar('r').rows)
+        t_rows = list(db.get_relvar('t').rows)
+
+        for (op, fn) in [('<', operator.lt), ('>=', operator.ge)]:
+            pred = lambda l, r: l[0] is not None and r[0] is not None and \
+                                fn(l[0], r[0])
+            for (join_op, join_type) in JOIN_OPS:
+                with self.subTest(op=op, join_op=join_op):
+                    result = eval_ra_expr(db, 'r %s[r.a %s t.a] t;' % \
+                                          (join_op, op))
+                    self.assertEqual(set(result.rows),
+                        reference_join(r_rows, t_rows, pred, join_type))
+
+    def test_null_padding(self):
+        db = Database()
+        db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                         {(1, 'x'), (None, 'y')}))
+        db.set_relvar('t', RelationValue(['t.a', 't.c'],
+                                         {(1, 10), (None, 20), (3, 30)}))
+
+        # Rows whose key is null never match, not even each other.
+        for (algorithm, cond) in EQUI_JOIN_CONDITIONS:
+            with self.subTest(algorithm=algorithm):
+                result = eval_ra_expr(db, 'r FBOWTIE[%s] t;' % cond)
+                self.assertEqual(set(result.rows), {
+                    (1, 'x', 1, 10), (None, 'y', None, None),
+                    (None, None, None, 20), (None, None, 3, 30)})
+
+        result = eval_ra_expr(db, 'r LBOWTIE t;')
+        self.assertEqual(set(result.rows), {(1, 'x', 10), (None, 'y', None)})
+        result = eval_ra_expr(db, 'r RBOWTIE t;')
+        self.assertEqual(set(result.rows), {(1, 'x', 10), (None, None, 20),
+                                            (3, None, 30)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import random, textwrap, unittest
+
+from relation import RelationValue, Database
+from ra_eval import PlanExecutor, eval_ra_expr, parse_ra_stmt
+from ra_plan import build_plan, explain, optimize
+
+
+def make_database(seed=0):
+    rng = random.Random(seed)
+    values = [None, 0, 1, 2, 3]
+
+    db = Database()
+    for (name, attrs) in [('r', ['a', 'b']), ('s', ['b', 'c']),
+                          ('t', ['a', 'c'])]:
+        rows = set([(rng.choice(values), rng.choice(values))
+                    for i in range(12)])
+        db.set_relvar(name, RelationValue(['%s.%s' % (name, a)
+                                           for a in attrs], rows))
+    return db
+
+
+def build(db, ra_str):
+    return build_plan(db, parse_ra_stmt(ra_str).relExpr())
+
+
+# Queries and the plans that selection pushdown turns them into.
+PUSHDOWN_PLANS = [
+    ('SIGMA[r.a = 1 and s.c > 2 and r.b = s.b](r CROSS s);', '''
+        BOWTIE[(r.b = s.b)]
+          SIGMA[(r.a = 1)]
+            r
+          SIGMA[(s.c > 2)]
+            s'''),
+    ('SIGMA[a = 1 and c = 2](r BOWTIE s);', '''
+        BOWTIE
+          SIGMA[(a = 1)]
+            r
+          SIGMA[(c = 2)]
+            s'''),
+    ('SIGMA[r.b < s.b](r BOWTIE[r.a = s.c] s);', '''
+        BOWTIE[((r.a = s.c) AND (r.b < s.b))]
+          r
+          s'''),
+
+    # Conjuncts are never pushed onto an outer join's null-padded side.
+    ('SIGMA[a = 1 and c = 2](r LBOWTIE s);', '''
+        SIGMA[(c = 2)]
+          LBOWTIE
+            SIGMA[(a = 1)]
+              r
+            s'''),
+    ('SIGMA[a = 1 and c = 2](r RBOWTIE s);', '''
+        SIGMA[(a = 1)]
+          RBOWTIE
+            r
+            SIGMA[(c = 2)]
+              s'''),
+    ('SIGMA[a = 1 and c = 2](r FBOWTIE s);', '''
+        SIGMA[((a = 1) AND (c = 2))]
+          FBOWTIE
+            r
+            s'''),
+
+    # Only conjuncts on the grouping attributes go below GROUP.
+    ('SIGMA[b = 1 and n > 1]([b]GROUP[count() AS n](r));', '''
+        SIGMA[(n > 1)]
+          [b] GROUP[count() AS n]
+            SIGMA[(b = 1)]
+              r'''),
+    ('SIGMA[a = 1](PI[a, b](r) DIVIDE PI[b](s));', '''
+        DIVIDE
+          PI[a, b]
+            SIGMA[(a = 1)]
+              r
+          PI[b]
+            s'''),
+    ('SIGMA[a = 1](PI[a, b](r) UNION PI[a, c](t));', '''
+        UNION
+          PI[a, b]
+            SIGMA[(a = 1)]
+              r
+          PI[a, c]
+            SIGMA[(a = 1)]
+              t'''),
+    ('SIGMA[a = 1](PI[a, b](r) INTERSECT PI[a, c](t));', '''
+        INTERSECT
+          PI[a, b]
+            SIGMA[(a = 1)]
+              r
+          PI[a, c]
+            SIGMA[(a = 1)]
+              t'''),
+    ('SIGMA[a = 1](PI[a, b](r) MINUS PI[a, c](t));', '''
+        MINUS
+          PI[a, b]
+            SIGMA[(a = 1)]
+              r
+          PI[a, c]
+            t'''),
+    ('SIGMA[x > 1](PI[a + 1 AS x](r));', '''
+        PI[(a + 1) AS x]
+          SIGMA[((a + 1) > 1)]
+            r'''),
+]
+
+# Queries whose optimized plans must give the same results as their plans
+# as written.
+EQUIVALENT_QUERIES = [query for (query, plan) in PUSHDOWN_PLANS] + [
+    'SIGMA[c = 2 or a = 1](r LBOWTIE s);',
+    'SIGMA[b = 1](r FBOWTIE[r.a = t.a] t);',
+    'SIGMA[t.c = 0](r RBOWTIE[r.a = t.a] t);',
+    'SIGMA[r.a = t.a and s.c = t.c](r CROSS s CROSS t);',
+    'PI[a](SIGMA[c > 0](r BOWTIE s));',
+    'SIGMA[n > 1 and b > 0]([b]GROUP[count() AS n](r));',
+    'SIGMA[a > 0](PI[a, b](r) DIVIDE PI[b](SIGMA[c = 1](s)));',
+    'SIGMA[a > 0](PI[a, b](r) UNION PI[a, c](t) MINUS PI[a, c](t));',
+    'SIGMA[a < b](r SEMIJOIN s);',
+    'SIGMA[b > 1](r ANTIJOIN s);',
+]
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_pushdown_plans(self):
+        db = make_database()
+        for (query, expected) in PUSHDOWN_PLANS:
+            with self.subTest(query=query):
+                plan = optimize(build(db, query), semi_joins=False)
+                self.assertEqual(explain(plan),
+                                 textwrap.dedent(expected).strip())
+
+    def test_results_match_unoptimized_plans(self):
+        for seed in range(5):
+            db = make_database(seed)
+            for query in EQUIVALENT_QUERIES:
+                with self.subTest(seed=seed, query=query):
+                    expected = PlanExecutor(db).execute(build(db, query))
+                    result = eval_ra_expr(db, query, cache=None)
+                    self.assertEqual(set(result.rows), set(expected.rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
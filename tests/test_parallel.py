@@ -0,0 +1,84 @@
+import random, unittest
+
+from relation import RelationValue, Database
+from ra_eval import PlanExecutor, eval_ra_expr
+from ra_index import HASH_INDEX
+from ra_parallel import ParallelExecutor
+
+
+QUERIES = [
+    'SIGMA[a > 1 OR b = null](r);',
+    'PI[a + b AS x, c](r);',
+    'DELTA(PI[a](r));',
+    '[a]GROUP[count() AS n, sum(b) AS total, min(c) AS lo](r);',
+    'GROUP[count(b) AS n, avg(b) AS mean](r);',
+    'PI[a](r) CROSS PI[d](s);',
+    'r BOWTIE s;',
+    'r LBOWTIE s;',
+    'r FBOWTIE s;',
+    'r BOWTIE[r.a < s.b] s;',
+    'r SEMIJOIN s;',
+    'r ANTIJOIN s;',
+    'PI[a, b](r) DIVIDE PI[b](SIGMA[d = 1](s));',
+    'PI[a](r) UNION PI[d](s);',
+    'PI[a](r) INTERSECT PI[d](s);',
+    'PI[a](r) MINUS PI[d](s);',
+]
+
+
+def random_rows(rng, num_rows, width):
+    values = [None, 0, 1, 2, 3, 4, 5]
+    return set([tuple([rng.choice(values) for i in range(width)])
+                for j in range(num_rows)])
+
+
+def make_database(index=False):
+    rng = random.Random(5)
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b', 'r.c'],
+                                     random_rows(rng, 200, 3)))
+    db.set_relvar('s', RelationValue(['s.b', 's.d'],
+                                     random_rows(rng, 30, 2)))
+    if index:
+        db.create_index('s', ['s.b'], HASH_INDEX)
+
+    return db
+
+
+class ParallelExecutorTest(unittest.TestCase):
+    def check_queries(self, db):
+        # Every operator is large enough to be partitioned.
+        executor = ParallelExecutor(db, workers=3, min_partition_rows=1)
+        try:
+            for q in QUERIES:
+                with self.subTest(query=q):
+                    expected = eval_ra_expr(db, q, cache=None,
+                                            executor=PlanExecutor(db))
+                    result = eval_ra_expr(db, q, cache=None,
+                                          executor=executor)
+                    self.assertEqual(result.get_attrs(),
+                                     expected.get_attrs())
+                    self.assertEqual(result.rows, expected.rows)
+
+            self.assertIsNotNone(executor.pool)
+        finally:
+            executor.close()
+
+    def test_matches_serial_execution(self):
+        self.check_queries(make_database())
+
+    def test_index_joins(self):
+        self.check_queries(make_database(index=True))
+
+    def test_one_worker(self):
+        db = make_database()
+        with ParallelExecutor(db, workers=1) as executor:
+            result = eval_ra_expr(db, 'r BOWTIE s;', cache=None,
+                                  executor=executor)
+            self.assertIsNone(executor.pool)
+
+        self.assertEqual(result.rows, eval_ra_expr(db, 'r BOWTIE s;').rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
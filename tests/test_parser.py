@@ -0,0 +1,128 @@
+import glob, os, unittest
+
+import parser
+from parser import UnderlineListener, parse_stmts
+from pset import iter_problems, PartType
+from ra_fastparse import ParseError, parse_relstmts
+
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+
+# Statements that exercise the precedence of the operators, semi-joins and
+# anti-joins, and NOT and unary minus.
+VALID_STATEMENTS = [
+    'a <- r UNION s MINUS t INTERSECT u;',
+    'r BOWTIE s CROSS t TIMES u DIVIDE v;',
+    'r UNION s BOWTIE t;',
+    'r UNION (s MINUS t);',
+    '((r));',
+    'r SEMIJOIN s ANTIJOIN t UNION u;',
+    'r SEMIJOIN[r.a = s.a] s;',
+    'r ANTIJOIN[a < b and not c] s LBOWTIE t;',
+    'DELTA(PI[a](r) RBOWTIE s);',
+    'RHO[s(x, y)](r FBOWTIE[r.a != s.b || r.c <> 2] s);',
+    'SIGMA[not a = 1 and b or c > -2](r);',
+    'SIGMA[-a * -3 + 4 - -5 / 2 > - (a + b)](r);',
+    'SIGMA[NOT NOT a OR NOT (b AND c)](r);',
+    'SIGMA[a = "x" && b == 3.0](r) DIVIDE PI[b](s);',
+    'PI[a + -1 AS x, -a, -(a), - 1.5](r);',
+    '[a, b + 1]GROUP[count() AS n, sum(-c), max(c) - min(c) AS spread](r);',
+    'GROUP[count_distinct(a)](r);',
+    '{(1, "a", null, true, FALSE), (-2, "b", -1.5, false, true)};',
+    '{};',
+    'Sch = (a, b, c);',
+    'r(x, y) <- {(1, 2)};',
+]
+
+# Statements with syntax errors, including reserved words used as names.
+INVALID_STATEMENTS = [
+    '[]GROUP[count()](r);',
+    '[a]GROUP[count(*)](r);',
+    'GROUP[](r);',
+    'sigma <- r;',
+    'SIGMA[a](pi);',
+    'r(union) <- s;',
+    'PI[a AS group](r);',
+    'SIGMA[a > 5](r)',
+    'SIGMA[a > > 5](r);',
+    'SIGMA[a -1 = 0](r);',
+    'PI[](r);',
+    'PI[a,](r);',
+    'RHO[x(a, b)(r);',
+    'r BOWTIE[] s;',
+    'r UNION;',
+    'r SEMIJOIN;',
+    'r s;',
+    'r <- ;',
+    'DELTA r;',
+    '{(a)};',
+    'Sch = ();',
+]
+
+
+# Returns the syntax errors that the ANTLR parser reports for the text.
+def antlr_errors(text):
+    error_listener = UnderlineListener()
+    antlr_parser = parser.parse_str(text)
+    antlr_parser.removeErrorListeners()
+    antlr_parser.addErrorListener(error_listener)
+    antlr_parser.relStmts()
+    return error_listener.errors
+
+
+def fast_parser_accepts(text):
+    try:
+        parse_relstmts(text)
+        return True
+    except ParseError:
+        return False
+
+
+def example_answers():
+    for filename in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.txt'))):
+        for (problem, parts) in iter_problems(filename):
+            for (part_type, lines) in parts:
+                if part_type == PartType.ANSWER:
+                    yield (os.path.basename(filename), problem,
+                           '\n'.join(lines))
+
+
+class ParserTest(unittest.TestCase):
+    def setUp(self):
+        self.front_end = parser.get_front_end()
+        parser.set_front_end('check')
+
+    def tearDown(self):
+        parser.set_front_end(self.front_end)
+
+    # In check mode, parse_stmts() raises a ValueError if the fast parser
+    # builds a different parse tree than ANTLR.
+    def check_statement(self, text):
+        error_listener = UnderlineListener()
+        parse_stmts(text, error_listener)
+        self.assertEqual(fast_parser_accepts(text), not error_listener.errors)
+        return error_listener.errors
+
+    def test_examples(self):
+        answers = list(example_answers())
+        self.assertTrue(answers)
+        for (filename, problem, text) in answers:
+            with self.subTest(filename=filename, problem=problem):
+                self.check_statement(text)
+
+    def test_valid_statements(self):
+        for text in VALID_STATEMENTS:
+            with self.subTest(text=text):
+                self.assertEqual(self.check_statement(text), [])
+
+    def test_invalid_statements(self):
+        for text in INVALID_STATEMENTS:
+            with self.subTest(text=text):
+                self.assertNotEqual(antlr_errors(text), [])
+                self.assertFalse(fast_parser_accepts(text))
+                self.assertNotEqual(self.check_statement(text), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import contextlib, io, os, re, tempfile, unittest
+
+from pset import PartType, index_problem_file, iter_problems, \
+    load_problem_file
+from pset_checker import check_problem_file
+from pset_formatter import format_problem_file
+from ra2html import format_relational_algebra
+
+
+PSET = '''\
+-- Header comment.
+Sch = (a, b);
+
+-- [Problem 3]
+
+-- Third.
+r BOWTIE s;
+PI[a](r);
+
+-- [Problem 1]
+
+SIGMA[a > 1](r);
+
+-- More about the first.
+
+-- [Problem 10]
+
+-- Tenth, with a syntax error.
+PI[a(r);
+
+-- [Problem 2]
+'''
+
+
+# Splits HTML from the formatter into the part before the first problem, and
+# the text of each problem keyed by its ID.
+def split_html(html):
+    pieces = re.split(r"(?=<h2 id=')", html)
+    problems = {}
+    for piece in pieces[1:]:
+        pid = re.match(r"<h2 id='([^']*)'>", piece).group(1)
+        problems[pid] = piece.replace('</body>\n</html>\n', '')
+
+    return (pieces[0], problems)
+
+
+# Splits output from the checker into the text of each problem.
+def split_check(output):
+    return dict([(block.split('\n', 1)[0], block)
+                 for block in output.strip('\n').split('\n\n')])
+
+
+class PsetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for (name, newline) in [('unix.txt', '\n'), ('dos.txt', '\r\n')]:
+            path = os.path.join(self.tmp.name, name)
+            with open(path, 'w', newline=newline) as f:
+                f.write(PSET)
+
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_iter_problems(self):
+        for filename in self.files:
+            with self.subTest(filename=filename):
+                in_order = list(iter_problems(filename))
+                self.assertEqual([pid for (pid, parts) in in_order],
+                    [None, 'Problem 3', 'Problem 1', 'Problem 10',
+                     'Problem 2'])
+                self.assertEqual(in_order[0][1],
+                    [(PartType.COMMENT, ['Header comment.']),
+                     (PartType.ANSWER, ['Sch = (a, b);'])])
+                self.assertEqual(in_order[2][1],
+                    [(PartType.ANSWER, ['SIGMA[a > 1](r);']),
+                     (PartType.COMMENT, ['More about the first.'])])
+
+                # Reading the problems from their positions in the file
+                # gives the same parts.
+                in_sorted_order = list(iter_problems(filename, sort=True))
+                self.assertEqual([pid for (pid, parts) in in_sorted_order],
+                    [None] + sorted([pid for (pid, parts) in in_order[1:]]))
+                self.assertEqual(dict(in_sorted_order), dict(in_order))
+                self.assertEqual(load_problem_file(filename), dict(in_order))
+
+                selected = list(iter_problems(filename,
+                                              ['Problem 10', 'Problem 4']))
+                self.assertEqual(selected, [in_order[0],
+                                            ('Problem 10', in_order[3][1]),
+                                            ('Problem 4', [])])
+
+    def test_duplicate_problems(self):
+        filename = os.path.join(self.tmp.name, 'dup.txt')
+        with open(filename, 'w') as f:
+            f.write(PSET + '\n-- [Problem 1]\n\nr;\n')
+
+        with self.assertRaises(ValueError):
+            index_problem_file(filename)
+
+        for sort in [False, True]:
+            with self.subTest(sort=sort):
+                with self.assertRaises(ValueError):
+                    list(iter_problems(filename, sort=sort))
+
+    def test_format_file_order(self):
+        # The formatter can't format answers with syntax errors.
+        for filename in self.files:
+            with open(filename, newline='') as f:
+                text = f.read()
+
+            with open(filename, 'w', newline='') as f:
+                f.write(text.replace('PI[a(r);', 'PI[a](r);'))
+
+        for filename in self.files:
+            with self.subTest(filename=filename):
+                output = {}
+                for sort in [False, True]:
+                    out = io.StringIO()
+                    with contextlib.redirect_stdout(io.StringIO()) as ids:
+                        format_problem_file(filename,
+                                            format_relational_algebra, out,
+                                            sort=sort)
+                    output[sort] = (out.getvalue(), ids.getvalue())
+
+                # The same problems are written either way, only in a
+                # different order.
+                (streamed, streamed_ids) = output[False]
+                (in_sorted_order, sorted_ids) = output[True]
+                self.assertEqual(streamed_ids,
+                    'Problem 3\nProblem 1\nProblem 10\nProblem 2\n')
+                self.assertEqual(sorted_ids,
+                    'Problem 1\nProblem 10\nProblem 2\nProblem 3\n')
+
+                self.assertEqual(split_html(streamed),
+                                 split_html(in_sorted_order))
+                self.assertEqual(sorted(streamed), sorted(in_sorted_order))
+                self.assertTrue(streamed.endswith('</body>\n</html>\n'))
+                self.assertIn('Header comment.', split_html(streamed)[0])
+
+    def test_check_file_order(self):
+        for filename in self.files:
+            with self.subTest(filename=filename):
+                output = {}
+                for sort in [False, True]:
+                    out = io.StringIO()
+                    counts = check_problem_file(filename, out, sort=sort)
+                    self.assertEqual(counts, (4, 1))
+                    output[sort] = out.getvalue()
+
+                self.assertEqual(split_check(output[False]),
+                                 split_check(output[True]))
+                self.assertLess(output[False].index('Problem 3'),
+                                output[False].index('Problem 1'))
+                self.assertLess(output[True].index('Problem 1'),
+                                output[True].index('Problem 3'))
+                self.assertIn('ERRORS ENCOUNTERED',
+                              split_check(output[True])['Problem 10'])
+
+
+if __name__ == '__main__':
+    unittest.main()
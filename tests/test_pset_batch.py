@@ -0,0 +1,159 @@
+import contextlib, io, os, tempfile, unittest
+
+import ra2html_app
+from pset_batch import CHECK, FORMAT, find_pset_files, process_files, \
+    run_batch
+
+
+GOOD = '''\
+-- [Problem 2]
+
+r BOWTIE s;
+
+-- [Problem 1]
+
+-- A comment.
+PI[a](r);
+'''
+
+BAD_SYNTAX = '''\
+-- [Problem 1]
+
+PI[a](r;
+
+-- [Problem 2]
+
+SIGMA[a > 1](r);
+'''
+
+DUPLICATE = '''\
+-- [Problem 1]
+
+r;
+
+-- [Problem 1]
+
+s;
+'''
+
+
+class PsetBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        os.makedirs(os.path.join(self.dir, 'sub', 'deeper'))
+
+        self.files = {}
+        for (name, text) in [('good.txt', GOOD),
+                             ('sub/bad.txt', BAD_SYNTAX),
+                             ('sub/deeper/dup.txt', DUPLICATE),
+                             ('sub/notes.md', GOOD)]:
+            path = os.path.join(self.dir, name)
+            with open(path, 'w') as f:
+                f.write(text)
+
+            self.files[name] = path
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_find_pset_files(self):
+        expected = sorted([self.files['good.txt'], self.files['sub/bad.txt'],
+                           self.files['sub/deeper/dup.txt']])
+        self.assertEqual(find_pset_files([self.dir]), expected)
+
+        # Files are only listed once, whichever way they are named.
+        self.assertEqual(find_pset_files([self.path('sub'),
+                                          self.path('**/*.txt'),
+                                          self.files['good.txt']]),
+                         expected)
+
+        # Files that are named don't have to match the pattern.
+        self.assertEqual(find_pset_files([self.files['sub/notes.md']]),
+                         [self.files['sub/notes.md']])
+        self.assertEqual(find_pset_files([self.path('sub')], '*.md'),
+                         [self.files['sub/notes.md']])
+
+        for paths in [[self.path('*.csv')], [self.path('missing.txt')]]:
+            with self.subTest(paths=paths):
+                with self.assertRaises(ValueError):
+                    find_pset_files(paths)
+
+    def test_process_files(self):
+        filenames = find_pset_files([self.dir])
+        results = process_files(filenames, CHECK, workers=1)
+        self.assertEqual([r.filename for r in results], filenames)
+
+        by_name = dict([(r.filename, r) for r in results])
+        good = by_name[self.files['good.txt']]
+        self.assertIsNone(good.error)
+        self.assertEqual((good.answers, good.answers_with_errors), (2, 0))
+        self.assertLess(good.output.index('Problem 1'),
+                        good.output.index('Problem 2'))
+
+        bad = by_name[self.files['sub/bad.txt']]
+        self.assertIsNone(bad.error)
+        self.assertEqual((bad.answers, bad.answers_with_errors), (2, 1))
+        self.assertIn('ERRORS ENCOUNTERED', bad.output)
+
+        dup = by_name[self.files['sub/deeper/dup.txt']]
+        self.assertIn('Problem 1 already appeared earlier', dup.error)
+
+        # Worker processes give the same results, in the same order.
+        parallel = process_files(filenames, CHECK, workers=2)
+        for (r, p) in zip(results, parallel):
+            self.assertEqual((p.filename, p.output, p.error, p.answers,
+                              p.answers_with_errors),
+                             (r.filename, r.output, r.error, r.answers,
+                              r.answers_with_errors))
+
+        # Without sorting, the problems are checked in file order.
+        unsorted = process_files([self.files['good.txt']], CHECK, sort=False)
+        output = unsorted[0].output
+        self.assertLess(output.index('Problem 2'), output.index('Problem 1'))
+
+    def test_format(self):
+        results = process_files([self.files['good.txt']], FORMAT)
+        self.assertIsNone(results[0].error)
+        with open(self.path('good.html')) as f:
+            html = f.read()
+
+        self.assertLess(html.index('Problem 1'), html.index('Problem 2'))
+
+    def test_report(self):
+        out = io.StringIO()
+        run_batch([self.dir], CHECK, workers=1, out=out)
+        report = out.getvalue()
+
+        for name in ['good.txt', 'sub/bad.txt', 'sub/deeper/dup.txt']:
+            self.assertIn('=== %s\n' % self.files[name], report)
+
+        summary = report[report.index('Summary\n'):]
+        self.assertIn('Checked 3 files', summary)
+        self.assertIn('  4 answers, 1 with errors\n', summary)
+        self.assertIn('  1 files parsed successfully, 1 with errors\n',
+                      summary)
+        self.assertIn('    %s:  1 of 2 answers\n' % self.files['sub/bad.txt'],
+                      summary)
+        self.assertIn('  1 files failed\n', summary)
+        self.assertIn('    %s:  ValueError' % self.files['sub/deeper/dup.txt'],
+                      summary)
+
+    def test_exit_status(self):
+        report = self.path('report.txt')
+        for (args, status) in [([self.files['good.txt'],
+                                 self.files['sub/bad.txt']], 0),
+                               ([self.dir], 1),
+                               ([self.path('*.csv'), self.dir], 1)]:
+            with self.subTest(args=args):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertEqual(ra2html_app.run(
+                        ['-n', '-j', '1', '--report', report] + args),
+                        status)
+
+
+if __name__ == '__main__':
+    unittest.main()
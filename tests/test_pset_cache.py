@@ -0,0 +1,115 @@
+import json, os, tempfile, time, unittest
+from unittest import mock
+
+import pset_cache
+from pset_cache import ResultCache
+from pset_batch import CHECK, process_files
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compute(self, text):
+        self.calls.append(text)
+        return [text.upper()]
+
+    def test_hits_and_misses(self):
+        cache = ResultCache(self.dir)
+        self.assertEqual(cache.lookup('check', 'r;', self.compute), ['R;'])
+        self.assertEqual(cache.lookup('check', 'r;', self.compute), ['R;'])
+        self.assertEqual(cache.lookup('check', 's;', self.compute), ['S;'])
+        self.assertEqual(self.calls, ['r;', 's;'])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # The kind of result is part of its key.
+        self.assertEqual(cache.cached('html', self.compute)('r;'), ['R;'])
+        self.assertEqual(cache.misses, 3)
+
+        # Results are shared with other caches in the same directory.
+        other = ResultCache(self.dir)
+        self.assertEqual(other.lookup('check', 's;', self.compute), ['S;'])
+        self.assertEqual((other.hits, other.misses), (1, 0))
+        self.assertEqual(len(self.calls), 3)
+
+        other.clear()
+        self.assertEqual(other.lookup('check', 's;', self.compute), ['S;'])
+        self.assertEqual(other.misses, 1)
+
+    def test_damaged_result(self):
+        cache = ResultCache(self.dir)
+        cache.lookup('check', 'r;', self.compute)
+        with open(cache._path('check', 'r;'), 'w') as f:
+            f.write('{"trunc')
+
+        self.assertEqual(cache.lookup('check', 'r;', self.compute), ['R;'])
+        self.assertEqual(self.calls, ['r;', 'r;'])
+        with open(cache._path('check', 'r;')) as f:
+            self.assertEqual(json.load(f), ['R;'])
+
+    def test_code_hash(self):
+        code_hash = pset_cache._get_code_hash()
+        with mock.patch.object(pset_cache, '_code_hash', None):
+            self.assertEqual(pset_cache._get_code_hash(), code_hash)
+
+        with mock.patch.object(pset_cache, '_code_hash', None), \
+             mock.patch.object(pset_cache, 'SOURCE_MODULES',
+                               pset_cache.SOURCE_MODULES[:-1]):
+            self.assertNotEqual(pset_cache._get_code_hash(), code_hash)
+
+        # Results computed by other code aren't used.
+        cache = ResultCache(self.dir)
+        cache.lookup('check', 'r;', self.compute)
+        with mock.patch.object(pset_cache, '_code_hash', 'changed'):
+            cache.lookup('check', 'r;', self.compute)
+
+        cache.lookup('check', 'r;', self.compute)
+        self.assertEqual(self.calls, ['r;', 'r;'])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_eviction(self):
+        # Each result is 11 bytes, so the cache holds 5 of them, and is cut
+        # down to 4 when it grows past that.
+        cache = ResultCache(self.dir, max_bytes=55)
+        texts = ['text %02d' % i for i in range(5)]
+        now = time.time()
+        for (i, text) in enumerate(texts):
+            cache.lookup('check', text, self.compute)
+            path = cache._path('check', text)
+            os.utime(path, (now - 100 + i, now - 100 + i))
+
+        self.assertEqual(os.path.getsize(path), 11)
+        self.assertEqual(cache.evictions, 0)
+
+        # Reading the oldest result makes it the most recently used.
+        cache.lookup('check', texts[0], self.compute)
+        cache.lookup('check', 'text 05', self.compute)
+        self.assertEqual(cache.evictions, 2)
+        self.assertEqual(cache.size, 44)
+
+        remaining = [t for t in texts + ['text 05']
+                     if os.path.exists(cache._path('check', t))]
+        self.assertEqual(remaining, [texts[0]] + texts[3:] + ['text 05'])
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_batch(self):
+        filename = os.path.join(self.dir, 'pset.txt')
+        with open(filename, 'w') as f:
+            f.write('-- [Problem 1]\n\nr;\n\n-- [Problem 2]\n\nPI[a](r;\n')
+
+        cache = ResultCache(os.path.join(self.dir, 'cache'))
+        first = process_files([filename], CHECK, workers=1, cache=cache)[0]
+        second = process_files([filename], CHECK, workers=1, cache=cache)[0]
+        self.assertEqual((first.cache_hits, first.cache_misses), (0, 2))
+        self.assertEqual((second.cache_hits, second.cache_misses), (2, 0))
+        self.assertEqual(second.output, first.output)
+        self.assertEqual(second.answers_with_errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
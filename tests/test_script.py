@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+from relation import RelationValue, Database
+from ra_eval import PlanExecutor, Script, eval_ra_expr, eval_ra_script, \
+    parse_ra_stmts
+
+
+def make_database():
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                     {(1, 0), (2, 0), (3, 1), (4, 2)}))
+    db.set_relvar('s', RelationValue(['s.b', 's.c'],
+                                     {(0, 'x'), (1, 'y'), (3, 'z')}))
+    return db
+
+
+SCRIPTS = [
+    'PI[a, c](r BOWTIE s); [c]GROUP[count() AS n](PI[a, c](r BOWTIE s));',
+    'u <- PI[a, c](r BOWTIE s); ' \
+    'r <- SIGMA[a > 2](r); ' \
+    'PI[a, c](r BOWTIE s) UNION u;',
+    'v(x, y) <- PI[a, c](r BOWTIE s); SIGMA[x > 1](v) MINUS v;',
+    'Sch = (a, b); [b]GROUP[count() AS n](r BOWTIE s); ' \
+    'SIGMA[n > 1]([b]GROUP[count() AS n](r BOWTIE s));',
+]
+
+
+class ScriptTest(unittest.TestCase):
+    def test_results_match_statements(self):
+        for script in SCRIPTS:
+            with self.subTest(script=script):
+                db = make_database()
+                results = eval_ra_script(db, script)
+
+                db = make_database()
+                stmts = [s.strip() + ';' for s in script.split(';')[:-1]]
+                for (stmt, result) in zip(stmts, results):
+                    if stmt.startswith('Sch'):
+                        self.assertIsNone(result)
+                    else:
+                        self.assertEqual(result.rows,
+                                         eval_ra_expr(db, stmt).rows)
+
+    def test_shared_subexpressions(self):
+        db = make_database()
+        script = Script(db, parse_ra_stmts(SCRIPTS[0]))
+        self.assertEqual(len(set(script.shared.values())), 1)
+
+        # The join is only computed once, and its result is released after
+        # its last use.
+        with mock.patch.object(PlanExecutor, 'visitJoinNode', autospec=True,
+                               side_effect=PlanExecutor.visitJoinNode) as m:
+            results = script.run()
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(results[1].rows, {('x', 2), ('y', 1)})
+        self.assertEqual(script.last_uses,
+                         [[], list(set(script.shared.values()))])
+
+    def test_assignments_make_new_versions(self):
+        # r is assigned between the two joins, so they aren't shared.
+        db = make_database()
+        script = Script(db, parse_ra_stmts(SCRIPTS[1]))
+        self.assertEqual(script.shared, {})
+
+        results = script.run()
+        self.assertEqual(results[2].rows, {(1, 'x'), (2, 'x'), (3, 'y')})
+        self.assertEqual(db.get_relvar('r').rows, {(3, 1), (4, 2)})
+
+    def test_errors_are_raised_when_run(self):
+        db = make_database()
+        script = Script(db, parse_ra_stmts('u <- r; PI[d](r); u <- s;'))
+        with self.assertRaises(ValueError):
+            script.run()
+
+        # The statements before the error were run.
+        self.assertEqual(db.get_relvar('u').rows, db.get_relvar('r').rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from relation import RelationValue, Database
+from ra_bag import BagExecutor
+from ra_eval import eval_ra_expr
+from ra_index import HASH_INDEX
+
+
+# r's rows match several rows of t each, on t.a and the condition on r.b.
+def make_database():
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'], {(1, 1), (2, 2)}))
+    db.set_relvar('t', RelationValue(['t.a', 't.c'],
+                                     {(1, 5), (1, 6), (1, 7), (2, 0)}))
+    return db
+
+
+class IndexSemiJoinTest(unittest.TestCase):
+    SEMI_JOIN = 'r SEMIJOIN[r.a = t.a and r.b < t.c] t'
+
+    def test_index_on_left_input(self):
+        for indexed in [None, 'r', 't']:
+            with self.subTest(indexed=indexed):
+                db = make_database()
+                if indexed is not None:
+                    db.create_index(indexed, [indexed + '.a'], HASH_INDEX)
+
+                result = eval_ra_expr(db, self.SEMI_JOIN + ';')
+                self.assertEqual(set(result.rows), {(1, 1)})
+
+                result = eval_ra_expr(db, 'GROUP[count() AS n](%s);' % \
+                                      self.SEMI_JOIN)
+                self.assertEqual(set(result.rows), {(1,)})
+
+                # A semi-join keeps each left row once, however many right
+                # rows it matches.
+                result = eval_ra_expr(db, self.SEMI_JOIN + ';',
+                                      executor=BagExecutor(db))
+                self.assertEqual(result.counts, {(1, 1): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
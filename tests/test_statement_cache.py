@@ -0,0 +1,117 @@
+import unittest
+
+from relation import RelationValue, Database
+from ra_eval import StatementCache, eval_ra_expr
+from ra_index import HASH_INDEX
+
+
+def make_database(num_rows=4):
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                     set([(i, i % 2) for i in range(num_rows)])))
+    db.set_relvar('s', RelationValue(['s.b', 's.c'], {(0, 'x'), (1, 'y')}))
+    return db
+
+
+class StatementCacheTest(unittest.TestCase):
+    def test_empty_constant_relation(self):
+        db = Database()
+        cache = StatementCache()
+        for c in [None, cache, cache]:
+            result = eval_ra_expr(db, '{};', cache=c)
+            self.assertEqual(result.get_attrs(), [])
+            self.assertEqual(list(result.rows), [])
+
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_hits_and_misses(self):
+        db = make_database()
+        cache = StatementCache()
+        eval_ra_expr(db, 'SIGMA[a > 1](r);', cache)
+        eval_ra_expr(db, ' SIGMA [a  >\n1] ( r ) ;', cache)
+        eval_ra_expr(db, 'SIGMA[a > 2](r);', cache)
+
+        # Whitespace in string literals is significant.
+        eval_ra_expr(db, 'SIGMA[c = "x"](s);', cache)
+        result = eval_ra_expr(db, 'SIGMA[c = "x "](s);', cache)
+        self.assertEqual(list(result.rows), [])
+
+        self.assertEqual(cache.stats(), {'entries' : 4, 'max_entries' : 512,
+                                         'hits' : 1, 'misses' : 4,
+                                         'evictions' : 0})
+
+    def test_lru_eviction(self):
+        cache = StatementCache(max_entries=2)
+        cache.lookup('r;')
+        cache.lookup('s;')
+        cache.lookup('r;')
+        cache.lookup('t;')
+
+        # s was the least recently used statement.
+        self.assertEqual(list(cache.entries.keys()), ['r;', 't;'])
+        self.assertEqual(cache.evictions, 1)
+
+        cache.lookup('s;')
+        self.assertEqual(list(cache.entries.keys()), ['t;', 's;'])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (1, 4, 2))
+
+        cache.clear()
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+class ReplanTest(unittest.TestCase):
+    QUERY = 'PI[a, c](SIGMA[b = 1](r) BOWTIE s);'
+
+    def setUp(self):
+        self.db = make_database()
+        self.stmt = StatementCache().lookup(self.QUERY)
+        self.plan = self.get_plan()
+
+    def get_plan(self, semi_joins=True):
+        return self.stmt.get_plan(self.db, self.stmt.parse_tree.relExpr(),
+                                  semi_joins)
+
+    def test_plan_is_reused(self):
+        self.assertIs(self.get_plan(), self.plan)
+
+        # Small changes to a relvar's size keep the plan.
+        self.db.update_relvar('r', inserted=[(10, 1)])
+        self.assertIs(self.get_plan(), self.plan)
+
+    def test_replan_for_index(self):
+        self.db.create_index('r', ['r.b'], HASH_INDEX)
+        plan = self.get_plan()
+        self.assertIsNot(plan, self.plan)
+        self.assertIs(self.get_plan(), plan)
+
+        result = eval_ra_expr(self.db, self.QUERY)
+        self.assertEqual(set(result.rows), {(1, 'y'), (3, 'y')})
+
+    def test_replan_for_attributes(self):
+        self.db.set_relvar('r', RelationValue(['r.b', 'r.a'],
+                                              {(1, 5), (0, 6)}))
+        self.assertIsNot(self.get_plan(), self.plan)
+
+        result = eval_ra_expr(self.db, self.QUERY)
+        self.assertEqual(set(result.rows), {(5, 'y')})
+
+    def test_replan_for_size(self):
+        self.db.update_relvar('r', inserted=[(i, 1) for i in range(10, 14)])
+        self.assertIs(self.get_plan(), self.plan)
+
+        self.db.update_relvar('r', inserted=[(i, 1) for i in range(20, 40)])
+        plan = self.get_plan()
+        self.assertIsNot(plan, self.plan)
+
+        self.db.update_relvar('r', deleted=[(i, 1) for i in range(20, 40)])
+        self.assertIsNot(self.get_plan(), plan)
+
+    def test_replan_for_semi_joins(self):
+        plan = self.get_plan(semi_joins=False)
+        self.assertIsNot(plan, self.plan)
+        self.assertIs(self.get_plan(semi_joins=False), plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
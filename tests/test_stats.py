@@ -0,0 +1,191 @@
+import random, textwrap, unittest
+
+from relation import RelationValue, Database
+from ra_eval import PlanExecutor, describe_relvar_stats, parse_ra_stmt
+from ra_plan import CardinalityEstimator, build_plan, explain, optimize
+from ra_stats import AttrStats
+
+
+def make_database():
+    db = Database()
+    db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                     {(i, i % 2) for i in range(200)}))
+    db.set_relvar('s', RelationValue(['s.b', 's.c'],
+                                     {(i % 2, i) for i in range(200)}))
+    db.set_relvar('t', RelationValue(['t.c', 't.d'],
+                                     {(i, i) for i in range(3)}))
+    return db
+
+
+def build(db, ra_str):
+    return build_plan(db, parse_ra_stmt(ra_str).relExpr())
+
+
+class AttrStatsTest(unittest.TestCase):
+    def test_counts(self):
+        stats = AttrStats([1, 2, 2, None, 3, None])
+        self.assertEqual(stats.distinct, 3)
+        self.assertEqual(stats.num_values, 4)
+        self.assertEqual(stats.null_count, 2)
+        self.assertEqual((stats.min, stats.max), (1, 3))
+
+    def test_unordered_values(self):
+        stats = AttrStats([1, 'a', None])
+        self.assertIsNone(stats.histogram())
+        self.assertIsNone(stats.min)
+        self.assertIsNone(stats.fraction('<', 1))
+        self.assertEqual(stats.fraction('==', 'a'), 0.5)
+
+    def test_fractions(self):
+        stats = AttrStats(range(1000))
+        for (op, value, expected) in [('==', 5, 0.001), ('!=', 5, 0.999),
+                                      ('<', 250, 0.25), ('>=', 250, 0.75),
+                                      ('<', -1, 0.0), ('>', 2000, 0.0)]:
+            with self.subTest(op=op, value=value):
+                self.assertAlmostEqual(stats.fraction(op, value), expected,
+                                       delta=0.01)
+
+    def test_update_matches_recomputation(self):
+        rng = random.Random(1)
+        values = [rng.choice([None, 0, 1, 2, 3, 4]) for i in range(50)]
+        stats = AttrStats(values)
+        for i in range(20):
+            inserted = [rng.choice([None, 0, 5, 6]) for j in range(3)]
+            deleted = rng.sample(values, 3)
+            for v in deleted:
+                values.remove(v)
+
+            values += inserted
+            stats.update(inserted, deleted)
+
+            expected = AttrStats(values)
+            self.assertEqual(stats.counts, expected.counts)
+            self.assertEqual(stats.null_count, expected.null_count)
+            self.assertEqual(stats.histogram(), expected.histogram())
+
+
+class DatabaseStatsTest(unittest.TestCase):
+    def test_stats_follow_relvar(self):
+        db = make_database()
+        stats = db.get_stats('t')
+        self.assertIs(db.get_stats('t'), stats)
+        self.assertEqual(stats.num_rows, 3)
+
+        # Inserting and deleting rows updates the statistics.
+        stats.get_attr_stats(0)
+        db.update_relvar('t', inserted={(7, None)}, deleted={(0, 0)})
+        self.assertIs(db.get_stats('t'), stats)
+        self.assertEqual(stats.num_rows, 3)
+        self.assertEqual(stats.get_attr_stats(0).counts, {1: 1, 2: 1, 7: 1})
+        self.assertEqual(stats.get_attr_stats(1).null_count, 1)
+
+        # Assigning the relvar computes them again.
+        db.set_relvar('t', RelationValue(['t.c', 't.d'], {(1, 1)}))
+        self.assertIsNot(db.get_stats('t'), stats)
+        self.assertEqual(db.get_stats('t').num_rows, 1)
+
+        with self.assertRaises(ValueError):
+            db.get_stats('u')
+
+    def test_describe(self):
+        db = make_database()
+        db.update_relvar('t', inserted={(None, 5)})
+        self.assertEqual(describe_relvar_stats(db, 't'), textwrap.dedent('''\
+            t:  4 rows
+              t.c:  3 distinct, 1 null, min 0, max 2
+              t.d:  4 distinct, 0 null, min 0, max 5'''))
+
+
+class EstimateTest(unittest.TestCase):
+    def test_estimates(self):
+        db = make_database()
+        estimator = CardinalityEstimator(db)
+        for (q, expected) in [('r;', 200),
+                              ('SIGMA[a < 50](r);', 50),
+                              ('SIGMA[b = 1](r);', 100),
+                              ('SIGMA[a = null](r);', 0),
+                              ('PI[b](r);', 2),
+                              ('[b]GROUP[count() AS n](r);', 2),
+                              ('r BOWTIE s;', 20000),
+                              ('s BOWTIE t;', 3),
+                              ('s LBOWTIE t;', 200),
+                              ('r SEMIJOIN s;', 200),
+                              ('s ANTIJOIN t;', 197)]:
+            with self.subTest(query=q):
+                self.assertAlmostEqual(estimator.estimate(build(db, q)).rows,
+                                       expected, delta=expected * 0.05)
+
+
+# Queries and the join orders that the optimizer chooses for them.
+JOIN_ORDERS = [
+    ('(r BOWTIE s) BOWTIE t;', '''
+        BOWTIE
+          r
+          BOWTIE
+            s
+            t'''),
+    ('r BOWTIE[r.b = s.b] s BOWTIE[s.c = t.c] t;', '''
+        BOWTIE[(r.b = s.b)]
+          r
+          BOWTIE[(s.c = t.c)]
+            s
+            t'''),
+    ('(r CROSS t) BOWTIE[r.b = s.b AND s.c = t.c] s;', '''
+        PI[r.a, r.b, t.c, t.d, s.b, s.c]
+          BOWTIE[(r.b = s.b)]
+            r
+            BOWTIE[(s.c = t.c)]
+              s
+              t'''),
+
+    # Already the best order.
+    ('r BOWTIE (s BOWTIE t);', '''
+        BOWTIE
+          r
+          BOWTIE
+            s
+            t'''),
+]
+
+
+class JoinOrderTest(unittest.TestCase):
+    def test_join_orders(self):
+        db = make_database()
+        for (q, expected) in JOIN_ORDERS:
+            with self.subTest(query=q):
+                plan = build(db, q)
+                optimized = optimize(plan, db)
+                self.assertEqual(explain(optimized),
+                                 textwrap.dedent(expected).strip('\n'))
+
+                expected = PlanExecutor(db).execute(plan)
+                result = PlanExecutor(db).execute(optimized)
+                self.assertEqual(result.get_attrs(), expected.get_attrs())
+                self.assertEqual(result.rows, expected.rows)
+
+    def test_order_follows_stats(self):
+        # Once t is large and only a few rows of r join with s, r is joined
+        # with s first.
+        db = make_database()
+        db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                         {(i, i % 50) for i in range(200)}))
+        db.set_relvar('s', RelationValue(['s.b', 's.c'], {(0, 0), (1, 1)}))
+        db.set_relvar('t', RelationValue(['t.c', 't.d'],
+                                         {(i % 2, i) for i in range(200)}))
+        plan = build(db, 'r BOWTIE (s BOWTIE t);')
+        optimized = optimize(plan, db)
+        self.assertEqual(explain(optimized), textwrap.dedent('''\
+            PI[r.a, r.b, t.c AS s.c, t.d]
+              BOWTIE
+                t
+                BOWTIE
+                  r
+                  s''').strip('\n'))
+
+        expected = PlanExecutor(db).execute(plan)
+        result = PlanExecutor(db).execute(optimized)
+        self.assertEqual(result.get_attrs(), expected.get_attrs())
+        self.assertEqual(result.rows, expected.rows)
+
+if __name__ == '__main__':
+    unittest.main()
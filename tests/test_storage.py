@@ -0,0 +1,125 @@
+import os, tempfile, unittest
+
+from relation import RelationValue
+from ra_columnar import ColumnarRelationValue, numpy
+from ra_storage import DiskDatabase, _read_header, decode_relation, \
+    encode_relation
+
+
+# Columns of each storage type, with nulls, and the type they are stored as.
+COLUMNS = [
+    ('int64', [1, None, -5, 2 ** 63 - 1]),
+    ('float64', [1.5, None, -0.25, 1e300]),
+    ('bool', [True, None, False, False]),
+    ('str', ['abc', None, '', 'déjà vu']),
+    ('int64', [None, None, None, None]),
+
+    # Values that the other types can't store are pickled.
+    ('object', [1, 'x', None, 2.5]),
+    ('object', [2 ** 70, None, 1, 2]),
+    ('object', ['a\0', None, 'b', 'c\0\0']),
+]
+
+
+def column_types(encoded):
+    (header, data_start) = _read_header(encoded, 'test')
+    return [c['type'] for c in header['columns']]
+
+
+class EncodingTest(unittest.TestCase):
+    def check_round_trip(self, relval):
+        encoded = encode_relation(relval)
+        decoded = decode_relation(encoded)
+        self.assertEqual(decoded.get_attrs(), relval.get_attrs())
+        self.assertEqual(decoded.rows, relval.rows)
+
+        if numpy is not None:
+            columnar = decode_relation(encoded, columnar=True)
+            self.assertIsInstance(columnar, ColumnarRelationValue)
+            self.assertEqual(columnar.num_rows(), relval.num_rows())
+            self.assertEqual(columnar.rows, relval.rows)
+
+            # A columnar relation-value is encoded from its arrays.
+            self.assertEqual(decode_relation(encode_relation(columnar)).rows,
+                             relval.rows)
+
+        return encoded
+
+    def test_column_types(self):
+        for (col_type, values) in COLUMNS:
+            with self.subTest(values=values):
+                relval = RelationValue(['r.a', 'r.i'],
+                                       zip(values, range(len(values))))
+                encoded = self.check_round_trip(relval)
+                self.assertEqual(column_types(encoded), [col_type, 'int64'])
+
+    def test_empty_strings_are_not_null(self):
+        relval = RelationValue(['r.a'], {('',), (None,)})
+        decoded = decode_relation(self.check_round_trip(relval))
+        self.assertEqual(decoded.rows, {('',), (None,)})
+
+    def test_all_columns(self):
+        relval = RelationValue(['r.c%d' % i for i in range(len(COLUMNS))],
+                               zip(*[values for (t, values) in COLUMNS]))
+        encoded = self.check_round_trip(relval)
+        self.assertEqual(column_types(encoded), [t for (t, v) in COLUMNS])
+
+    def test_empty_relations(self):
+        self.check_round_trip(RelationValue(['r.a', 'r.b'], []))
+        self.check_round_trip(RelationValue([], []))
+        self.check_round_trip(RelationValue([], [()]))
+
+    def test_not_a_relation_file(self):
+        with self.assertRaises(ValueError):
+            decode_relation(b'NOTAFILE' + bytes(16))
+
+
+class DiskDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_reopen(self):
+        db = DiskDatabase(self.directory)
+        db.set_relvar('r', RelationValue(['r.a', 'r.b'],
+                                         {(1, 'x'), (2, None)}))
+        db.set_relvar('s', RelationValue(['s.c'], {(1.5,)}))
+
+        db = DiskDatabase(self.directory)
+        self.assertEqual(sorted(db.get_relvar_names()), ['r', 's'])
+        self.assertEqual(db.get_relvar('r').get_attrs(), ['r.a', 'r.b'])
+        self.assertEqual(db.get_relvar('r').rows, {(1, 'x'), (2, None)})
+        self.assertEqual(db.get_relvar('s').rows, {(1.5,)})
+        self.assertIsNone(db.get_relvar('t'))
+
+    def test_update_relvar(self):
+        db = DiskDatabase(self.directory)
+        db.set_relvar('r', RelationValue(['r.a'], {(1,), (2,)}))
+
+        db = DiskDatabase(self.directory)
+        db.update_relvar('r', inserted=[(3,)], deleted=[(1,)])
+        self.assertEqual(db.get_relvar('r').rows, {(2,), (3,)})
+
+        db = DiskDatabase(self.directory)
+        self.assertEqual(db.get_relvar('r').rows, {(2,), (3,)})
+
+    def test_del_relvar(self):
+        db = DiskDatabase(self.directory)
+        db.set_relvar('r', RelationValue(['r.a'], {(1,)}))
+        db.set_relvar('s', RelationValue(['s.a'], {(2,)}))
+        db.del_relvar('r')
+        self.assertFalse(os.path.exists(db.relvar_path('r')))
+        self.assertEqual(db.get_relvar_names(), ['s'])
+
+        # A relvar can be deleted without being opened first.
+        db = DiskDatabase(self.directory)
+        db.del_relvar('s')
+        self.assertEqual(db.get_relvar_names(), [])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import random, unittest
+
+from relation import RelationValue, Database
+from ra_eval import create_view, drop_view, eval_ra_expr, \
+    get_view_manager
+
+
+# View expressions over r(a, b), s(b, c) and t(a, c), covering each of the
+# delta operators, and operators whose views are recomputed instead.
+INCREMENTAL_VIEWS = [
+    'SIGMA[a > 1](r)',
+    'PI[b](r)',
+    'PI[a + b AS x](SIGMA[b != 2](r))',
+    'DELTA(PI[a](r))',
+    'PI[a](r) UNION PI[a](t)',
+    'PI[a](r) INTERSECT PI[a](t)',
+    'PI[a](r) MINUS PI[a](t)',
+    'r BOWTIE s',
+    'r BOWTIE[r.a = t.a and r.b < t.c] t',
+    'r CROSS s',
+    'PI[a, c](r BOWTIE s) MINUS t',
+    'PI[a](r) UNION {(7), (null)}',
+]
+
+RECOMPUTED_VIEWS = [
+    '[a]GROUP[count() AS n](r)',
+    'r DIVIDE PI[b](s)',
+    'r LBOWTIE s',
+    'r SEMIJOIN s',
+]
+
+
+def random_rows(rng, n):
+    values = [None, 0, 1, 2, 3]
+    return set([(rng.choice(values), rng.choice(values)) for i in range(n)])
+
+
+def make_database(rng):
+    db = Database()
+    for (name, attrs) in [('r', ['a', 'b']), ('s', ['b', 'c']),
+                          ('t', ['a', 'c'])]:
+        db.set_relvar(name, RelationValue(['%s.%s' % (name, a)
+                                           for a in attrs],
+                                          random_rows(rng, 8)))
+    return db
+
+
+class ViewTest(unittest.TestCase):
+    def check_views(self, exprs, incremental):
+        rng = random.Random(7)
+        db = make_database(rng)
+        manager = get_view_manager(db)
+        names = ['v%d' % i for i in range(len(exprs))]
+        for (name, expr) in zip(names, exprs):
+            view = create_view(db, '%s <- %s;' % (name, expr))
+            self.assertEqual(view.is_incremental(), incremental, expr)
+
+        for step in range(30):
+            name = rng.choice(['r', 's', 't'])
+            rows = db.get_relvar(name).rows
+            deleted = rng.sample(sorted(rows, key=repr), min(len(rows), 2))
+            db.update_relvar(name, inserted=random_rows(rng, 2),
+                             deleted=deleted)
+
+            for (name, expr) in zip(names, exprs):
+                with self.subTest(step=step, expr=expr):
+                    self.assertIn(name, manager.views)
+                    expected = eval_ra_expr(db, expr + ';', cache=None)
+                    self.assertEqual(db.get_relvar(name).rows,
+                                     expected.rows)
+
+    def test_incremental_views(self):
+        self.check_views(INCREMENTAL_VIEWS, True)
+
+    def test_recomputed_views(self):
+        self.check_views(RECOMPUTED_VIEWS, False)
+
+    def test_divide_with_nulls(self):
+        db = Database()
+        db.set_relvar('r', RelationValue(['r.a', 'r.c'],
+                                         {(1, 1), (2, 1)}))
+        create_view(db, 'q <- r DIVIDE PI[c](r);')
+        self.assertEqual(db.get_relvar('q').rows, {(1,), (2,)})
+
+        db.update_relvar('r', inserted=[(1, None)])
+        self.assertEqual(db.get_relvar('q').rows, {(1,)})
+        self.assertEqual(db.get_relvar('q').rows,
+                         eval_ra_expr(db, 'r DIVIDE PI[c](r);').rows)
+
+    def test_view_of_view(self):
+        db = make_database(random.Random(1))
+        create_view(db, 'v <- PI[a, c](r BOWTIE s);')
+        create_view(db, 'w(x) <- PI[a](v) MINUS PI[a](t);')
+        db.update_relvar('s', inserted=[(0, 0), (1, 1), (2, 2)])
+        db.update_relvar('t', deleted=list(db.get_relvar('t').rows)[:3])
+
+        self.assertEqual(db.get_relvar('w').get_attrs(), ['w.x'])
+        self.assertEqual(db.get_relvar('w').rows, eval_ra_expr(db,
+            'PI[a](PI[a, c](r BOWTIE s)) MINUS PI[a](t);').rows)
+
+    def test_views_stop_being_maintained(self):
+        db = make_database(random.Random(2))
+        manager = get_view_manager(db)
+        create_view(db, 'v <- PI[a](r);')
+        create_view(db, 'w <- PI[b](s);')
+        with self.assertRaises(ValueError):
+            create_view(db, 'v <- PI[b](r);')
+
+        # Assigning to a view makes it an ordinary relvar.
+        db.set_relvar('v', RelationValue(['v.a'], {(9,)}))
+        self.assertNotIn('v', manager.views)
+        db.update_relvar('r', inserted=[(5, 5)])
+        self.assertEqual(db.get_relvar('v').rows, {(9,)})
+
+        # So does deleting one of its inputs.
+        db.del_relvar('s')
+        self.assertNotIn('w', manager.views)
+
+        create_view(db, 'x <- PI[a](r);')
+        drop_view(db, 'x')
+        self.assertEqual(manager.views, {})
+
+
+if __name__ == '__main__':
+    unittest.main()